@@ -0,0 +1,241 @@
+"""
+Retention for runs and evaluations: months older than RUN_RETENTION_MONTHS
+are exported to gzipped JSONL in object storage and deleted from MySQL.
+Nothing is archived or deleted unless RUN_ARCHIVE_ENABLED is set.
+
+Each archive object holds up to ARCHIVE_CHUNK_SIZE runs of one month, one line
+per run with its evaluations. archived_run maps every archived run to its
+object, so the run endpoints can still serve it by reading a single object.
+Stats are unaffected: they are read from stats_rollup, which only compacts the
+last few days.
+
+Backends, picked with ARCHIVE_STORE:
+- "gcs" (default): objects under ARCHIVE_PREFIX in ARCHIVE_GCS_BUCKET
+- "local": files under ARCHIVE_LOCAL_DIR, for tests and local development
+"""
+
+import asyncio
+import gzip
+import os
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+
+from app.db_api.models import ArchivedRun, Evaluation, Run
+from app.logging_config import logger
+from app.utils.stats_rollups import insert_ignore
+from common import serialization
+from common.utils import load_env
+
+env_vars = load_env()
+
+# Archiving deletes runs from MySQL, so deployments opt in explicitly
+RUN_ARCHIVE_ENABLED = env_vars.get("RUN_ARCHIVE_ENABLED", "f").lower() in (
+    "true",
+    "1",
+    "t",
+)
+RUN_RETENTION_MONTHS = int(env_vars.get("RUN_RETENTION_MONTHS", 6))
+ARCHIVE_CHUNK_SIZE = int(env_vars.get("ARCHIVE_CHUNK_SIZE", 1000))
+ARCHIVE_STORE = env_vars.get("ARCHIVE_STORE", "gcs")
+ARCHIVE_GCS_BUCKET = env_vars.get("ARCHIVE_GCS_BUCKET", env_vars.get("GCS_BUCKET_NAME"))
+ARCHIVE_PREFIX = env_vars.get("ARCHIVE_PREFIX", "archive/")
+ARCHIVE_LOCAL_DIR = env_vars.get("ARCHIVE_LOCAL_DIR", "/tmp/llm_eval_archive")
+
+
+class GCSArchiveStorage:
+    def __init__(self, bucket_name: str, prefix: str):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from google.cloud import storage
+
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def put(self, name: str, data: bytes):
+        self.bucket.blob(self.prefix + name).upload_from_string(
+            data, content_type="application/gzip"
+        )
+
+    def get(self, name: str) -> bytes:
+        return self.bucket.blob(self.prefix + name).download_as_bytes()
+
+
+class LocalArchiveStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, name: str, data: bytes):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def get(self, name: str) -> bytes:
+        with open(os.path.join(self.root, name), "rb") as f:
+            return f.read()
+
+
+def make_storage(name: str = ARCHIVE_STORE):
+    if name == "local":
+        return LocalArchiveStorage(ARCHIVE_LOCAL_DIR)
+    return GCSArchiveStorage(ARCHIVE_GCS_BUCKET, ARCHIVE_PREFIX)
+
+
+archive_storage = make_storage()
+
+
+def month_start(day: date, months_back: int = 0) -> date:
+    month_index = day.year * 12 + day.month - 1 - months_back
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def encode_chunk(records: list[dict]) -> bytes:
+    return gzip.compress(
+        b"".join(serialization.dumps(record) + b"\n" for record in records)
+    )
+
+
+def decode_chunk(data: bytes) -> list[dict]:
+    return [
+        serialization.loads(line) for line in gzip.decompress(data).splitlines() if line
+    ]
+
+
+def _row(row) -> dict:
+    return dict(row._mapping)
+
+
+def archive_chunk(
+    db, month: date, after_id: int, chunk_size: int, storage
+) -> tuple[int, int]:
+    """
+    Exports the next chunk of runs created in month with id above after_id,
+    then deletes them. Returns the number of runs archived and the last id.
+
+    The object is named after the id range, so a chunk retried after a crash
+    overwrites its own object.
+    """
+    runs = db.execute(
+        select(Run.__table__)
+        .filter(
+            Run.created_at >= month,
+            Run.created_at < month_start(month, -1),
+            Run.id > after_id,
+        )
+        .order_by(Run.id)
+        .limit(chunk_size)
+    ).all()
+    if not runs:
+        return 0, after_id
+    run_ids = [run.id for run in runs]
+    evaluations_by_run: dict[int, list[dict]] = {run_id: [] for run_id in run_ids}
+    for evaluation in db.execute(
+        select(Evaluation.__table__).filter(Evaluation.run_id.in_(run_ids))
+    ):
+        evaluations_by_run[evaluation.run_id].append(_row(evaluation))
+
+    name = f"runs/{month:%Y-%m}/{run_ids[0]}-{run_ids[-1]}.jsonl.gz"
+    storage.put(
+        name,
+        encode_chunk(
+            [
+                {"run": _row(run), "evaluations": evaluations_by_run[run.id]}
+                for run in runs
+            ]
+        ),
+    )
+    insert_ignore(
+        db,
+        ArchivedRun.__table__,
+        [
+            {
+                "run_id": run.id,
+                "batch_run_id": run.batch_run_id,
+                "month": f"{month:%Y-%m}",
+                "object_name": name,
+            }
+            for run in runs
+        ],
+    )
+    db.execute(delete(Evaluation).where(Evaluation.run_id.in_(run_ids)))
+    db.execute(delete(Run).where(Run.id.in_(run_ids)))
+    db.commit()
+    logger.info(f"Archived {len(run_ids)} runs of {month:%Y-%m} to {name}")
+    return len(run_ids), run_ids[-1]
+
+
+def archive_cold_months(
+    db,
+    retention_months: int = RUN_RETENTION_MONTHS,
+    chunk_size: int = ARCHIVE_CHUNK_SIZE,
+    storage=None,
+) -> int:
+    """
+    Archives every month older than retention_months, oldest first. Returns
+    the number of runs archived; none unless RUN_ARCHIVE_ENABLED.
+    """
+    if not RUN_ARCHIVE_ENABLED:
+        logger.warning(
+            "Run archiving is disabled, set RUN_ARCHIVE_ENABLED to enable it"
+        )
+        return 0
+    storage = storage or archive_storage
+    cutoff = month_start(date.today(), retention_months)
+    oldest = db.scalar(select(func.min(Run.created_at)))
+    archived = 0
+    month = oldest and month_start(oldest.date())
+    while month and month < cutoff:
+        count, after_id = archive_chunk(db, month, 0, chunk_size, storage)
+        while count:
+            archived += count
+            count, after_id = archive_chunk(db, month, after_id, chunk_size, storage)
+        month = month_start(month, -1)
+    return archived
+
+
+def _pick(records: list[dict], run_ids: set) -> list[dict]:
+    return [record for record in records if record["run"]["id"] in run_ids]
+
+
+def _load(storage, object_names: dict[str, set]) -> list[dict]:
+    found = []
+    for name, run_ids in object_names.items():
+        found.extend(_pick(decode_chunk(storage.get(name)), run_ids))
+    return found
+
+
+def _group(rows) -> dict[str, set]:
+    object_names: dict[str, set] = {}
+    for run_id, name in rows:
+        object_names.setdefault(name, set()).add(run_id)
+    return object_names
+
+
+async def aload_archived_runs(
+    db,
+    run_id: Optional[int] = None,
+    batch_run_id: Optional[int] = None,
+    storage=None,
+) -> list[dict]:
+    """
+    Archived runs by id or batch, as {"run": ..., "evaluations": [...]}
+    records. Reads one object per archive chunk involved.
+    """
+    storage = storage or archive_storage
+    query = select(ArchivedRun.run_id, ArchivedRun.object_name)
+    if run_id is not None:
+        query = query.filter(ArchivedRun.run_id == run_id)
+    if batch_run_id is not None:
+        query = query.filter(ArchivedRun.batch_run_id == batch_run_id)
+    object_names = _group((await db.execute(query)).all())
+    if not object_names:
+        return []
+    return await asyncio.to_thread(_load, storage, object_names)
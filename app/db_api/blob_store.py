@@ -0,0 +1,322 @@
+"""
+Blob tier for large JSON payloads (Run.message, Evaluation.output).
+
+Payloads whose JSON is larger than BLOB_THRESHOLD_BYTES are compressed and
+stored outside the row, keyed by the sha256 of their JSON; the row keeps the
+key in <field>_blob and NULL in the JSON column. Identical payloads share one
+blob. Endpoints that return the payloads resolve the keys with load_rows /
+aload_rows, everything else never reads them.
+
+Backends, picked with BLOB_STORE:
+- "db" (default): the blob side table
+- "gcs": objects under BLOB_GCS_PREFIX in BLOB_GCS_BUCKET
+- "local": files under BLOB_LOCAL_DIR, for tests and local development
+"""
+
+import asyncio
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.db_api import database
+from app.db_api.models import Blob
+from app.logging_config import logger
+from app.utils.stats_rollups import insert_ignore, insert_ignore_stmt
+from common import serialization
+from common.utils import load_env
+
+env_vars = load_env()
+
+BLOB_STORE = env_vars.get("BLOB_STORE", "db")
+BLOB_THRESHOLD_BYTES = int(env_vars.get("BLOB_THRESHOLD_BYTES", 16384))
+BLOB_GCS_BUCKET = env_vars.get("BLOB_GCS_BUCKET", env_vars.get("GCS_BUCKET_NAME"))
+BLOB_GCS_PREFIX = env_vars.get("BLOB_GCS_PREFIX", "blobs/")
+BLOB_LOCAL_DIR = env_vars.get("BLOB_LOCAL_DIR", "/tmp/llm_eval_blobs")
+BLOB_CODEC = "zlib"
+
+# Keys this process stored recently; content addressing makes re-storing them a
+# no-op, so followers and retries skip the round trip
+_RECENT_KEYS_MAX = 4096
+
+
+def encode_payload(raw: bytes) -> tuple[str, bytes]:
+    """Returns the blob key and compressed data of a payload's JSON."""
+    return hashlib.sha256(raw).hexdigest(), zlib.compress(raw, 6)
+
+
+def decode_payload(data: bytes) -> Any:
+    return serialization.loads(zlib.decompress(data))
+
+
+class DatabaseBlobBackend:
+    """Blobs in the blob side table, skipping keys that are already stored."""
+
+    def _rows(self, blobs: dict[str, tuple[bytes, int]]) -> list[dict]:
+        return [
+            {"hash": key, "codec": BLOB_CODEC, "size": size, "data": data}
+            for key, (data, size) in blobs.items()
+        ]
+
+    def put_many(self, blobs: dict[str, tuple[bytes, int]], session=None):
+        if session is not None:
+            insert_ignore(session, Blob.__table__, self._rows(blobs))
+            return
+        with database.get_db_ctx() as session:
+            insert_ignore(session, Blob.__table__, self._rows(blobs))
+
+    def get_many(self, keys: list[str], session=None) -> dict[str, bytes]:
+        stmt = select(Blob.hash, Blob.data).filter(Blob.hash.in_(keys))
+        if session is not None:
+            return dict(session.execute(stmt).all())
+        with database.get_db_ctx_manual() as session:
+            return dict(session.execute(stmt).all())
+
+    async def aput_many(self, blobs: dict[str, tuple[bytes, int]], session=None):
+        if session is not None:
+            await session.execute(
+                insert_ignore_stmt(session, Blob.__table__), self._rows(blobs)
+            )
+            return
+        async with database.async_get_db_session_ctx() as session:
+            await session.execute(
+                insert_ignore_stmt(session, Blob.__table__), self._rows(blobs)
+            )
+            await session.commit()
+
+    async def aget_many(self, keys: list[str], session=None) -> dict[str, bytes]:
+        stmt = select(Blob.hash, Blob.data).filter(Blob.hash.in_(keys))
+        if session is not None:
+            return dict((await session.execute(stmt)).all())
+        async with database.async_get_db_session_ctx() as session:
+            return dict((await session.execute(stmt)).all())
+
+
+class _ThreadedBackend:
+    """Async access for the backends with blocking clients."""
+
+    async def aput_many(self, blobs: dict[str, tuple[bytes, int]], session=None):
+        await asyncio.to_thread(self.put_many, blobs)
+
+    async def aget_many(self, keys: list[str], session=None) -> dict[str, bytes]:
+        return await asyncio.to_thread(self.get_many, keys)
+
+
+class GCSBlobBackend(_ThreadedBackend):
+    def __init__(self, bucket_name: str, prefix: str):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from google.cloud import storage
+
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def _blob(self, key: str):
+        return self.bucket.blob(f"{self.prefix}{key[:2]}/{key}")
+
+    def put_many(self, blobs: dict[str, tuple[bytes, int]], session=None):
+        for key, (data, _) in blobs.items():
+            self._blob(key).upload_from_string(
+                data, content_type="application/octet-stream"
+            )
+
+    def get_many(self, keys: list[str], session=None) -> dict[str, bytes]:
+        from google.api_core.exceptions import NotFound
+
+        found = {}
+        for key in keys:
+            try:
+                found[key] = self._blob(key).download_as_bytes()
+            except NotFound:
+                pass
+        return found
+
+
+class LocalBlobBackend(_ThreadedBackend):
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def put_many(self, blobs: dict[str, tuple[bytes, int]], session=None):
+        for key, (data, _) in blobs.items():
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial blob
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def get_many(self, keys: list[str], session=None) -> dict[str, bytes]:
+        found = {}
+        for key in keys:
+            try:
+                with open(self._path(key), "rb") as f:
+                    found[key] = f.read()
+            except FileNotFoundError:
+                pass
+        return found
+
+
+def make_backend(name: str = BLOB_STORE):
+    if name == "gcs":
+        return GCSBlobBackend(BLOB_GCS_BUCKET, BLOB_GCS_PREFIX)
+    if name == "local":
+        return LocalBlobBackend(BLOB_LOCAL_DIR)
+    return DatabaseBlobBackend()
+
+
+class BlobStore:
+    def __init__(self, backend, threshold: int = BLOB_THRESHOLD_BYTES):
+        self.backend = backend
+        self.threshold = threshold
+        self._recent_keys: OrderedDict[str, None] = OrderedDict()
+
+    def _remember(self, keys):
+        for key in keys:
+            self._recent_keys[key] = None
+            self._recent_keys.move_to_end(key)
+        while len(self._recent_keys) > _RECENT_KEYS_MAX:
+            self._recent_keys.popitem(last=False)
+
+    def _split(self, rows: list[dict], field: str, ref_field: str):
+        """
+        Copies of rows with the large payloads of field swapped for their key,
+        and the blobs to store. Every copy has ref_field set, so multi-row
+        inserts see the same columns on each row.
+        """
+        stored, blobs = [], {}
+        for row in rows:
+            payload = row.get(field)
+            if payload is None:
+                stored.append({**row, ref_field: None})
+                continue
+            raw = serialization.dumps(payload)
+            if len(raw) <= self.threshold:
+                stored.append({**row, ref_field: None})
+                continue
+            key, data = encode_payload(raw)
+            stored.append({**row, field: None, ref_field: key})
+            if key not in self._recent_keys:
+                blobs[key] = (data, len(raw))
+        return stored, blobs
+
+    def offload_rows(
+        self, rows: list[dict], field: str, ref_field: str, session=None
+    ) -> list[dict]:
+        """
+        Returns rows ready to insert or update, with payloads above the
+        threshold stored as blobs. Pass the session writing the rows to put
+        side table blobs in the same transaction.
+        """
+        stored, blobs = self._split(rows, field, ref_field)
+        if blobs:
+            self.backend.put_many(blobs, session=session)
+            if session is None:
+                # Stored for good; a session's blobs could still roll back
+                self._remember(blobs)
+            logger.debug(f"Offloaded {len(blobs)} {field} payloads to blobs")
+        return stored
+
+    async def aoffload_rows(
+        self, rows: list[dict], field: str, ref_field: str, session=None
+    ) -> list[dict]:
+        stored, blobs = self._split(rows, field, ref_field)
+        if blobs:
+            await self.backend.aput_many(blobs, session=session)
+            if session is None:
+                # Stored for good; a session's blobs could still roll back
+                self._remember(blobs)
+            logger.debug(f"Offloaded {len(blobs)} {field} payloads to blobs")
+        return stored
+
+    def _refs(self, rows, ref_field: str) -> list[str]:
+        return list({key for row in rows if (key := _get(row, ref_field)) is not None})
+
+    def _fill(self, rows, field: str, ref_field: str, found: dict[str, bytes]):
+        for row in rows:
+            key = _get(row, ref_field)
+            if key is None:
+                continue
+            if key not in found:
+                logger.error(f"Blob {key} referenced by {field} is missing")
+                continue
+            _set(row, field, decode_payload(found[key]))
+
+    def load_rows(self, rows, field: str, ref_field: str, session=None):
+        """
+        Fills field in place on rows (ORM objects or dicts) that reference a
+        blob. ORM objects aren't marked dirty.
+        """
+        keys = self._refs(rows, ref_field)
+        if keys:
+            self._fill(
+                rows, field, ref_field, self.backend.get_many(keys, session=session)
+            )
+        return rows
+
+    async def aload_rows(self, rows, field: str, ref_field: str, session=None):
+        keys = self._refs(rows, ref_field)
+        if keys:
+            found = await self.backend.aget_many(keys, session=session)
+            self._fill(rows, field, ref_field, found)
+        return rows
+
+
+def offload_existing(
+    db, model, field: str, ref_field: str, batch_size: int = 500, after_id: int = 0
+) -> int:
+    """
+    Moves payloads of rows saved before the blob tier existed out of the row,
+    walking ids upwards in batches. Returns the number of rows offloaded.
+    """
+    column = getattr(model, field)
+    offloaded = 0
+    while True:
+        rows = db.execute(
+            select(model.id, column)
+            .filter(
+                model.id > after_id,
+                getattr(model, ref_field).is_(None),
+                func.json_storage_size(column) > blob_store.threshold,
+            )
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        stored = blob_store.offload_rows(
+            [{"id": id, field: payload} for id, payload in rows],
+            field,
+            ref_field,
+            session=db,
+        )
+        db.execute(update(model), stored)
+        db.commit()
+        offloaded += len(stored)
+        after_id = rows[-1].id
+    return offloaded
+
+
+def _get(row, name: str) -> Optional[Any]:
+    return row.get(name) if isinstance(row, dict) else getattr(row, name)
+
+
+def _set(row, name: str, value: Any):
+    if isinstance(row, dict):
+        row[name] = value
+    else:
+        set_committed_value(row, name, value)
+
+
+blob_store = BlobStore(make_backend())
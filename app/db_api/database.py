@@ -13,6 +13,12 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+from app.db_api.pool_profiles import (
+    InstrumentedAsyncAdaptedQueuePool,
+    InstrumentedQueuePool,
+    pool_metrics,
+    pool_profile,
+)
 from common.utils import load_env
 
 env_vars = load_env()  # Load environment variables from .env file
@@ -31,14 +37,15 @@ if DATABASE_URL is None:
 
 Base = declarative_base()
 
+# Pool sizes depend on the process role (DB_POOL_ROLE), see pool_profiles
+db_pool_profile = pool_profile()
 
 engine = create_engine(
     DATABASE_URL,
-    pool_size=30,  # Increase pool size
-    max_overflow=10,  # Increase maximum overflow
-    pool_recycle=600,  # Recycle connections after 10 minutes
-    pool_timeout=60,  # Increase timeout to 60 seconds
+    poolclass=InstrumentedQueuePool,
+    **db_pool_profile.engine_kwargs(),
 )
+pool_metrics.pools["sync"] = engine.pool
 SessionLocal = sessionmaker(autoflush=False, bind=engine)
 
 
@@ -105,12 +112,11 @@ class AsyncDatabaseSessionManager:
 async_sessionmanager = AsyncDatabaseSessionManager(
     ASYNC_DATABASE_URL,
     engine_kwargs=dict(
-        pool_size=30,  # Increase pool size
-        max_overflow=10,  # Increase maximum overflow
-        pool_recycle=600,  # Recycle connections after 10 minutes
-        pool_timeout=60,  # Increase timeout to 60 seconds)
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        **db_pool_profile.engine_kwargs(),
     ),
 )
+pool_metrics.pools["async"] = async_sessionmanager._engine.sync_engine.pool
 
 
 async def async_get_db_session():
@@ -1,14 +1,20 @@
 from .models import (
+    ArchivedRun,
     BatchRun,
+    Blob,
     Engagement,
     Evaluation,
     EvaluationConfig,
     Evaluator,
     EvaluatorConfig,
     EvaluatorType,
+    LLMCall,
+    LLMPricing,
     Project,
     Role,
     Run,
+    StatsRollup,
+    StatsRollupLock,
     User,
     UserProjectRole,
 )
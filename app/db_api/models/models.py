@@ -2,19 +2,22 @@ import uuid
 
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     Column,
     Date,
+    DateTime,
     Float,
     ForeignKey,
     Index,
     Integer,
+    LargeBinary,
     String,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 
-from app.db_api.models.base import TimestampedBase
+from app.db_api.models.base import Base, TimestampedBase
 
 CONST = ""  # "llm_eval__"
 
@@ -31,6 +34,7 @@ class Engagement(TimestampedBase):
     __table_args__ = (
         UniqueConstraint("name", name="_engname_uc"),
         Index("idx_engagement_name", "name"),
+        Index("idx_engagement_created_at_id", "created_at", "id"),
     )
 
 
@@ -43,6 +47,7 @@ class Role(TimestampedBase):
     __table_args__ = (
         UniqueConstraint("name", name="_role_uc"),
         Index("idx_role_name", "name"),
+        Index("idx_role_created_at_id", "created_at", "id"),
     )
 
 
@@ -61,6 +66,7 @@ class User(TimestampedBase):
     __table_args__ = (
         UniqueConstraint("email", name="_user_email_uc"),
         Index("idx_user_email", "email"),
+        Index("idx_user_created_at_id", "created_at", "id"),
     )
 
 
@@ -78,6 +84,7 @@ class Project(TimestampedBase):
         UniqueConstraint("engagement_id", "name", name="_engagement_project_uc"),
         Index("idx_project_engagement_id", "engagement_id"),
         Index("idx_project_name", "name"),
+        Index("idx_project_created_at_id", "created_at", "id"),
     )
 
 
@@ -103,6 +110,7 @@ class UserProjectRole(TimestampedBase):
         Index("idx_user_project_role_user_id", "user_id"),
         Index("idx_user_project_role_project_id", "project_id"),
         Index("idx_user_project_role_role_id", "role_id"),
+        Index("idx_user_project_role_created_at_id", "created_at", "id"),
     )
 
 
@@ -119,6 +127,7 @@ class BatchRun(TimestampedBase):
 
     __table_args__ = (
         Index("idx_batch_run_user_project_role_id", "user_project_role_id"),
+        Index("idx_batch_run_created_at_id", "created_at", "id"),
     )
 
 
@@ -139,10 +148,15 @@ class Run(TimestampedBase):
     user_project_role = relationship("UserProjectRole", back_populates="runs")
     batch_run = relationship("BatchRun", back_populates="runs")
     message = Column(JSON, nullable=True)
+    # Key of message in the blob tier when it is too large to keep inline,
+    # see app.db_api.blob_store
+    message_blob = Column(String(64), nullable=True)
 
     __table_args__ = (
-        Index("idx_run_batch_run_id", "batch_run_id"),
+        Index("idx_run_batch_run_id_status", "batch_run_id", "status"),
+        Index("idx_run_input_hash", "input_hash"),
         Index("idx_run_user_project_role_id", "user_project_role_id"),
+        Index("idx_run_created_at_id", "created_at", "id"),
     )
 
 
@@ -158,24 +172,38 @@ class Evaluation(TimestampedBase):
     status = Column(String(15))
     config = Column(JSON)
     output = Column(JSON)
+    # Key of output in the blob tier when it is too large to keep inline
+    output_blob = Column(String(64), nullable=True)
     prompt_tokens_used = Column(Integer, default=0)
     generate_tokens_used = Column(Integer, default=0)
+    # Part of prompt_tokens_used read from the provider's prompt cache
+    cached_prompt_tokens_used = Column(Integer, default=0)
     is_aggregator = Column(Boolean, default=False)
     is_used_for_aggregation = Column(Boolean, default=False)
     fail_reason = Column(String(1000), nullable=True)
     run = relationship("Run", back_populates="evaluations")
     evaluator_config_override = Column(JSON, nullable=True)
     is_dev = Column(Boolean, default=False)
+    # Stamped at save time from the pricing in force, see app.utils.pricing_index
+    llm_provider = Column(String(80), nullable=True)
+    llm_model = Column(String(100), nullable=True)
+    cost = Column(Float, nullable=True)
 
     evaluator = relationship("Evaluator", back_populates="evaluations")
     user_project_role = relationship("UserProjectRole", back_populates="evaluations")
     uuid_token = Column(String(36), default=lambda: str(uuid.uuid4()), nullable=False)
 
     __table_args__ = (
-        Index("idx_run_id", "run_id"),
+        Index("idx_evaluation_run_id_name", "run_id", "name"),
         Index("idx_batch_run_id", "batch_run_id"),
         Index("idx_user_project_role_id", "user_project_role_id"),
         Index("idx_uuid_token", "uuid_token"),
+        Index("idx_evaluation_created_at_id", "created_at", "id"),
+        Index(
+            "idx_evaluation_user_project_role_created_at",
+            "user_project_role_id",
+            "created_at",
+        ),
     )
 
 
@@ -187,7 +215,10 @@ class EvaluatorType(TimestampedBase):
     config_schema = Column(JSON)
     evaluators = relationship("Evaluator", back_populates="evaluator_type")
 
-    __table_args__ = (Index("idx_evaluator_type_name", "name"),)
+    __table_args__ = (
+        Index("idx_evaluator_type_name", "name"),
+        Index("idx_evaluator_type_created_at_id", "created_at", "id"),
+    )
 
 
 class Evaluator(TimestampedBase):
@@ -214,6 +245,7 @@ class Evaluator(TimestampedBase):
         Index("idx_evaluator_name", "name"),
         Index("idx_evaluator_type_id", "evaluator_type_id"),
         Index("idx_creator_id", "creator_id"),
+        Index("idx_evaluator_created_at_id", "created_at", "id"),
     )
 
 
@@ -258,6 +290,7 @@ class LLMPricing(TimestampedBase):
     version = Column(String(100), index=True, nullable=True)
     input_price_per_million_tokens = Column(Float, nullable=False)
     output_price_per_million_tokens = Column(Float, nullable=False)
+    cached_input_price_per_million_tokens = Column(Float, nullable=True)
     effective_from = Column(Date, nullable=False)
     effective_to = Column(Date, nullable=True)
 
@@ -270,3 +303,123 @@ class LLMPricing(TimestampedBase):
         Index("idx_llmpricing_effective_from", "effective_from"),
         Index("idx_llmpricing_effective_to", "effective_to"),
     )
+
+
+class StatsRollup(TimestampedBase):
+    """
+    Daily aggregates per engagement, project and evaluator, maintained from the
+    saving path and reconciled by compaction. Rows with evaluator_id 0 hold
+    run-level totals across all evaluators of a run.
+    """
+
+    __tablename__ = CONST + "stats_rollup"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    engagement_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False)
+    evaluator_id = Column(Integer, nullable=False, default=0)
+
+    run_count = Column(Integer, nullable=False, default=0)
+    run_failed_count = Column(Integer, nullable=False, default=0)
+    evaluation_count = Column(Integer, nullable=False, default=0)
+    evaluation_failed_count = Column(Integer, nullable=False, default=0)
+    total_prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    total_generate_tokens = Column(BigInteger, nullable=False, default=0)
+    total_latency_ms = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "day",
+            "engagement_id",
+            "project_id",
+            "evaluator_id",
+            name="uq_stats_rollup_grain",
+        ),
+        Index("idx_stats_rollup_engagement_day", "engagement_id", "day"),
+        Index("idx_stats_rollup_project_day", "project_id", "day"),
+        Index("idx_stats_rollup_evaluator_day", "evaluator_id", "day"),
+    )
+
+
+class StatsRollupLock(Base):
+    """One row per rollup day, locked to order saves against compaction."""
+
+    __tablename__ = CONST + "stats_rollup_lock"
+    day = Column(Date, primary_key=True)
+
+
+class Blob(TimestampedBase):
+    """
+    Compressed payloads offloaded from JSON columns, keyed by the sha256 of
+    their JSON. Only used with BLOB_STORE=db, see app.db_api.blob_store.
+    """
+
+    __tablename__ = CONST + "blob"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hash = Column(String(64), nullable=False)
+    codec = Column(String(10), nullable=False)
+    size = Column(Integer, nullable=False)
+    # LONGBLOB on MySQL
+    data = Column(LargeBinary(length=2**32 - 1), nullable=False)
+
+    __table_args__ = (UniqueConstraint("hash", name="uq_blob_hash"),)
+
+
+class ArchivedRun(TimestampedBase):
+    """
+    Runs moved out of MySQL by the retention job and the archive object that
+    holds each of them, see app.db_api.archive.
+    """
+
+    __tablename__ = CONST + "archived_run"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, nullable=False)
+    batch_run_id = Column(Integer, nullable=True)
+    month = Column(String(7), nullable=False)
+    object_name = Column(String(255), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("run_id", name="uq_archived_run_run_id"),
+        Index("idx_archived_run_batch_run_id", "batch_run_id"),
+    )
+
+
+class LLMCall(TimestampedBase):
+    """
+    One attempt of a ChatFailoverLLM call, drained from the call ledger
+    stream (llm_failover.ledger, app.utils.llm_ledger). Attempts of a call
+    share call_id; run_id, evaluator and engagement come from the tags of
+    the evaluate task that made it.
+    """
+
+    __tablename__ = CONST + "llm_call"
+    # Only INTEGER PRIMARY KEY autoincrements on SQLite
+    id = Column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    call_id = Column(String(32), nullable=False)
+    attempt = Column(Integer, nullable=False, default=0)
+    provider = Column(String(100), nullable=False)
+    model = Column(String(100), nullable=False)
+    key_alias = Column(String(16), nullable=False)
+    run_id = Column(Integer, nullable=True)
+    evaluator = Column(String(150), nullable=True)
+    engagement = Column(String(150), nullable=True)
+    latency_ms = Column(Integer, nullable=False)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_prompt_tokens = Column(Integer, nullable=True)
+    error = Column(String(100), nullable=True)
+    stream = Column(Boolean, nullable=False, default=False)
+    cost = Column(Float, nullable=True)
+    called_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("idx_llm_call_run_id", "run_id"),
+        Index("idx_llm_call_evaluator_called_at", "evaluator", "called_at"),
+        Index("idx_llm_call_engagement_called_at", "engagement", "called_at"),
+        Index("idx_llm_call_called_at", "called_at"),
+        UniqueConstraint("call_id", "attempt", name="uq_llm_call_attempt"),
+    )
@@ -0,0 +1,264 @@
+"""
+Connection pool profiles per process role, pool instrumentation, and the
+connection footprint of a supervisor config.
+
+Each process picks its profile from DB_POOL_ROLE (set per program in
+supervisord.conf). Print the footprint of a deployment with:
+
+    python -m app.db_api.pool_profiles supervisor/supervisord.conf
+"""
+
+import argparse
+import configparser
+import os
+import re
+import socket
+import threading
+import time
+from typing import NamedTuple
+
+import redis
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from common import serialization
+from common.utils import load_env
+
+env_vars = load_env()
+
+
+class PoolProfile(NamedTuple):
+    pool_size: int
+    max_overflow: int
+    pool_timeout: int = 60
+    pool_recycle: int = 600
+    # Open a connection when the process starts instead of on first use
+    warm: bool = False
+    # Whether the role serves requests through the async engine as well
+    uses_async: bool = False
+
+    def engine_kwargs(self) -> dict:
+        return dict(
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+        )
+
+    @property
+    def max_connections(self) -> int:
+        engines = 2 if self.uses_async else 1
+        return engines * (self.pool_size + self.max_overflow)
+
+
+POOL_PROFILES = {
+    # uvicorn workers: most CRUD routes are on the async engine, auth and
+    # ingestion still use the sync one
+    "api": PoolProfile(10, 10, uses_async=True, warm=True),
+    # save_results and save_follower_results: one short transaction per run
+    # across 50 greenlets
+    "saving_worker": PoolProfile(10, 10, warm=True),
+    # compile_evaluations and maintenance jobs
+    "db_fetch_worker": PoolProfile(5, 5, warm=True),
+    # process_run and fail_run touch the DB only on failures
+    "process_worker": PoolProfile(2, 3),
+    # Evaluators don't query the DB; connections open only if one does
+    "evaluation_worker": PoolProfile(1, 1),
+    "evaluation_stage2_worker": PoolProfile(1, 1),
+    "celery_beat": PoolProfile(1, 0),
+    # Every stage of bulk runs, saving included
+    "bulk_worker": PoolProfile(5, 5, warm=True),
+    # Anything not running under supervisor, e.g. scripts and tests
+    "default": PoolProfile(30, 10, uses_async=True, warm=True),
+}
+
+DB_POOL_ROLE = env_vars.get("DB_POOL_ROLE", "default")
+DB_POOL_METRICS_INTERVAL = int(env_vars.get("DB_POOL_METRICS_INTERVAL", 30))
+DB_POOL_METRICS_KEY = "db_pool_metrics"
+
+
+def pool_profile(role: str = DB_POOL_ROLE) -> PoolProfile:
+    profile = POOL_PROFILES.get(role, POOL_PROFILES["default"])
+    # Per-deployment overrides without editing the profiles
+    return profile._replace(
+        pool_size=int(env_vars.get("DB_POOL_SIZE") or profile.pool_size),
+        max_overflow=int(env_vars.get("DB_MAX_OVERFLOW") or profile.max_overflow),
+    )
+
+
+class PoolMetrics:
+    """
+    Checkout wait time and timeouts for this process's pools, published with
+    the pools' checked-out and overflow counts to a Redis hash (one field per
+    process) at most every DB_POOL_METRICS_INTERVAL seconds.
+    """
+
+    def __init__(self, role: str = DB_POOL_ROLE):
+        self.role = role
+        self.process = f"{role}:{socket.gethostname()}:{os.getpid()}"
+        self.pools: dict[str, QueuePool] = {}
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self._published_at = 0.0
+        self._lock = threading.Lock()
+        self._redis_client = None
+
+    def record_checkout(self, wait_seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            # Anything over a millisecond queued behind other checkouts
+            if wait_seconds > 0.001:
+                self.waits += 1
+            self.wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self.maybe_publish()
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+        self.maybe_publish(force=True)
+
+    def snapshot(self) -> dict:
+        return {
+            "role": self.role,
+            "process": self.process,
+            "published_at": time.time(),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "timeouts": self.timeouts,
+            "pools": {
+                name: {
+                    "size": pool.size(),
+                    "checked_out": pool.checkedout(),
+                    "overflow": max(pool.overflow(), 0),
+                    "max_overflow": pool._max_overflow,
+                }
+                for name, pool in self.pools.items()
+            },
+        }
+
+    def maybe_publish(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._published_at < DB_POOL_METRICS_INTERVAL:
+            return
+        self._published_at = now
+        try:
+            if self._redis_client is None:
+                # Imported here to keep the footprint CLI free of llm_failover
+                from llm_failover.health import redis_url
+
+                # The Redis the health endpoints read, see app.main
+                self._redis_client = redis.StrictRedis.from_url(
+                    redis_url(env_vars) or "redis://localhost:6379/0",
+                    socket_timeout=1,
+                )
+            self._redis_client.hset(
+                DB_POOL_METRICS_KEY, self.process, serialization.dumps(self.snapshot())
+            )
+        except redis.RedisError:
+            # Metrics must never get in the way of a checkout
+            pass
+
+
+pool_metrics = PoolMetrics()
+
+
+class _InstrumentedPoolMixin:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def summarize_pool_metrics(published: list) -> dict:
+    """
+    Sums the snapshots in the DB_POOL_METRICS_KEY hash per role, dropping
+    processes that stopped publishing.
+    """
+    roles: dict[str, dict] = {}
+    cutoff = time.time() - 10 * DB_POOL_METRICS_INTERVAL
+    for raw in published:
+        snapshot = serialization.loads(raw)
+        if snapshot["published_at"] < cutoff:
+            continue
+        role = roles.setdefault(
+            snapshot["role"],
+            {
+                "processes": 0,
+                "checked_out": 0,
+                "overflow": 0,
+                "checkouts": 0,
+                "waits": 0,
+                "wait_seconds": 0.0,
+                "max_wait_seconds": 0.0,
+                "timeouts": 0,
+            },
+        )
+        role["processes"] += 1
+        for pool in snapshot["pools"].values():
+            role["checked_out"] += pool["checked_out"]
+            role["overflow"] += pool["overflow"]
+        for key in ("checkouts", "waits", "wait_seconds", "timeouts"):
+            role[key] += snapshot[key]
+        role["max_wait_seconds"] = max(
+            role["max_wait_seconds"], snapshot["max_wait_seconds"]
+        )
+    return roles
+
+
+def connection_footprint(supervisor_conf: str) -> dict[str, int]:
+    """
+    Worst-case MySQL connections per supervisor program: processes times the
+    role's pool size plus overflow. Programs with autostart=false are skipped.
+    """
+    parser = configparser.RawConfigParser(strict=False)
+    parser.read(supervisor_conf)
+    footprint = {}
+    for section in parser.sections():
+        if not section.startswith("program:"):
+            continue
+        program = parser[section]
+        if program.get("autostart", "true").lower() == "false":
+            continue
+        role_match = re.search(
+            r"DB_POOL_ROLE=\"?(\w+)\"?", program.get("environment", "")
+        )
+        role = role_match.group(1) if role_match else "default"
+        processes = int(program.get("numprocs", 1))
+        workers = re.search(r"--workers[ =](\d+)", program.get("command", ""))
+        if workers:
+            processes *= int(workers.group(1))
+        footprint[section.split(":", 1)[1]] = (
+            processes * pool_profile(role).max_connections
+        )
+    return footprint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "supervisor_conf", nargs="?", default="supervisor/supervisord.conf"
+    )
+    args = parser.parse_args()
+    footprint = connection_footprint(args.supervisor_conf)
+    for program, connections in footprint.items():
+        print(f"{program:30} {connections:6}")
+    print(f"{'total':30} {sum(footprint.values()):6}")
@@ -0,0 +1,248 @@
+import hashlib
+import itertools
+import threading
+import time
+from typing import Optional
+
+import redis.asyncio as async_redis
+from fastapi import Request
+from sqlalchemy import TextClause, create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.db_api.database import SessionLocal, async_sessionmanager
+from app.logging_config import logger
+from common.utils import load_env
+
+env_vars = load_env()
+
+REPLICA_DB_URLS = [
+    url.strip().replace("asyncmy", "pymysql")
+    for url in env_vars.get("REPLICA_DB_URLS", "").split(",")
+    if url.strip()
+]
+# After a write, the caller's reads stay on the primary for this long
+REPLICA_STICKY_SECONDS = int(env_vars.get("REPLICA_STICKY_SECONDS", 10))
+REPLICA_MAX_LAG_SECONDS = int(env_vars.get("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_CHECK_SECONDS = int(env_vars.get("REPLICA_CHECK_SECONDS", 15))
+REPLICA_POOL_SIZE = int(env_vars.get("REPLICA_POOL_SIZE", 10))
+REPLICA_STICKY_PREFIX = "replica_sticky:"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReadOnlySessionError(RuntimeError):
+    pass
+
+
+class ReplicaSession(Session):
+    pass
+
+
+@event.listens_for(ReplicaSession, "before_flush")
+def _refuse_flush(session, flush_context, instances):
+    raise ReadOnlySessionError("Attempted to write through a read replica session")
+
+
+class Replica:
+    """
+    One read replica with its own sync and async engines. It is healthy while
+    its replication lag, checked every REPLICA_CHECK_SECONDS, is within
+    REPLICA_MAX_LAG_SECONDS; a disconnect marks it unhealthy until the next
+    successful check.
+    """
+
+    def __init__(self, url: str):
+        self.name = url.split("@")[-1]
+        engine_kwargs = dict(
+            pool_size=REPLICA_POOL_SIZE,
+            max_overflow=REPLICA_POOL_SIZE // 2,
+            pool_recycle=600,
+            pool_timeout=10,
+        )
+        self.engine = create_engine(url, **engine_kwargs)
+        self.async_engine = create_async_engine(
+            url.replace("pymysql", "asyncmy"), **engine_kwargs
+        )
+        self.SessionLocal = sessionmaker(
+            autoflush=False, bind=self.engine, class_=ReplicaSession
+        )
+        self.async_sessionmaker = async_sessionmaker(
+            autocommit=False, bind=self.async_engine, sync_session_class=ReplicaSession
+        )
+        event.listen(self.engine, "handle_error", self._on_error)
+        event.listen(self.async_engine.sync_engine, "handle_error", self._on_error)
+        self.healthy = True
+        self.lag = None
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            logger.warning(f"Replica {self.name} disconnected, routing to primary")
+            self.healthy = False
+
+    def _record_lag(self, rows):
+        lags = [
+            row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+            for row in rows
+        ]
+        # No status rows means the server isn't replicating (replication was
+        # reset, or the URL points at a primary) and a NULL lag means it is
+        # stopped: neither can vouch for fresh reads.
+        self.lag = None if not lags or None in lags else max(lags)
+        healthy = self.lag is not None and self.lag <= REPLICA_MAX_LAG_SECONDS
+        if healthy != self.healthy:
+            logger.warning(f"Replica {self.name} healthy={healthy} lag={self.lag}")
+        self.healthy = healthy
+
+    def _check_due(self) -> bool:
+        return (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at >= REPLICA_CHECK_SECONDS
+        )
+
+    def check(self):
+        with self._lock:
+            if not self._check_due():
+                return
+            self.checked_at = time.monotonic()
+        try:
+            with self.engine.connect() as connection:
+                rows = connection.execute(TextClause("SHOW REPLICA STATUS"))
+                self._record_lag([dict(row._mapping) for row in rows])
+        except DBAPIError as e:
+            logger.warning(f"Replica {self.name} health check failed: {e}")
+            self.healthy = False
+
+    async def acheck(self):
+        with self._lock:
+            if not self._check_due():
+                return
+            self.checked_at = time.monotonic()
+        try:
+            async with self.async_engine.connect() as connection:
+                rows = await connection.execute(TextClause("SHOW REPLICA STATUS"))
+                self._record_lag([dict(row._mapping) for row in rows])
+        except DBAPIError as e:
+            logger.warning(f"Replica {self.name} health check failed: {e}")
+            self.healthy = False
+
+
+class ReplicaRouter:
+    """Round-robins reads over healthy replicas; None means use the primary."""
+
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+
+    def _next_healthy(self) -> Optional[Replica]:
+        for _ in range(len(self.replicas)):
+            replica = next(self._cycle)
+            if replica.healthy:
+                return replica
+        return None
+
+    def choose(self) -> Optional[Replica]:
+        for replica in self.replicas:
+            replica.check()
+        return self._next_healthy()
+
+    async def achoose(self) -> Optional[Replica]:
+        for replica in self.replicas:
+            await replica.acheck()
+        return self._next_healthy()
+
+
+replica_router = ReplicaRouter(REPLICA_DB_URLS)
+
+_sticky_client = async_redis.StrictRedis(
+    host=env_vars.get("REDIS_HOST", "localhost"),
+    port=int(env_vars.get("REDIS_PORT", 6379)),
+    db=int(env_vars.get("REDIS_DB", 0)),
+)
+
+
+def caller_key(request: Request) -> Optional[str]:
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return None
+    return REPLICA_STICKY_PREFIX + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+async def replica_routing_middleware(request: Request, call_next):
+    """
+    Read-your-writes for replica reads: a successful write request pins the
+    caller to the primary for REPLICA_STICKY_SECONDS, in Redis so it holds
+    across API workers. Reads check the pin before any dependency runs.
+
+    A read that fails with a database error while on a replica is retried
+    once on the primary; it has no side effects and no body to replay.
+    """
+    request.state.use_primary = True
+    request.state.replica = None
+    if not replica_router.replicas:
+        return await call_next(request)
+
+    key = caller_key(request)
+    if request.method in SAFE_METHODS:
+        try:
+            request.state.use_primary = bool(key and await _sticky_client.exists(key))
+        except async_redis.RedisError as e:
+            logger.warning(f"Replica stickiness lookup failed: {e}")
+        try:
+            return await call_next(request)
+        except DBAPIError as e:
+            if request.state.replica is None:
+                raise
+            logger.warning(
+                f"Read on replica {request.state.replica} failed, retrying on the primary: {e}"
+            )
+            request.state.use_primary = True
+            request.state.replica = None
+            return await call_next(request)
+
+    response = await call_next(request)
+    if key and response.status_code < 400:
+        try:
+            await _sticky_client.set(key, 1, ex=REPLICA_STICKY_SECONDS)
+        except async_redis.RedisError as e:
+            logger.warning(f"Replica stickiness update failed: {e}")
+    return response
+
+
+def _use_primary(request: Request) -> bool:
+    return getattr(request.state, "use_primary", True)
+
+
+def get_read_db_gen(request: Request):
+    """
+    get_db_gen for read-only endpoints: a session on a healthy replica, or on
+    the primary when the caller wrote recently or no replica is usable.
+    """
+    replica = None if _use_primary(request) else replica_router.choose()
+    request.state.replica = replica.name if replica else None
+    db: Session = replica.SessionLocal() if replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def async_get_read_db_session(request: Request):
+    """async_get_db_session counterpart of get_read_db_gen."""
+    replica = None if _use_primary(request) else await replica_router.achoose()
+    request.state.replica = replica.name if replica else None
+    if replica is None:
+        async with async_sessionmanager.session() as session:
+            yield session
+        return
+    session = replica.async_sessionmaker()
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
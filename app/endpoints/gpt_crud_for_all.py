@@ -1,24 +1,34 @@
 from typing import Any, Dict, List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db_api import models
-from app.db_api.database import get_db_gen
+from app.db_api.blob_store import blob_store
+from app.db_api.database import async_get_db_session
+from app.db_api.replicas import async_get_read_db_session
 from app.logging_config import logger
 from app.schemas import gpt_generated_schemas_for_all as schemas
-from app.utils.auth import create_access_token, get_current_user
+from app.utils.auth import async_get_current_user, create_access_token
+from app.utils.pagination import MAX_PAGE_SIZE, async_keyset_paginate
+from app.utils.principal_cache import principal_cache
+from app.utils.stats_rollups import (
+    ALL_EVALUATORS,
+    async_count_distinct_rollup,
+    async_read_rollup_totals,
+    batch_count_select,
+)
 from common.utils import load_env
 
 env_vars = load_env()
-router = APIRouter(dependencies=[Depends(get_current_user)])
+router = APIRouter(dependencies=[Depends(async_get_current_user)])
 
 
 # Utility function to handle not found errors
-def get_or_404(model, id, db):
+async def get_or_404(model, id, db):
     logger.debug(f"Fetching {model.__name__} with id {id}")
-    obj = db.query(model).filter(model.id == id).first()
+    obj = await db.get(model, id)
     if not obj:
         logger.error(f"{model.__name__} with id {id} not found")
         raise HTTPException(status_code=404, detail="Item not found")
@@ -27,401 +37,493 @@ def get_or_404(model, id, db):
 
 # Engagement CRUD and Search
 @router.post("/engagements/", response_model=schemas.Engagement)
-def create_engagement(
+async def create_engagement(
     engagement: schemas.EngagementCreate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Creating engagement with data: {engagement.dict()}")
-    db_engagement = (
-        db.query(models.Engagement)
-        .filter(models.Engagement.name == engagement.name)
-        .first()
+    db_engagement = await db.scalar(
+        select(models.Engagement).filter(models.Engagement.name == engagement.name)
     )
     if db_engagement:
         logger.error(f"Engagement with name {engagement.name} already exists")
         raise HTTPException(status_code=400, detail="Engagement already exists")
     db_engagement = models.Engagement(**engagement.dict())
     db.add(db_engagement)
-    db.commit()
-    db.refresh(db_engagement)
+    await db.commit()
+    await db.refresh(db_engagement)
     logger.info(f"Created engagement with id {db_engagement.id}")
     return db_engagement
 
 
 @router.get("/engagements", response_model=List[schemas.Engagement])
-def read_engagements(
+async def read_engagements(
+    response: Response,
     engagement_id: Optional[int] = None,
     skip: int = 0,
-    limit: int = 10,
+    limit: int = MAX_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    paginate: bool = False,
     name: Optional[str] = None,
     description: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading engagements with filters - id: {engagement_id}, name: {name}, description: {description}"
     )
     if engagement_id is not None:
-        return [get_or_404(models.Engagement, engagement_id, db)]
+        return [await get_or_404(models.Engagement, engagement_id, db)]
 
-    query = db.query(models.Engagement)
+    query = select(models.Engagement)
     if name:
         query = query.filter(models.Engagement.name.contains(name))
     if description:
         query = query.filter(models.Engagement.description.contains(description))
-    query = query.order_by(models.Engagement.name.asc())
-    results = query.all()
+    if cursor or paginate:
+        results = await async_keyset_paginate(
+            db,
+            query,
+            models.Engagement,
+            limit,
+            cursor=cursor,
+            skip=skip,
+            response=response,
+        )
+    else:
+        # Unpaginated callers keep the whole table by name
+        results = (await db.scalars(query.order_by(models.Engagement.name.asc()))).all()
     logger.info(f"Found {len(results)} engagements")
     return results
 
 
 @router.put("/engagements/{engagement_id}", response_model=schemas.Engagement)
-def update_engagement(
+async def update_engagement(
     engagement_id: int,
     engagement: schemas.EngagementUpdate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(
         f"Updating engagement with id {engagement_id} with data: {engagement.dict(exclude_unset=True)}"
     )
-    db_engagement = get_or_404(models.Engagement, engagement_id, db)
+    db_engagement = await get_or_404(models.Engagement, engagement_id, db)
     for key, value in engagement.dict(exclude_unset=True).items():
         setattr(db_engagement, key, value)
-    db.commit()
-    db.refresh(db_engagement)
+    await db.commit()
+    principal_cache.clear()
+    await db.refresh(db_engagement)
     logger.info(f"Updated engagement with id {db_engagement.id}")
     return db_engagement
 
 
 # Role CRUD and Search
 @router.post("/roles/", response_model=schemas.Role)
-def create_role(
+async def create_role(
     role: schemas.RoleCreate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Creating role with data: {role.dict()}")
     db_role = models.Role(**role.dict())
     db.add(db_role)
-    db.commit()
-    db.refresh(db_role)
+    await db.commit()
+    await db.refresh(db_role)
     logger.info(f"Created role with id {db_role.id}")
     return db_role
 
 
 @router.get("/roles", response_model=List[schemas.Role])
-def read_roles(
+async def read_roles(
+    response: Response,
     role_id: Optional[int] = None,
     skip: int = 0,
-    limit: int = 10,
+    limit: int = MAX_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    paginate: bool = False,
     name: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(f"Reading roles with filters - id: {role_id}, name: {name}")
     if role_id is not None:
-        return [get_or_404(models.Role, role_id, db)]
+        return [await get_or_404(models.Role, role_id, db)]
 
-    query = db.query(models.Role)
+    query = select(models.Role)
     if name:
         query = query.filter(models.Role.name.contains(name))
-    query = query.order_by(models.Role.updated_at.desc())
-    results = query.all()
+    if cursor or paginate:
+        results = await async_keyset_paginate(
+            db, query, models.Role, limit, cursor=cursor, skip=skip, response=response
+        )
+    else:
+        # Unpaginated callers keep the whole table, last updated first
+        results = (
+            await db.scalars(query.order_by(models.Role.updated_at.desc()))
+        ).all()
     logger.info(f"Found {len(results)} roles")
     return results
 
 
 @router.put("/roles/{role_id}", response_model=schemas.Role)
-def update_role(
+async def update_role(
     role_id: int,
     role: schemas.RoleUpdate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(
         f"Updating role with id {role_id} with data: {role.dict(exclude_unset=True)}"
     )
-    db_role = get_or_404(models.Role, role_id, db)
+    db_role = await get_or_404(models.Role, role_id, db)
     for key, value in role.dict(exclude_unset=True).items():
         setattr(db_role, key, value)
-    db.commit()
-    db.refresh(db_role)
+    await db.commit()
+    principal_cache.clear()
+    await db.refresh(db_role)
     logger.info(f"Updated role with id {db_role.id}")
     return db_role
 
 
 # User CRUD and Search
 @router.post("/users/", response_model=schemas.User)
-def create_user(
+async def create_user(
     user_instance: schemas.UserCreate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Creating user with data: {user_instance.dict()}")
     db_user = models.User(**user_instance.dict())
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     logger.info(f"Created user with id {db_user.id}")
     return db_user
 
 
 @router.get("/users", response_model=List[schemas.User])
-def read_users(
+async def read_users(
+    response: Response,
     user_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = MAX_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    paginate: bool = False,
     email: Optional[str] = None,
     name: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading users with filters - id: {user_id}, email: {email}, name: {name}"
     )
     if user_id is not None:
-        return [get_or_404(models.User, user_id, db)]
+        return [await get_or_404(models.User, user_id, db)]
 
-    query = db.query(models.User)
+    query = select(models.User)
     if email:
         query = query.filter(models.User.email.contains(email))
     if name:
         query = query.filter(models.User.name.contains(name))
-    query = query.order_by(models.User.email.asc())
-    results = query.all()
+    if cursor or paginate:
+        results = await async_keyset_paginate(
+            db, query, models.User, limit, cursor=cursor, skip=skip, response=response
+        )
+    else:
+        # Unpaginated callers keep the whole table by email
+        results = (await db.scalars(query.order_by(models.User.email.asc()))).all()
     logger.info(f"Found {len(results)} users")
     return results
 
 
 @router.put("/users/{user_id}", response_model=schemas.User)
-def update_user(
+async def update_user(
     user_id: int,
     user: schemas.UserUpdate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(
         f"Updating user with id {user_id} with data: {user.dict(exclude_unset=True)}"
     )
-    db_user = get_or_404(models.User, user_id, db)
+    db_user = await get_or_404(models.User, user_id, db)
     for key, value in user.dict(exclude_unset=True).items():
         setattr(db_user, key, value)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    principal_cache.clear()
+    await db.refresh(db_user)
     logger.info(f"Updated user with id {db_user.id}")
     return db_user
 
 
 # Project CRUD and Search
 @router.post("/projects/", response_model=schemas.Project)
-def create_project(
+async def create_project(
     project: schemas.ProjectCreate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Creating project with data: {project.dict()}")
     db_project = models.Project(**project.dict())
     db.add(db_project)
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    await db.refresh(db_project)
     logger.info(f"Created project with id {db_project.id}")
     return db_project
 
 
 @router.get("/projects", response_model=List[schemas.Project])
-def read_projects(
+async def read_projects(
+    response: Response,
     project_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    paginate: bool = False,
     name: Optional[str] = None,
     description: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading projects with filters - id: {project_id}, name: {name}, description: {description}, skip: {skip}, limit: {limit}"
     )
     if project_id is not None:
-        return [get_or_404(models.Project, project_id, db)]
+        return [await get_or_404(models.Project, project_id, db)]
 
-    query = db.query(models.Project)
+    query = select(models.Project)
     if name:
         query = query.filter(models.Project.name.contains(name))
     if description:
         query = query.filter(models.Project.description.contains(description))
-    query = query.order_by(models.Project.name.asc()).offset(skip).limit(limit)
-    results = query.all()
+    if cursor or paginate:
+        results = await async_keyset_paginate(
+            db,
+            query,
+            models.Project,
+            limit,
+            cursor=cursor,
+            skip=skip,
+            response=response,
+        )
+    else:
+        # Unpaginated callers keep skip/limit by name
+        query = query.order_by(models.Project.name.asc()).offset(skip).limit(limit)
+        results = (await db.scalars(query)).all()
     logger.info(f"Found {len(results)} projects")
     return results
 
 
 @router.put("/projects/{project_id}", response_model=schemas.Project)
-def update_project(
+async def update_project(
     project_id: int,
     project: schemas.ProjectUpdate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(
         f"Updating project with id {project_id} with data: {project.dict(exclude_unset=True)}"
     )
-    db_project = get_or_404(models.Project, project_id, db)
+    db_project = await get_or_404(models.Project, project_id, db)
     for key, value in project.dict(exclude_unset=True).items():
         setattr(db_project, key, value)
-    db.commit()
-    db.refresh(db_project)
+    await db.commit()
+    principal_cache.clear()
+    await db.refresh(db_project)
     logger.info(f"Updated project with id {db_project.id}")
     return db_project
 
 
 # UserProjectRole CRUD and Search
 @router.post("/user_project_roles/", response_model=schemas.UserProjectRole)
-def create_user_project_role(
+async def create_user_project_role(
     user_project_role: schemas.UserProjectRoleCreate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Creating user project role with data: {user_project_role.dict()}")
     db_user_project_role = models.UserProjectRole(**user_project_role.dict())
     db.add(db_user_project_role)
-    db.commit()
-    db.refresh(db_user_project_role)
+    await db.commit()
+    principal_cache.clear()
+    await db.refresh(db_user_project_role)
     logger.info(f"Created user project role with id {db_user_project_role.id}")
     return db_user_project_role
 
 
 @router.get("/user_project_roles", response_model=List[schemas.UserProjectRole])
-def read_user_project_roles(
+async def read_user_project_roles(
+    response: Response,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
     user_id: Optional[int] = None,
     project_id: Optional[int] = None,
     role_id: Optional[int] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading user project roles with filters - user_id: {user_id}, project_id: {project_id}, role_id: {role_id}, skip: {skip}, limit: {limit}"
     )
-    query = db.query(models.UserProjectRole)
+    query = select(models.UserProjectRole)
     if user_id:
         query = query.filter(models.UserProjectRole.user_id == user_id)
     if project_id:
         query = query.filter(models.UserProjectRole.project_id == project_id)
     if role_id:
         query = query.filter(models.UserProjectRole.role_id == role_id)
-    query = (
-        query.order_by(models.UserProjectRole.updated_at.desc())
-        .offset(skip)
-        .limit(limit)
+    results = await async_keyset_paginate(
+        db,
+        query,
+        models.UserProjectRole,
+        limit,
+        cursor=cursor,
+        skip=skip,
+        response=response,
     )
-    results = query.all()
     logger.info(f"Found {len(results)} user project roles")
     return results
 
 
 @router.get("/batch_runs", response_model=List[schemas.BatchRun])
-def read_batch_runs(
+async def read_batch_runs(
+    response: Response,
     batch_run_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
     name: Optional[str] = None,
     input_type: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading batch runs with filters - id: {batch_run_id}, name: {name}, input_type: {input_type}, skip: {skip}, limit: {limit}"
     )
     if batch_run_id is not None:
-        return [get_or_404(models.BatchRun, batch_run_id, db)]
+        return [await get_or_404(models.BatchRun, batch_run_id, db)]
 
-    query = db.query(models.BatchRun)
+    query = select(models.BatchRun)
     if name:
         query = query.filter(models.BatchRun.name.contains(name))
     if input_type:
         query = query.filter(models.BatchRun.input_type.contains(input_type))
-    query = query.order_by(models.BatchRun.updated_at.desc()).offset(skip).limit(limit)
-    results = query.all()
+    results = await async_keyset_paginate(
+        db, query, models.BatchRun, limit, cursor=cursor, skip=skip, response=response
+    )
     logger.info(f"Found {len(results)} batch runs")
     return results
 
 
+# Length of a sha256 hex digest, the form of every stored input_hash
+INPUT_HASH_LENGTH = 64
+
+
+def input_hash_filter(input_hash: str):
+    """
+    Runs whose input_hash contains input_hash. A full digest can only be
+    contained in itself, so it is compared exactly and seeks
+    idx_run_input_hash.
+    """
+    if len(input_hash) == INPUT_HASH_LENGTH:
+        return models.Run.input_hash == input_hash
+    return models.Run.input_hash.contains(input_hash)
+
+
 @router.get("/runs", response_model=List[schemas.Run])
-def read_runs(
+async def read_runs(
+    response: Response,
     run_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
     status: Optional[str] = None,
     input_hash: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading runs with filters - id: {run_id}, status: {status}, input_hash: {input_hash}, skip: {skip}, limit: {limit}"
     )
     if run_id is not None:
-        return [get_or_404(models.Run, run_id, db)]
-
-    query = db.query(models.Run)
-    if status:
-        query = query.filter(models.Run.status.contains(status))
-    if input_hash:
-        query = query.filter(models.Run.input_hash.contains(input_hash))
-    query = query.order_by(models.Run.updated_at.desc()).offset(skip).limit(limit)
-    results = query.all()
-    logger.info(f"Found {len(results)} runs")
-    return results
+        results = [await get_or_404(models.Run, run_id, db)]
+    else:
+        query = select(models.Run)
+        if status:
+            query = query.filter(models.Run.status.contains(status))
+        if input_hash:
+            query = query.filter(input_hash_filter(input_hash))
+        results = await async_keyset_paginate(
+            db, query, models.Run, limit, cursor=cursor, skip=skip, response=response
+        )
+        logger.info(f"Found {len(results)} runs")
+    return await blob_store.aload_rows(results, "message", "message_blob", session=db)
 
 
 @router.get("/evaluations", response_model=List[schemas.Evaluation])
-def read_evaluations(
+async def read_evaluations(
+    response: Response,
     evaluation_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
     name: Optional[str] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading evaluations with filters - id: {evaluation_id}, name: {name}, status: {status}, skip: {skip}, limit: {limit}"
     )
     if evaluation_id is not None:
-        return [get_or_404(models.Evaluation, evaluation_id, db)]
-
-    query = db.query(models.Evaluation)
-    if name:
-        query = query.filter(models.Evaluation.name.contains(name))
-    if status:
-        query = query.filter(models.Evaluation.status.contains(status))
-    query = (
-        query.order_by(models.Evaluation.updated_at.desc()).offset(skip).limit(limit)
-    )
-    results = query.all()
-    logger.info(f"Found {len(results)} evaluations")
-    return results
+        results = [await get_or_404(models.Evaluation, evaluation_id, db)]
+    else:
+        query = select(models.Evaluation)
+        if name:
+            query = query.filter(models.Evaluation.name.contains(name))
+        if status:
+            query = query.filter(models.Evaluation.status.contains(status))
+        results = await async_keyset_paginate(
+            db,
+            query,
+            models.Evaluation,
+            limit,
+            cursor=cursor,
+            skip=skip,
+            response=response,
+        )
+        logger.info(f"Found {len(results)} evaluations")
+    return await blob_store.aload_rows(results, "output", "output_blob", session=db)
 
 
 # EvaluatorType CRUD and Search
 @router.post("/evaluator_types/", response_model=schemas.EvaluatorType)
-def create_evaluator_type(
+async def create_evaluator_type(
     evaluator_type: schemas.EvaluatorTypeCreate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Creating evaluator type with data: {evaluator_type}")
     db_evaluator_type = models.EvaluatorType(**evaluator_type.dict())
     db.add(db_evaluator_type)
-    db.commit()
-    db.refresh(db_evaluator_type)
+    await db.commit()
+    await db.refresh(db_evaluator_type)
     logger.info(f"Created evaluator type with ID: {db_evaluator_type.id}")
     return db_evaluator_type
 
 
 @router.get("/evaluator_types", response_model=List[schemas.EvaluatorType])
-def read_evaluator_types(
+async def read_evaluator_types(
+    response: Response,
     evaluator_type_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
     name: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading evaluator types with filters - id: {evaluator_type_id}, name: {name}, skip: {skip}, limit: {limit}"
     )
     if evaluator_type_id is not None:
-        return [get_or_404(models.EvaluatorType, evaluator_type_id, db)]
+        return [await get_or_404(models.EvaluatorType, evaluator_type_id, db)]
 
-    query = db.query(models.EvaluatorType)
+    query = select(models.EvaluatorType)
     if name:
         query = query.filter(models.EvaluatorType.name.contains(name))
-    query = (
-        query.order_by(models.EvaluatorType.updated_at.desc()).offset(skip).limit(limit)
+    results = await async_keyset_paginate(
+        db,
+        query,
+        models.EvaluatorType,
+        limit,
+        cursor=cursor,
+        skip=skip,
+        response=response,
     )
-    results = query.all()
     logger.info(f"Found {len(results)} evaluator types")
     return results
 
@@ -429,282 +531,211 @@ def read_evaluator_types(
 @router.put(
     "/evaluator_types/{evaluator_type_id}", response_model=schemas.EvaluatorType
 )
-def update_evaluator_type(
+async def update_evaluator_type(
     evaluator_type_id: int,
     evaluator_type: schemas.EvaluatorTypeUpdate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(
         f"Updating evaluator type with ID: {evaluator_type_id} with data: {evaluator_type}"
     )
-    db_evaluator_type = get_or_404(models.EvaluatorType, evaluator_type_id, db)
+    db_evaluator_type = await get_or_404(models.EvaluatorType, evaluator_type_id, db)
     for key, value in evaluator_type.dict(exclude_unset=True).items():
         setattr(db_evaluator_type, key, value)
-    db.commit()
-    db.refresh(db_evaluator_type)
+    await db.commit()
+    await db.refresh(db_evaluator_type)
     logger.info(f"Updated evaluator type with ID: {db_evaluator_type.id}")
     return db_evaluator_type
 
 
 # Evaluator CRUD and Search
 @router.post("/evaluators/", response_model=schemas.Evaluator)
-def create_evaluator(
+async def create_evaluator(
     evaluator: schemas.EvaluatorCreate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Creating evaluator with data: {evaluator}")
     db_evaluator = models.Evaluator(**evaluator.dict())
     db.add(db_evaluator)
-    db.commit()
-    db.refresh(db_evaluator)
+    await db.commit()
+    await db.refresh(db_evaluator)
     logger.info(f"Created evaluator with ID: {db_evaluator.id}")
     return db_evaluator
 
 
 @router.get("/evaluators", response_model=List[schemas.Evaluator])
-def read_evaluators(
+async def read_evaluators(
+    response: Response,
     evaluator_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
     name: Optional[str] = None,
     llm_provider: Optional[str] = None,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(
         f"Reading evaluators with filters - id: {evaluator_id}, name: {name}, llm_provider: {llm_provider}, skip: {skip}, limit: {limit}"
     )
     if evaluator_id is not None:
-        return [get_or_404(models.Evaluator, evaluator_id, db)]
+        return [await get_or_404(models.Evaluator, evaluator_id, db)]
 
-    query = db.query(models.Evaluator)
+    query = select(models.Evaluator)
     if name:
         query = query.filter(models.Evaluator.name.contains(name))
     if llm_provider:
         query = query.filter(models.Evaluator.llm_provider.contains(llm_provider))
-    query = query.order_by(models.Evaluator.updated_at.desc()).offset(skip).limit(limit)
-    results = query.all()
+    results = await async_keyset_paginate(
+        db, query, models.Evaluator, limit, cursor=cursor, skip=skip, response=response
+    )
     logger.info(f"Found {len(results)} evaluators")
     return results
 
 
 @router.put("/evaluators/{evaluator_id}", response_model=schemas.Evaluator)
-def update_evaluator(
+async def update_evaluator(
     evaluator_id: int,
     evaluator: schemas.EvaluatorUpdate,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     logger.debug(f"Updating evaluator with ID: {evaluator_id} with data: {evaluator}")
-    db_evaluator = get_or_404(models.Evaluator, evaluator_id, db)
+    db_evaluator = await get_or_404(models.Evaluator, evaluator_id, db)
     for key, value in evaluator.dict(exclude_unset=True).items():
         setattr(db_evaluator, key, value)
-    db.commit()
-    db.refresh(db_evaluator)
+    await db.commit()
+    await db.refresh(db_evaluator)
     logger.info(f"Updated evaluator with ID: {db_evaluator.id}")
     return db_evaluator
 
 
 @router.get("/stats/{what}/{what_id}", response_model=schemas.StatsResponse)
-def get_stats(
+async def get_stats(
     what: str,
     what_id: int,
-    db: Session = Depends(get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     logger.debug(f"Getting stats for {what} with ID: {what_id}")
     if what == "engagement":
-        return get_engagement_stats(what_id, db)
+        return await get_engagement_stats(what_id, db)
     elif what == "project":
-        return get_project_stats(what_id, db)
+        return await get_project_stats(what_id, db)
     elif what == "batch":
-        return get_batch_stats(what_id, db)
+        return await get_batch_stats(what_id, db)
     elif what == "run":
-        return get_run_stats(what_id, db)
+        return await get_run_stats(what_id, db)
     elif what == "evaluation":
-        return get_evaluation_stats(what_id, db)
+        return await get_evaluation_stats(what_id, db)
     elif what == "evaluator":
-        return get_evaluator_stats(what_id, db)
+        return await get_evaluator_stats(what_id, db)
     else:
         logger.error(f"Invalid stats type: {what}")
         raise HTTPException(status_code=400, detail="Invalid stats type")
 
 
-def get_evaluator_stats(evaluator_id: int, db: Session) -> dict[str, Any]:
+async def get_evaluator_stats(evaluator_id: int, db: AsyncSession) -> dict[str, Any]:
     logger.debug(f"Getting evaluator stats for ID: {evaluator_id}")
-    evaluator = db.query(models.Evaluator).filter_by(id=evaluator_id).first()
+    evaluator = await db.get(models.Evaluator, evaluator_id)
     if not evaluator:
         logger.error(f"Evaluator not found with ID: {evaluator_id}")
         raise HTTPException(status_code=404, detail="Item not found")
 
-    evaluation_query = (
-        db.query(
-            func.count(models.Evaluation.id).label("evaluation_count"),
-            func.coalesce(func.sum(models.Evaluation.prompt_tokens_used), 0).label(
-                "total_prompt_tokens"
-            ),
-            func.coalesce(func.sum(models.Evaluation.generate_tokens_used), 0).label(
-                "total_generate_tokens"
-            ),
-        )
-        .filter_by(evaluator_id=evaluator_id)
-        .first()
-    )
-
-    evaluation_count = evaluation_query.evaluation_count
-    total_prompt_tokens = evaluation_query.total_prompt_tokens
-    total_generate_tokens = evaluation_query.total_generate_tokens
-
-    run_count = (
-        db.query(func.count(models.Run.id.distinct()))
-        .join(models.Evaluation)
-        .filter(models.Evaluation.evaluator_id == evaluator_id)
-        .scalar()
-    )
-
-    batch_count = (
-        db.query(func.count(models.BatchRun.id.distinct()))
-        .join(models.Run)
-        .join(models.Evaluation)
-        .filter(models.Evaluation.evaluator_id == evaluator_id)
-        .scalar()
-    )
-
-    project_count = (
-        db.query(func.count(models.Project.id.distinct()))
-        .join(models.UserProjectRole)
-        .join(models.Run)
-        .join(models.Evaluation)
-        .filter(models.Evaluation.evaluator_id == evaluator_id)
-        .scalar()
-    )
-
-    engagements_count = (
-        db.query(func.count(models.Engagement.id.distinct()))
-        .join(models.Project)
-        .join(models.UserProjectRole)
-        .join(models.Run)
-        .join(models.Evaluation)
-        .filter(models.Evaluation.evaluator_id == evaluator_id)
-        .scalar()
-    )
-
+    totals = await async_read_rollup_totals(db, evaluator_id=evaluator_id)
     stats = {
         "evaluator_id": evaluator.id,
         "name": evaluator.name,
         "description": evaluator.description,
-        "engagements_count": engagements_count,
-        "projects_count": project_count,
-        "batch_count": batch_count,
-        "run_count": run_count,
-        "evaluation_count": evaluation_count,
-        "total_prompt_tokens": total_prompt_tokens,
-        "total_generate_tokens": total_generate_tokens,
+        "engagements_count": await async_count_distinct_rollup(
+            db, "engagement_id", evaluator_id=evaluator_id
+        ),
+        "projects_count": await async_count_distinct_rollup(
+            db, "project_id", evaluator_id=evaluator_id
+        ),
+        "batch_count": await db.scalar(batch_count_select(evaluator_id=evaluator_id)),
+        "run_count": totals["run_count"],
+        "evaluation_count": totals["evaluation_count"],
+        "total_prompt_tokens": totals["total_prompt_tokens"],
+        "total_generate_tokens": totals["total_generate_tokens"],
     }
     logger.info(f"Evaluator stats: {stats}")
     return stats
 
 
-def get_engagement_stats(engagement_id: int, db: Session) -> dict[str, Any]:
+async def get_engagement_stats(engagement_id: int, db: AsyncSession) -> dict[str, Any]:
     logger.debug(f"Getting engagement stats for ID: {engagement_id}")
-    engagement = db.query(models.Engagement).filter_by(id=engagement_id).first()
+    engagement = await db.get(models.Engagement, engagement_id)
     if not engagement:
         logger.error(f"Engagement not found with ID: {engagement_id}")
         raise HTTPException(status_code=404, detail="Item not found")
 
-    project_ids = (
-        db.query(models.Project.id).filter_by(engagement_id=engagement_id).all()
-    )
-    project_ids = [project_id[0] for project_id in project_ids]
-
-    batch_count = (
-        db.query(func.count(models.BatchRun.id.distinct()))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id.in_(project_ids))
-        .scalar()
-    )
-
-    run_count = (
-        db.query(func.count(models.Run.id.distinct()))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id.in_(project_ids))
-        .scalar()
-    )
-
-    evaluation_count = (
-        db.query(func.count(models.Evaluation.id.distinct()))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id.in_(project_ids))
-        .scalar()
-    )
-
-    total_prompt_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.prompt_tokens_used), 0))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id.in_(project_ids))
-        .scalar()
+    projects_count = await db.scalar(
+        select(func.count(models.Project.id)).filter_by(engagement_id=engagement_id)
     )
-
-    total_generate_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.generate_tokens_used), 0))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id.in_(project_ids))
-        .scalar()
+    totals = await async_read_rollup_totals(
+        db, engagement_id=engagement_id, evaluator_id=ALL_EVALUATORS
     )
 
     stats = {
         "engagement_id": engagement.id,
         "name": engagement.name,
         "description": engagement.description,
-        "projects_count": len(project_ids),
-        "batch_count": batch_count,
-        "run_count": run_count,
-        "evaluation_count": evaluation_count,
-        "total_prompt_tokens": total_prompt_tokens,
-        "total_generate_tokens": total_generate_tokens,
+        "projects_count": projects_count,
+        "batch_count": await db.scalar(batch_count_select(engagement_id=engagement_id)),
+        "run_count": totals["run_count"],
+        "evaluation_count": totals["evaluation_count"],
+        "total_prompt_tokens": totals["total_prompt_tokens"],
+        "total_generate_tokens": totals["total_generate_tokens"],
     }
     logger.info(f"Engagement stats: {stats}")
     return stats
 
 
-def get_run_stats(run_id: int, db: Session) -> dict[str, Any]:
+def evaluation_totals_select():
+    return select(
+        func.count(models.Evaluation.id.distinct()).label("evaluation_count"),
+        func.coalesce(func.sum(models.Evaluation.prompt_tokens_used), 0).label(
+            "total_prompt_tokens"
+        ),
+        func.coalesce(func.sum(models.Evaluation.generate_tokens_used), 0).label(
+            "total_generate_tokens"
+        ),
+    )
+
+
+def run_totals_select(run_id: int):
+    return evaluation_totals_select().filter(models.Evaluation.run_id == run_id)
+
+
+def batch_totals_select(batch_id: int):
+    return (
+        evaluation_totals_select()
+        .join(models.Run)
+        .filter(models.Run.batch_run_id == batch_id)
+    )
+
+
+async def get_run_stats(run_id: int, db: AsyncSession) -> dict[str, Any]:
     logger.debug(f"Fetching run stats for run_id: {run_id}")
-    run = db.query(models.Run).filter_by(id=run_id).first()
+    run = await db.get(models.Run, run_id)
     if not run:
         logger.error(f"Run with id {run_id} not found")
         raise HTTPException(status_code=404, detail="Item not found")
 
-    evaluation_count = (
-        db.query(func.count(models.Evaluation.id.distinct()))
-        .filter_by(run_id=run_id)
-        .scalar()
-    )
-    logger.debug(f"Evaluation count for run_id {run_id}: {evaluation_count}")
-
-    total_prompt_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.prompt_tokens_used), 0))
-        .filter_by(run_id=run_id)
-        .scalar()
-    )
-    logger.debug(f"Total prompt tokens for run_id {run_id}: {total_prompt_tokens}")
-
-    total_generate_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.generate_tokens_used), 0))
-        .filter_by(run_id=run_id)
-        .scalar()
-    )
-    logger.debug(f"Total generate tokens for run_id {run_id}: {total_generate_tokens}")
+    totals = (await db.execute(run_totals_select(run_id))).mappings().one()
+    logger.debug(f"Evaluation totals for run_id {run_id}: {dict(totals)}")
 
     stats = {
         "run_id": run.id,
-        "evaluation_count": evaluation_count,
-        "total_prompt_tokens": total_prompt_tokens,
-        "total_generate_tokens": total_generate_tokens,
+        "evaluation_count": totals["evaluation_count"],
+        "total_prompt_tokens": totals["total_prompt_tokens"],
+        "total_generate_tokens": totals["total_generate_tokens"],
     }
     logger.info(f"Run stats for run_id {run_id}: {stats}")
     return stats
 
 
-def get_evaluation_stats(evaluation_id: int, db: Session) -> dict[str, Any]:
+async def get_evaluation_stats(evaluation_id: int, db: AsyncSession) -> dict[str, Any]:
     logger.debug(f"Fetching evaluation stats for evaluation_id: {evaluation_id}")
-    evaluation = db.query(models.Evaluation).filter_by(id=evaluation_id).first()
+    evaluation = await db.get(models.Evaluation, evaluation_id)
     if not evaluation:
         logger.error(f"Evaluation with id {evaluation_id} not found")
         raise HTTPException(status_code=404, detail="Item not found")
@@ -719,126 +750,62 @@ def get_evaluation_stats(evaluation_id: int, db: Session) -> dict[str, Any]:
     return stats
 
 
-def get_project_stats(project_id: int, db: Session) -> dict[str, Any]:
+async def get_project_stats(project_id: int, db: AsyncSession) -> dict[str, Any]:
     logger.debug(f"Fetching project stats for project_id: {project_id}")
-    project = db.query(models.Project).filter_by(id=project_id).first()
+    project = await db.get(models.Project, project_id)
     if not project:
         logger.error(f"Project with id {project_id} not found")
         raise HTTPException(status_code=404, detail="Item not found")
 
-    batch_count = (
-        db.query(func.count(models.BatchRun.id.distinct()))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id == project_id)
-        .scalar()
-    )
-    logger.debug(f"Batch count for project_id {project_id}: {batch_count}")
-
-    run_count = (
-        db.query(func.count(models.Run.id.distinct()))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id == project_id)
-        .scalar()
-    )
-    logger.debug(f"Run count for project_id {project_id}: {run_count}")
-
-    evaluation_count = (
-        db.query(func.count(models.Evaluation.id.distinct()))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id == project_id)
-        .scalar()
-    )
-    logger.debug(f"Evaluation count for project_id {project_id}: {evaluation_count}")
-
-    total_prompt_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.prompt_tokens_used), 0))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id == project_id)
-        .scalar()
-    )
-    logger.debug(
-        f"Total prompt tokens for project_id {project_id}: {total_prompt_tokens}"
-    )
-
-    total_generate_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.generate_tokens_used), 0))
-        .join(models.UserProjectRole)
-        .filter(models.UserProjectRole.project_id == project_id)
-        .scalar()
-    )
-    logger.debug(
-        f"Total generate tokens for project_id {project_id}: {total_generate_tokens}"
+    totals = await async_read_rollup_totals(
+        db, project_id=project_id, evaluator_id=ALL_EVALUATORS
     )
 
     stats = {
         "project_id": project.id,
         "name": project.name,
         "description": project.description,
-        "batch_count": batch_count,
-        "run_count": run_count,
-        "evaluation_count": evaluation_count,
-        "total_prompt_tokens": total_prompt_tokens,
-        "total_generate_tokens": total_generate_tokens,
+        "batch_count": await db.scalar(batch_count_select(project_id=project_id)),
+        "run_count": totals["run_count"],
+        "evaluation_count": totals["evaluation_count"],
+        "total_prompt_tokens": totals["total_prompt_tokens"],
+        "total_generate_tokens": totals["total_generate_tokens"],
     }
     logger.info(f"Project stats for project_id {project_id}: {stats}")
     return stats
 
 
-def get_batch_stats(batch_id: int, db: Session) -> dict[str, Any]:
+async def get_batch_stats(batch_id: int, db: AsyncSession) -> dict[str, Any]:
     logger.debug(f"Fetching batch stats for batch_id: {batch_id}")
-    batch = db.query(models.BatchRun).filter_by(id=batch_id).first()
+    batch = await db.get(models.BatchRun, batch_id)
     if not batch:
         logger.error(f"Batch with id {batch_id} not found")
         raise HTTPException(status_code=404, detail="Item not found")
 
-    run_count = (
-        db.query(func.count(models.Run.id.distinct()))
-        .filter_by(batch_run_id=batch_id)
-        .scalar()
+    run_count = await db.scalar(
+        select(func.count(models.Run.id.distinct())).filter_by(batch_run_id=batch_id)
     )
     logger.debug(f"Run count for batch_id {batch_id}: {run_count}")
 
-    evaluation_count = (
-        db.query(func.count(models.Evaluation.id.distinct()))
-        .join(models.Run)
-        .filter(models.Run.batch_run_id == batch_id)
-        .scalar()
-    )
-    logger.debug(f"Evaluation count for batch_id {batch_id}: {evaluation_count}")
-
-    total_prompt_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.prompt_tokens_used), 0))
-        .join(models.Run)
-        .filter(models.Run.batch_run_id == batch_id)
-        .scalar()
-    )
-    logger.debug(f"Total prompt tokens for batch_id {batch_id}: {total_prompt_tokens}")
-
-    total_generate_tokens = (
-        db.query(func.coalesce(func.sum(models.Evaluation.generate_tokens_used), 0))
-        .join(models.Run)
-        .filter(models.Run.batch_run_id == batch_id)
-        .scalar()
-    )
-    logger.debug(
-        f"Total generate tokens for batch_id {batch_id}: {total_generate_tokens}"
-    )
+    totals = (await db.execute(batch_totals_select(batch_id))).mappings().one()
+    logger.debug(f"Evaluation totals for batch_id {batch_id}: {dict(totals)}")
 
     stats = {
         "batch_id": batch.id,
         "name": batch.name,
         "run_count": run_count,
-        "evaluation_count": evaluation_count,
-        "total_prompt_tokens": total_prompt_tokens,
-        "total_generate_tokens": total_generate_tokens,
+        "evaluation_count": totals["evaluation_count"],
+        "total_prompt_tokens": totals["total_prompt_tokens"],
+        "total_generate_tokens": totals["total_generate_tokens"],
     }
     logger.info(f"Batch stats for batch_id {batch_id}: {stats}")
     return stats
 
 
 @router.post("/onboard", response_model=schemas.OnboardUserResponse)
-def onboard_user(
-    onboard_data: schemas.OnboardUserRequest, db: Session = Depends(get_db_gen)
+async def onboard_user(
+    onboard_data: schemas.OnboardUserRequest,
+    db: AsyncSession = Depends(async_get_db_session),
 ):
     try:
         logger.debug(f"Onboarding user with data: {onboard_data}")
@@ -863,8 +830,8 @@ def onboard_user(
             logger.debug(f"Creating new project with name: {new_project_name}")
             project = models.Project(name=new_project_name, engagement_id=engagement_id)
             db.add(project)
-            db.commit()
-            db.refresh(project)
+            await db.commit()
+            await db.refresh(project)
             project_id = project.id
 
         # Handle the creation of a new user if needed
@@ -872,8 +839,8 @@ def onboard_user(
             logger.debug(f"Creating new user with email: {new_user_email}")
             user = models.User(name=new_user_name, email=new_user_email)
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
             payload = {
                 "user_email": new_user_email,
                 "env": env_vars["ENVIRONMENT"],
@@ -885,10 +852,10 @@ def onboard_user(
             response_dict.update({"token": user.api_token})
 
         # Check if the association between user, project, and role already exists
-        existing_association = (
-            db.query(models.UserProjectRole)
-            .filter_by(user_id=user_id, project_id=project_id, role_id=role_id)
-            .first()
+        existing_association = await db.scalar(
+            select(models.UserProjectRole).filter_by(
+                user_id=user_id, project_id=project_id, role_id=role_id
+            )
         )
         response_dict.update({"message": "existing"})
         # If the association does not exist, create it
@@ -900,7 +867,8 @@ def onboard_user(
                 user_id=user_id, project_id=project_id, role_id=role_id
             )
             db.add(association)
-            db.commit()
+            await db.commit()
+            principal_cache.clear()
             response_dict.update({"message": "new"})
 
         response_dict.update({"status": "success"})
@@ -1,6 +1,5 @@
 from datetime import timedelta, date
 import json
-from sqlite3 import IntegrityError
 from typing import Any, Dict, List, Optional
 from app.db_api.models.models import (
     Engagement,
@@ -12,12 +11,22 @@ from app.db_api.models.models import (
     UserProjectRole,
 )
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import desc, func, and_, or_, case
+from sqlalchemy import desc, func, and_, or_, case, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, load_only
 
 from app.db_api import database
+from app.db_api.replicas import async_get_read_db_session
 from app.logging_config import logger
-from app.schemas.pricing import LLMPricingCreate, LLMPricingResponse, TokenUsageData
+from app.schemas.pricing import (
+    LLMCallStats,
+    LLMPricingCreate,
+    LLMPricingResponse,
+    TokenUsageData,
+)
+from app.utils.llm_ledger import STATS_GROUPS, llm_call_stats_select
+from app.utils.pricing_index import pricing_index
 from common.utils import load_env
 
 env_vars = load_env()
@@ -27,16 +36,16 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[LLMPricingResponse])
-def get_llm_pricing(
+async def get_llm_pricing(
     skip: int = 0,
     limit: int = 100,
     provider: Optional[str] = None,
     model: Optional[str] = None,
     version: Optional[str] = None,
     active_only: bool = False,
-    db: Session = Depends(database.get_db_gen),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
-    query = db.query(LLMPricing)
+    query = select(LLMPricing)
 
     if provider:
         query = query.filter(LLMPricing.provider == provider)
@@ -48,29 +57,32 @@ def get_llm_pricing(
         query = query.filter(LLMPricing.effective_to.is_(None))
 
     return (
-        query.order_by(
-            LLMPricing.provider,
-            LLMPricing.model,
-            LLMPricing.version,
-            LLMPricing.effective_from.desc(),
+        await db.scalars(
+            query.order_by(
+                LLMPricing.provider,
+                LLMPricing.model,
+                LLMPricing.version,
+                LLMPricing.effective_from.desc(),
+            )
+            .offset(skip)
+            .limit(limit)
         )
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    ).all()
 
 
 @router.get("/provider-models", response_model=Dict[str, List[str]])
-def get_provider_models(db: Session = Depends(database.get_db_gen)):
+async def get_provider_models(
+    db: AsyncSession = Depends(async_get_read_db_session),
+):
     # Query to get distinct providers and models
     query = (
-        db.query(LLMPricing.provider, LLMPricing.model)
+        select(LLMPricing.provider, LLMPricing.model)
         .distinct()
         .order_by(LLMPricing.provider, LLMPricing.model)
     )
 
     # Execute the query and fetch all results
-    results = query.all()
+    results = (await db.execute(query)).all()
 
     # Create a dictionary to store the provider-model mapping
     provider_models = {}
@@ -85,19 +97,18 @@ def get_provider_models(db: Session = Depends(database.get_db_gen)):
 
 
 @router.post("/create/", response_model=LLMPricingResponse)
-def create_llm_pricing(
-    pricing: LLMPricingCreate, db: Session = Depends(database.get_db_gen)
+async def create_llm_pricing(
+    pricing: LLMPricingCreate,
+    db: AsyncSession = Depends(database.async_get_db_session),
 ):
     # Check if there's an existing active pricing for the same provider, model, and version
-    existing_pricing = (
-        db.query(LLMPricing)
-        .filter(
+    existing_pricing = await db.scalar(
+        select(LLMPricing).filter(
             LLMPricing.provider == pricing.provider,
             LLMPricing.model == pricing.model,
             LLMPricing.version == pricing.version,
             LLMPricing.effective_to.is_(None),
         )
-        .first()
     )
 
     if existing_pricing:
@@ -109,122 +120,58 @@ def create_llm_pricing(
     db.add(db_pricing)
 
     try:
-        db.commit()
-        db.refresh(db_pricing)
+        await db.commit()
+        await db.refresh(db_pricing)
+        pricing_index.invalidate()
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Invalid data or duplicate entry")
 
     return db_pricing
 
 
-@router.get("/token-usage", response_model=List[TokenUsageData])
-async def get_token_usage(
-    engagement_id: str = Query(..., description="Engagement ID"),
-    project_id: Optional[str] = Query(None, description="Project ID"),
-    start: date = Query(..., description="Start date"),
-    end: date = Query(..., description="End date"),
-    db: Session = Depends(database.get_db_gen),
-):
-    # Subquery to get the latest pricing for each model
-    latest_pricing = (
-        db.query(
-            LLMPricing.model,
-            func.max(LLMPricing.effective_from).label("max_effective_from"),
-        )
-        .filter(LLMPricing.effective_from <= end)
-        .group_by(LLMPricing.model)
-        .subquery()
-    )
-
-    # Main query
+def token_usage_select(engagement_id, project_id, start: date, end: date):
+    # Cost, provider and model are stamped on each evaluation when it is saved
+    # (app.utils.pricing_index), so this is an indexed range sum.
     query = (
-        db.query(
+        select(
             func.date(Evaluation.created_at).label("date"),
-            func.any_value(
-                case(
-                    (
-                        Evaluation.evaluator_config_override.isnot(None),
-                        func.json_unquote(
-                            func.json_extract(
-                                Evaluation.evaluator_config_override,
-                                "$.llm_config.provider",
-                            )
-                        ),
-                    ),
-                    else_=Evaluator.llm_provider,
-                )
-            ).label("provider"),
-            func.any_value(
-                case(
-                    (
-                        Evaluation.evaluator_config_override.isnot(None),
-                        func.json_unquote(
-                            func.json_extract(
-                                Evaluation.evaluator_config_override,
-                                "$.llm_config.model",
-                            )
-                        ),
-                    ),
-                    else_=Evaluator.llm_model,
-                )
-            ).label("model"),
+            func.any_value(Evaluation.llm_provider).label("provider"),
+            func.any_value(Evaluation.llm_model).label("model"),
             func.sum(Evaluation.prompt_tokens_used).label("input_tokens"),
             func.sum(Evaluation.generate_tokens_used).label("output_tokens"),
-            func.sum(
-                case(
-                    (
-                        Evaluation.evaluator_config_override.isnot(None),
-                        (
-                            Evaluation.prompt_tokens_used
-                            * LLMPricing.input_price_per_million_tokens
-                            / 1000000
-                        )
-                        + (
-                            Evaluation.generate_tokens_used
-                            * LLMPricing.output_price_per_million_tokens
-                            / 1000000
-                        ),
-                    ),
-                    else_=(
-                        Evaluation.prompt_tokens_used
-                        * LLMPricing.input_price_per_million_tokens
-                        / 1000000
-                    )
-                    + (
-                        Evaluation.generate_tokens_used
-                        * LLMPricing.output_price_per_million_tokens
-                        / 1000000
-                    ),
-                )
-            ).label("total_cost"),
+            func.sum(Evaluation.cost).label("total_cost"),
         )
-        .join(Evaluator, Evaluation.evaluator_id == Evaluator.id)
         .join(UserProjectRole, Evaluation.user_project_role_id == UserProjectRole.id)
         .join(Project, UserProjectRole.project_id == Project.id)
-        .join(latest_pricing, latest_pricing.c.model == Evaluator.llm_model)
-        .join(
-            LLMPricing,
-            and_(
-                LLMPricing.model == latest_pricing.c.model,
-                LLMPricing.effective_from == latest_pricing.c.max_effective_from,
-            ),
-        )
         .filter(
             Project.engagement_id == engagement_id,
-            func.date(Evaluation.created_at).between(start, end),
+            Evaluation.created_at >= start,
+            Evaluation.created_at < end + timedelta(days=1),
+            Evaluation.cost.isnot(None),
         )
     )
 
     if project_id:
         query = query.filter(Project.id == project_id)
 
-    evaluations = (
-        query.group_by(func.date(Evaluation.created_at))
-        .order_by(func.date(Evaluation.created_at))
-        .all()
+    return query.group_by(func.date(Evaluation.created_at)).order_by(
+        func.date(Evaluation.created_at)
     )
 
+
+@router.get("/token-usage", response_model=List[TokenUsageData])
+async def get_token_usage(
+    engagement_id: str = Query(..., description="Engagement ID"),
+    project_id: Optional[str] = Query(None, description="Project ID"),
+    start: date = Query(..., description="Start date"),
+    end: date = Query(..., description="End date"),
+    db: AsyncSession = Depends(async_get_read_db_session),
+):
+    evaluations = (
+        await db.execute(token_usage_select(engagement_id, project_id, start, end))
+    ).all()
+
     if not evaluations:
         raise HTTPException(
             status_code=404,
@@ -244,3 +191,30 @@ async def get_token_usage(
     ]
 
     return result
+
+
+@router.get("/llm-calls", response_model=List[LLMCallStats])
+async def get_llm_call_stats(
+    group_by: str = Query(
+        "evaluator,model",
+        description=f"Comma separated of {', '.join(STATS_GROUPS)}",
+    ),
+    run_id: Optional[int] = Query(None, description="Run ID"),
+    evaluator: Optional[str] = Query(None, description="Evaluator name"),
+    engagement: Optional[str] = Query(None, description="Engagement name"),
+    start: Optional[date] = Query(None, description="Start date"),
+    end: Optional[date] = Query(None, description="End date"),
+    db: AsyncSession = Depends(async_get_read_db_session),
+):
+    # Attempts, failovers, latency and cost of model calls, from the call
+    # ledger (llm_failover.ledger) drained into llm_call
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in groups if name not in STATS_GROUPS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown group_by columns: {', '.join(unknown)}"
+        )
+    rows = await db.execute(
+        llm_call_stats_select(groups, run_id, evaluator, engagement, start, end)
+    )
+    return [dict(row._mapping) for row in rows]
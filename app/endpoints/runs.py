@@ -1,5 +1,3 @@
-import hashlib
-import json
 import traceback
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
@@ -9,6 +7,7 @@ from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from app.db_api import database, models
+from app.db_api.blob_store import blob_store
 from app.db_api.database import get_db_ctx, get_db_ctx_manual
 from app.logging_config import logger
 from app.pydantic_models import (
@@ -30,6 +29,7 @@ from common.pubsub_queue import (
     create_stage_pubsub_messages,
     publish_messages,
 )
+from common.serialization import compute_input_hash
 from common.utils import load_env
 
 env_vars = load_env()
@@ -205,10 +205,9 @@ def create_run_and_evaluations(req: BatchRunRequest, user=None) -> dict:
     def process_input_item(input_item, store_input):
         with get_db_ctx_manual() as db:
             try:
-                input_data_json = json.dumps(input_item, sort_keys=True)
-                input_data_hash = hashlib.sha256(
-                    (input_data_json + str(req.input_type)).encode("utf-8")
-                ).hexdigest()
+                input_data_json, input_data_hash = compute_input_hash(
+                    input_item, req.input_type
+                )
 
                 new_run = models.Run(
                     user_project_role_id=user_project_obj_id,
@@ -222,7 +221,12 @@ def create_run_and_evaluations(req: BatchRunRequest, user=None) -> dict:
                         if req.aggregated_evaluations
                         else 0
                     ),
-                    message=input_data_json if store_input else None,
+                    **blob_store.offload_rows(
+                        [{"message": input_data_json if store_input else None}],
+                        "message",
+                        "message_blob",
+                        session=db,
+                    )[0],
                 )
                 db.add(new_run)
                 db.commit()
@@ -349,6 +353,7 @@ def submit_pubsub_messages_again(
                     status_code=404, detail=f"Run with ID {req.run_id} not found"
                 )
 
+            blob_store.load_rows([run], "message", "message_blob", session=db)
             if not run.message:
                 logger.error(f"Run with ID {req.run_id} Input is not saved in db")
                 raise HTTPException(
@@ -557,6 +562,7 @@ def get_batch_run(
 
 def get_run_response(run_orm):
     all_evaluations = {"stage1": [], "stage2": []}
+    blob_store.load_rows(run_orm.evaluations, "output", "output_blob")
     for evaluation in run_orm.evaluations:
         evaluation_resp = EvaluationResponse(
             evaluator_id=evaluation.evaluator_id,
@@ -1,28 +1,47 @@
 import asyncio
-import hashlib
-import json
 import time
 
 import redis
 from celery.result import AsyncResult
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import ValidationError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload, selectinload
 
 from app.db_api import database, models
+from app.db_api.archive import aload_archived_runs
+from app.db_api.blob_store import blob_store
+from app.db_api.replicas import async_get_read_db_session
 from app.logging_config import logger
 from app.pydantic_models import (
     BatchRunRequest,
     BatchRunResponse,
     BatchRunStatusResponse,
+    BulkBatchRunHeader,
     EvaluationResponse,
     RunResponse,
     RunStatusResponse,
 )
 from app.utils.auth import async_get_current_user, get_current_user
+from app.utils.bulk_ingest import (
+    BULK_INSERT_CHUNK_SIZE,
+    BULK_MAX_ROWS,
+    enqueue_bulk_runs,
+    insert_runs_chunk,
+    iter_jsonl_lines,
+    parse_jsonl_line,
+)
 from app.utils.cache_manager import RequestCacheManager
 from app.utils.query import async_get_user_project_object
+from app.utils.rate_limit import (
+    RATE_LIMITER_ENABLED,
+    enforce_rate_limit,
+    refund_rate_limit,
+    request_cost,
+)
+from common.run_coalescing import COALESCING_ENABLED, RunCoalescer, coalescing_key
+from common.serialization import compute_input_hash
 from common.utils import load_env, get_next_queue
 from workers import slim_tasks
 from workers.slim_tasks import RunStatus
@@ -34,15 +53,6 @@ DEFAULT_EMAIL = "admintest@xxxx.com"
 MAX_WAIT_TIME_SYNC_REQUEST = int(env_vars.get("MAX_WAIT_TIME_SYNC_REQUEST", 120))
 router = APIRouter()
 
-RATE_LIMIT = int(env_vars.get("RATE_LIMIT", 500))  # requests
-TIME_WINDOW = int(env_vars.get("TIME_WINDOW", 60))  # seconds (1 minute)
-
-RATE_LIMITER_ENABLED = env_vars.get("RATE_LIMITER_ENABLED", "f").lower() in (
-    "true",
-    "1",
-    "t",
-)
-
 # Cache configuration from environment variables
 CACHE_ENABLED = env_vars.get("CACHE_ENABLED", "false").lower() in ("true", "1", "t")
 CACHE_TTL = int(env_vars.get("CACHE_TTL", "900"))  # Default 15 mins
@@ -53,18 +63,16 @@ redis_port = int(env_vars.get("REDIS_PORT", 6379))
 redis_db = int(env_vars.get("REDIS_DB", 0))
 redis_client = redis.StrictRedis(host=redis_host, port=redis_port, db=redis_db)
 
-def rate_limiter(engagement_name: str):
-    key = f"rate_limit:{engagement_name}"
-
-    # Increment the request count and set expiry if it's the first request
-    request_count = redis_client.incr(key)
-    if request_count == 1:
-        redis_client.expire(key, TIME_WINDOW)
-
-    if request_count > RATE_LIMIT:
+def validate_evaluation_names(req: BatchRunRequest):
+    evaluation_names = [eval_request.name for eval_request in req.evaluations]
+    if req.aggregated_evaluations:
+        evaluation_names += [
+            eval_request.name for eval_request in req.aggregated_evaluations
+        ]
+    if len(evaluation_names) != len(set(evaluation_names)):
         raise HTTPException(
-            status_code=429,
-            detail="Too many requests for this engagement. Please try after 1 minute.",
+            status_code=400,
+            detail="Evaluation names must be unique across evaluations and aggregated evaluations.",
         )
 
 
@@ -105,22 +113,14 @@ async def async_create_batch_and_runs(req: BatchRunRequest, user=None, db=None)
         # res["project_name"] = project.name
         logger.info(f"Batch created in {time.time() - sss:.4f} seconds")
         sss = time.time()
-        evaluation_names = [eval_request.name for eval_request in req.evaluations]
-        if req.aggregated_evaluations:
-            evaluation_names += [
-                eval_request.name for eval_request in req.aggregated_evaluations
-            ]
-        if len(evaluation_names) != len(set(evaluation_names)):
-            raise HTTPException(
-                status_code=400,
-                detail="Evaluation names must be unique across evaluations and aggregated evaluations.",
-            )
+        validate_evaluation_names(req)
         logger.debug("Before creating run dict")
 
         async def create_run_dict(new_run, input_item):
             return {
                 "run_id": await new_run.awaitable_attrs.id,
                 "run_status": new_run.status,
+                "input_hash": new_run.input_hash,
                 "input": input_item,
                 "input_type": req.input_type,
                 "batch_run_id": res["batch_run_id"],
@@ -133,10 +133,9 @@ async def async_create_batch_and_runs(req: BatchRunRequest, user=None, db=None)
             }
 
         def create_new_run(input_item, store_input):
-            input_data_json = json.dumps(input_item, sort_keys=True)
-            input_data_hash = hashlib.sha256(
-                (input_data_json + str(req.input_type)).encode("utf-8")
-            ).hexdigest()
+            input_data_json, input_data_hash = compute_input_hash(
+                input_item, req.input_type
+            )
 
             return models.Run(
                 user_project_role_id=user_project_obj_id,
@@ -153,6 +152,16 @@ async def async_create_batch_and_runs(req: BatchRunRequest, user=None, db=None)
 
         logger.debug("Creating new runs")
         new_runs = [create_new_run(item, req.store_input) for item in req.inputs]
+        if req.store_input:
+            stored_messages = await blob_store.aoffload_rows(
+                [{"message": new_run.message} for new_run in new_runs],
+                "message",
+                "message_blob",
+                session=db,
+            )
+            for new_run, stored in zip(new_runs, stored_messages):
+                new_run.message = stored["message"]
+                new_run.message_blob = stored["message_blob"]
         logger.debug("Adding new runs to the database")
         db.add_all(new_runs)
         await db.flush()
@@ -175,6 +184,165 @@ async def async_create_batch_and_runs(req: BatchRunRequest, user=None, db=None)
     return res
 
 
+async def async_stream_create_batch_and_runs(
+    request: Request, user=None, db=None, response=None
+):
+    """
+    Creates a batch from a streamed JSONL body (optionally gzip compressed).
+
+    The first line is a BulkBatchRunHeader, every following line is one input.
+    Rows are validated and hashed as they arrive and inserted in chunks with
+    multi-row INSERTs inside a single transaction, so a bad line rejects the
+    whole batch. Runs are enqueued to the bulk queue only after commit. The rate
+    limit is charged to the bulk buckets per chunk, since the input count is only
+    known as it streams; what was charged is refunded when the batch is rolled
+    back.
+    """
+    sss = time.time()
+    lines = iter_jsonl_lines(request.stream())
+    try:
+        line_number, header_line = await anext(lines)
+    except StopAsyncIteration:
+        raise HTTPException(status_code=400, detail="Empty bulk submission")
+    try:
+        req = BulkBatchRunHeader(**parse_jsonl_line(line_number, header_line))
+    except (ValidationError, ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid header line: {e}")
+    validate_evaluation_names(req)
+
+    user_project_obj, project, user, engagement = await async_get_user_project_object(
+        db,
+        req.engagement_name,
+        req.project_name,
+        user.email if user else DEFAULT_EMAIL,
+        create_project_if_not=req.should_create_project,
+    )
+    user_project_obj_id = await user_project_obj.awaitable_attrs.id
+
+    evaluations = [e.model_dump() for e in req.evaluations]
+    aggregated_evaluations = (
+        [e.model_dump() for e in req.aggregated_evaluations]
+        if req.aggregated_evaluations is not None
+        else None
+    )
+    run_items = []
+    # Rate limit cost charged so far, refunded if the batch is rolled back
+    charged = 0
+    try:
+        new_batch_run = models.BatchRun(
+            name=req.batch_name,
+            user_project_role_id=user_project_obj_id,
+            input_type=str(req.input_type),
+        )
+        db.add(new_batch_run)
+        await db.flush()
+        batch_run_id = new_batch_run.id
+        res = {
+            "batch_run_id": batch_run_id,
+            "batch_run_created_at": await new_batch_run.awaitable_attrs.created_at,
+            "batch_run_updated_at": await new_batch_run.awaitable_attrs.updated_at,
+            "runs": run_items,
+        }
+
+        run_template = {
+            "user_project_role_id": user_project_obj_id,
+            "batch_run_id": batch_run_id,
+            "status": RunStatus.PENDING.value,
+            "item_metadata": req.item_metadata,
+            "stage1_left": len(req.evaluations),
+            "stage2_left": (
+                len(req.aggregated_evaluations) if req.aggregated_evaluations else 0
+            ),
+            "stage1_failed": 0,
+            "stage2_failed": 0,
+        }
+        last_id = 0
+        pending_rows, pending_inputs = [], []
+
+        async def flush_pending():
+            nonlocal last_id, charged
+            charged += await charge_rate_limit(
+                req, user, pending_inputs, response, bulk=True
+            )
+            rows = await blob_store.aoffload_rows(
+                pending_rows, "message", "message_blob", session=db
+            )
+            run_ids = await insert_runs_chunk(db, rows, batch_run_id, last_id)
+            if len(run_ids) != len(pending_rows):
+                raise RuntimeError(
+                    f"Inserted {len(pending_rows)} runs but got {len(run_ids)} ids back"
+                )
+            last_id = run_ids[-1]
+            run_items.extend(
+                {
+                    "run_id": run_id,
+                    "run_status": RunStatus.PENDING.value,
+                    "input_hash": row["input_hash"],
+                    "input": input_item,
+                    "input_type": req.input_type,
+                    "batch_run_id": batch_run_id,
+                    "is_dev_request": req.is_dev_request,
+                    "user_project_role_id": user_project_obj_id,
+                    "parse": req.parse,
+                    "format_to_issues_scores": req.format_to_issues_scores,
+                    "engagement_name": req.engagement_name,
+                    "callback": req.callback,
+                }
+                for run_id, row, input_item in zip(run_ids, pending_rows, pending_inputs)
+            )
+            pending_rows.clear()
+            pending_inputs.clear()
+
+        async for line_number, line in lines:
+            input_item = parse_jsonl_line(line_number, line)
+            input_data_json, input_data_hash = compute_input_hash(
+                input_item, req.input_type
+            )
+            pending_rows.append(
+                {
+                    **run_template,
+                    "input_hash": input_data_hash,
+                    "message": input_data_json if req.store_input else None,
+                }
+            )
+            pending_inputs.append(input_item)
+            if len(run_items) + len(pending_rows) > BULK_MAX_ROWS:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Bulk submission exceeds the limit of {BULK_MAX_ROWS} inputs",
+                )
+            if len(pending_rows) >= BULK_INSERT_CHUNK_SIZE:
+                await flush_pending()
+        if pending_rows:
+            await flush_pending()
+        if not run_items:
+            raise HTTPException(status_code=400, detail="Bulk submission has no inputs")
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        await refund_charged(req, user, charged, bulk=True)
+        raise
+    except Exception as e:
+        await db.rollback()
+        await refund_charged(req, user, charged, bulk=True)
+        logger.error("Error creating bulk batch and runs", exc_info=e)
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"{len(run_items)} runs inserted in {time.time() - sss:.4f} seconds")
+
+    try:
+        enqueue_bulk_runs(
+            redis_client,
+            coalesce_run_items(req, run_items, evaluations, aggregated_evaluations),
+            evaluations,
+            aggregated_evaluations,
+        )
+    except Exception as e:
+        logger.error("Error enqueueing bulk runs", exc_info=e)
+        raise HTTPException(status_code=500, detail=str(e))
+    logger.info(f"Bulk batch {batch_run_id} ingested in {time.time() - sss:.4f} seconds")
+    return res
+
+
 async def wait_for_celery_result_task_id(task_id: str, depth=0):
     max_wait_time = MAX_WAIT_TIME_SYNC_REQUEST
     start_time = time.time()
@@ -245,9 +413,46 @@ async def gather_celery_results(tasks):
     return await asyncio.gather(*awaitables)
 
 
+def coalesce_run_items(req, run_items, evaluations, aggregated_evaluations):
+    """
+    Attaches runs identical to one already in flight (same input hash, evaluator
+    set and config) as followers of that run and returns the ones to dispatch.
+    Followers stay pending until their leader's results are copied onto them.
+    """
+    if not COALESCING_ENABLED or req.force_skip_cache or not run_items:
+        return run_items
+    run_config = {
+        "input_type": req.input_type,
+        "parse": req.parse,
+        "format_to_issues_scores": req.format_to_issues_scores,
+        "is_dev_request": req.is_dev_request,
+        "engagement_name": req.engagement_name,
+    }
+    try:
+        leaders = RunCoalescer(redis_client).join_many(
+            [
+                (
+                    coalescing_key(
+                        run_item["input_hash"],
+                        evaluations,
+                        aggregated_evaluations,
+                        run_config,
+                    ),
+                    run_item,
+                )
+                for run_item in run_items
+            ]
+        )
+    except redis.RedisError as e:
+        logger.error("Run coalescing unavailable, dispatching all runs", exc_info=e)
+        return run_items
+    return [
+        run_item for run_item, leader in zip(run_items, leaders) if leader is None
+    ]
+
+
 async def initiate_run_common(req, user, db, is_async, is_bulk_request=False):
     """Common logic for initiating a run."""
-    all_runs = []
     try:
         start_time = time.time()
         all_runs_dict = await async_create_batch_and_runs(req, user, db=db)
@@ -260,36 +465,35 @@ async def initiate_run_common(req, user, db, is_async, is_bulk_request=False):
         raise HTTPException(status_code=500, detail=str(e))
 
     runs_tasks = []
+    evaluations = [e.model_dump() for e in req.evaluations]
+    aggregated_evaluations = (
+        [e.model_dump() for e in req.aggregated_evaluations]
+        if req.aggregated_evaluations is not None
+        else None
+    )
+    all_runs = [
+        {"run_id": run_item["run_id"], "status": run_item["run_status"]}
+        for run_item in all_runs_dict["runs"]
+    ]
+    # Sync requests wait on a task per run, so only async runs are coalesced
+    runs_to_dispatch = (
+        coalesce_run_items(
+            req, all_runs_dict["runs"], evaluations, aggregated_evaluations
+        )
+        if is_async
+        else all_runs_dict["runs"]
+    )
     try:
-        for run_item in all_runs_dict["runs"]:
-            all_runs.append(
-                {"run_id": run_item["run_id"], "status": run_item["run_status"]}
+        if is_bulk_request:
+            # Send data to Redis queue in FIFO order, one pipelined round trip
+            enqueue_bulk_runs(
+                redis_client, runs_to_dispatch, evaluations, aggregated_evaluations
             )
-            if is_bulk_request:
-                # Send data to Redis queue in FIFO order
-                print(f"Send to slow queue for run_id {run_item['run_id']}")
-                redis_payload = {
-                    "run_item": run_item,
-                    "evaluations": [e.model_dump() for e in req.evaluations],
-                    "aggregated_evaluations": (
-                        [e.model_dump() for e in req.aggregated_evaluations]
-                        if req.aggregated_evaluations is not None
-                        else None
-                    ),
-                }
-                redis_client.rpush("bulk_batch_request", json.dumps(redis_payload))
-            else:
+        else:
+            for run_item in runs_to_dispatch:
                 print(f"Directly sending to process_run for run_id {run_item['run_id']}")
                 runs_task = slim_tasks.process_run.apply_async(
-                    args=[
-                        run_item,
-                        [e.model_dump() for e in req.evaluations],
-                        (
-                            [e.model_dump() for e in req.aggregated_evaluations]
-                            if req.aggregated_evaluations is not None
-                            else None
-                        ),
-                    ],
+                    args=[run_item, evaluations, aggregated_evaluations],
                     queue=get_next_queue("process_queue", is_bulk_request),
                     kwargs={"save_to_db": True},
                 )
@@ -399,6 +603,47 @@ async def get_run_response(run_orm):
     )
 
 
+async def archived_run_responses(records, db):
+    """RunResponses for runs read back from the archive (app.db_api.archive)."""
+    await blob_store.aload_rows(
+        [evaluation for record in records for evaluation in record["evaluations"]],
+        "output",
+        "output_blob",
+        session=db,
+    )
+    responses = []
+    for record in records:
+        run = record["run"]
+        evaluations = {True: [], False: []}
+        for evaluation in record["evaluations"]:
+            evaluations[bool(evaluation["is_aggregator"])].append(
+                EvaluationResponse(
+                    evaluator_id=evaluation["evaluator_id"],
+                    name=evaluation["name"],
+                    status=evaluation["status"],
+                    fail_reason=evaluation["fail_reason"],
+                    output=evaluation["output"],
+                    is_used_for_aggregation=bool(
+                        evaluation["is_used_for_aggregation"]
+                    ),
+                )
+            )
+        responses.append(
+            RunResponse(
+                created_at=run["created_at"],
+                updated_at=run["updated_at"],
+                evaluations_failed=run["stage1_failed"],
+                aggregated_evaluations_failed=run["stage2_failed"],
+                run_id=run["id"],
+                status=run["status"],
+                item_metadata=run["item_metadata"],
+                evaluations=evaluations[False],
+                aggregated_evaluations=evaluations[True],
+            )
+        )
+    return responses
+
+
 async def async_get_evaluation_response(evaluation):
     return EvaluationResponse(
         evaluator_id=evaluation.evaluator_id,
@@ -410,7 +655,31 @@ async def async_get_evaluation_response(evaluation):
     )
 
 
-async def start_evaluation_run(req, user, db, is_bulk_request):
+async def charge_rate_limit(req, user, inputs, response=None, bulk=False) -> int:
+    """
+    Charges the request's cost to its rate limit buckets, the bulk ones for
+    bulk submissions, and returns the cost charged.
+    """
+    if not RATE_LIMITER_ENABLED:
+        return 0
+    cost = request_cost(inputs, req.evaluations, req.aggregated_evaluations)
+    await enforce_rate_limit(
+        req.engagement_name,
+        user.email if user else DEFAULT_EMAIL,
+        cost,
+        response,
+        bulk=bulk,
+    )
+    return cost
+
+
+async def refund_charged(req, user, cost: int, bulk=False):
+    await refund_rate_limit(
+        req.engagement_name, user.email if user else DEFAULT_EMAIL, cost, bulk=bulk
+    )
+
+
+async def start_evaluation_run(req, user, db, is_bulk_request, response=None):
     """Initiate a run with multiple evaluations for a single input."""
     log_payload = req.model_dump_json(exclude={"inputs"})
     logger.debug(f"Received request payload: {log_payload}")
@@ -418,9 +687,6 @@ async def start_evaluation_run(req, user, db, is_bulk_request):
 
     logger.debug(f"is bulk request {is_bulk_request}")
 
-    if RATE_LIMITER_ENABLED:
-        rate_limiter(req.engagement_name)
-
     cached_run_id = None
     if CACHE_ENABLED:
         logger.debug("Cache is enabled, checking for existing run")
@@ -462,8 +728,18 @@ async def start_evaluation_run(req, user, db, is_bulk_request):
                         ),
                     )
 
-    # If no cache hit or caching is disabled, proceed with normal execution
-    all_runs_dict, all_runs, _ = await initiate_run_common(req, user, db, is_async=True, is_bulk_request=is_bulk_request)
+    # If no cache hit or caching is disabled, proceed with normal execution;
+    # a cached run isn't charged
+    charged = await charge_rate_limit(
+        req, user, req.inputs, response, bulk=is_bulk_request
+    )
+    try:
+        all_runs_dict, all_runs, _ = await initiate_run_common(
+            req, user, db, is_async=True, is_bulk_request=is_bulk_request
+        )
+    except Exception:
+        await refund_charged(req, user, charged, bulk=is_bulk_request)
+        raise
 
     if CACHE_ENABLED and cache_key and all_runs:
         first_run_id = all_runs[0]["run_id"]
@@ -493,13 +769,19 @@ async def start_evaluation_run(req, user, db, is_bulk_request):
 @router.post("/sync", response_model=BatchRunResponse)
 async def sync_initiate_run(
     req: BatchRunRequest,
+    response: Response,
     user: models.User = Depends(async_get_current_user),
     db=Depends(database.async_get_db_session),
 ):
     """Initiate a run with multiple evaluations for a single input."""
-    all_runs_dict, _, runs_tasks = await initiate_run_common(
-        req, user, db, is_async=False, is_bulk_request=False
-    )
+    charged = await charge_rate_limit(req, user, req.inputs, response)
+    try:
+        all_runs_dict, _, runs_tasks = await initiate_run_common(
+            req, user, db, is_async=False, is_bulk_request=False
+        )
+    except Exception:
+        await refund_charged(req, user, charged)
+        raise
     saved_runs = await process_sync_results(runs_tasks, all_runs_dict, req)
     return BatchRunResponse(
         batch_run_id=all_runs_dict["batch_run_id"],
@@ -515,18 +797,47 @@ async def async_initiate_run(
     req: BatchRunRequest,
     user: models.User = Depends(async_get_current_user),
     db=Depends(database.async_get_db_session),
+    response: Response = None,
 ):
-    return await start_evaluation_run(req, user, db, is_bulk_request=False)
+    return await start_evaluation_run(req, user, db, is_bulk_request=False, response=response)
 
 
 @router.post("bulk_batch_runs", response_model=BatchRunStatusResponse)
 @router.post("/bulk_batch_runs", response_model=BatchRunStatusResponse)
 async def async_bulk_batch_initiate_run(
     req: BatchRunRequest,
+    response: Response,
+    user: models.User = Depends(async_get_current_user),
+    db=Depends(database.async_get_db_session),
+):
+    return await start_evaluation_run(req, user, db, is_bulk_request=True, response=response)
+
+
+@router.post("bulk_jsonl", response_model=BatchRunStatusResponse)
+@router.post("/bulk_jsonl", response_model=BatchRunStatusResponse)
+async def async_bulk_jsonl_initiate_run(
+    request: Request,
+    response: Response,
     user: models.User = Depends(async_get_current_user),
     db=Depends(database.async_get_db_session),
 ):
-    return await start_evaluation_run(req, user, db, is_bulk_request=True)
+    """
+    Initiate a bulk batch from a JSONL body, optionally gzip compressed.
+    The first line holds the batch request without `inputs`, every following line is one input.
+    """
+    all_runs_dict = await async_stream_create_batch_and_runs(request, user, db, response)
+    all_runs = [
+        {"run_id": run_item["run_id"], "status": run_item["run_status"]}
+        for run_item in all_runs_dict["runs"]
+    ]
+    return BatchRunStatusResponse(
+        batch_run_id=all_runs_dict["batch_run_id"],
+        created_at=str(all_runs_dict["batch_run_created_at"]),
+        updated_at=str(all_runs_dict["batch_run_updated_at"]),
+        runs=all_runs,
+        is_batch_ready=False,
+        runs_left=len(all_runs),
+    )
 
 
 @router.get("/{run_id}/status/", response_model=RunStatusResponse)
@@ -534,7 +845,7 @@ async def async_bulk_batch_initiate_run(
 async def get_run_status(
     run_id: int,
     user: models.User = Depends(async_get_current_user),
-    db: AsyncSession = Depends(database.async_get_db_session),
+    db: AsyncSession = Depends(async_get_read_db_session),
 ):
     """Get a small status object to see if the evaluations are complete."""
     query = (
@@ -551,6 +862,15 @@ async def get_run_status(
     db_run = result.unique().scalar_one_or_none()
 
     if db_run is None:
+        archived = await aload_archived_runs(db, run_id=run_id)
+        if archived:
+            run = archived[0]["run"]
+            return RunStatusResponse(
+                created_at=run["created_at"],
+                updated_at=run["updated_at"],
+                run_id=run["id"],
+                status=run["status"],
+            )
         logger.error(f"Run with ID {run_id} not found")
         raise HTTPException(status_code=404, detail="Run not found")
 
@@ -565,11 +885,18 @@ async def get_run_status(
     )
 
 
+def batch_run_statuses_select(batch_run_id: int):
+    # Served from idx_run_batch_run_id_status alone, without reading run rows
+    return select(models.Run.id, models.Run.status).filter(
+        models.Run.batch_run_id == batch_run_id
+    )
+
+
 @router.get("/batch/{batch_run_id}/status/", response_model=BatchRunStatusResponse)
 @router.get("/batch/{batch_run_id}/status", response_model=BatchRunStatusResponse)
 async def batch_status(
     batch_run_id: int,
-    db: AsyncSession = Depends(database.async_get_db_session),
+    db: AsyncSession = Depends(async_get_read_db_session),
     user: models.User = Depends(async_get_current_user),
 ):
     """Retrieve the status of a batch run with multiple evaluations."""
@@ -579,7 +906,6 @@ async def batch_status(
             joinedload(models.BatchRun.user_project_role)
             .joinedload(models.UserProjectRole.project)
             .joinedload(models.Project.engagement),
-            joinedload(models.BatchRun.runs),
         )
         .filter(models.BatchRun.id == batch_run_id)
     )
@@ -591,7 +917,10 @@ async def batch_status(
         logger.error(f"Batch run with ID {batch_run_id} not found")
         raise HTTPException(status_code=404, detail="Batch run not found")
 
-    run_statuses = [{"run_id": run.id, "status": run.status} for run in batch_run.runs]
+    run_statuses = [
+        {"run_id": run_id, "status": status}
+        for run_id, status in await db.execute(batch_run_statuses_select(batch_run_id))
+    ]
     runs_left = sum(
         1
         for run in run_statuses
@@ -615,7 +944,7 @@ async def batch_status(
 @router.get("/batch/{batch_run_id}", response_model=BatchRunResponse)
 async def get_batch_run(
     batch_run_id: int,
-    db: AsyncSession = Depends(database.async_get_db_session),
+    db: AsyncSession = Depends(async_get_read_db_session),
     user: models.User = Depends(async_get_current_user),
 ):
     """Retrieve details for a specific batch run."""
@@ -633,9 +962,20 @@ async def get_batch_run(
         .filter(models.Run.batch_run_id == batch_run_id)
     )
     runs = runs.scalars().all()
+    await blob_store.aload_rows(
+        [evaluation for run in runs for evaluation in run.evaluations],
+        "output",
+        "output_blob",
+        session=db,
+    )
     run_responses = []
     for run in runs:
         run_responses.append(await get_run_response(run))
+    run_responses.extend(
+        await archived_run_responses(
+            await aload_archived_runs(db, batch_run_id=batch_run_id), db
+        )
+    )
 
     return BatchRunResponse(
         batch_run_id=batch_run.id,
@@ -649,7 +989,7 @@ async def get_batch_run(
 @router.get("/{run_id}", response_model=RunResponse)
 async def get_run(
     run_id: int,
-    db: AsyncSession = Depends(database.async_get_db_session),
+    db: AsyncSession = Depends(async_get_read_db_session),
     user: models.User = Depends(async_get_current_user),
 ):
     """
@@ -662,8 +1002,14 @@ async def get_run(
     )
     db_run = db_run.scalar_one_or_none()
     if db_run is None:
+        archived = await aload_archived_runs(db, run_id=run_id)
+        if archived:
+            return (await archived_run_responses(archived, db))[0]
         logger.error(f"Run with ID {run_id} not found")
         raise HTTPException(status_code=404, detail="Run not found")
+    await blob_store.aload_rows(
+        db_run.evaluations, "output", "output_blob", session=db
+    )
     return await get_run_response(db_run)
 
 
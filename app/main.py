@@ -10,18 +10,25 @@ from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+import redis.asyncio as async_redis
 from sqlalchemy import TextClause
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
 
-from app.db_api.database import get_db_gen
+from app.db_api.database import async_get_db_session
+from app.db_api.pool_profiles import DB_POOL_METRICS_KEY, summarize_pool_metrics
+from app.db_api.replicas import replica_routing_middleware
 from app.logging_config import logger
 from app.routers import api_router
 from common.utils import load_env
+from llm_failover.health import HEALTH_PREFIX, redis_url
+from llm_failover.key_selection import KEY_METRICS_NAME, summarize_key_metrics
+from llm_failover.routing import ROUTE_METRICS_NAME, summarize_route_metrics
 
 SECRET_PATH = "42--3-14"
 
@@ -45,7 +52,7 @@ def check_basic_auth(credentials: HTTPBasicCredentials = Depends(security)):
     logger.info("Basic auth successful")
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 # Override the default OpenAPI and Swagger UI endpoints to include basic auth
@@ -147,18 +154,63 @@ else:
     logger.info("Running in production mode.")
 
 app.middleware("http")(catch_exceptions_middleware)
+app.middleware("http")(replica_routing_middleware)
 app.add_middleware(LoggingAndTraceIDMiddleware)
 app.include_router(api_router)
 
 
 @app.get(f"/api/v1/health")
-async def health_check(db: Session = Depends(get_db_gen)):
+async def health_check(db: AsyncSession = Depends(async_get_db_session)):
     try:
         # logger.debug("Performing health check")
         # Attempt to fetch a single row to check database connectivity
-        db.execute(TextClause("SELECT 1"))
+        await db.execute(TextClause("SELECT 1"))
         # logger.info("Health check successful")
         return {"status": "UP"}
     except Exception as e:
         logger.error(f"Database connection error: {e}", exc_info=e)
         return {"status": "DOWN", "failed": ["db_connection"]}
+
+
+async def read_published_metrics(key: str) -> list:
+    """
+    Snapshots each process last published to the hash at key, in the Redis
+    shared for health state (LLM_HEALTH_REDIS_URL, else REDIS_HOST).
+    """
+    url = redis_url(env_vars) or "redis://localhost:6379/0"
+    client = async_redis.StrictRedis.from_url(url)
+    try:
+        return await client.hvals(key)
+    finally:
+        await client.aclose()
+
+
+@app.get(f"/api/v1/health/db-pools", include_in_schema=False)
+async def db_pool_health(
+    credentials: HTTPBasicCredentials = Depends(check_basic_auth),
+):
+    # Checked-out connections, overflow, checkout waits and timeouts per role,
+    # as last published by each process (app.db_api.pool_profiles)
+    return summarize_pool_metrics(await read_published_metrics(DB_POOL_METRICS_KEY))
+
+
+@app.get(f"/api/v1/health/llm-keys", include_in_schema=False)
+async def llm_key_health(
+    credentials: HTTPBasicCredentials = Depends(check_basic_auth),
+):
+    # Requests, in-flight calls, rate limits and quota left per API key, as
+    # last published by each worker (llm_failover.key_selection)
+    return summarize_key_metrics(
+        await read_published_metrics(HEALTH_PREFIX + KEY_METRICS_NAME)
+    )
+
+
+@app.get(f"/api/v1/health/llm-routes", include_in_schema=False)
+async def llm_route_health(
+    credentials: HTTPBasicCredentials = Depends(check_basic_auth),
+):
+    # Models chosen per requested model and why (requested, context, cost,
+    # no_fit), summed over the workers (llm_failover.routing)
+    return summarize_route_metrics(
+        await read_published_metrics(HEALTH_PREFIX + ROUTE_METRICS_NAME)
+    )
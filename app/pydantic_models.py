@@ -185,6 +185,12 @@ class BatchRunRequest(BaseModel):
     }
 
 
+class BulkBatchRunHeader(BatchRunRequest):
+    """First line of a JSONL bulk submission, every following line is one input."""
+
+    inputs: Any = None
+
+
 class SubmitPubsubMessagesAgainRequest(BaseModel):
     run_id: str | None
     input_type: list | dict | str
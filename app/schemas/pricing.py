@@ -9,6 +9,7 @@ class LLMPricingCreate(BaseModel):
     version: str
     input_price_per_million_tokens: float
     output_price_per_million_tokens: float
+    cached_input_price_per_million_tokens: Optional[float] = None
     effective_from: date
 
 
@@ -22,6 +23,26 @@ class LLMPricingResponse(LLMPricingCreate):
         orm_mode = True
 
 
+class LLMCallStats(BaseModel):
+    # Set for the columns the stats are grouped by
+    run: Optional[int] = None
+    evaluator: Optional[str] = None
+    engagement: Optional[str] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    key: Optional[str] = None
+    calls: int
+    attempts: int
+    failed_attempts: int
+    failed_over_calls: int
+    avg_latency_ms: float
+    max_latency_ms: int
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_prompt_tokens: Optional[int] = None
+    cost: Optional[float] = None
+
+
 class TokenUsageData(BaseModel):
     date: date
     provider: str
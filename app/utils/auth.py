@@ -15,6 +15,7 @@ from sqlalchemy.orm import Session
 
 from app.db_api import AsyncSession, database, models
 from app.logging_config import logger
+from app.utils.principal_cache import principal_cache, user_key
 from common.utils import load_env
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -38,13 +39,25 @@ def create_user(db, email):
 
 
 async def _async_get_user_db_request(db, user_id):
-    return (
+    cached = principal_cache.get_instances(user_key(user_id), (models.User,))
+    if cached:
+        return await db.merge(cached[0], load=False)
+    user = (
         await db.scalars(select(models.User).where(models.User.id == user_id))
     ).first()
+    if user:
+        principal_cache.set_instances(user_key(user_id), (user,))
+    return user
 
 
 def _sync_get_user_db_request(db, user_id):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    cached = principal_cache.get_instances(user_key(user_id), (models.User,))
+    if cached:
+        return db.merge(cached[0], load=False)
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user:
+        principal_cache.set_instances(user_key(user_id), (user,))
+    return user
 
 
 def _get_current_user_helper(
@@ -152,6 +165,7 @@ def create_and_update_access_token(db, user, token_payload):
     user.api_token = jwt_token
     db.add(user)
     db.commit()
+    principal_cache.invalidate(user_key(user.id))
     return jwt_token
 
 
@@ -184,6 +198,7 @@ def update_access_token(db, token: str, expires_delta=REFRESH_TOKEN_EXPIRE_DAYS)
         user.api_token = new_token
         db.add(user)
         db.commit()
+        principal_cache.invalidate(user_key(user.id))
     return new_token
 
 
@@ -0,0 +1,112 @@
+import zlib
+from typing import Any, AsyncIterator
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+
+from app.db_api import models
+from app.logging_config import logger
+from common import serialization
+from common.utils import load_env
+
+env_vars = load_env()
+
+BULK_INSERT_CHUNK_SIZE = int(env_vars.get("BULK_INSERT_CHUNK_SIZE", 1000))
+BULK_MAX_ROWS = int(env_vars.get("BULK_MAX_ROWS", 50000))
+BULK_ENQUEUE_SLICE_SIZE = 500
+BULK_QUEUE_NAME = "bulk_batch_request"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+async def iter_jsonl_lines(
+    byte_stream: AsyncIterator[bytes], gzipped: bool | None = None
+) -> AsyncIterator[tuple[int, bytes]]:
+    """
+    Yields (line_number, raw_line) from a streamed JSONL body.
+
+    When gzipped is None the body is sniffed for the gzip magic bytes, so clients
+    don't have to set Content-Encoding. Decompression is incremental, the full
+    body is never held in memory.
+    """
+    decompressor = None
+    buffer = b""
+    line_number = 0
+    async for chunk in byte_stream:
+        if not chunk:
+            continue
+        if gzipped is None:
+            gzipped = chunk[:2] == GZIP_MAGIC
+        if gzipped:
+            if decompressor is None:
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            try:
+                chunk = decompressor.decompress(chunk)
+            except zlib.error as e:
+                raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+
+    if decompressor is not None:
+        buffer += decompressor.flush()
+    for line in buffer.split(b"\n"):
+        line_number += 1
+        if line.strip():
+            yield line_number, line
+
+
+def parse_jsonl_line(line_number: int, line: bytes) -> Any:
+    try:
+        return serialization.loads(line)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid JSON on line {line_number}: {e}"
+        )
+
+
+async def insert_runs_chunk(db, rows: list[dict], batch_run_id: int, last_id: int):
+    """
+    Inserts a chunk of runs with a single multi-row INSERT and returns their ids.
+
+    Dialects with INSERT ... RETURNING hand the ids back directly. MySQL has no
+    RETURNING, so the ids are read back with one indexed range query on
+    (batch_run_id, id); the batch is owned by this request, so every row above
+    the previous chunk's last id belongs to this chunk.
+    """
+    if db.bind.dialect.insert_returning:
+        result = await db.execute(
+            insert(models.Run).values(rows).returning(models.Run.id)
+        )
+        return sorted(result.scalars().all())
+
+    await db.execute(insert(models.Run).values(rows))
+    result = await db.execute(
+        select(models.Run.id)
+        .filter(models.Run.batch_run_id == batch_run_id, models.Run.id > last_id)
+        .order_by(models.Run.id)
+    )
+    return list(result.scalars().all())
+
+
+def enqueue_bulk_runs(redis_client, run_items, evaluations, aggregated_evaluations):
+    """Pushes run payloads onto the bulk queue in one pipelined round trip."""
+    if not run_items:
+        return
+    payloads = [
+        serialization.dumps(
+            {
+                "run_item": run_item,
+                "evaluations": evaluations,
+                "aggregated_evaluations": aggregated_evaluations,
+            }
+        )
+        for run_item in run_items
+    ]
+    pipeline = redis_client.pipeline(transaction=False)
+    for i in range(0, len(payloads), BULK_ENQUEUE_SLICE_SIZE):
+        pipeline.rpush(BULK_QUEUE_NAME, *payloads[i : i + BULK_ENQUEUE_SLICE_SIZE])
+    pipeline.execute()
+    logger.debug(f"Enqueued {len(run_items)} runs to {BULK_QUEUE_NAME}")
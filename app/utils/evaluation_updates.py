@@ -0,0 +1,45 @@
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import joinedload
+
+from app.db_api.models import Evaluation, Evaluator
+from common.pubsub_queue import EvaluationStatus
+
+CLAIMABLE_STATUSES = [EvaluationStatus.QUEUED.value, EvaluationStatus.PENDING.value]
+
+
+def claim_select(evaluation_ids):
+    """
+    SELECT ... FOR UPDATE SKIP LOCKED of the claimable evaluations among
+    evaluation_ids, with their evaluator and evaluator type.
+    """
+    return (
+        select(Evaluation)
+        .options(joinedload(Evaluation.evaluator).joinedload(Evaluator.evaluator_type))
+        .filter(
+            Evaluation.id.in_(evaluation_ids),
+            Evaluation.status.in_(CLAIMABLE_STATUSES),
+        )
+        .with_for_update(skip_locked=True, of=Evaluation)
+    )
+
+
+def evaluation_results_update(statuses, outputs, output_blobs, fail_reasons):
+    """
+    One UPDATE writing each evaluation's status, output and output_blob, keyed
+    by id. Rows missing from fail_reasons keep their fail_reason.
+    """
+    values = {
+        "status": case(statuses, value=Evaluation.id),
+        "output": case(outputs, value=Evaluation.id),
+        "output_blob": case(output_blobs, value=Evaluation.id),
+    }
+    if fail_reasons:
+        values["fail_reason"] = case(
+            fail_reasons, value=Evaluation.id, else_=Evaluation.fail_reason
+        )
+    return (
+        update(Evaluation)
+        .where(Evaluation.id.in_(list(statuses)))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
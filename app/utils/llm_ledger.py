@@ -0,0 +1,219 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import redis
+from sqlalchemy import case, distinct, func, select
+
+from app.db_api import models
+from app.logging_config import logger
+from app.utils.pricing_index import evaluation_cost, pricing_index
+from app.utils.stats_rollups import insert_ignore
+from llm_failover.ledger import LEDGER_STREAM, CallRecord
+
+# Consumer group of the drain; one consumer, since beat runs one drain at a time
+LEDGER_GROUP = "db"
+LEDGER_CONSUMER = "drain"
+# Records that can't be parsed, or still fail to insert after
+# LEDGER_MAX_DELIVERIES reads, are moved here with their error
+LEDGER_DEAD_STREAM = f"{LEDGER_STREAM}:dead"
+LEDGER_MAX_DELIVERIES = 3
+
+# Columns the call stats can be grouped by
+STATS_GROUPS = {
+    "run": models.LLMCall.run_id,
+    "evaluator": models.LLMCall.evaluator,
+    "engagement": models.LLMCall.engagement,
+    "provider": models.LLMCall.provider,
+    "model": models.LLMCall.model,
+    "key": models.LLMCall.key_alias,
+}
+
+
+def call_row(record: CallRecord) -> dict:
+    """
+    llm_call row of a ledger record. Cost is priced from llm_pricing on the
+    day of the call; models without a price keep the estimate the worker
+    made from LLM_MODEL_PRICES, if any.
+    """
+    called_at = datetime.fromtimestamp(record.called_at)
+    price = pricing_index.price_at(record.provider, record.model, called_at.date())
+    cost = record.cost
+    if price and record.prompt_tokens is not None:
+        cost = evaluation_cost(
+            record.prompt_tokens,
+            record.completion_tokens,
+            price,
+            record.cached_prompt_tokens,
+        )
+    run_id = record.tags.get("run_id")
+    return {
+        "call_id": record.call_id,
+        "attempt": record.attempt,
+        "provider": record.provider,
+        "model": record.model,
+        "key_alias": record.key,
+        "run_id": int(run_id) if run_id is not None else None,
+        "evaluator": record.tags.get("evaluator"),
+        "engagement": record.tags.get("engagement"),
+        "latency_ms": round(record.latency_seconds * 1000),
+        "prompt_tokens": record.prompt_tokens,
+        "completion_tokens": record.completion_tokens,
+        "cached_prompt_tokens": record.cached_prompt_tokens,
+        "error": record.error,
+        "stream": record.stream,
+        "cost": cost,
+        "called_at": called_at,
+    }
+
+
+def _rows(entries) -> tuple[list[tuple], dict]:
+    """(entry_id, row) pairs of the entries, and the errors of malformed ones by entry_id."""
+    rows, malformed = [], {}
+    for entry_id, fields in entries:
+        try:
+            rows.append((entry_id, call_row(CallRecord.from_json(fields[b"record"]))))
+        except Exception as e:
+            malformed[entry_id] = str(e)
+    return rows, malformed
+
+
+def _insert(db, rows: list[tuple]) -> dict:
+    """
+    Inserts the rows, skipping attempts already in llm_call. When the batch
+    fails the rows are inserted one by one; returns the errors of those that
+    still failed by entry_id.
+    """
+    table = models.LLMCall.__table__
+    try:
+        insert_ignore(db, table, [row for _, row in rows])
+        db.commit()
+        return {}
+    except Exception as e:
+        db.rollback()
+        logger.warning(
+            f"Could not insert {len(rows)} call records, retrying one by one: {e}"
+        )
+    failed = {}
+    for entry_id, row in rows:
+        try:
+            insert_ignore(db, table, [row])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            failed[entry_id] = str(e)
+    return failed
+
+
+def _deliveries(client: redis.Redis, entry_id) -> int:
+    """How often the group has delivered a pending entry."""
+    pending = client.xpending_range(
+        LEDGER_STREAM, LEDGER_GROUP, min=entry_id, max=entry_id, count=1
+    )
+    return pending[0]["times_delivered"] if pending else 0
+
+
+def drain_ledger(
+    db, client: redis.Redis, batch_size: int = 5000, max_batches: int = 20
+) -> int:
+    """
+    Moves call records from the ledger stream into llm_call. Entries are
+    acknowledged and deleted after their insert commits, so a drain that
+    dies in between re-reads them from the group's pending list first; the
+    unique (call_id, attempt) lets their insert skip what already committed.
+    Records that fail to insert stay pending for the next drain, until
+    LEDGER_MAX_DELIVERIES, then go to LEDGER_DEAD_STREAM like malformed ones.
+    """
+    try:
+        client.xgroup_create(LEDGER_STREAM, LEDGER_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    pricing_index.refresh(db)
+
+    drained = 0
+    start = "0"
+    for _ in range(max_batches):
+        response = client.xreadgroup(
+            LEDGER_GROUP, LEDGER_CONSUMER, {LEDGER_STREAM: start}, count=batch_size
+        )
+        entries = response[0][1] if response else []
+        if not entries:
+            if start != ">":
+                start = ">"
+                continue
+            break
+        if start != ">":
+            # Pages through the pending list, past records left pending again
+            start = entries[-1][0]
+
+        rows, dead = _rows(entries)
+        failed = _insert(db, rows) if rows else {}
+        for entry_id, error in failed.items():
+            if _deliveries(client, entry_id) >= LEDGER_MAX_DELIVERIES:
+                dead[entry_id] = error
+        for entry_id, fields in entries:
+            if entry_id in dead:
+                logger.warning(
+                    f"Dead-lettering call record {entry_id}: {dead[entry_id]}"
+                )
+                client.xadd(
+                    LEDGER_DEAD_STREAM,
+                    {
+                        "record": (fields or {}).get(b"record", b""),
+                        "error": dead[entry_id][:1000],
+                    },
+                )
+
+        entry_ids = [
+            entry_id
+            for entry_id, _ in entries
+            if entry_id not in failed or entry_id in dead
+        ]
+        if entry_ids:
+            client.xack(LEDGER_STREAM, LEDGER_GROUP, *entry_ids)
+            client.xdel(LEDGER_STREAM, *entry_ids)
+        drained += len(rows) - len(failed)
+    return drained
+
+
+def llm_call_stats_select(
+    group_by: list[str],
+    run_id: Optional[int] = None,
+    evaluator: Optional[str] = None,
+    engagement: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    """
+    Calls, attempts, failovers, latency, tokens and cost from llm_call, per
+    group_by columns (keys of STATS_GROUPS). A call failed over when it took
+    more than one attempt.
+    """
+    LLMCall = models.LLMCall
+    groups = [STATS_GROUPS[name] for name in group_by]
+    query = select(
+        *(column.label(name) for name, column in zip(group_by, groups)),
+        func.count(distinct(LLMCall.call_id)).label("calls"),
+        func.count(LLMCall.id).label("attempts"),
+        func.count(LLMCall.error).label("failed_attempts"),
+        func.count(distinct(case((LLMCall.attempt > 0, LLMCall.call_id)))).label(
+            "failed_over_calls"
+        ),
+        func.avg(LLMCall.latency_ms).label("avg_latency_ms"),
+        func.max(LLMCall.latency_ms).label("max_latency_ms"),
+        func.sum(LLMCall.prompt_tokens).label("prompt_tokens"),
+        func.sum(LLMCall.completion_tokens).label("completion_tokens"),
+        func.sum(LLMCall.cached_prompt_tokens).label("cached_prompt_tokens"),
+        func.sum(LLMCall.cost).label("cost"),
+    )
+    if run_id is not None:
+        query = query.filter(LLMCall.run_id == run_id)
+    if evaluator:
+        query = query.filter(LLMCall.evaluator == evaluator)
+    if engagement:
+        query = query.filter(LLMCall.engagement == engagement)
+    if start:
+        query = query.filter(LLMCall.called_at >= start)
+    if end:
+        query = query.filter(LLMCall.called_at < end + timedelta(days=1))
+    return query.group_by(*groups).order_by(*groups)
@@ -0,0 +1,104 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+
+from app.logging_config import logger
+from common import serialization
+from common.utils import load_env
+
+env_vars = load_env()
+
+MAX_PAGE_SIZE = int(env_vars.get("MAX_PAGE_SIZE", 500))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: Optional[datetime], id: int) -> str:
+    raw = serialization.dumps(
+        [created_at.isoformat() if created_at is not None else None, id]
+    )
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[Optional[datetime], int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = serialization.loads(raw)
+        if created_at is not None:
+            created_at = datetime.fromisoformat(created_at)
+        return created_at, int(id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        logger.error(f"Invalid pagination cursor {cursor!r}: {e}")
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_select(
+    stmt,
+    model,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+):
+    """
+    Newest-first page of stmt ordered on (created_at, id). Passing back the
+    cursor of the previous page seeks straight to its last row through the
+    (created_at, id) index, so every page costs the same as the first. One
+    extra row is fetched to tell whether there is a next page.
+
+    created_at is nullable. NULL sorts lowest on MySQL, so rows without it
+    come last, ordered on id alone, and a cursor on such a row carries None.
+
+    skip is kept for clients that haven't moved to cursors yet and is ignored
+    once a cursor is given.
+    """
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        if created_at is None:
+            stmt = stmt.filter(model.created_at.is_(None), model.id < id)
+        else:
+            stmt = stmt.filter(
+                or_(
+                    model.created_at < created_at,
+                    and_(model.created_at == created_at, model.id < id),
+                    model.created_at.is_(None),
+                )
+            )
+    elif skip:
+        stmt = stmt.offset(skip)
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(
+        page_size(limit) + 1
+    )
+
+
+def page_rows(rows, limit: int, response: Optional[Response] = None):
+    """Trims the lookahead row of a keyset_select page and sets X-Next-Cursor."""
+    limit = page_size(limit)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if response is not None:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                rows[-1].created_at, rows[-1].id
+            )
+    return rows
+
+
+async def async_keyset_paginate(
+    db,
+    stmt,
+    model,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    response: Optional[Response] = None,
+):
+    rows = (
+        await db.scalars(keyset_select(stmt, model, limit, cursor=cursor, skip=skip))
+    ).all()
+    return page_rows(rows, limit, response)
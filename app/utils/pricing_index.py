@@ -0,0 +1,226 @@
+import bisect
+import threading
+import time
+from datetime import date
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, select
+
+from app.db_api import models
+from app.logging_config import logger
+from common.utils import load_env
+
+env_vars = load_env()
+
+# How often a process checks llm_pricing for changes made by other processes
+PRICING_INDEX_CHECK_SECONDS = int(env_vars.get("PRICING_INDEX_CHECK_SECONDS", 60))
+
+
+class Price(NamedTuple):
+    effective_from: date
+    input_price_per_million_tokens: float
+    output_price_per_million_tokens: float
+    # Prompt tokens read from the provider's prompt cache; None bills them as input
+    cached_input_price_per_million_tokens: Optional[float] = None
+
+
+def evaluation_model(evaluation: dict, evaluator_models: dict) -> tuple:
+    """
+    (provider, model) an evaluation ran on: the llm_config of its override when
+    present, else its evaluator's configured model.
+    """
+    override = evaluation.get("evaluator_config_override") or {}
+    llm_config = override.get("llm_config") or {}
+    provider, model = evaluator_models.get(
+        evaluation.get("evaluator_id"), (None, None)
+    )
+    return llm_config.get("provider") or provider, llm_config.get("model") or model
+
+
+def evaluation_cost(
+    prompt_tokens, generate_tokens, price: Price, cached_prompt_tokens=None
+) -> float:
+    """Cost in dollars; cached_prompt_tokens are the part of prompt_tokens read from cache."""
+    cached = cached_prompt_tokens or 0
+    cached_price = price.cached_input_price_per_million_tokens
+    if cached_price is None:
+        cached_price = price.input_price_per_million_tokens
+    return (
+        ((prompt_tokens or 0) - cached) * price.input_price_per_million_tokens
+        + cached * cached_price
+        + (generate_tokens or 0) * price.output_price_per_million_tokens
+    ) / 1000000
+
+
+class PricingIndex:
+    """
+    In-process interval index over llm_pricing: per (provider, model), prices
+    sorted by effective_from, so the price in force on a day is one bisect. A
+    price applies from its effective_from until the next one for the provider
+    and model, which matches how create_llm_pricing closes the previous
+    interval.
+
+    The index reloads when invalidated in this process, or when a periodic
+    check of (row count, max updated_at) sees a change from another process.
+    """
+
+    def __init__(self, check_seconds: int = PRICING_INDEX_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._prices: dict[tuple[str, str], list[Price]] = {}
+        self._starts: dict[tuple[str, str], list[date]] = {}
+        self._fingerprint = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def load(self, rows):
+        prices: dict[tuple[str, str], list[Price]] = {}
+        for row in rows:
+            prices.setdefault((row.provider, row.model), []).append(
+                Price(
+                    row.effective_from,
+                    row.input_price_per_million_tokens,
+                    row.output_price_per_million_tokens,
+                    row.cached_input_price_per_million_tokens,
+                )
+            )
+        for model_prices in prices.values():
+            model_prices.sort()
+        self._prices = prices
+        self._starts = {
+            key: [p.effective_from for p in model_prices]
+            for key, model_prices in prices.items()
+        }
+
+    def invalidate(self):
+        with self._lock:
+            self._fingerprint = None
+            self._checked_at = None
+
+    def refresh(self, db):
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._checked_at is not None
+                and now - self._checked_at < self.check_seconds
+            ):
+                return
+            fingerprint = tuple(
+                db.execute(
+                    select(
+                        func.count(models.LLMPricing.id),
+                        func.max(models.LLMPricing.updated_at),
+                    )
+                ).one()
+            )
+            if fingerprint != self._fingerprint:
+                self.load(db.execute(select(models.LLMPricing)).scalars())
+                self._fingerprint = fingerprint
+                logger.info(f"Loaded pricing index for {len(self._prices)} models")
+            self._checked_at = now
+
+    def price_at(self, provider: str, model: str, day: date) -> Optional[Price]:
+        starts = self._starts.get((provider, model))
+        if not starts:
+            return None
+        position = bisect.bisect_right(starts, day)
+        if position == 0:
+            return None
+        return self._prices[provider, model][position - 1]
+
+
+pricing_index = PricingIndex()
+
+
+def load_evaluator_models(db, evaluator_ids) -> dict:
+    evaluator_ids = {i for i in evaluator_ids if i is not None}
+    if not evaluator_ids:
+        return {}
+    rows = db.execute(
+        select(
+            models.Evaluator.id,
+            models.Evaluator.llm_provider,
+            models.Evaluator.llm_model,
+        ).filter(models.Evaluator.id.in_(evaluator_ids))
+    )
+    return {evaluator_id: (provider, model) for evaluator_id, provider, model in rows}
+
+
+def stamp_costs(db, evaluations: list[dict], day: date):
+    """
+    Sets llm_provider, llm_model and cost on evaluation rows about to be saved,
+    priced on `day`, the day their models were called. Rows whose model has no
+    price on `day` keep a NULL cost.
+    """
+    pricing_index.refresh(db)
+    evaluator_models = load_evaluator_models(
+        db, (e.get("evaluator_id") for e in evaluations)
+    )
+    for evaluation in evaluations:
+        provider, model = evaluation_model(evaluation, evaluator_models)
+        price = pricing_index.price_at(provider, model, day)
+        evaluation["llm_provider"] = provider
+        evaluation["llm_model"] = model
+        evaluation["cost"] = (
+            evaluation_cost(
+                evaluation.get("prompt_tokens_used"),
+                evaluation.get("generate_tokens_used"),
+                price,
+                evaluation.get("cached_prompt_tokens_used"),
+            )
+            if price
+            else None
+        )
+
+
+def backfill_costs(db, batch_size: int = 1000, after_id: int = 0) -> int:
+    """
+    Stamps provider, model and cost on evaluations saved before costs were
+    stamped, walking ids upwards in batches. Each evaluation is priced on the
+    day its run started, as stamp_costs does. Returns the number of rows
+    stamped.
+    """
+    pricing_index.refresh(db)
+    stamped = 0
+    while True:
+        rows = (
+            db.execute(
+                select(models.Evaluation, models.Run.created_at)
+                .join(models.Run, models.Run.id == models.Evaluation.run_id)
+                .filter(
+                    models.Evaluation.id > after_id,
+                    models.Evaluation.cost.is_(None),
+                )
+                .order_by(models.Evaluation.id)
+                .limit(batch_size)
+            )
+            .tuples()
+            .all()
+        )
+        if not rows:
+            break
+        evaluator_models = load_evaluator_models(db, (e.evaluator_id for e, _ in rows))
+        for evaluation, run_created_at in rows:
+            provider, model = evaluation_model(
+                {
+                    "evaluator_id": evaluation.evaluator_id,
+                    "evaluator_config_override": evaluation.evaluator_config_override,
+                },
+                evaluator_models,
+            )
+            evaluation.llm_provider = provider
+            evaluation.llm_model = model
+            price = run_created_at and pricing_index.price_at(
+                provider, model, run_created_at.date()
+            )
+            if price:
+                evaluation.cost = evaluation_cost(
+                    evaluation.prompt_tokens_used,
+                    evaluation.generate_tokens_used,
+                    price,
+                    evaluation.cached_prompt_tokens_used,
+                )
+                stamped += 1
+        after_id = rows[-1][0].id
+        db.commit()
+        logger.info(f"Backfilled evaluation costs up to id {after_id}")
+    return stamped
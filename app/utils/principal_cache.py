@@ -0,0 +1,190 @@
+import threading
+import time
+from datetime import date, datetime
+from typing import Any
+
+import redis
+from sqlalchemy import Date, DateTime, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.logging_config import logger
+from common import serialization
+from common.utils import load_env
+
+env_vars = load_env()
+
+PRINCIPAL_CACHE_ENABLED = env_vars.get("PRINCIPAL_CACHE_ENABLED", "t").lower() in (
+    "true",
+    "1",
+    "t",
+)
+PRINCIPAL_CACHE_TTL = int(env_vars.get("PRINCIPAL_CACHE_TTL", 30))
+PRINCIPAL_CACHE_MAX_SIZE = int(env_vars.get("PRINCIPAL_CACHE_MAX_SIZE", 10000))
+PRINCIPAL_CACHE_REDIS = env_vars.get("PRINCIPAL_CACHE_REDIS", "f").lower() in (
+    "true",
+    "1",
+    "t",
+)
+PRINCIPAL_CACHE_REDIS_PREFIX = "principal_cache:"
+
+# Credentials never go to the cache; a restored instance loads them from the
+# database if something reads them
+SECRET_COLUMNS = frozenset({"api_token", "client_secret"})
+
+
+def snapshot(obj) -> dict:
+    """Column values of a loaded ORM instance, without SECRET_COLUMNS."""
+    return {
+        attr.key: getattr(obj, attr.key)
+        for attr in inspect(obj).mapper.column_attrs
+        if attr.key not in SECRET_COLUMNS
+    }
+
+
+def restore(model, data: dict):
+    """
+    Rebuilds a detached instance from a snapshot. Callers attach it to their
+    session with merge(load=False), which doesn't emit any SQL.
+    """
+    columns = inspect(model).columns
+    for key, value in data.items():
+        if isinstance(value, str) and key in columns:
+            column_type = columns[key].type
+            if isinstance(column_type, DateTime):
+                data[key] = datetime.fromisoformat(value)
+            elif isinstance(column_type, Date):
+                data[key] = date.fromisoformat(value)
+    obj = model(**data)
+    make_transient_to_detached(obj)
+    return obj
+
+
+def user_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def binding_key(user_email, engagement_name, project_name) -> str:
+    return f"binding:{user_email}:{engagement_name}:{project_name}"
+
+
+class PrincipalCache:
+    """
+    Short-TTL cache of authenticated users (keyed by token subject) and
+    user/project/engagement role bindings.
+
+    Entries live in process memory and, with PRINCIPAL_CACHE_REDIS, as Redis
+    keys expiring with the TTL so API workers warm each other. Invalidation
+    clears this process and Redis; other processes' local entries age out
+    within the TTL.
+    """
+
+    def __init__(
+        self,
+        ttl: int = PRINCIPAL_CACHE_TTL,
+        max_size: int = PRINCIPAL_CACHE_MAX_SIZE,
+        redis_client=None,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.redis_client = redis_client
+        self._entries: dict[str, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def _set_local(self, key, value, ttl):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # Dicts keep insertion order, so this drops the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def get(self, key: str):
+        value = self._get_local(key)
+        if value is not None or self.redis_client is None:
+            return value
+        try:
+            raw = self.redis_client.get(PRINCIPAL_CACHE_REDIS_PREFIX + key)
+        except redis.RedisError as e:
+            logger.warning(f"Principal cache Redis lookup failed: {e}")
+            return None
+        if raw is None:
+            return None
+        expires_at, value = serialization.loads(raw)
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return None
+        self._set_local(key, value, remaining)
+        return value
+
+    def set(self, key: str, value):
+        self._set_local(key, value, self.ttl)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(
+                PRINCIPAL_CACHE_REDIS_PREFIX + key,
+                serialization.dumps([time.time() + self.ttl, value]),
+                ex=max(1, int(self.ttl)),
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Principal cache Redis write failed: {e}")
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(PRINCIPAL_CACHE_REDIS_PREFIX + key)
+            except redis.RedisError as e:
+                logger.warning(f"Principal cache Redis invalidation failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.redis_client is not None:
+            try:
+                keys = list(
+                    self.redis_client.scan_iter(
+                        match=PRINCIPAL_CACHE_REDIS_PREFIX + "*", count=1000
+                    )
+                )
+                if keys:
+                    self.redis_client.delete(*keys)
+            except redis.RedisError as e:
+                logger.warning(f"Principal cache Redis invalidation failed: {e}")
+
+    def get_instances(self, key: str, models: tuple):
+        """Detached instances of models for key, or None on a miss."""
+        if not PRINCIPAL_CACHE_ENABLED:
+            return None
+        snapshots = self.get(key)
+        if snapshots is None:
+            return None
+        return [restore(model, dict(data)) for model, data in zip(models, snapshots)]
+
+    def set_instances(self, key: str, instances):
+        if PRINCIPAL_CACHE_ENABLED:
+            self.set(key, [snapshot(obj) for obj in instances])
+
+
+def _redis_client():
+    if not PRINCIPAL_CACHE_REDIS:
+        return None
+    return redis.StrictRedis(
+        host=env_vars.get("REDIS_HOST", "localhost"),
+        port=int(env_vars.get("REDIS_PORT", 6379)),
+        db=int(env_vars.get("REDIS_DB", 0)),
+    )
+
+
+principal_cache = PrincipalCache(redis_client=_redis_client())
@@ -11,6 +11,7 @@ from app.db_api.models.models import (
     UserProjectRole,
 )
 from app.logging_config import logger
+from app.utils.principal_cache import binding_key, principal_cache
 from common.constants import DEFAULT_EMAIL
 from common.utils import load_env
 
@@ -85,6 +86,9 @@ def get_engagement_and_user_create_project_and_role(
     return user_project_role, engagement, project, user
 
 
+BINDING_MODELS = (Engagement, Project, User, UserProjectRole)
+
+
 def _get_user_object(
     db, engagement_name, project_name, user_email, raise_exc, create_project_if_not
 ):
@@ -152,6 +156,14 @@ async def async_get_user_project_object(
     raise_exc=True,
     create_project_if_not=False,
 ):
+    key = binding_key(user_email, engagement_name, project_name)
+    cached = principal_cache.get_instances(key, BINDING_MODELS)
+    if cached:
+        engagement, project, user, user_project_role = [
+            await db.merge(obj, load=False) for obj in cached
+        ]
+        return user_project_role, project, user, engagement
+
     g = _get_user_object(
         db, engagement_name, project_name, user_email, raise_exc, create_project_if_not
     )
@@ -162,6 +174,8 @@ async def async_get_user_project_object(
     except Exception as e:
         logger.debug("Engagement project user not found", exc_info=e)
         result = None
+    if result:
+        principal_cache.set_instances(key, result)
     engagement, project, user, user_project_role = g.send(result)
     logger.info(
         f"Engagement: {engagement}, Project: {project}, User: {user}, user_project_role: {user_project_role}"
@@ -181,6 +195,14 @@ def get_user_project_object(
     logger.debug(
         f"Fetching user object for email: {user_email}, engagement: {engagement_name}, project: {project_name}"
     )
+    key = binding_key(user_email, engagement_name, project_name)
+    cached = principal_cache.get_instances(key, BINDING_MODELS)
+    if cached:
+        engagement, project, user, user_project_role = [
+            db.merge(obj, load=False) for obj in cached
+        ]
+        return user_project_role, project, user, engagement
+
     g = _get_user_object(
         db, engagement_name, project_name, user_email, raise_exc, create_project_if_not
     )
@@ -191,6 +213,8 @@ def get_user_project_object(
     except Exception as e:
         logger.error("Engagement project user not found", exc_info=e)
         result = None
+    if result:
+        principal_cache.set_instances(key, result)
 
     engagement, project, user, user_project_role = g.send(result)
 
@@ -0,0 +1,240 @@
+import math
+
+import redis
+import redis.asyncio as aioredis
+from fastapi import HTTPException
+
+from app.logging_config import logger
+from common.utils import load_env, num_tokens_from_string
+
+env_vars = load_env()
+
+RATE_LIMITER_ENABLED = env_vars.get("RATE_LIMITER_ENABLED", "f").lower() in (
+    "true",
+    "1",
+    "t",
+)
+# Limits are in cost units per period. With the default "evaluations" cost a
+# batch of N inputs with E evaluators costs N * E; with "tokens" it costs the
+# estimated input tokens times E.
+RATE_LIMIT_COST = env_vars.get("RATE_LIMIT_COST", "evaluations")
+RATE_LIMIT_PERIOD = int(env_vars.get("RATE_LIMIT_PERIOD", env_vars.get("TIME_WINDOW", 60)))
+RATE_LIMIT_ENGAGEMENT = int(env_vars.get("RATE_LIMIT_ENGAGEMENT", 500))
+RATE_LIMIT_USER = int(env_vars.get("RATE_LIMIT_USER", RATE_LIMIT_ENGAGEMENT))
+# Bulk submissions draw on their own buckets, sized for whole submissions
+# rather than interactive requests
+RATE_LIMIT_BULK_PERIOD = int(env_vars.get("RATE_LIMIT_BULK_PERIOD", 3600))
+RATE_LIMIT_BULK_ENGAGEMENT = int(env_vars.get("RATE_LIMIT_BULK_ENGAGEMENT", 500000))
+RATE_LIMIT_BULK_USER = int(
+    env_vars.get("RATE_LIMIT_BULK_USER", RATE_LIMIT_BULK_ENGAGEMENT)
+)
+RATE_LIMIT_PREFIX = "gcra:"
+
+if env_vars.get("RATE_LIMIT") and not env_vars.get("RATE_LIMIT_ENGAGEMENT"):
+    logger.warning(
+        "RATE_LIMIT counted requests and is no longer read. Limits are cost units "
+        "(inputs x evaluators) per RATE_LIMIT_PERIOD; set RATE_LIMIT_ENGAGEMENT "
+        "and RATE_LIMIT_USER instead."
+    )
+
+redis_host = env_vars.get("REDIS_HOST", "localhost")
+redis_port = int(env_vars.get("REDIS_PORT", 6379))
+redis_db = int(env_vars.get("REDIS_DB", 0))
+async_redis_client = aioredis.StrictRedis(host=redis_host, port=redis_port, db=redis_db)
+
+# Generic cell rate algorithm over several buckets at once.
+# KEYS: one bucket per limit, each holding its theoretical arrival time (ms)
+# ARGV[1]: cost, then limit and period (ms) for every key
+# A request is admitted only if every bucket admits it, and only then are the
+# buckets advanced, so a rejection never consumes capacity. The clock is Redis
+# TIME, so API replicas with skewed clocks share one timeline.
+GCRA_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + tonumber(now_parts[2]) / 1000
+local cost = tonumber(ARGV[1])
+local allowed = 1
+local results = {}
+local new_tats = {}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 * i])
+    local period = tonumber(ARGV[2 * i + 1])
+    local interval = period / limit
+    local tat = tonumber(redis.call('GET', key)) or now
+    if tat < now then
+        tat = now
+    end
+    local new_tat = tat + cost * interval
+    local allow_at = new_tat - period
+    local retry_after = 0
+    if allow_at > now then
+        allowed = 0
+        retry_after = allow_at - now
+        new_tat = tat
+    end
+    new_tats[i] = new_tat
+    local remaining = math.floor((now - (new_tat - period)) / interval)
+    results[i] = {limit, remaining, math.ceil(retry_after), math.ceil(new_tat - now)}
+end
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, tostring(new_tats[i]), 'PX', math.max(1, math.ceil(new_tats[i] - now)))
+    end
+end
+return {allowed, results}
+"""
+
+# Gives back cost charged by GCRA_SCRIPT to work that was then rolled back.
+# KEYS and ARGV as in GCRA_SCRIPT.
+REFUND_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + tonumber(now_parts[2]) / 1000
+local cost = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    local tat = tonumber(redis.call('GET', key))
+    if tat then
+        local interval = tonumber(ARGV[2 * i + 1]) / tonumber(ARGV[2 * i])
+        local new_tat = tat - cost * interval
+        if new_tat <= now then
+            redis.call('DEL', key)
+        else
+            redis.call('SET', key, tostring(new_tat), 'PX', math.max(1, math.ceil(new_tat - now)))
+        end
+    end
+end
+return 1
+"""
+
+
+class RateLimitResult:
+    def __init__(self, allowed: bool, limit: int, remaining: int, retry_after_ms: int, reset_ms: int):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = math.ceil(retry_after_ms / 1000)
+        self.reset = math.ceil(reset_ms / 1000)
+
+    def headers(self) -> dict:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+class GCRARateLimiter:
+    """
+    Cost-weighted GCRA limiter evaluated atomically in a single Lua script.
+
+    Each limit is a bucket of `limit` cost units refilled evenly over `period`
+    seconds. A request costing more than a full bucket can never be admitted;
+    enforce_rate_limit rejects it before it reaches Redis.
+    """
+
+    def __init__(self, client=None, period: int = RATE_LIMIT_PERIOD):
+        self.client = client or async_redis_client
+        self.period_ms = period * 1000
+        self._script = self.client.register_script(GCRA_SCRIPT)
+        self._refund_script = self.client.register_script(REFUND_SCRIPT)
+
+    def _args(self, buckets: dict[str, int], cost: int) -> tuple[list, list]:
+        keys = [f"{RATE_LIMIT_PREFIX}{key}" for key in buckets]
+        args = [cost]
+        for limit in buckets.values():
+            args += [limit, self.period_ms]
+        return keys, args
+
+    async def acquire(self, buckets: dict[str, int], cost: int) -> RateLimitResult:
+        """Charges cost against every bucket ({key: limit}); reports the most constrained one."""
+        keys, args = self._args(buckets, cost)
+        allowed, results = await self._script(keys=keys, args=args)
+        allowed = bool(allowed)
+        if allowed:
+            binding = min(results, key=lambda r: r[1])
+        else:
+            binding = max(results, key=lambda r: r[2])
+        return RateLimitResult(allowed, *binding)
+
+    async def refund(self, buckets: dict[str, int], cost: int):
+        keys, args = self._args(buckets, cost)
+        await self._refund_script(keys=keys, args=args)
+
+
+def request_cost(inputs, evaluations, aggregated_evaluations=None) -> int:
+    evaluator_count = len(evaluations) + len(aggregated_evaluations or [])
+    if RATE_LIMIT_COST == "tokens":
+        units = sum(num_tokens_from_string(item) for item in inputs)
+    else:
+        units = len(inputs)
+    return max(1, units * max(1, evaluator_count))
+
+
+def rate_limit_buckets(
+    engagement_name, user_email, bulk: bool = False
+) -> dict[str, int]:
+    if bulk:
+        return {
+            f"bulk:engagement:{engagement_name}": RATE_LIMIT_BULK_ENGAGEMENT,
+            f"bulk:user:{user_email}": RATE_LIMIT_BULK_USER,
+        }
+    return {
+        f"engagement:{engagement_name}": RATE_LIMIT_ENGAGEMENT,
+        f"user:{user_email}": RATE_LIMIT_USER,
+    }
+
+
+def rate_limiter(bulk: bool = False) -> GCRARateLimiter:
+    return GCRARateLimiter(period=RATE_LIMIT_BULK_PERIOD if bulk else RATE_LIMIT_PERIOD)
+
+
+async def enforce_rate_limit(
+    engagement_name, user_email, cost: int, response=None, bulk: bool = False
+):
+    """
+    Charges cost to the engagement and user buckets, the bulk ones for bulk
+    submissions. Raises 429 with Retry-After when either is exhausted, and 429
+    without it when cost exceeds a whole bucket, which no wait would admit.
+    Otherwise sets RateLimit-* headers on response. Fails open if Redis is
+    unavailable.
+    """
+    buckets = rate_limit_buckets(engagement_name, user_email, bulk)
+    limit = min(buckets.values())
+    if cost > limit:
+        period = RATE_LIMIT_BULK_PERIOD if bulk else RATE_LIMIT_PERIOD
+        hint = (
+            "Submit it with fewer evaluators."
+            if bulk
+            else "Split it into smaller requests."
+        )
+        raise HTTPException(
+            status_code=429,
+            detail=f"Request cost {cost} exceeds the rate limit of {limit} per {period} seconds. {hint}",
+        )
+    try:
+        result = await rate_limiter(bulk).acquire(buckets, cost)
+    except redis.RedisError as e:
+        logger.error("Rate limiter unavailable, allowing request", exc_info=e)
+        return None
+    if not result.allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded. Please retry after {result.retry_after} seconds.",
+            headers=result.headers(),
+        )
+    if response is not None:
+        response.headers.update(result.headers())
+    return result
+
+
+async def refund_rate_limit(engagement_name, user_email, cost: int, bulk: bool = False):
+    """Returns cost charged by enforce_rate_limit for work that was rolled back."""
+    if cost <= 0:
+        return
+    try:
+        await rate_limiter(bulk).refund(
+            rate_limit_buckets(engagement_name, user_email, bulk), cost
+        )
+    except redis.RedisError as e:
+        logger.error("Rate limiter unavailable, could not refund", exc_info=e)
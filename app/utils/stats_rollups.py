@@ -0,0 +1,472 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, delete, distinct, func, insert, literal, select, text
+
+from app.db_api import models
+from app.logging_config import logger
+from app.pydantic_models import RunStatus
+
+# evaluator_id of the run-level row: totals across every evaluator of a run
+ALL_EVALUATORS = 0
+
+ROLLUP_KEYS = ("day", "engagement_id", "project_id", "evaluator_id")
+ROLLUP_COUNTERS = (
+    "run_count",
+    "run_failed_count",
+    "evaluation_count",
+    "evaluation_failed_count",
+    "total_prompt_tokens",
+    "total_generate_tokens",
+    "total_latency_ms",
+)
+
+_project_scopes: dict[int, tuple[int, int]] = {}
+
+
+def _empty_row(day, engagement_id, project_id, evaluator_id) -> dict:
+    return {
+        "day": day,
+        "engagement_id": engagement_id,
+        "project_id": project_id,
+        "evaluator_id": evaluator_id,
+        **{counter: 0 for counter in ROLLUP_COUNTERS},
+    }
+
+
+def run_rollup_increments(
+    day: date,
+    engagement_id: int,
+    project_id: int,
+    run_status: str,
+    evaluations: list[dict],
+    latency_ms: int,
+) -> list[dict]:
+    """
+    Rollup increments for one saved run: a run-level row (ALL_EVALUATORS) plus
+    one row per evaluator that ran on it. Rows are sorted by key so concurrent
+    upserts lock them in the same order.
+    """
+    run_failed = int(run_status == RunStatus.FAILED.value)
+    rows = {ALL_EVALUATORS: _empty_row(day, engagement_id, project_id, ALL_EVALUATORS)}
+    for evaluation in evaluations:
+        evaluator_id = evaluation.get("evaluator_id") or ALL_EVALUATORS
+        targets = [rows[ALL_EVALUATORS]]
+        if evaluator_id != ALL_EVALUATORS:
+            if evaluator_id not in rows:
+                rows[evaluator_id] = _empty_row(
+                    day, engagement_id, project_id, evaluator_id
+                )
+                rows[evaluator_id]["run_count"] = 1
+                rows[evaluator_id]["run_failed_count"] = run_failed
+                rows[evaluator_id]["total_latency_ms"] = latency_ms
+            targets.append(rows[evaluator_id])
+        for row in targets:
+            row["evaluation_count"] += 1
+            row["evaluation_failed_count"] += int(
+                evaluation.get("status") == RunStatus.FAILED.value
+            )
+            row["total_prompt_tokens"] += evaluation.get("prompt_tokens_used") or 0
+            row["total_generate_tokens"] += evaluation.get("generate_tokens_used") or 0
+
+    run_row = rows[ALL_EVALUATORS]
+    run_row["run_count"] = 1
+    run_row["run_failed_count"] = run_failed
+    run_row["total_latency_ms"] = latency_ms
+    return [rows[evaluator_id] for evaluator_id in sorted(rows)]
+
+
+def insert_ignore_stmt(db, table):
+    """
+    INSERT into table that skips rows whose unique keys already exist, for the
+    dialect of db (a Session or AsyncSession).
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+
+        # A no-op update rather than INSERT IGNORE, which would also turn
+        # truncation and other data errors into warnings
+        key = next(iter(table.primary_key))
+        return dialect_insert(table).on_duplicate_key_update({key.name: key})
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    return dialect_insert(table).on_conflict_do_nothing()
+
+
+def insert_ignore(db, table, rows: list[dict]):
+    """Inserts rows, skipping those whose unique keys already exist."""
+    db.execute(insert_ignore_stmt(db, table), rows)
+
+
+def lock_days(db, days: list[date], exclusive: bool = False):
+    """
+    Locks the rollup buckets of days until the transaction ends. Saves take
+    them shared and compaction exclusive, before it reads any run: a run
+    saved before compaction's reads is counted by compaction, and the
+    increment of one saved while it runs lands on top of its rows.
+    """
+    days = sorted(set(days))
+    insert_ignore(db, models.StatsRollupLock.__table__, [{"day": d} for d in days])
+    db.execute(
+        select(models.StatsRollupLock.day)
+        .filter(models.StatsRollupLock.day.in_(days))
+        .order_by(models.StatsRollupLock.day)
+        .with_for_update(read=not exclusive)
+    ).all()
+
+
+def upsert_rollup_increments(db, rows: list[dict]):
+    """Adds rows onto the rollup table, creating missing grains."""
+    if not rows:
+        return
+    table = models.StatsRollup.__table__
+    dialect = db.bind.dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+
+        stmt = dialect_insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            {c: table.c[c] + stmt.inserted[c] for c in ROLLUP_COUNTERS}
+            | {"updated_at": func.now()}
+        )
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        stmt = dialect_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEYS),
+            set_={c: table.c[c] + stmt.excluded[c] for c in ROLLUP_COUNTERS}
+            | {"updated_at": func.now()},
+        )
+    db.execute(stmt)
+
+
+def resolve_project_scope(db, user_project_role_id: int) -> tuple[int, int]:
+    """(engagement_id, project_id) of a user project role; bindings don't move projects."""
+    scope = _project_scopes.get(user_project_role_id)
+    if scope is None:
+        scope = tuple(
+            db.execute(
+                select(models.Project.engagement_id, models.Project.id)
+                .join(
+                    models.UserProjectRole,
+                    models.UserProjectRole.project_id == models.Project.id,
+                )
+                .filter(models.UserProjectRole.id == user_project_role_id)
+            ).one()
+        )
+        _project_scopes[user_project_role_id] = scope
+    return scope
+
+
+def record_saved_run(
+    db,
+    run: dict,
+    run_status: str,
+    evaluations: list[dict],
+    run_created_at,
+    run_updated_at,
+):
+    """
+    Applies a saved run to the rollups within the caller's transaction, before
+    it commits the run, so compaction sees either both or neither. Rollups are
+    derived data: a failure here rolls back to a savepoint and is logged,
+    left to compaction to repair rather than failing the save.
+    """
+    try:
+        with db.begin_nested():
+            engagement_id, project_id = resolve_project_scope(
+                db, run["user_project_role_id"]
+            )
+            latency_ms = max(
+                0, int((run_updated_at - run_created_at).total_seconds() * 1000)
+            )
+            lock_days(db, [run_created_at.date()])
+            upsert_rollup_increments(
+                db,
+                run_rollup_increments(
+                    run_created_at.date(),
+                    engagement_id,
+                    project_id,
+                    run_status,
+                    evaluations,
+                    latency_ms,
+                ),
+            )
+    except Exception as e:
+        logger.error(
+            f"Failed to update stats rollups for run {run['run_id']}", exc_info=e
+        )
+
+
+def _elapsed_ms(dialect: str, start, end):
+    """Milliseconds from start to end; datetime arithmetic differs per dialect."""
+    if dialect == "mysql":
+        return func.timestampdiff(text("MICROSECOND"), start, end) / 1000
+    if dialect == "postgresql":
+        return func.extract("epoch", end - start) * 1000
+    return (func.julianday(end) - func.julianday(start)) * 86400000
+
+
+def _aggregate_runs(since: datetime, until: datetime, dialect: str):
+    day = func.date(models.Run.created_at)
+    return (
+        select(
+            day.label("day"),
+            models.Project.engagement_id,
+            models.Project.id.label("project_id"),
+            literal(ALL_EVALUATORS).label("evaluator_id"),
+            func.count(models.Run.id).label("run_count"),
+            func.sum(
+                case((models.Run.status == RunStatus.FAILED.value, 1), else_=0)
+            ).label("run_failed_count"),
+            func.coalesce(
+                func.sum(
+                    _elapsed_ms(dialect, models.Run.created_at, models.Run.updated_at)
+                ),
+                0,
+            ).label("total_latency_ms"),
+        )
+        .join(
+            models.UserProjectRole,
+            models.UserProjectRole.id == models.Run.user_project_role_id,
+        )
+        .join(models.Project, models.Project.id == models.UserProjectRole.project_id)
+        .filter(
+            models.Run.created_at >= since,
+            models.Run.created_at < until,
+            models.Run.status.notin_(
+                [RunStatus.PENDING.value, RunStatus.IN_PROGRESS.value]
+            ),
+        )
+        .group_by(day, models.Project.engagement_id, models.Project.id)
+    )
+
+
+def _aggregate_evaluations(since: datetime, until: datetime, per_evaluator: bool):
+    day = func.date(models.Run.created_at)
+    evaluator_id = (
+        func.coalesce(models.Evaluation.evaluator_id, ALL_EVALUATORS)
+        if per_evaluator
+        else literal(ALL_EVALUATORS)
+    )
+    columns = [
+        day.label("day"),
+        models.Project.engagement_id,
+        models.Project.id.label("project_id"),
+        evaluator_id.label("evaluator_id"),
+        func.count(models.Evaluation.id).label("evaluation_count"),
+        func.sum(
+            case((models.Evaluation.status == RunStatus.FAILED.value, 1), else_=0)
+        ).label("evaluation_failed_count"),
+        func.coalesce(func.sum(models.Evaluation.prompt_tokens_used), 0).label(
+            "total_prompt_tokens"
+        ),
+        func.coalesce(func.sum(models.Evaluation.generate_tokens_used), 0).label(
+            "total_generate_tokens"
+        ),
+    ]
+    if per_evaluator:
+        columns += [
+            func.count(distinct(models.Run.id)).label("run_count"),
+            func.count(
+                distinct(
+                    case((models.Run.status == RunStatus.FAILED.value, models.Run.id))
+                )
+            ).label("run_failed_count"),
+        ]
+    query = (
+        select(*columns)
+        .join(models.Run, models.Run.id == models.Evaluation.run_id)
+        .join(
+            models.UserProjectRole,
+            models.UserProjectRole.id == models.Run.user_project_role_id,
+        )
+        .join(models.Project, models.Project.id == models.UserProjectRole.project_id)
+        .filter(models.Run.created_at >= since, models.Run.created_at < until)
+        .group_by(day, models.Project.engagement_id, models.Project.id)
+    )
+    if per_evaluator:
+        query = query.filter(models.Evaluation.evaluator_id.isnot(None)).group_by(
+            evaluator_id
+        )
+    return query
+
+
+def compact_rollups(db, days: int = 2, until: date | None = None) -> int:
+    """
+    Recomputes the rollups of the last `days` days exactly from runs and
+    evaluations and swaps them in within one transaction. This reconciles any
+    drift from the incremental path (runs failed outside save_results, upserts
+    that were lost).
+
+    The days are locked against saves for the duration, see lock_days.
+    """
+    until = until or date.today() + timedelta(days=1)
+    since = until - timedelta(days=days)
+    since_dt = datetime.combine(since, datetime.min.time())
+    until_dt = datetime.combine(until, datetime.min.time())
+    lock_days(db, [since + timedelta(days=i) for i in range(days)], exclusive=True)
+
+    rows: dict[tuple, dict] = {}
+
+    def merge(result):
+        for record in result.mappings():
+            key = tuple(record[k] for k in ROLLUP_KEYS)
+            row = rows.setdefault(key, _empty_row(*key))
+            for counter in ROLLUP_COUNTERS:
+                if counter in record:
+                    row[counter] = int(record[counter] or 0)
+
+    merge(db.execute(_aggregate_runs(since_dt, until_dt, db.bind.dialect.name)))
+    merge(db.execute(_aggregate_evaluations(since_dt, until_dt, per_evaluator=False)))
+    merge(db.execute(_aggregate_evaluations(since_dt, until_dt, per_evaluator=True)))
+
+    per_evaluator_latency = _evaluator_latency(db, since_dt, until_dt)
+    for key, latency_ms in per_evaluator_latency.items():
+        if key in rows:
+            rows[key]["total_latency_ms"] = latency_ms
+
+    db.execute(
+        delete(models.StatsRollup).filter(
+            models.StatsRollup.day >= since, models.StatsRollup.day < until
+        )
+    )
+    if rows:
+        db.execute(insert(models.StatsRollup), [rows[key] for key in sorted(rows)])
+    db.commit()
+    logger.info(f"Compacted {len(rows)} stats rollup rows for {since} to {until}")
+    return len(rows)
+
+
+def backfill_rollups(db, chunk_days: int = 30) -> int:
+    """
+    Compacts every day since the first run, chunk_days per transaction. Run
+    once after creating the rollup table; the scheduled compaction only
+    covers the trailing days.
+    """
+    first_run_at = db.scalar(select(func.min(models.Run.created_at)))
+    if first_run_at is None:
+        return 0
+    end = date.today() + timedelta(days=1)
+    day = first_run_at.date()
+    compacted = 0
+    while day < end:
+        until = min(day + timedelta(days=chunk_days), end)
+        compacted += compact_rollups(db, days=(until - day).days, until=until)
+        day = until
+    return compacted
+
+
+def _evaluator_latency(db, since: datetime, until: datetime) -> dict[tuple, int]:
+    """Summed run latency per evaluator grain, each run counted once per evaluator."""
+    dialect = db.bind.dialect.name
+    runs_per_evaluator = (
+        select(
+            models.Run.id.label("run_id"),
+            models.Run.created_at,
+            models.Run.updated_at,
+            models.Run.user_project_role_id,
+            models.Evaluation.evaluator_id,
+        )
+        .join(models.Evaluation, models.Evaluation.run_id == models.Run.id)
+        .filter(
+            models.Run.created_at >= since,
+            models.Run.created_at < until,
+            models.Evaluation.evaluator_id.isnot(None),
+            models.Run.status.notin_(
+                [RunStatus.PENDING.value, RunStatus.IN_PROGRESS.value]
+            ),
+        )
+        .distinct()
+        .subquery()
+    )
+    query = (
+        select(
+            func.date(runs_per_evaluator.c.created_at).label("day"),
+            models.Project.engagement_id,
+            models.Project.id.label("project_id"),
+            runs_per_evaluator.c.evaluator_id,
+            func.coalesce(
+                func.sum(
+                    _elapsed_ms(
+                        dialect,
+                        runs_per_evaluator.c.created_at,
+                        runs_per_evaluator.c.updated_at,
+                    )
+                ),
+                0,
+            ).label("total_latency_ms"),
+        )
+        .join(
+            models.UserProjectRole,
+            models.UserProjectRole.id == runs_per_evaluator.c.user_project_role_id,
+        )
+        .join(models.Project, models.Project.id == models.UserProjectRole.project_id)
+        .group_by(
+            func.date(runs_per_evaluator.c.created_at),
+            models.Project.engagement_id,
+            models.Project.id,
+            runs_per_evaluator.c.evaluator_id,
+        )
+    )
+    return {
+        tuple(record[k] for k in ROLLUP_KEYS): int(record["total_latency_ms"] or 0)
+        for record in db.execute(query).mappings()
+    }
+
+
+def _rollup_filters(filters: dict):
+    return [getattr(models.StatsRollup, key) == value for key, value in filters.items()]
+
+
+def rollup_totals_select(**filters):
+    """Sums every counter over the rollup rows matching filters (column == value)."""
+    return select(
+        *[
+            func.coalesce(func.sum(getattr(models.StatsRollup, c)), 0).label(c)
+            for c in ROLLUP_COUNTERS
+        ]
+    ).filter(*_rollup_filters(filters))
+
+
+async def async_read_rollup_totals(db, **filters) -> dict:
+    row = (await db.execute(rollup_totals_select(**filters))).mappings().one()
+    return {c: int(row[c]) for c in ROLLUP_COUNTERS}
+
+
+def batch_count_select(engagement_id=None, project_id=None, evaluator_id=None):
+    """
+    Distinct batches of an engagement, project or evaluator. Counted at read
+    time rather than rolled up: a batch active on several days would be
+    counted once per day by summing daily rows.
+    """
+    if evaluator_id is not None:
+        return (
+            select(func.count(distinct(models.Run.batch_run_id)))
+            .join(models.Evaluation, models.Evaluation.run_id == models.Run.id)
+            .filter(models.Evaluation.evaluator_id == evaluator_id)
+        )
+    query = select(func.count(models.BatchRun.id)).join(
+        models.UserProjectRole,
+        models.UserProjectRole.id == models.BatchRun.user_project_role_id,
+    )
+    if project_id is not None:
+        return query.filter(models.UserProjectRole.project_id == project_id)
+    return query.join(
+        models.Project, models.Project.id == models.UserProjectRole.project_id
+    ).filter(models.Project.engagement_id == engagement_id)
+
+
+async def async_count_distinct_rollup(db, column: str, **filters) -> int:
+    return await db.scalar(
+        select(func.count(distinct(getattr(models.StatsRollup, column)))).filter(
+            *_rollup_filters(filters)
+        )
+    )
@@ -0,0 +1,78 @@
+"""
+Load test for the CRUD, pricing and health endpoints. Fires more concurrent
+requests than FastAPI's default threadpool (40 threads) can serve at once:
+with async endpoints the latency of a wave stays close to that of a single
+request instead of growing in steps of 40.
+
+    python -m benchmarks.crud_load_test --base-url http://localhost:8887 \\
+        --token $API_TOKEN --concurrency 200 --waves 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+PATHS = [
+    "/api/v1/health",
+    "/api/v1/admin-crud-for-all/engagements?limit=50",
+    "/api/v1/admin-crud-for-all/runs?limit=50",
+    "/api/v1/admin-crud-for-all/evaluations?limit=50",
+    "/api/v1/pricing/provider-models",
+]
+
+
+async def timed_get(client: httpx.AsyncClient, path: str) -> tuple[float, int]:
+    start = time.perf_counter()
+    response = await client.get(path)
+    return time.perf_counter() - start, response.status_code
+
+
+async def run_wave(client: httpx.AsyncClient, concurrency: int):
+    return await asyncio.gather(
+        *[timed_get(client, PATHS[i % len(PATHS)]) for i in range(concurrency)]
+    )
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[int(q) - 1]
+
+
+async def main(base_url: str, token: str, concurrency: int, waves: int):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        headers={"Authorization": f"Bearer {token}"},
+        limits=limits,
+        timeout=120,
+    ) as client:
+        # Single request baseline
+        baseline = [(await timed_get(client, path))[0] for path in PATHS]
+
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(waves):
+            for latency, status in await run_wave(client, concurrency):
+                latencies.append(latency)
+                errors += status >= 400
+        elapsed = time.perf_counter() - start
+
+    print(f"single request   mean {statistics.mean(baseline) * 1000:8.1f} ms")
+    print(f"concurrency      {concurrency} x {waves} waves")
+    print(f"throughput       {len(latencies) / elapsed:8.1f} req/s")
+    print(f"latency p50      {percentile(latencies, 50) * 1000:8.1f} ms")
+    print(f"latency p95      {percentile(latencies, 95) * 1000:8.1f} ms")
+    print(f"latency p99      {percentile(latencies, 99) * 1000:8.1f} ms")
+    print(f"errors           {errors}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8887")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--waves", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.token, args.concurrency, args.waves))
@@ -0,0 +1,111 @@
+"""
+Per-call overhead of building a chat model (and its HTTP client) on every
+attempt versus reusing the pooled instance from llm_failover.client_registry.
+
+By default it runs against a local fake OpenAI-compatible server, which shows
+the client construction cost. Point it at a real endpoint to include the TLS
+handshake and connection setup that pooling removes:
+
+    python -m benchmarks.llm_client_overhead --calls 200
+    python -m benchmarks.llm_client_overhead --base-url https://api.openai.com/v1 \\
+        --api-key $OPENAI_API_KEY --model gpt-4o-mini --calls 20
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_openai import ChatOpenAI
+
+from llm_failover import ChatFailoverLLM
+from llm_failover.client_registry import client_registry
+
+COMPLETION = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "ok"},
+            "finish_reason": "stop",
+        }
+    ],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def fresh_call(base_url: str, api_key: str, model: str):
+    # What every attempt did before: a new model and HTTP client per call
+    return ChatOpenAI(
+        openai_api_key=api_key, model=model, base_url=base_url, max_retries=0
+    ).invoke("ping")
+
+
+def pooled_call(base_url: str, api_key: str, model: str):
+    llm = ChatFailoverLLM(
+        "openai_api", model, initial_key=api_key, base_url=base_url, max_retries=0
+    )
+    return llm.invoke("ping")
+
+
+def timed(call, calls: int, *args) -> list[float]:
+    call(*args)  # warm-up, imports and the first connection
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    print(
+        f"{name:8} mean {statistics.mean(latencies) * 1000:8.2f} ms"
+        f"   p50 {statistics.median(latencies) * 1000:8.2f} ms"
+        f"   max {max(latencies) * 1000:8.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url")
+    parser.add_argument("--api-key", default="sk-benchmark")
+    parser.add_argument("--model", default="bench")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    base_url = args.base_url or start_fake_server()
+
+    fresh = timed(fresh_call, args.calls, base_url, args.api_key, args.model)
+    pooled = timed(pooled_call, args.calls, base_url, args.api_key, args.model)
+    report("fresh", fresh)
+    report("pooled", pooled)
+    saved = statistics.mean(fresh) - statistics.mean(pooled)
+    print(f"overhead removed per call {saved * 1000:8.2f} ms")
+    print(f"registry {client_registry.stats()}")
@@ -0,0 +1,90 @@
+"""
+Compares stdlib json against the orjson-backed common.serialization layer on
+payloads shaped like the ones this service moves around: a large evaluation
+output and a batch of bulk queue payloads.
+
+    python -m benchmarks.serialization_bench --runs 200 --repeat 20
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime, timezone
+
+from common import serialization
+
+
+def make_evaluation_output(turns: int) -> dict:
+    return {
+        "name": "dual_agent_judge",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "output": {
+            "score": 0.87,
+            "verdict": "PASS",
+            "issues": [
+                {
+                    "turn": i,
+                    "severity": "minor" if i % 3 else "major",
+                    "explanation": "The assistant répondu partially — " * 8,
+                    "spans": [[i, i + 17], [i + 40, i + 52]],
+                    "confidence": 0.5 + (i % 50) / 100,
+                }
+                for i in range(turns)
+            ],
+            "token_usage": {"input_tokens": 18234, "output_tokens": 2311},
+        },
+    }
+
+
+def make_queue_payloads(runs: int) -> list[dict]:
+    return [
+        {
+            "run_item": {
+                "id": i,
+                "input_hash": f"{i:064x}",
+                "input": {"conversation": [f"User: question {i}", "Assistant: answer"]},
+            },
+            "evaluations": [{"name": "grammar"}, {"name": "dual_agent_judge"}],
+            "aggregated_evaluations": [],
+        }
+        for i in range(runs)
+    ]
+
+
+def bench(label: str, fn, repeat: int):
+    seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"{label:<32} {seconds * 1000:9.3f} ms")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON serialization")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    output = make_evaluation_output(args.turns)
+    payloads = make_queue_payloads(args.runs)
+    encoded = json.dumps(output)
+
+    print(f"evaluation output: {len(encoded) / 1024:.1f} KiB, queue payloads: {args.runs}")
+    pairs = [
+        ("dumps output", lambda: json.dumps(output), lambda: serialization.dumps(output)),
+        ("loads output", lambda: json.loads(encoded), lambda: serialization.loads(encoded)),
+        (
+            "dumps queue payloads",
+            lambda: [json.dumps(p) for p in payloads],
+            lambda: [serialization.dumps(p) for p in payloads],
+        ),
+    ]
+    for label, stdlib_fn, fast_fn in pairs:
+        stdlib = bench(f"{label} (json)", stdlib_fn, args.repeat)
+        fast = bench(f"{label} (orjson)", fast_fn, args.repeat)
+        print(f"{'':<32} {stdlib / fast:9.1f}x")
+
+    bench("input hash (canonical)", lambda: serialization.content_hash(output), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
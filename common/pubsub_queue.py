@@ -1,4 +1,3 @@
-import json
 from enum import Enum
 from typing import Any
 
@@ -6,6 +5,7 @@ from google.cloud import pubsub_v1
 from google.oauth2 import service_account
 from pydantic import BaseModel, Field
 
+from common import serialization
 from common.constants import GOOGLE_API_CREDENTIALS_PATH
 from common.utils import load_env
 
@@ -49,7 +49,7 @@ class PubSubMessage(BaseModel):
 
     @classmethod
     def deserialize(cls, message: bytes) -> "PubSubMessage":
-        return cls(**json.loads(message.decode("utf-8")))
+        return cls(**serialization.loads(message))
 
 
 def create_stage_pubsub_messages(
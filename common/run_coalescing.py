@@ -0,0 +1,207 @@
+import redis
+
+from app.logging_config import logger
+from common import serialization
+from common.utils import load_env
+
+env_vars = load_env()
+
+COALESCING_ENABLED = env_vars.get("COALESCING_ENABLED", "f").lower() in (
+    "true",
+    "1",
+    "t",
+)
+# Should outlive the slowest run (see MAX_CELERY_TASK_TIMEOUT): followers of a
+# leader that hasn't reported back when its keys expire are failed by the sweep.
+COALESCING_TTL = int(env_vars.get("COALESCING_TTL", 1800))
+COALESCING_PREFIX = "coalesce:"
+# Followers waiting on a leader, oldest first, with their run items and leaders.
+# Unlike the leader keys these never expire, so the sweep can find followers
+# whose leader was revoked, lost with its worker or outlived COALESCING_TTL.
+WAITING_KEY = f"{COALESCING_PREFIX}waiting"
+WAITING_ITEMS_KEY = f"{COALESCING_PREFIX}waiting:items"
+WAITING_LEADERS_KEY = f"{COALESCING_PREFIX}waiting:leaders"
+SWEEP_PAGE_SIZE = 1000
+
+redis_host = env_vars.get("REDIS_HOST", "localhost")
+redis_port = int(env_vars.get("REDIS_PORT", 6379))
+redis_db = int(env_vars.get("REDIS_DB", 0))
+redis_client = redis.StrictRedis(host=redis_host, port=redis_port, db=redis_db)
+
+# KEYS: leader key, followers key, leader run key, then the waiting keys
+# ARGV: run_id, follower payload, ttl
+# Returns the leader's run_id when one is already in flight (the run was attached as
+# a follower), or nothing when this run became the leader.
+JOIN_SCRIPT = """
+local leader = redis.call('GET', KEYS[1])
+if leader then
+    local now = redis.call('TIME')
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    redis.call('ZADD', KEYS[4], now[1], ARGV[1])
+    redis.call('HSET', KEYS[5], ARGV[1], ARGV[2])
+    redis.call('HSET', KEYS[6], ARGV[1], leader)
+    return leader
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('SET', KEYS[3], KEYS[1], 'EX', ARGV[3])
+return false
+"""
+
+# KEYS: leader run key, then the waiting keys
+# ARGV: run_id, followers key prefix
+# Releases leadership and returns every attached follower payload in one step, so a
+# submission either lands in the returned list or starts a fresh leader. Lists
+# written before followers were tracked hold the payloads themselves.
+COMPLETE_SCRIPT = """
+local leader_key = redis.call('GET', KEYS[1])
+if not leader_key then
+    return {}
+end
+local followers_key = ARGV[2] .. leader_key
+local ids = redis.call('LRANGE', followers_key, 0, -1)
+if redis.call('GET', leader_key) == ARGV[1] then
+    redis.call('DEL', leader_key)
+end
+redis.call('DEL', KEYS[1], followers_key)
+local followers = {}
+for _, id in ipairs(ids) do
+    local item = redis.call('HGET', KEYS[3], id)
+    if item then
+        followers[#followers + 1] = item
+        redis.call('ZREM', KEYS[2], id)
+        redis.call('HDEL', KEYS[3], id)
+        redis.call('HDEL', KEYS[4], id)
+    elseif string.sub(id, 1, 1) == '{' then
+        followers[#followers + 1] = id
+    end
+end
+return followers
+"""
+
+# KEYS: the waiting keys
+# ARGV: run key prefix, then follower run_ids
+# Releases the given followers whose leader's run key is gone and returns how
+# many were released and their payloads. A completing leader releases its followers in the same step as its
+# run key, so a follower is either completed or swept, never both.
+SWEEP_SCRIPT = """
+local released = 0
+local orphans = {}
+for i = 2, #ARGV do
+    local id = ARGV[i]
+    local leader = redis.call('HGET', KEYS[3], id)
+    if not leader or redis.call('EXISTS', ARGV[1] .. leader) == 0 then
+        local item = redis.call('HGET', KEYS[2], id)
+        if item then
+            orphans[#orphans + 1] = item
+        end
+        released = released + 1
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('HDEL', KEYS[2], id)
+        redis.call('HDEL', KEYS[3], id)
+    end
+end
+return {released, orphans}
+"""
+
+WAITING_KEYS = [WAITING_KEY, WAITING_ITEMS_KEY, WAITING_LEADERS_KEY]
+
+
+def coalescing_key(
+    input_hash: str, evaluations, aggregated_evaluations, run_config: dict
+) -> str:
+    """
+    Identity of a run's work: the input hash, the evaluator set and the settings
+    that change evaluator output. Two runs with the same key produce the same
+    evaluations, so only one of them needs to be executed.
+    """
+    evaluator_set_hash = serialization.content_hash(
+        {"evaluations": evaluations, "aggregated_evaluations": aggregated_evaluations}
+    )
+    config_hash = serialization.content_hash(run_config)
+    return f"{input_hash}:{evaluator_set_hash}:{config_hash}"
+
+
+class RunCoalescer:
+    """
+    Single-flight coalescing of identical in-flight runs.
+
+    The first run submitted for a key becomes the leader and is executed normally.
+    Identical runs submitted while the leader is pending are attached as followers
+    and not dispatched; when the leader's results are saved (or it fails), the
+    followers are released and receive copies of the outcome. Followers of a
+    leader that never reports back are released by sweep() once its keys expire.
+    """
+
+    def __init__(self, client=None, ttl: int = COALESCING_TTL):
+        self.client = client or redis_client
+        self.ttl = ttl
+        self._join = self.client.register_script(JOIN_SCRIPT)
+        self._complete = self.client.register_script(COMPLETE_SCRIPT)
+        self._sweep = self.client.register_script(SWEEP_SCRIPT)
+
+    @staticmethod
+    def _leader_key(key: str) -> str:
+        return f"{COALESCING_PREFIX}leader:{key}"
+
+    @staticmethod
+    def _run_key(run_id: int) -> str:
+        return f"{COALESCING_PREFIX}run:{run_id}"
+
+    def join_many(self, keyed_run_items: list[tuple[str, dict]]) -> list[int | None]:
+        """
+        Joins each (key, run_item) in one pipelined round trip. Returns, per item,
+        the leader's run_id if it was attached as a follower, or None if it leads.
+        Duplicates within the same call coalesce onto the first of them.
+        """
+        pipeline = self.client.pipeline(transaction=False)
+        for key, run_item in keyed_run_items:
+            leader_key = self._leader_key(key)
+            self._join(
+                keys=[
+                    leader_key,
+                    f"{COALESCING_PREFIX}followers:{leader_key}",
+                    self._run_key(run_item["run_id"]),
+                    *WAITING_KEYS,
+                ],
+                args=[run_item["run_id"], serialization.dumps(run_item), self.ttl],
+                client=pipeline,
+            )
+        leaders = [
+            None if leader is None else int(leader) for leader in pipeline.execute()
+        ]
+        followers = sum(leader is not None for leader in leaders)
+        if followers:
+            logger.info(f"{followers} runs coalesced onto in-flight runs")
+        return leaders
+
+    def complete(self, run_id: int) -> list[dict]:
+        """Releases leadership of run_id and returns the run items of its followers."""
+        followers = self._complete(
+            keys=[self._run_key(run_id), *WAITING_KEYS],
+            args=[run_id, f"{COALESCING_PREFIX}followers:"],
+        )
+        return [serialization.loads(follower) for follower in followers]
+
+    def sweep(self) -> list[dict]:
+        """
+        Releases the followers whose leader's keys expired without it
+        completing, and returns their run items.
+        """
+        orphans = []
+        start = 0
+        while True:
+            ids = self.client.zrange(WAITING_KEY, start, start + SWEEP_PAGE_SIZE - 1)
+            if not ids:
+                break
+            released, items = self._sweep(
+                keys=WAITING_KEYS, args=[self._run_key(""), *ids]
+            )
+            orphans += [serialization.loads(item) for item in items]
+            # Released followers left the set, the rest stay ahead of the next page
+            start += len(ids) - released
+            if len(ids) < SWEEP_PAGE_SIZE:
+                break
+        if orphans:
+            logger.warning(f"{len(orphans)} coalesced runs lost their leader")
+        return orphans
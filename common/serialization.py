@@ -0,0 +1,77 @@
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+
+import orjson
+from pydantic import BaseModel
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    """Fallback for types orjson doesn't serialize natively."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """Serializes to UTF-8 JSON bytes with orjson, falling back to the stdlib for
+    values orjson rejects (e.g. integers wider than 64 bits)."""
+    try:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        return json.dumps(obj, default=_default).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data: bytes | bytearray | memoryview | str) -> Any:
+    """Parses JSON with orjson, falling back to the stdlib for inputs only it
+    accepts (NaN/Infinity literals)."""
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return json.loads(data)
+
+
+def canonical_dumps(obj: Any) -> str:
+    """
+    Canonical JSON used for content hashing.
+
+    This is deliberately the stdlib encoder with sort_keys=True: every
+    input_hash already stored on runs was computed from exactly this form
+    (spaced separators, ASCII escapes, Python float repr). orjson's compact
+    UTF-8 output would change every digest. The stdlib encoder here runs in
+    its C accelerator, so hashing stays cheap.
+    """
+    return json.dumps(obj, sort_keys=True)
+
+
+def compute_input_hash(input_item: Any, input_type: Any) -> tuple[str, str]:
+    """Returns the canonical JSON of an input item and its sha256 input hash."""
+    input_data_json = canonical_dumps(input_item)
+    input_data_hash = hashlib.sha256(
+        (input_data_json + str(input_type)).encode("utf-8")
+    ).hexdigest()
+    return input_data_json, input_data_hash
+
+
+def content_hash(obj: Any) -> str:
+    """sha256 over the canonical JSON of any payload."""
+    return hashlib.sha256(canonical_dumps(obj).encode("utf-8")).hexdigest()
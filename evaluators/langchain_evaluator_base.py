@@ -1,18 +1,20 @@
 import json
 import os
+import string
 from abc import abstractmethod
 from typing import Any
 
 import gevent
-from langchain.prompts import HumanMessagePromptTemplate
+from langchain.prompts import HumanMessagePromptTemplate, PromptTemplate
 from langchain.prompts.base import BasePromptTemplate
-from langchain.schema import AIMessage, ChatGeneration
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration
 from langchain_core.output_parsers.format_instructions import \
     JSON_FORMAT_INSTRUCTIONS
 from langchain_core.output_parsers.json import parse_json_markdown
 from langchain_core.output_parsers.openai_tools import JsonOutputToolsParser
 from langchain_core.output_parsers.string import StrOutputParser
-from llm_failover import ChatFailoverLLM
+from langchain_core.runnables import RunnableLambda
+from llm_failover import CACHE_BREAKPOINT, ChatFailoverLLM
 
 from app.logging_config import logger
 from common.utils import load_env
@@ -22,6 +24,16 @@ from evaluators.gcs_utils import get_gsc_images_as_data_urls
 from evaluators.mixins import TokenUsageMixin
 
 
+def literal_prefix(template: str) -> tuple[str, bool]:
+    """Text of an f-string template before its first variable, and whether it has one."""
+    literal = []
+    for text, field, _, _ in string.Formatter().parse(template):
+        literal.append(text)
+        if field is not None:
+            return "".join(literal), True
+    return "".join(literal), False
+
+
 def StructuredOutputParser(ai_message) -> dict:
     parsed = ai_message["parsed"]
     if isinstance(parsed, list):
@@ -57,11 +69,16 @@ class LangChainBaseEvaluator(BaseEvaluator, TokenUsageMixin):
         logger.debug(
             f"Adding JSON format instructions to the prompt. run_id: {self.run_id}"
         )
+        # The schema instructions are the same for every input, so they go
+        # ahead of the system prompt's variables into the cacheable prefix
         prompt.messages[0].prompt = (
-            prompt.messages[0].prompt
-            + (JSON_FORMAT_INSTRUCTIONS.format(schema=self.output_schema))
-            .replace("{", "{{")
-            .replace("}", "}}")
+            PromptTemplate.from_template(
+                (JSON_FORMAT_INSTRUCTIONS.format(schema=self.output_schema))
+                .replace("{", "{{")
+                .replace("}", "}}")
+                + "\n\n"
+            )
+            + prompt.messages[0].prompt
             + "\nPlease, output only JSON nothing else, start with {{"
         )
         return prompt
@@ -83,6 +100,50 @@ class LangChainBaseEvaluator(BaseEvaluator, TokenUsageMixin):
         )
         return prompt, model.with_structured_output(self.output_schema, include_raw=True), StructuredOutputParser, "json"
 
+    @staticmethod
+    def _stable_prefix(prompt):
+        """
+        (message index, text) of the longest prefix of the prompt that is the
+        same for every input: its messages without variables, then the text
+        before the first variable. None if not even that is stable.
+        """
+        stable = None
+        for index, message in enumerate(getattr(prompt, "messages", [])):
+            if isinstance(message, BaseMessage):
+                if not isinstance(message.content, str):
+                    break
+                stable = (index, message.content)
+                continue
+            template = getattr(message, "prompt", None)
+            if (
+                not isinstance(template, PromptTemplate)
+                or template.template_format != "f-string"
+            ):
+                break
+            text, has_variables = literal_prefix(template.template)
+            if text.strip():
+                stable = (index, text)
+            if has_variables:
+                break
+        return stable
+
+    @staticmethod
+    def _mark_cache_breakpoint(stable_prefix, prompt_value):
+        """Marks the end of the stable prefix for providers that cache up to explicit breakpoints."""
+        index, text = stable_prefix
+        messages = prompt_value.to_messages()
+        message = messages[index]
+        if isinstance(message.content, str) and message.content.startswith(text):
+            messages[index] = message.model_copy(
+                update={
+                    "additional_kwargs": {
+                        **message.additional_kwargs,
+                        CACHE_BREAKPOINT: len(text),
+                    }
+                }
+            )
+        return messages
+
     def add_images_to_prompt(self, prompt, gcs_images_list):
         """gcs_images_list = [{'uri': 'gcs://...', params: {'detail': 'auto'}}]"""
         uris = [item["uri"] for item in gcs_images_list]
@@ -192,11 +253,28 @@ class LangChainBaseEvaluator(BaseEvaluator, TokenUsageMixin):
         self, prompt, model, input_data, parse, output_parser, output_type
     ):
         retries = self.config.get("retries", 3)
-        total_metadata = {"total_tokens": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        total_metadata = {
+            "total_tokens": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_prompt_tokens": 0,
+        }
+        stable_prefix = self._stable_prefix(prompt)
         for attempt in range(retries):
             try:
                 gevent.sleep(0)
-                chain = prompt | model
+                if stable_prefix:
+                    chain = (
+                        prompt
+                        | RunnableLambda(
+                            lambda value: self._mark_cache_breakpoint(
+                                stable_prefix, value
+                            )
+                        )
+                        | model
+                    )
+                else:
+                    chain = prompt | model
                 raw_result = chain.invoke(input_data)
 
                 # check if structured output is used
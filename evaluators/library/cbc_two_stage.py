@@ -15,6 +15,7 @@ from app.logging_config import logger
 from common.utils import load_env
 from evaluators.formatter_to_issues import format_output_to_issues
 from evaluators.library.single_stage_messages import SingleStageMessagesEvaluator
+from llm_failover.batch import in_current_context
 
 
 class CellFilterConfig(BaseModel):
@@ -125,7 +126,12 @@ class CBCTwoStageEvaluator(SingleStageMessagesEvaluator):
             "Initialized results list with None: %s, run_id: %s", results, self.run_id
         )
 
-        total_metadata = {"total_tokens": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        total_metadata = {
+            "total_tokens": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_prompt_tokens": 0,
+        }
 
         cell_filter = self.config.get("cell_filter_by_field")
         conversation = input_data["conversation"]
@@ -222,6 +228,8 @@ class CBCTwoStageEvaluator(SingleStageMessagesEvaluator):
 
         pool = Pool(10)  # Create a pool with a maximum of 10 greenlets
         logger.debug("Gevent Pool initialized with size 10, run_id: %s", self.run_id)
+        # Greenlets start from an empty context; carry batch mode and ledger tags over
+        evaluate_cell = in_current_context(evaluate_cell)
         greenlets = [
             pool.spawn(evaluate_cell, index, cell)
             for index, cell in enumerate(conversation)
@@ -18,6 +18,7 @@ from evaluators.gcs_utils import (
 )
 import dotenv
 from app.logging_config import logger
+from llm_failover.batch import in_current_context
 from evaluators.formatter_to_issues import format_output_to_issues
 
 dotenv.load_dotenv(dotenv.find_dotenv(), override=True)
@@ -219,14 +220,16 @@ def run_multiple_turns_interpreter(
             "code": turn,
         }
 
+    # Pools start from an empty context; carry batch mode and ledger tags over
+    process_turn = in_current_context(process_turn_wrapper)
     if use_gevent:
         pool = Pool(n_workers)
-        jobs = [pool.spawn(process_turn_wrapper, turn) for turn in turns]
+        jobs = [pool.spawn(process_turn, turn) for turn in turns]
         pool.join(raise_error=True)
         final_output = [job.get() for job in jobs]
     else:
         with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            final_output = list(executor.map(process_turn_wrapper, turns))
+            final_output = list(executor.map(process_turn, turns))
 
     return final_output
 
@@ -101,7 +101,12 @@ class RLHFEvaluator(SingleStageSystemPromptEvaluator):
             self.output_schema,
         )
         results = []
-        total_metadata = {"total_tokens": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        total_metadata = {
+            "total_tokens": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_prompt_tokens": 0,
+        }
 
         for idx, cell in enumerate(input_data["conversation"]):
             if cell["role"] == "user":
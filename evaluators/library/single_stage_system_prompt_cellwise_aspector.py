@@ -67,7 +67,12 @@ class SingleStageSystemPromptCellwiseAspectorEvaluator(
         )
 
         results = []
-        total_metadata = {"total_tokens": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        total_metadata = {
+            "total_tokens": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_prompt_tokens": 0,
+        }
 
         logger.info("Starting evaluation of conversation cells.")
         for cell in input_data["conversation"]:
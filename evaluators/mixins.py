@@ -21,6 +21,11 @@ class TokenUsageMixin:
             except ex:
                 result_dict = {}
 
+        # Messages carry usage as an attribute, including chunks merged from a stream
+        usage_metadata = getattr(raw_result, "usage_metadata", None)
+        if usage_metadata and "usage_metadata" not in result_dict:
+            result_dict = {**result_dict, "usage_metadata": usage_metadata}
+
         # Check for 'usage_metadata' in the parsed result
         if "usage_metadata" in result_dict:
             usage_metadata = result_dict["usage_metadata"]
@@ -29,6 +34,10 @@ class TokenUsageMixin:
                     "prompt_tokens": usage_metadata.get("input_tokens", 0),
                     "completion_tokens": usage_metadata.get("output_tokens", 0),
                     "total_tokens": usage_metadata.get("total_tokens", 0),
+                    # Part of prompt_tokens read from the provider's prompt cache
+                    "cached_prompt_tokens": (
+                        usage_metadata.get("input_token_details") or {}
+                    ).get("cache_read", 0),
                 }
             )
 
@@ -38,6 +47,9 @@ class TokenUsageMixin:
             token_usage = response_metadata.get("token_usage", {})
             usage_data.update(
                 {
+                    "cached_prompt_tokens": (
+                        token_usage.get("prompt_tokens_details") or {}
+                    ).get("cached_tokens", usage_data.get("cached_prompt_tokens", 0)),
                     "prompt_tokens": token_usage.get(
                         "prompt_tokens", usage_data.get("prompt_tokens", 0)
                     ),
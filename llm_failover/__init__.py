@@ -1,3 +1,4 @@
-from llm_failover.chat_failover_llm import ChatFailoverLLM
+from llm_failover.chat_failover_llm import ChatFailoverLLM, StreamInterruptedError
+from llm_failover.prompt_cache import CACHE_BREAKPOINT
 
-__all__ = ["ChatFailoverLLM"]
+__all__ = ["ChatFailoverLLM", "StreamInterruptedError", "CACHE_BREAKPOINT"]
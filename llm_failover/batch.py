@@ -0,0 +1,401 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import redis
+
+from llm_failover.config import logger
+from llm_failover.health import HEALTH_PREFIX, redis_url
+
+BATCH_PREFIX = f"{HEALTH_PREFIX}batch:"
+# Results are kept for replays of the deferred calls; providers complete within 24h
+LLM_BATCH_RESULT_TTL = int(os.environ.get("LLM_BATCH_RESULT_TTL", 3 * 86400))
+LLM_BATCH_MAX_REQUESTS = int(os.environ.get("LLM_BATCH_MAX_REQUESTS", 10000))
+
+# Provider batch statuses that are not final yet
+OPENAI_RUNNING = ("validating", "in_progress", "finalizing", "cancelling")
+
+
+class BatchPending(BaseException):
+    """
+    A model call in batch mode whose request is queued for the provider's
+    batch API and has no result yet. Derives from BaseException so provider
+    SDKs, LangChain and evaluator retry loops pass it through to the task
+    instead of retrying it as a connection error.
+    """
+
+    def __init__(self, provider: str, custom_id: str):
+        super().__init__(f"Request {custom_id} queued for the {provider} batch API")
+        self.provider = provider
+        self.custom_id = custom_id
+
+
+_batch_mode: ContextVar[bool] = ContextVar("llm_batch_mode", default=False)
+
+
+@contextmanager
+def batch_mode(enabled: bool = True) -> Iterator[None]:
+    """
+    Routes sync model calls of supported providers through their batch API while active.
+
+    A call without a result yet raises BatchPending and the task is replayed
+    once the batch completed, so calls made one after another each wait for a
+    batch of their own: an evaluator making n dependent calls takes n batch
+    round trips, up to a day each. Calls made concurrently, in pools wrapped
+    with in_current_context, are queued in the same round.
+    """
+    token = _batch_mode.set(enabled)
+    try:
+        yield
+    finally:
+        _batch_mode.reset(token)
+
+
+def in_batch_mode() -> bool:
+    return _batch_mode.get()
+
+
+def in_current_context(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    func running in a copy of the caller's context, for thread pools and
+    gevent greenlets, which start from an empty one and would otherwise drop
+    batch mode and ledger tags. Each call gets its own copy, since a context
+    can only be entered by one thread at a time.
+    """
+    context = copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def request_id(provider: str, body: Dict) -> str:
+    """Content address of a request body; identical calls share one batch entry and result."""
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{provider}:{canonical}".encode()).hexdigest()
+
+
+class LocalBatchStore:
+    """In-process store with the RedisBatchStore interface, for a single process and tests."""
+
+    def __init__(self):
+        self._requests: Dict[str, Dict] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._results: Dict[str, Dict] = {}
+        self._batches: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def result(self, custom_id: str) -> Optional[Dict]:
+        return self._results.get(custom_id)
+
+    def enqueue(self, provider: str, custom_id: str, body: Dict) -> bool:
+        with self._lock:
+            if custom_id in self._requests:
+                return False
+            self._requests[custom_id] = body
+            self._pending.setdefault(provider, []).append(custom_id)
+            return True
+
+    def take(self, provider: str, limit: int) -> List[Tuple[str, Dict]]:
+        with self._lock:
+            pending = self._pending.get(provider, [])
+            taken, self._pending[provider] = pending[:limit], pending[limit:]
+            return [(custom_id, self._requests[custom_id]) for custom_id in taken]
+
+    def add_batch(self, provider: str, batch_id: str, custom_ids: List[str]):
+        with self._lock:
+            self._batches[batch_id] = {"provider": provider, "custom_ids": custom_ids, "submitted_at": time.time()}
+
+    def batches(self) -> Dict[str, Dict]:
+        return dict(self._batches)
+
+    def complete(self, batch_id: Optional[str], results: Dict[str, Dict]):
+        with self._lock:
+            for custom_id, result in results.items():
+                self._results[custom_id] = result
+                self._requests.pop(custom_id, None)
+            self._batches.pop(batch_id, None)
+
+
+class RedisBatchStore:
+    """
+    Queued requests, submitted batches and results in Redis, shared by the
+    workers deferring calls and the tasks submitting and polling batches.
+    """
+
+    def __init__(self, client: redis.Redis, result_ttl: int = LLM_BATCH_RESULT_TTL):
+        self.client = client
+        self.result_ttl = result_ttl
+
+    def result(self, custom_id: str) -> Optional[Dict]:
+        raw = self.client.get(f"{BATCH_PREFIX}result:{custom_id}")
+        return json.loads(raw) if raw else None
+
+    def enqueue(self, provider: str, custom_id: str, body: Dict) -> bool:
+        # The request body doubles as the "already queued" marker
+        if not self.client.set(f"{BATCH_PREFIX}request:{custom_id}", json.dumps(body), nx=True, ex=self.result_ttl):
+            return False
+        self.client.rpush(f"{BATCH_PREFIX}pending:{provider}", custom_id)
+        return True
+
+    def take(self, provider: str, limit: int) -> List[Tuple[str, Dict]]:
+        name = f"{BATCH_PREFIX}pending:{provider}"
+        pipe = self.client.pipeline()
+        pipe.lrange(name, 0, limit - 1)
+        pipe.ltrim(name, limit, -1)
+        custom_ids = [custom_id.decode() for custom_id in pipe.execute()[0]]
+        if not custom_ids:
+            return []
+        bodies = self.client.mget([f"{BATCH_PREFIX}request:{custom_id}" for custom_id in custom_ids])
+        # Requests whose body expired have no caller waiting anymore
+        return [(custom_id, json.loads(body)) for custom_id, body in zip(custom_ids, bodies) if body]
+
+    def add_batch(self, provider: str, batch_id: str, custom_ids: List[str]):
+        self.client.hset(
+            f"{BATCH_PREFIX}batches",
+            batch_id,
+            json.dumps({"provider": provider, "custom_ids": custom_ids, "submitted_at": time.time()}),
+        )
+
+    def batches(self) -> Dict[str, Dict]:
+        return {k.decode(): json.loads(v) for k, v in self.client.hgetall(f"{BATCH_PREFIX}batches").items()}
+
+    def complete(self, batch_id: Optional[str], results: Dict[str, Dict]):
+        pipe = self.client.pipeline()
+        for custom_id, result in results.items():
+            pipe.set(f"{BATCH_PREFIX}result:{custom_id}", json.dumps(result), ex=self.result_ttl)
+            pipe.delete(f"{BATCH_PREFIX}request:{custom_id}")
+        if batch_id is not None:
+            pipe.hdel(f"{BATCH_PREFIX}batches", batch_id)
+        pipe.execute()
+
+
+_store = None
+
+
+def batch_store():
+    """The process-wide batch store, in Redis when one is configured."""
+    global _store
+    if _store is None:
+        url = redis_url(os.environ)
+        _store = RedisBatchStore(redis.Redis.from_url(url)) if url else LocalBatchStore()
+    return _store
+
+
+class BatchTransport(httpx.BaseTransport):
+    """
+    httpx transport of a provider's model in batch mode. A completion request
+    with a batch result is answered with it, so LangChain parses it like a
+    live response; one without is queued for the batch API and the call
+    raises BatchPending. Requests whose batch entry failed or expired, and
+    everything else, go to the provider live.
+    """
+
+    def __init__(self, provider: str, path: str, live: httpx.BaseTransport, store=None):
+        self.provider = provider
+        self.path = path
+        self.live = live
+        self.store = store
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or not request.url.path.endswith(self.path):
+            return self.live.handle_request(request)
+        body = json.loads(request.read())
+        if body.get("stream"):
+            return self.live.handle_request(request)
+        store = self.store or batch_store()
+        custom_id = request_id(self.provider, body)
+        result = store.result(custom_id)
+        if result is None:
+            store.enqueue(self.provider, custom_id, body)
+            raise BatchPending(self.provider, custom_id)
+        if result["status"] == "done":
+            return httpx.Response(200, json=result["body"], request=request)
+        logger.info(f"Batch request {custom_id} {result['status']}, calling {self.provider} live")
+        return self.live.handle_request(request)
+
+    def close(self):
+        self.live.close()
+
+
+def _failed(error: object) -> Dict:
+    return {"status": "failed", "error": str(error)}
+
+
+class OpenAIBatchAPI:
+    """OpenAI Batch API: a JSONL file of /v1/chat/completions requests, completed within 24h."""
+
+    provider = "openai_api"
+    path = "/chat/completions"
+
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", client: Optional[httpx.Client] = None):
+        self.base_url = base_url.rstrip("/")
+        self.client = client or httpx.Client(timeout=120)
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    def submit(self, requests: List[Tuple[str, Dict]]) -> str:
+        lines = "\n".join(
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {k: v for k, v in body.items() if k != "stream"},
+            })
+            for custom_id, body in requests
+        )
+        uploaded = self.client.post(
+            f"{self.base_url}/files",
+            headers=self.headers,
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", lines.encode(), "application/jsonl")},
+        )
+        uploaded.raise_for_status()
+        batch = self.client.post(
+            f"{self.base_url}/batches",
+            headers=self.headers,
+            json={"input_file_id": uploaded.json()["id"], "endpoint": "/v1/chat/completions", "completion_window": "24h"},
+        )
+        batch.raise_for_status()
+        return batch.json()["id"]
+
+    def poll(self, batch_id: str) -> Optional[Dict[str, Dict]]:
+        """Results by custom_id once the batch is final, None while it runs."""
+        response = self.client.get(f"{self.base_url}/batches/{batch_id}", headers=self.headers)
+        response.raise_for_status()
+        batch = response.json()
+        if batch["status"] in OPENAI_RUNNING:
+            return None
+        results = {}
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            content = self.client.get(f"{self.base_url}/files/{file_id}/content", headers=self.headers)
+            content.raise_for_status()
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[entry["custom_id"]] = {"status": "done", "body": response["body"]}
+                else:
+                    results[entry["custom_id"]] = _failed(entry.get("error") or response.get("body"))
+        return results
+
+
+class AnthropicBatchAPI:
+    """Anthropic Message Batches: /v1/messages requests, completed within 24h."""
+
+    provider = "anthropic_api"
+    path = "/v1/messages"
+
+    def __init__(self, api_key: str, base_url: str = "https://api.anthropic.com", client: Optional[httpx.Client] = None):
+        self.base_url = base_url.rstrip("/")
+        self.client = client or httpx.Client(timeout=120)
+        self.headers = {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+
+    def submit(self, requests: List[Tuple[str, Dict]]) -> str:
+        batch = self.client.post(
+            f"{self.base_url}/v1/messages/batches",
+            headers=self.headers,
+            json={
+                "requests": [
+                    {"custom_id": custom_id, "params": {k: v for k, v in body.items() if k != "stream"}}
+                    for custom_id, body in requests
+                ]
+            },
+        )
+        batch.raise_for_status()
+        return batch.json()["id"]
+
+    def poll(self, batch_id: str) -> Optional[Dict[str, Dict]]:
+        """Results by custom_id once the batch ended, None while it runs."""
+        response = self.client.get(f"{self.base_url}/v1/messages/batches/{batch_id}", headers=self.headers)
+        response.raise_for_status()
+        batch = response.json()
+        if batch["processing_status"] != "ended":
+            return None
+        results = {}
+        content = self.client.get(batch["results_url"], headers=self.headers)
+        content.raise_for_status()
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            result = entry["result"]
+            if result["type"] == "succeeded":
+                results[entry["custom_id"]] = {"status": "done", "body": result["message"]}
+            else:
+                results[entry["custom_id"]] = _failed(result.get("error") or result["type"])
+        return results
+
+
+BATCH_APIS = {api.provider: api for api in (OpenAIBatchAPI, AnthropicBatchAPI)}
+
+
+def batch_apis_from_env(env_vars) -> Dict:
+    """
+    Batch API clients of the configured providers. <PROVIDER>_BATCH_API_KEY
+    submits batches under a key (or project) of its own, so batch traffic
+    draws on a separate quota from interactive calls; without it the first
+    interactive key is used.
+    """
+    apis = {}
+    for provider, env_prefix in (("openai_api", "OPENAI"), ("anthropic_api", "ANTHROPIC")):
+        api_key = env_vars.get(f"{env_prefix}_BATCH_API_KEY") or env_vars.get(f"{env_prefix}_API_KEY", "").split(",")[0]
+        if not api_key:
+            continue
+        base_url = env_vars.get(f"{env_prefix}_BATCH_BASE_URL")
+        apis[provider] = BATCH_APIS[provider](api_key, base_url) if base_url else BATCH_APIS[provider](api_key)
+    return apis
+
+
+def submit_pending(store, apis: Dict, max_requests: int = LLM_BATCH_MAX_REQUESTS) -> Dict[str, int]:
+    """
+    Submits the queued requests of every provider as batches of up to
+    max_requests. Requests of a batch the provider refused are marked failed,
+    so their callers fall back to live calls.
+    """
+    submitted = {}
+    for provider, api in apis.items():
+        while requests := store.take(provider, max_requests):
+            custom_ids = [custom_id for custom_id, _ in requests]
+            try:
+                batch_id = api.submit(requests)
+            except Exception as e:
+                logger.error(f"Submitting {len(requests)} requests to the {provider} batch API failed: {e}")
+                store.complete(None, {custom_id: _failed(e) for custom_id in custom_ids})
+                continue
+            store.add_batch(provider, batch_id, custom_ids)
+            submitted[provider] = submitted.get(provider, 0) + len(requests)
+            logger.info(f"Submitted batch {batch_id} of {len(requests)} requests to {provider}")
+    return submitted
+
+
+def poll_submitted(store, apis: Dict) -> int:
+    """
+    Stores the results of the submitted batches that are final. Requests a
+    final batch has no result for (expired, cancelled) are marked failed.
+    """
+    completed = 0
+    for batch_id, batch in store.batches().items():
+        api = apis.get(batch["provider"])
+        if api is None:
+            continue
+        try:
+            results = api.poll(batch_id)
+        except Exception as e:
+            logger.warning(f"Polling batch {batch_id} of {batch['provider']} failed: {e}")
+            continue
+        if results is None:
+            continue
+        for custom_id in batch["custom_ids"]:
+            results.setdefault(custom_id, _failed("no result in the batch"))
+        store.complete(batch_id, results)
+        completed += 1
+        done = sum(result["status"] == "done" for result in results.values())
+        logger.info(f"Batch {batch_id} of {batch['provider']} finished, {done}/{len(results)} succeeded")
+    return completed
@@ -0,0 +1,388 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import redis
+from langchain_core.load import dumpd, load
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel
+
+from llm_failover.config import logger
+from llm_failover.health import HEALTH_PREFIX, redis_url
+
+CALL_CACHE_PREFIX = f"{HEALTH_PREFIX}call_cache:"
+# redis (when one is configured), disk or off
+LLM_CALL_CACHE = os.environ.get("LLM_CALL_CACHE", "redis").lower()
+LLM_CALL_CACHE_DIR = os.environ.get("LLM_CALL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "llm_call_cache"))
+LLM_CALL_CACHE_TTL = int(os.environ.get("LLM_CALL_CACHE_TTL", 86400))
+# How long identical calls wait for the one in flight before calling themselves
+LLM_CALL_CACHE_LOCK_SECONDS = float(os.environ.get("LLM_CALL_CACHE_LOCK_SECONDS", 120))
+LLM_CALL_CACHE_POLL_SECONDS = 0.2
+
+ZERO_USAGE = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+def cacheable(params: Dict[str, Any]) -> bool:
+    """Only calls at temperature 0 with a single completion give answers worth replaying."""
+    return params.get("temperature") == 0 and params.get("n", 1) == 1
+
+
+def call_key(**parts: Any) -> str:
+    """Content address of a model call; messages are compared without their ids."""
+    def canonical(value: Any) -> Any:
+        if isinstance(value, BaseMessage):
+            return value.model_dump(exclude={"id"})
+        if isinstance(value, type) and hasattr(value, "model_json_schema"):
+            return value.model_json_schema()
+        return repr(value)
+
+    body = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=canonical)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def as_cache_hit(result: Any) -> Any:
+    """
+    A replayed result with zero token usage, so evaluations don't bill tokens
+    nobody spent. Messages are marked with cache_hit in response_metadata,
+    also the raw message of structured output with include_raw.
+    """
+    message = result.get("raw") if isinstance(result, dict) else result
+    if isinstance(message, BaseMessage):
+        metadata = {k: v for k, v in message.response_metadata.items() if k not in ("token_usage", "usage")}
+        message.response_metadata = {**metadata, "cache_hit": True}
+        if getattr(message, "usage_metadata", None) is not None:
+            message.usage_metadata = dict(ZERO_USAGE)
+    return result
+
+
+def encode_result(result: Any) -> bytes:
+    """
+    A call result as JSON: messages serialized by LangChain, structured
+    output as the fields of its schema. Anything else that isn't plain JSON,
+    like the parsing_error of include_raw, raises TypeError and isn't cached.
+    """
+    def encode(value: Any) -> Dict[str, Any]:
+        if isinstance(value, BaseMessage):
+            return {"message": dumpd(value)}
+        if isinstance(value, BaseModel):
+            return {"model": value.model_dump(mode="json")}
+        if isinstance(value, dict):
+            return {"dict": {k: encode(v) for k, v in value.items()}}
+        return {"json": value}
+
+    return json.dumps(encode(result)).encode()
+
+
+def decode_result(raw: bytes, schema: Optional[type] = None) -> Any:
+    """Result of encode_result; structured output is validated into schema again."""
+    def decode(value: Dict[str, Any]) -> Any:
+        if "message" in value:
+            return load(value["message"])
+        if "model" in value:
+            if schema is None:
+                raise TypeError("Cached structured output without a schema to load it into")
+            return schema.model_validate(value["model"])
+        if "dict" in value:
+            return {k: decode(v) for k, v in value["dict"].items()}
+        return value["json"]
+
+    return decode(json.loads(raw))
+
+
+class DiskCallCache:
+    """Results as files under a directory, for a single host without Redis."""
+
+    def __init__(self, directory: str = LLM_CALL_CACHE_DIR, clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.clock = clock
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, suffix: str = "") -> str:
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                expires_at, value = float(f.readline()), f.read()
+        except (OSError, ValueError):
+            return None
+        return value if expires_at > self.clock() else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(f"{self.clock() + ttl}\n".encode())
+            f.write(value)
+        os.replace(tmp, path)
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        path = self._path(key, ".lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # A lock left by a crashed process expires like a Redis one
+            if self.clock() - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL))
+            return True
+        except FileExistsError:
+            return False
+
+    def release(self, key: str):
+        try:
+            os.remove(self._path(key, ".lock"))
+        except OSError:
+            pass
+
+
+class RedisCallCache:
+    """Results in Redis, shared by every process using the same server."""
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(f"{CALL_CACHE_PREFIX}{key}")
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(f"{CALL_CACHE_PREFIX}{key}", value, ex=int(ttl))
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        return bool(self.client.set(f"{CALL_CACHE_PREFIX}lock:{key}", 1, nx=True, ex=max(1, int(ttl))))
+
+    def release(self, key: str):
+        self.client.delete(f"{CALL_CACHE_PREFIX}lock:{key}")
+
+
+# Result of an async flight whose leader failed or didn't store its answer,
+# followers then call themselves
+_NOT_SHARED = object()
+
+
+class _Flight:
+    """An upstream call identical callers in this process wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.ok = False
+
+
+class CallCache:
+    """
+    Results of identical model calls, served from the backend for ttl
+    seconds. Concurrent identical calls are coalesced: in a process they wait
+    for the first one, across processes for the one holding the backend's
+    lock. A waiter whose leader failed or took longer than lock_seconds makes
+    the call itself. Backend errors never fail a call, it just isn't cached.
+
+    Results are stored as JSON (see encode_result), so a shared backend never
+    holds anything that runs code when read; structured output is loaded
+    back into the schema the caller passes.
+    """
+
+    def __init__(
+        self,
+        backend,
+        ttl: float = LLM_CALL_CACHE_TTL,
+        lock_seconds: float = LLM_CALL_CACHE_LOCK_SECONDS,
+        poll_seconds: float = LLM_CALL_CACHE_POLL_SECONDS,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.poll_seconds = poll_seconds
+        self._flights: Dict[str, _Flight] = {}
+        # Async flights are futures of their event loop
+        self._async_flights: "weakref.WeakKeyDictionary[Any, Dict[str, asyncio.Future]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get(self, key: str, schema: Optional[type] = None) -> Optional[Any]:
+        try:
+            raw = self.backend.get(key)
+            return as_cache_hit(decode_result(raw, schema)) if raw is not None else None
+        except Exception as e:
+            logger.warning(f"Could not read the call cache: {e}")
+            return None
+
+    def _set(self, key: str, result: Any):
+        try:
+            self.backend.set(key, encode_result(result), self.ttl)
+        except Exception as e:
+            logger.warning(f"Could not write the call cache: {e}")
+
+    def _acquire(self, key: str) -> bool:
+        try:
+            return self.backend.acquire(key, self.lock_seconds)
+        except Exception as e:
+            logger.warning(f"Could not lock the call cache: {e}")
+            return True
+
+    def _release(self, key: str):
+        try:
+            self.backend.release(key)
+        except Exception as e:
+            logger.warning(f"Could not unlock the call cache: {e}")
+
+    def _hit(self, result: Any, coalesced: bool = False) -> Any:
+        with self._lock:
+            self.hits += 1
+            self.coalesced += coalesced
+        return result
+
+    def _call(self, key: str, func: Callable[[], Any], schema: Optional[type], store: Callable[[Any], bool]) -> Any:
+        """func under the backend's lock; other processes wait on it for its result."""
+        deadline = time.monotonic() + self.lock_seconds
+        locked = self._acquire(key)
+        while not locked and time.monotonic() < deadline:
+            time.sleep(self.poll_seconds)
+            result = self._get(key, schema)
+            if result is not None:
+                return self._hit(result, coalesced=True)
+            locked = self._acquire(key)
+        with self._lock:
+            self.misses += 1
+        try:
+            result = func()
+            if store(result):
+                self._set(key, result)
+            return result
+        finally:
+            if locked:
+                self._release(key)
+
+    def get_or_call(
+        self,
+        key: str,
+        func: Callable[[], Any],
+        schema: Optional[type] = None,
+        store: Callable[[Any], bool] = lambda result: True,
+    ) -> Any:
+        """
+        The cached result of key or func's; schema is the pydantic model of
+        structured output, if any. Results store rejects are neither cached
+        nor shared with concurrent callers.
+        """
+        result = self._get(key, schema)
+        if result is not None:
+            return self._hit(result)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if flight.done.wait(self.lock_seconds) and flight.ok:
+                # Each caller gets its own copy to mutate
+                return self._hit(as_cache_hit(copy.deepcopy(flight.result)), coalesced=True)
+            return func()
+
+        try:
+            flight.result = self._call(key, func, schema, store)
+            flight.ok = store(flight.result)
+            return flight.result
+        finally:
+            flight.done.set()
+            with self._lock:
+                self._flights.pop(key, None)
+
+    async def _acall(
+        self, key: str, func: Callable[[], Awaitable[Any]], schema: Optional[type], store: Callable[[Any], bool]
+    ) -> Any:
+        # Backend calls block, so they run off the event loop
+        deadline = time.monotonic() + self.lock_seconds
+        locked = await asyncio.to_thread(self._acquire, key)
+        while not locked and time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_seconds)
+            result = await asyncio.to_thread(self._get, key, schema)
+            if result is not None:
+                return self._hit(result, coalesced=True)
+            locked = await asyncio.to_thread(self._acquire, key)
+        with self._lock:
+            self.misses += 1
+        try:
+            result = await func()
+            if store(result):
+                await asyncio.to_thread(self._set, key, result)
+            return result
+        finally:
+            if locked:
+                await asyncio.to_thread(self._release, key)
+
+    async def aget_or_call(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        schema: Optional[type] = None,
+        store: Callable[[Any], bool] = lambda result: True,
+    ) -> Any:
+        """get_or_call for coroutines; callers on the same event loop share one call."""
+        result = await asyncio.to_thread(self._get, key, schema)
+        if result is not None:
+            return self._hit(result)
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flights = self._async_flights.setdefault(loop, {})
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = loop.create_future()
+        if not leader:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(flight), self.lock_seconds)
+            except asyncio.TimeoutError:
+                return await func()
+            if result is _NOT_SHARED:
+                return await func()
+            return self._hit(as_cache_hit(copy.deepcopy(result)), coalesced=True)
+
+        try:
+            result = await self._acall(key, func, schema, store)
+            flight.set_result(result if store(result) else _NOT_SHARED)
+            return result
+        except BaseException:
+            # Followers call themselves rather than sharing the leader's
+            # failure, which may be its own CancelledError or BatchPending.
+            # Only their own cancellation ever reaches them.
+            flight.set_result(_NOT_SHARED)
+            raise
+        finally:
+            with self._lock:
+                flights.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+
+_cache = None
+
+
+def call_cache() -> Optional[CallCache]:
+    """The process-wide call cache per LLM_CALL_CACHE, None when it's off."""
+    global _cache
+    if _cache is None:
+        if LLM_CALL_CACHE == "disk":
+            _cache = CallCache(DiskCallCache())
+        elif LLM_CALL_CACHE == "redis" and redis_url(os.environ):
+            client = redis.Redis.from_url(redis_url(os.environ), socket_timeout=0.5, socket_connect_timeout=0.5)
+            _cache = CallCache(RedisCallCache(client))
+        else:
+            _cache = False
+    return _cache or None
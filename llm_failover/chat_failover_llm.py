@@ -1,3 +1,7 @@
+import asyncio
+import time
+from functools import cached_property
+
 from pydantic import BaseModel
 from typing import Any, List, Optional, Dict, AsyncIterator, Iterator, TypeVar, Callable, Union, Awaitable, Sequence, cast
 
@@ -7,25 +11,98 @@ from langchain_core.messages import BaseMessage, BaseMessageChunk
 from langchain_core.callbacks import CallbackManagerForLLMRun
 from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
 
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_anthropic import ChatAnthropic
+import anthropic
 
-from llm_failover.key_manager import key_manager
-from llm_failover.config import logger, WRONG_API_KEY_ERRORS, ChatGoogleGenerativeAIError, TEMPORARY_KEY_ERRORS, TEMPORARY_PROVIDER_ERRORS
+from llm_failover.batch import BATCH_APIS, BatchPending, BatchTransport, in_batch_mode
+from llm_failover.call_cache import cacheable, call_cache, call_key
+from llm_failover.client_registry import client_registry
+from llm_failover.health import key_id
+from llm_failover.ledger import CallRecord, ledger, new_call_id, usage_of
+from llm_failover.prompt_cache import anthropic_cache_control
+from llm_failover.key_manager import KeyInfo, key_manager
+from llm_failover.config import logger, WRONG_API_KEY_ERRORS, ChatGoogleGenerativeAIError, TEMPORARY_KEY_ERRORS, TEMPORARY_PROVIDER_ERRORS, CONNECTION_ERRORS, LLM_ROUTING, is_context_length_error
+from llm_failover.routing import estimate_prompt_tokens
 
 T = TypeVar('T')  # Generic type for return value
 ModelFunc = Callable[..., Union[T, Awaitable[T]]]  # Type for model functions
 
+class StreamInterruptedError(Exception):
+    """A stream failed after chunks were sent, so it could not fail over."""
+
+    def __init__(self, provider: str, model: str, chunks: int, error: Exception):
+        super().__init__(f"Stream from {provider} {model} failed after {chunks} chunks: {error}")
+        self.provider = provider
+        self.model = model
+        self.chunks = chunks
+        self.error = error
+
+
+class _StreamAccounting:
+    """Merges streamed message chunks so usage and headers can be read at the end."""
+
+    def __init__(self, first_chunk_seconds: float):
+        self.first_chunk_seconds = first_chunk_seconds
+        self.chunks = 0
+        self.message: Optional[BaseMessageChunk] = None
+
+    def add(self, chunk: Any):
+        self.chunks += 1
+        # Structured output streams partial objects, only messages merge
+        if isinstance(chunk, BaseMessageChunk):
+            self.message = chunk if self.message is None else self.message + chunk
+
+    def usage(self) -> Optional[Dict[str, int]]:
+        return getattr(self.message, "usage_metadata", None)
+
+
+def response_headers(obj: Any) -> Optional[Dict[str, str]]:
+    """HTTP headers of a provider error or message, where the client exposes them."""
+    response = getattr(obj, "response", None)
+    if response is not None:
+        return getattr(response, "headers", None)
+    if isinstance(obj, BaseMessage):
+        return obj.response_metadata.get("headers")
+    return None
+
+def _batch_http_client(provider: str):
+    path = BATCH_APIS[provider].path
+    return client_registry.batch_http_client(provider, lambda live: BatchTransport(provider, path, live))
+
+
+class _ChatAnthropic(ChatAnthropic):
+    """ChatAnthropic with cache breakpoints on the stable prompt prefixes callers marked."""
+
+    def _get_request_payload(self, input_: LanguageModelInput, *, stop: Optional[List[str]] = None, **kwargs: Any) -> Dict:
+        messages = anthropic_cache_control(self._convert_input(input_).to_messages())
+        return super()._get_request_payload(messages, stop=stop, **kwargs)
+
+
+class _BatchChatAnthropic(_ChatAnthropic):
+    """_ChatAnthropic whose sync client sends through the batch transport."""
+
+    @cached_property
+    def _client(self) -> anthropic.Client:
+        return anthropic.Client(**self._client_params, http_client=_batch_http_client("anthropic_api"))
+
+
 class ChatFailoverLLM(BaseChatModel):
     initial_provider: str
     initial_model: str
     initial_key: str
     last_provider: str
     last_model: str
+    # Usage and time to first chunk of the last completed stream
+    last_usage: Optional[Dict[str, int]] = None
+    last_first_chunk_seconds: Optional[float] = None
     params: Dict[str, Any]
     method_calls: List[Callable[[BaseChatModel], BaseChatModel]]
+    # What the method calls bind, as part of the call cache key
+    method_signatures: List[Any]
 
     def __init__(
         self,
@@ -41,7 +118,8 @@ class ChatFailoverLLM(BaseChatModel):
             last_provider="",
             last_model="",
             params=params,
-            method_calls=[]
+            method_calls=[],
+            method_signatures=[]
         )
     
     @property
@@ -96,14 +174,48 @@ class ChatFailoverLLM(BaseChatModel):
         self,
         provider: str,
         api_key: str,
-        model_name: str
+        model_name: str,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> BaseChatModel:
+        # One instance per provider, model, key and params for the process,
+        # and per event loop for async calls. Sync calls in batch mode get
+        # instances sending through the provider's batch API.
+        batch = loop is None and in_batch_mode() and provider in BATCH_APIS
+        return client_registry.get(
+            provider,
+            model_name,
+            api_key,
+            self.params,
+            lambda: self._build_model(provider, api_key, model_name, loop, batch),
+            scope="batch" if batch else None,
+            loop=loop,
+        )
+
+    def _build_model(
+        self,
+        provider: str,
+        api_key: str,
+        model_name: str,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        batch: bool = False,
     ) -> BaseChatModel:
         match provider:
             case "openai_api":
+                if batch:
+                    http_client = {"http_client": _batch_http_client(provider)}
+                elif loop:
+                    http_client = {"http_async_client": client_registry.http_async_client(provider, loop)}
+                else:
+                    http_client = {"http_client": client_registry.http_client(provider)}
                 return ChatOpenAI(
                     **self.params,
                     openai_api_key=api_key,
                     model=model_name,
+                    **http_client,
+                    # Usage in the last chunk of streams
+                    stream_usage=True,
+                    # Rate limit headers in response_metadata for quota-aware key selection
+                    include_response_headers=key_manager.policy(provider) == "quota",
                 )
             case "google_api":
                 return ChatGoogleGenerativeAI(
@@ -112,7 +224,7 @@ class ChatFailoverLLM(BaseChatModel):
                     model=model_name,
                 )
             case "anthropic_api":
-                return ChatAnthropic(
+                return (_BatchChatAnthropic if batch else _ChatAnthropic)(
                     **{k: v for k, v in self.params.items() if k != 'seed'},
                     anthropic_api_key=api_key,
                     model=model_name,
@@ -120,49 +232,194 @@ class ChatFailoverLLM(BaseChatModel):
             case _:
                 raise ValueError(f"Unsupported provider in ChatFailoverLLM: {provider}")
 
+    def _cache_key(self, input: LanguageModelInput, stop: Optional[list[str]], kwargs: Dict[str, Any]) -> Optional[str]:
+        """Content address of a deterministic call, None when it shouldn't be cached."""
+        if not cacheable(self.params) or call_cache() is None:
+            return None
+        return call_key(
+            provider=self.initial_provider,
+            model=self.initial_model,
+            params=self.params,
+            bound=self.method_signatures,
+            messages=self._convert_input(input).to_messages(),
+            stop=stop,
+            kwargs=kwargs,
+        )
+
+    def _output_schema(self) -> Optional[type]:
+        """Pydantic model of the structured output, which cached results are loaded back into."""
+        schemas = [s["schema"] for s in self.method_signatures if "schema" in s]
+        return schemas[-1] if schemas and isinstance(schemas[-1], type) else None
+
+    def _served_as_asked(self, served: list) -> Callable[[Any], bool]:
+        """
+        Whether a result may be cached: only answers of the model asked for
+        are, not those of a routed or failover model, since the key names
+        the initial provider and model.
+        """
+        return lambda result: served == [(self.initial_provider, self.initial_model)]
+
+    def _prompt_tokens(self, input: LanguageModelInput) -> Optional[int]:
+        """Estimated prompt size for routing, None when routing is off."""
+        if not LLM_ROUTING:
+            return None
+        try:
+            return estimate_prompt_tokens(input)
+        except Exception as e:
+            logger.warning(f"Could not estimate prompt tokens, calling without routing: {e}")
+            return None
+
+    def _output_tokens(self) -> Optional[int]:
+        return self.params.get("max_tokens") or self.params.get("max_output_tokens")
+
+    def _select(self, attempt: int, prompt_tokens: Optional[int] = None) -> tuple[str, str, KeyInfo]:
+        output_tokens = self._output_tokens()
+        if self.initial_key and attempt == 0:
+            model_name = self.initial_model
+            if prompt_tokens is not None:
+                model_name = key_manager.router.route(self.initial_provider, model_name, prompt_tokens, output_tokens)
+            if model_name is not None:
+                return self.initial_provider, model_name, KeyInfo(self.initial_key)
+        return key_manager.get_api_info(self.initial_provider, self.initial_model, prompt_tokens, output_tokens)
+
+    def _prepare_model(self, provider: str, model_name: str, key_info: KeyInfo, scope: Any = None) -> Runnable:
+        model = self._create_model(provider, key_info.key, model_name, scope)
+
+        for method_call in self.method_calls:
+            model = method_call(model)
+
+        logger.debug(f"Generating... provider: {provider}, model: {model_name}, details: {key_info}, params: {self.params}")
+        return model
+
+    def _record(
+        self,
+        call_id: str,
+        attempt: int,
+        provider: str,
+        model_name: str,
+        key_info: KeyInfo,
+        start: float,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+        stream: bool = False,
+    ):
+        """Emits the ledger record of one attempt; cost is estimated from the router's prices, if any."""
+        usage = usage_of(result)
+        ledger().emit(CallRecord(
+            call_id=call_id,
+            attempt=attempt,
+            provider=provider,
+            model=model_name,
+            key=key_id(key_info.key),
+            latency_seconds=time.perf_counter() - start,
+            error=type(error).__name__ if error is not None else None,
+            cost=key_manager.router.call_cost(model_name, usage["prompt_tokens"] or 0, usage["completion_tokens"] or 0) if usage else None,
+            stream=stream,
+            **usage,
+        ))
+
+    def _finish(self, provider: str, model_name: str, key_info: KeyInfo, result: Any):
+        key_manager.release_key(provider, key_info, response_headers(result))
+        key_manager.record_success(provider, model_name)
+
+        self.last_provider = provider
+        self.last_model = model_name
+        key_manager.log_status(f"Finished with provider: {self.last_provider}, model: {self.last_model}, details: {key_info}")
+
+    def _handle_error(self, e: Exception, provider: str, model_name: str, key_info: KeyInfo, prompt_tokens: Optional[int] = None):
+        """Releases the key and marks it or the provider by error class; re-raises errors failover can't fix."""
+        key_manager.release_key(provider, key_info, response_headers(e))
+
+        if is_context_length_error(e):
+            # The router's window for the model was off; it routes around it from now on
+            logger.warning(f"Catched Context Length Error. provider: {provider}, model: {model_name}, prompt tokens: {prompt_tokens}, error: {e}")
+            if prompt_tokens is None:
+                raise e
+            key_manager.router.cap_window(model_name, str(e), prompt_tokens, self._output_tokens())
+
+        elif isinstance(e, WRONG_API_KEY_ERRORS):
+            if isinstance(e, ChatGoogleGenerativeAIError):
+                if str(e.args[0]).find("API_KEY_INVALID") < 0:
+                    logger.debug("Ignore Invalid Argument Error which doesn't contain 'API_KEY_INVALID'")
+                    raise e
+            logger.warning(f"Catched Wrong API Key Error. provider: {provider}, details: {key_info}, error: {e}")
+            key_manager.remove_key(provider, key_info)
+            client_registry.evict(provider, key_info.key)
+
+        elif isinstance(e, TEMPORARY_KEY_ERRORS):
+            logger.warning(f"Catched Rate Limit Error. provider: {provider}, details: {key_info}, error: {e}")
+            key_manager.pause_key(provider, key_info, response_headers(e))
+
+        elif isinstance(e, TEMPORARY_PROVIDER_ERRORS):
+            logger.warning(f"Catched Service Error. provider: {provider}, model: {model_name}, details: {key_info}, error: {e}")
+            key_manager.record_failure(provider, model_name, key_info)
+            if isinstance(e, CONNECTION_ERRORS):
+                client_registry.reset_connections(provider)
+
+        else:
+            raise e
+
     def _execute_with_failover(
         self,
         func: ModelFunc[T],
+        prompt_tokens: Optional[int] = None,
+        served: Optional[list] = None,
     ) -> T:
+        """Calls func on the selected models until one answers; its (provider, model) is appended to served."""
         key_manager.log_status(f"Started with provider: {self.initial_provider}, model: {self.initial_model}")
-        
+        call_id = new_call_id()
+
         for attempt in range(key_manager.get_api_retries()):
+            provider, model_name, key_info = self._select(attempt, prompt_tokens)
+            start = time.perf_counter()
             try:
-                if self.initial_key and attempt == 0:
-                    provider, model_name, key_info = self.initial_provider, self.initial_model, self.initial_key
-                else:
-                    provider, default_model, key_info = key_manager.get_api_info(self.initial_provider)
-                    model_name = self.initial_model if provider == self.initial_provider else default_model
-
-                model = self._create_model(provider, key_info.key, model_name)
-
-                for method_call in self.method_calls:
-                    model = method_call(model)
-
-                logger.debug(f"Generating... provider: {provider}, model: {model_name}, details: {key_info}, params: {self.params}")
-
-                result = func(model)
-                
-                self.last_provider = provider
-                self.last_model = model_name
-                key_manager.log_status(f"Finished with provider: {self.last_provider}, model: {self.last_model}, details: {key_info}")
-                return result
-                
-            except WRONG_API_KEY_ERRORS as e:
-                if isinstance(e, ChatGoogleGenerativeAIError):
-                    if str(e.args[0]).find("API_KEY_INVALID") < 0:
-                        logger.debug("Ignore Invalid Argument Error which doesn't contain 'API_KEY_INVALID'")
-                        raise
-                logger.warning(f"Catched Wrong API Key Error. provider: {provider}, details: {key_info}, error: {e}")
-                key_manager.remove_key(provider, key_info)
-
-            except TEMPORARY_KEY_ERRORS as e:
-                logger.warning(f"Catched Rate Limit Error. provider: {provider}, details: {key_info}, error: {e}")
-                key_manager.pause_key(provider, key_info)
-
-            except TEMPORARY_PROVIDER_ERRORS as e:
-                logger.warning(f"Catched Service Error. provider: {provider}, details: {key_info}, error: {e}")
-                key_manager.pause_provider(provider)
+                result = func(self._prepare_model(provider, model_name, key_info))
+            except BatchPending:
+                # Queued for the batch API, the caller retries once it completed
+                key_manager.release_key(provider, key_info)
+                raise
+            except Exception as e:
+                self._record(call_id, attempt, provider, model_name, key_info, start, error=e)
+                self._handle_error(e, provider, model_name, key_info, prompt_tokens)
+                continue
+            self._record(call_id, attempt, provider, model_name, key_info, start, result=result)
+            self._finish(provider, model_name, key_info, result)
+            if served is not None:
+                served.append((provider, model_name))
+            return result
+
+        key_manager.log_status(f"Something went wrong with KeyManager")
+        raise Exception("Something went wrong with Failover Logic")
+
+    async def _aexecute_with_failover(
+        self,
+        func: Callable[[Runnable], Awaitable[T]],
+        prompt_tokens: Optional[int] = None,
+        served: Optional[list] = None,
+    ) -> T:
+        """
+        _execute_with_failover on the providers' async clients. Model instances
+        are scoped to the running loop, since their async clients hold
+        connections bound to it.
+        """
+        key_manager.log_status(f"Started with provider: {self.initial_provider}, model: {self.initial_model}")
+        loop = asyncio.get_running_loop()
+        call_id = new_call_id()
+
+        for attempt in range(key_manager.get_api_retries()):
+            provider, model_name, key_info = self._select(attempt, prompt_tokens)
+            start = time.perf_counter()
+            try:
+                result = await func(self._prepare_model(provider, model_name, key_info, loop))
+            except Exception as e:
+                self._record(call_id, attempt, provider, model_name, key_info, start, error=e)
+                self._handle_error(e, provider, model_name, key_info, prompt_tokens)
+                continue
+            self._record(call_id, attempt, provider, model_name, key_info, start, result=result)
+            self._finish(provider, model_name, key_info, result)
+            if served is not None:
+                served.append((provider, model_name))
+            return result
 
         key_manager.log_status(f"Something went wrong with KeyManager")
         raise Exception("Something went wrong with Failover Logic")
@@ -178,6 +435,7 @@ class ChatFailoverLLM(BaseChatModel):
             tools,
             **kwargs
         ))
+        self.method_signatures.append({"tools": [convert_to_openai_tool(tool) for tool in tools], **kwargs})
         return self
     
     def with_structured_output(
@@ -192,6 +450,7 @@ class ChatFailoverLLM(BaseChatModel):
             include_raw=include_raw,
             **kwargs
         ))
+        self.method_signatures.append({"schema": schema, "include_raw": include_raw, **kwargs})
         return self
     
     def invoke(
@@ -202,14 +461,20 @@ class ChatFailoverLLM(BaseChatModel):
         stop: Optional[list[str]] = None,
         **kwargs: Any,
     ) -> BaseMessage:
-        return self._execute_with_failover(
+        served = []
+        call = lambda: self._execute_with_failover(
             func=lambda model: model.invoke(
                 input,
                 config,
                 stop=stop,
                 **kwargs
-            )
+            ),
+            prompt_tokens=self._prompt_tokens(input),
+            served=served,
         )
+        # Identical deterministic calls are answered once, concurrent ones wait for it
+        key = self._cache_key(input, stop, kwargs)
+        return call_cache().get_or_call(key, call, self._output_schema(), self._served_as_asked(served)) if key else call()
 
     async def ainvoke(
         self,
@@ -219,14 +484,19 @@ class ChatFailoverLLM(BaseChatModel):
         stop: Optional[list[str]] = None,
         **kwargs: Any,
     ) -> BaseMessage:
-        return self._execute_with_failover(
-            func=lambda model: model.invoke(
+        served = []
+        call = lambda: self._aexecute_with_failover(
+            func=lambda model: model.ainvoke(
                 input,
                 config,
                 stop=stop,
                 **kwargs
-            )
+            ),
+            prompt_tokens=self._prompt_tokens(input),
+            served=served,
         )
+        key = self._cache_key(input, stop, kwargs)
+        return await (call_cache().aget_or_call(key, call, self._output_schema(), self._served_as_asked(served)) if key else call())
     
     def stream(
         self,
@@ -234,7 +504,46 @@ class ChatFailoverLLM(BaseChatModel):
         config: Optional[RunnableConfig] = None,
         **kwargs: Any,
     ) -> Iterator[BaseMessageChunk]:
-        raise NotImplementedError
+        """
+        Streams from the first provider and key that produce a chunk; failures
+        before it fail over as in invoke. A failure after it raises
+        StreamInterruptedError, since the chunks already sent can't be taken back.
+        """
+        key_manager.log_status(f"Started streaming with provider: {self.initial_provider}, model: {self.initial_model}")
+        prompt_tokens = self._prompt_tokens(input)
+        call_id = new_call_id()
+
+        for attempt in range(key_manager.get_api_retries()):
+            provider, model_name, key_info = self._select(attempt, prompt_tokens)
+            start = time.perf_counter()
+            try:
+                chunks = iter(self._prepare_model(provider, model_name, key_info).stream(input, config, **kwargs))
+                chunk = next(chunks, None)
+            except Exception as e:
+                self._record(call_id, attempt, provider, model_name, key_info, start, error=e, stream=True)
+                self._handle_error(e, provider, model_name, key_info, prompt_tokens)
+                continue
+
+            stream = _StreamAccounting(time.perf_counter() - start)
+            try:
+                while chunk is not None:
+                    stream.add(chunk)
+                    yield chunk
+                    chunk = next(chunks, None)
+            except GeneratorExit as e:
+                # The caller stopped reading, e.g. to abort an obviously bad output
+                self._record(call_id, attempt, provider, model_name, key_info, start, stream.message, e, stream=True)
+                key_manager.release_key(provider, key_info)
+                raise
+            except Exception as e:
+                self._record(call_id, attempt, provider, model_name, key_info, start, stream.message, e, stream=True)
+                raise self._interrupt(e, provider, model_name, key_info, stream) from e
+            self._record(call_id, attempt, provider, model_name, key_info, start, stream.message, stream=True)
+            self._finish_stream(provider, model_name, key_info, stream)
+            return
+
+        key_manager.log_status(f"Something went wrong with KeyManager")
+        raise Exception("Something went wrong with Failover Logic")
     
     async def astream(
         self,
@@ -242,5 +551,55 @@ class ChatFailoverLLM(BaseChatModel):
         config: Optional[RunnableConfig] = None,
         **kwargs: Any,
     ) -> AsyncIterator[BaseMessageChunk]:
-        raise NotImplementedError
-    
\ No newline at end of file
+        """stream on the providers' async clients."""
+        key_manager.log_status(f"Started streaming with provider: {self.initial_provider}, model: {self.initial_model}")
+        loop = asyncio.get_running_loop()
+        prompt_tokens = self._prompt_tokens(input)
+        call_id = new_call_id()
+
+        for attempt in range(key_manager.get_api_retries()):
+            provider, model_name, key_info = self._select(attempt, prompt_tokens)
+            start = time.perf_counter()
+            try:
+                chunks = aiter(self._prepare_model(provider, model_name, key_info, loop).astream(input, config, **kwargs))
+                chunk = await anext(chunks, None)
+            except Exception as e:
+                self._record(call_id, attempt, provider, model_name, key_info, start, error=e, stream=True)
+                self._handle_error(e, provider, model_name, key_info, prompt_tokens)
+                continue
+
+            stream = _StreamAccounting(time.perf_counter() - start)
+            try:
+                while chunk is not None:
+                    stream.add(chunk)
+                    yield chunk
+                    chunk = await anext(chunks, None)
+            except GeneratorExit as e:
+                self._record(call_id, attempt, provider, model_name, key_info, start, stream.message, e, stream=True)
+                key_manager.release_key(provider, key_info)
+                raise
+            except Exception as e:
+                self._record(call_id, attempt, provider, model_name, key_info, start, stream.message, e, stream=True)
+                raise self._interrupt(e, provider, model_name, key_info, stream) from e
+            self._record(call_id, attempt, provider, model_name, key_info, start, stream.message, stream=True)
+            self._finish_stream(provider, model_name, key_info, stream)
+            return
+
+        key_manager.log_status(f"Something went wrong with KeyManager")
+        raise Exception("Something went wrong with Failover Logic")
+
+    def _interrupt(
+        self, e: Exception, provider: str, model_name: str, key_info: KeyInfo, stream: "_StreamAccounting"
+    ) -> "StreamInterruptedError":
+        try:
+            # Marks the key or provider as for any other failure
+            self._handle_error(e, provider, model_name, key_info)
+        except Exception:
+            pass
+        logger.warning(f"Stream interrupted after {stream.chunks} chunks. provider: {provider}, model: {model_name}, error: {e}")
+        return StreamInterruptedError(provider, model_name, stream.chunks, e)
+
+    def _finish_stream(self, provider: str, model_name: str, key_info: KeyInfo, stream: "_StreamAccounting"):
+        self._finish(provider, model_name, key_info, stream.message)
+        self.last_usage = stream.usage()
+        self.last_first_chunk_seconds = stream.first_chunk_seconds
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import httpx
+
+from llm_failover.config import logger
+from llm_failover.health import key_id
+
+LLM_CLIENT_REGISTRY_SIZE = int(os.environ.get("LLM_CLIENT_REGISTRY_SIZE", 256))
+LLM_CLIENT_IDLE_SECONDS = float(os.environ.get("LLM_CLIENT_IDLE_SECONDS", 1800))
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "true").lower() in ("true", "1", "t")
+LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", 100))
+LLM_HTTP_TIMEOUT = float(os.environ.get("LLM_HTTP_TIMEOUT", 600))
+
+
+def params_key(params: Dict[str, Any]) -> str:
+    return json.dumps(params, sort_keys=True, default=repr)
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=120,
+    )
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_HTTP_TIMEOUT, connect=10)
+
+
+def make_http_client(client_class=httpx.Client):
+    """
+    Long-lived connection pool for a provider. HTTP/2 multiplexes concurrent
+    calls over one TLS connection; it needs the h2 package (httpx[http2]) and
+    falls back to HTTP/1.1 pooling without it.
+    """
+    if LLM_HTTP2:
+        try:
+            return client_class(http2=True, limits=_http_limits(), timeout=_http_timeout())
+        except ImportError:
+            logger.warning("h2 is not installed, provider connections use HTTP/1.1")
+    return client_class(limits=_http_limits(), timeout=_http_timeout())
+
+
+def make_http_transport() -> httpx.HTTPTransport:
+    """The connection pool of make_http_client as a transport, for wrapping."""
+    if LLM_HTTP2:
+        try:
+            return httpx.HTTPTransport(http2=True, limits=_http_limits())
+        except ImportError:
+            logger.warning("h2 is not installed, provider connections use HTTP/1.1")
+    return httpx.HTTPTransport(limits=_http_limits())
+
+
+def _close_async_client(client: httpx.AsyncClient):
+    """Closes a pool whose event loop is gone, on a loop of its own in a thread."""
+    def close():
+        try:
+            asyncio.run(client.aclose())
+        except Exception as e:
+            logger.debug(f"Could not close the connections of a closed event loop: {e}")
+
+    threading.Thread(target=close, daemon=True).start()
+
+
+class ClientRegistry:
+    """
+    Process-wide chat model instances keyed by (provider, model, key, params),
+    so repeated calls reuse their client and its open connections instead of
+    building both and paying a TLS handshake per attempt.
+
+    Providers whose LangChain wrapper accepts an httpx client (OpenAI) share
+    one pool per provider across keys and models; the others keep the client
+    their instance owns. Least recently used instances beyond max_size, idle
+    ones after idle_seconds and those of a removed key are dropped.
+
+    Instances and pools of async calls are bound to their event loop, which
+    they are keyed on by id so the registry doesn't keep it alive. They are
+    dropped, and their pools closed, once the loop is closed or collected.
+    """
+
+    def __init__(
+        self,
+        max_size: int = LLM_CLIENT_REGISTRY_SIZE,
+        idle_seconds: float = LLM_CLIENT_IDLE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._models: "OrderedDict[Tuple, Tuple[Any, float]]" = OrderedDict()
+        self._http_clients: Dict[str, httpx.Client] = {}
+        # Async pools hold connections bound to their event loop, by id(loop)
+        self._async_http_clients: Dict[int, Dict[str, httpx.AsyncClient]] = {}
+        self._loops: Dict[int, weakref.ref] = {}
+        # Appended to by finalizers, which may run under the lock, and swept
+        # by the next call
+        self._collected_loops: list = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def http_client(self, provider: str) -> httpx.Client:
+        with self._lock:
+            client = self._http_clients.get(provider)
+            if client is None or client.is_closed:
+                client = self._http_clients[provider] = make_http_client()
+            return client
+
+    def batch_http_client(
+        self,
+        provider: str,
+        wrap: Callable[[httpx.BaseTransport], httpx.BaseTransport],
+    ) -> httpx.Client:
+        """A pool for batch mode, whose transport is wrap applied to the provider's connections."""
+        name = f"batch:{provider}"
+        with self._lock:
+            client = self._http_clients.get(name)
+            if client is None or client.is_closed:
+                client = self._http_clients[name] = httpx.Client(
+                    transport=wrap(make_http_transport()), timeout=_http_timeout()
+                )
+            return client
+
+    def _track_loop(self, loop: Any) -> int:
+        """id of loop, registering it to be swept once closed or collected. Call under the lock."""
+        loop_id = id(loop)
+        if loop_id not in self._loops:
+            self._loops[loop_id] = weakref.ref(loop)
+            weakref.finalize(loop, self._collected_loops.append, loop_id)
+        return loop_id
+
+    def _sweep_loops(self):
+        """Drops the instances and closes the pools of loops closed or collected since the last call."""
+        with self._lock:
+            gone = set()
+            while self._collected_loops:
+                gone.add(self._collected_loops.pop())
+            for loop_id, ref in self._loops.items():
+                loop = ref()
+                if loop is None or loop.is_closed():
+                    gone.add(loop_id)
+            if not gone:
+                return
+            for loop_id in gone:
+                self._loops.pop(loop_id, None)
+            for cache_key in [k for k in self._models if k[5] in gone]:
+                del self._models[cache_key]
+            clients = [
+                client
+                for loop_id in gone
+                for client in self._async_http_clients.pop(loop_id, {}).values()
+            ]
+        for client in clients:
+            _close_async_client(client)
+        logger.debug(f"Dropped clients of {len(gone)} finished event loops")
+
+    def http_async_client(self, provider: str, loop: Any) -> httpx.AsyncClient:
+        self._sweep_loops()
+        with self._lock:
+            clients = self._async_http_clients.setdefault(self._track_loop(loop), {})
+            client = clients.get(provider)
+            if client is None or client.is_closed:
+                client = clients[provider] = make_http_client(httpx.AsyncClient)
+            return client
+
+    def get(
+        self,
+        provider: str,
+        model_name: str,
+        api_key: str,
+        params: Dict[str, Any],
+        factory: Callable[[], Any],
+        scope: Hashable = None,
+        loop: Any = None,
+    ) -> Any:
+        """
+        The registered instance for these arguments, built with factory the
+        first time. Instances for async calls are scoped to their event loop.
+        """
+        self._sweep_loops()
+        now = self.clock()
+        with self._lock:
+            loop_id = self._track_loop(loop) if loop is not None else None
+            cache_key: Hashable = (provider, model_name, key_id(api_key), params_key(params), scope, loop_id)
+            entry = self._models.get(cache_key)
+            if entry is not None and now - entry[1] < self.idle_seconds:
+                self._models[cache_key] = (entry[0], now)
+                self._models.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+        # Built outside the lock; two threads racing on a cold key both build
+        # one and the last registered wins
+        model = factory()
+        with self._lock:
+            self.misses += 1
+            self._models[cache_key] = (model, now)
+            self._models.move_to_end(cache_key)
+            while len(self._models) > self.max_size:
+                self._models.popitem(last=False)
+        return model
+
+    def evict(self, provider: str, api_key: Optional[str] = None, model_name: Optional[str] = None) -> int:
+        """Drops the instances of a provider, optionally only of one key and/or model."""
+        with self._lock:
+            doomed = [
+                cache_key
+                for cache_key in self._models
+                if cache_key[0] == provider
+                and (api_key is None or cache_key[2] == key_id(api_key))
+                and (model_name is None or cache_key[1] == model_name)
+            ]
+            for cache_key in doomed:
+                del self._models[cache_key]
+        if doomed:
+            logger.debug(f"Evicted {len(doomed)} clients. provider: {provider}, model: {model_name}")
+        return len(doomed)
+
+    def reset_connections(self, provider: str):
+        """
+        Starts a new pool for the provider after connection errors. The old
+        one isn't closed under calls still using it; it goes with its last
+        instance.
+        """
+        with self._lock:
+            self._http_clients.pop(provider, None)
+            self._http_clients.pop(f"batch:{provider}", None)
+            for clients in self._async_http_clients.values():
+                clients.pop(provider, None)
+        self.evict(provider)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._models), "hits": self.hits, "misses": self.misses}
+
+
+client_registry = ClientRegistry()
@@ -1,3 +1,4 @@
+import os
 import openai
 import logging
 import anthropic
@@ -23,16 +24,25 @@ AVAILABLE_PROVIDERS = [
         "provider": "openai_api",
         "api_key": "OPENAI_API_KEY",
         "default_model": "OPENAI_DEFAULT_MODEL",
+        "key_weights": "OPENAI_API_KEY_WEIGHTS",
+        "key_policy": "OPENAI_KEY_POLICY",
+        "route_models": "OPENAI_ROUTE_MODELS",
     },
     {
         "provider": "google_api",
         "api_key": "GOOGLE_API_KEY",
         "default_model": "GOOGLE_DEFAULT_MODEL",
+        "key_weights": "GOOGLE_API_KEY_WEIGHTS",
+        "key_policy": "GOOGLE_KEY_POLICY",
+        "route_models": "GOOGLE_ROUTE_MODELS",
     },
     {
         "provider": "anthropic_api",
         "api_key": "ANTHROPIC_API_KEY",
         "default_model": "ANTHROPIC_DEFAULT_MODEL",
+        "key_weights": "ANTHROPIC_API_KEY_WEIGHTS",
+        "key_policy": "ANTHROPIC_KEY_POLICY",
+        "route_models": "ANTHROPIC_ROUTE_MODELS",
     }
 ]
 
@@ -60,3 +70,29 @@ TEMPORARY_PROVIDER_ERRORS = (
     anthropic.InternalServerError,
     anthropic.APIConnectionError,
 )
+
+# Provider errors after which the pooled connections are not trusted
+CONNECTION_ERRORS = (
+    openai.APIConnectionError,
+    anthropic.APIConnectionError,
+)
+
+# Errors a provider returns for a prompt too long for the model
+CONTEXT_LENGTH_ERRORS = (
+    openai.BadRequestError,
+    anthropic.BadRequestError,
+    google_exceptions.InvalidArgument,
+    ChatGoogleGenerativeAIError,
+)
+CONTEXT_LENGTH_MESSAGES = (
+    "context_length_exceeded",
+    "maximum context length",
+    "prompt is too long",
+    "exceeds the maximum number of tokens",
+)
+
+def is_context_length_error(e: Exception) -> bool:
+    return isinstance(e, CONTEXT_LENGTH_ERRORS) and any(m in str(e).lower() for m in CONTEXT_LENGTH_MESSAGES)
+
+# Route each call to a model whose context window fits the estimated prompt
+LLM_ROUTING = os.environ.get("LLM_ROUTING", "true").lower() in ("true", "1", "t")
@@ -0,0 +1,312 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import redis
+
+from llm_failover.config import logger
+
+HEALTH_PREFIX = "llm_failover:"
+
+
+def key_id(key: str) -> str:
+    """Stable id of an API key for shared state; the key itself never leaves the process."""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def redis_url(env_vars) -> Optional[str]:
+    """Redis for state shared across processes: LLM_HEALTH_REDIS_URL, else the app's REDIS_HOST."""
+    url = env_vars.get("LLM_HEALTH_REDIS_URL")
+    if not url and env_vars.get("REDIS_HOST"):
+        url = f"redis://{env_vars['REDIS_HOST']}:{env_vars.get('REDIS_PORT', 6379)}/{env_vars.get('REDIS_DB', 0)}"
+    return url
+
+
+class KeyState(NamedTuple):
+    available: bool
+    # Share of the key's request/token quota left in the current window, as
+    # last reported by the provider; None until a response reported it
+    remaining: Optional[float] = None
+
+
+class LocalHealthStore:
+    """In-process store with the RedisHealthStore interface, used without Redis."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, name: str) -> Dict[str, str]:
+        if self._expires.get(name, float("inf")) <= self.clock():
+            self._hashes.pop(name, None)
+            self._expires.pop(name, None)
+        return self._hashes.get(name, {})
+
+    def read(self, names: List[str]) -> List[Dict[str, str]]:
+        with self._lock:
+            return [dict(self._live(name)) for name in names]
+
+    def write(self, name: str, mapping: Dict[str, object], ttl: float):
+        with self._lock:
+            self._hashes[name] = {**self._live(name), **{k: str(v) for k, v in mapping.items()}}
+            self._expires[name] = self.clock() + ttl
+
+    def incr(self, name: str, field: str, ttl: float) -> int:
+        with self._lock:
+            fields = self._hashes[name] = dict(self._live(name))
+            fields[field] = str(int(fields.get(field, 0)) + 1)
+            self._expires[name] = self.clock() + ttl
+            return int(fields[field])
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        with self._lock:
+            if self._live(name):
+                return False
+            self._hashes[name] = {"held": "1"}
+            self._expires[name] = self.clock() + ttl
+            return True
+
+    def delete(self, names: List[str]):
+        with self._lock:
+            for name in names:
+                self._hashes.pop(name, None)
+                self._expires.pop(name, None)
+
+
+class RedisHealthStore:
+    """Health hashes in Redis, shared by every process using the same server."""
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    def read(self, names: List[str]) -> List[Dict[str, str]]:
+        pipe = self.client.pipeline(transaction=False)
+        for name in names:
+            pipe.hgetall(name)
+        return [
+            {k.decode(): v.decode() for k, v in fields.items()} for fields in pipe.execute()
+        ]
+
+    def write(self, name: str, mapping: Dict[str, object], ttl: float):
+        pipe = self.client.pipeline()
+        pipe.hset(name, mapping=mapping)
+        pipe.pexpire(name, max(1, int(ttl * 1000)))
+        pipe.execute()
+
+    def incr(self, name: str, field: str, ttl: float) -> int:
+        pipe = self.client.pipeline()
+        pipe.hincrby(name, field, 1)
+        pipe.pexpire(name, max(1, int(ttl * 1000)))
+        return pipe.execute()[0]
+
+    def acquire(self, name: str, ttl: float) -> bool:
+        return bool(self.client.set(name, 1, nx=True, px=max(1, int(ttl * 1000))))
+
+    def delete(self, names: List[str]):
+        self.client.delete(*names)
+
+
+class ProviderHealth:
+    """
+    Key and provider health shared across processes through a health store.
+
+    Keys: a rate-limited key is paused for key_pause_seconds, an invalid key is
+    removed for removed_key_seconds, for every process at once.
+
+    Circuits, one per provider and model: failure_threshold failures with no
+    gap longer than failure_window seconds open the circuit for open_seconds.
+    Once that elapses the circuit is half-open and admits one probe request
+    per probe_interval across the cluster. A successful probe closes it, a
+    failed one reopens it for twice as long, up to max_open_seconds.
+
+    Reads are cached in process for cache_seconds. If the store is
+    unreachable, the state is kept in process until it is back.
+    """
+
+    def __init__(
+        self,
+        store,
+        key_pause_seconds: float,
+        open_seconds: float,
+        failure_threshold: int = 3,
+        failure_window: float = 60,
+        max_open_seconds: float = 3600,
+        probe_interval: float = 10,
+        removed_key_seconds: float = 86400,
+        cache_seconds: float = 1,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = store
+        self.fallback = LocalHealthStore(clock)
+        self.key_pause_seconds = key_pause_seconds
+        self.open_seconds = open_seconds
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.max_open_seconds = max_open_seconds
+        self.probe_interval = probe_interval
+        self.removed_key_seconds = removed_key_seconds
+        self.cache_seconds = cache_seconds
+        self.clock = clock
+        self._cache: Dict[str, tuple] = {}
+        self._store_down_since: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, env_vars, key_pause_seconds: float, open_seconds: float) -> "ProviderHealth":
+        url = redis_url(env_vars)
+        store = (
+            RedisHealthStore(redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5))
+            if url
+            else LocalHealthStore()
+        )
+        return cls(
+            store,
+            key_pause_seconds=key_pause_seconds,
+            open_seconds=open_seconds,
+            failure_threshold=int(env_vars.get("CIRCUIT_FAILURE_THRESHOLD", 3)),
+            failure_window=float(env_vars.get("CIRCUIT_FAILURE_WINDOW", 60)),
+            max_open_seconds=float(env_vars.get("CIRCUIT_MAX_OPEN_SECONDS", 3600)),
+            probe_interval=float(env_vars.get("CIRCUIT_PROBE_INTERVAL", 10)),
+            removed_key_seconds=float(env_vars.get("API_KEY_REMOVED_SECONDS", 86400)),
+            cache_seconds=float(env_vars.get("LLM_HEALTH_CACHE_SECONDS", 1)),
+        )
+
+    def _call(self, method: str, *args):
+        if self._store_down_since is not None and self.clock() - self._store_down_since < self.probe_interval:
+            return getattr(self.fallback, method)(*args)
+        try:
+            result = getattr(self.store, method)(*args)
+            if self._store_down_since is not None:
+                logger.info("Health store is back, sharing key and provider health again")
+                self._store_down_since = None
+            return result
+        except redis.RedisError as e:
+            if self._store_down_since is None:
+                logger.warning(f"Health store unavailable, keeping health in process: {e}")
+            self._store_down_since = self.clock()
+            return getattr(self.fallback, method)(*args)
+
+    def _read(self, names: List[str]) -> List[Dict[str, str]]:
+        now = self.clock()
+        missing = [name for name in names if now - self._cache.get(name, (float("-inf"),))[0] >= self.cache_seconds]
+        if missing:
+            for name, fields in zip(missing, self._call("read", missing)):
+                self._cache[name] = (now, fields)
+        return [self._cache[name][1] for name in names]
+
+    def _write(self, name: str, mapping: Dict[str, object], ttl: float):
+        self._call("write", name, mapping, ttl)
+        self._cache.pop(name, None)
+
+    def _forget(self, names: List[str]):
+        self._call("delete", names)
+        for name in names:
+            self._cache.pop(name, None)
+
+    @staticmethod
+    def _key_name(provider: str, key: str) -> str:
+        return f"{HEALTH_PREFIX}key:{provider}:{key_id(key)}"
+
+    @staticmethod
+    def _circuit_name(provider: str, model: str) -> str:
+        return f"{HEALTH_PREFIX}circuit:{provider}:{model}"
+
+    @staticmethod
+    def _failures_name(provider: str, model: str) -> str:
+        return f"{HEALTH_PREFIX}failures:{provider}:{model}"
+
+    @staticmethod
+    def _quota_name(provider: str, key: str) -> str:
+        return f"{HEALTH_PREFIX}quota:{provider}:{key_id(key)}"
+
+    def key_states(self, provider: str, keys: List[str]) -> List[KeyState]:
+        """Availability and remaining quota of keys, read in one round trip."""
+        names = [self._key_name(provider, key) for key in keys]
+        names += [self._quota_name(provider, key) for key in keys]
+        fields = self._read(names)
+        now = self.clock()
+        states = []
+        for health, quota in zip(fields[: len(keys)], fields[len(keys) :]):
+            available = health.get("removed") != "1" and float(health.get("paused_until", 0)) <= now
+            remaining = float(quota["remaining"]) if "remaining" in quota else None
+            # Out of quota until the provider's window resets
+            if remaining == 0 and float(quota.get("reset_at", 0)) > now:
+                available = False
+            states.append(KeyState(available, remaining))
+        return states
+
+    def key_available(self, provider: str, key: str) -> bool:
+        return self.key_states(provider, [key])[0].available
+
+    def pause_key(self, provider: str, key: str, seconds: Optional[float] = None):
+        seconds = seconds or self.key_pause_seconds
+        self._write(
+            self._key_name(provider, key),
+            {"paused_until": self.clock() + seconds},
+            seconds,
+        )
+
+    def observe_quota(self, provider: str, key: str, remaining: float, reset_seconds: float):
+        """Records the share of quota a provider reported left for key, valid until the reset."""
+        reset_seconds = max(reset_seconds, 1)
+        self._write(
+            self._quota_name(provider, key),
+            {"remaining": round(remaining, 4), "reset_at": self.clock() + reset_seconds},
+            reset_seconds,
+        )
+
+    def publish(self, name: str, field: str, value: str, ttl: float):
+        self._call("write", f"{HEALTH_PREFIX}{name}", {field: value}, ttl)
+
+    def published(self, name: str) -> Dict[str, str]:
+        return self._call("read", [f"{HEALTH_PREFIX}{name}"])[0]
+
+    def remove_key(self, provider: str, key: str):
+        self._write(self._key_name(provider, key), {"removed": 1}, self.removed_key_seconds)
+
+    def circuit_state(self, provider: str, model: str) -> str:
+        """closed, open or half_open"""
+        [fields] = self._read([self._circuit_name(provider, model)])
+        open_until = float(fields.get("open_until", 0))
+        if not open_until:
+            return "closed"
+        return "open" if self.clock() < open_until else "half_open"
+
+    def allow(self, provider: str, model: str) -> bool:
+        """Whether a request may go to provider and model. In half-open, only the probe may."""
+        state = self.circuit_state(provider, model)
+        if state == "half_open":
+            return self._call("acquire", f"{HEALTH_PREFIX}probe:{provider}:{model}", self.probe_interval)
+        return state == "closed"
+
+    def open_circuit(self, provider: str, model: str, seconds: float, trips: int = 1):
+        self._write(
+            self._circuit_name(provider, model),
+            {"open_until": self.clock() + seconds, "trips": trips},
+            seconds + self.max_open_seconds,
+        )
+        self._forget([self._failures_name(provider, model)])
+        logger.warning(f"Circuit opened for {seconds:.0f}s. provider: {provider}, model: {model}, trips: {trips}")
+
+    def close_circuit(self, provider: str, model: str):
+        self._forget([self._circuit_name(provider, model), f"{HEALTH_PREFIX}probe:{provider}:{model}"])
+        logger.info(f"Circuit closed. provider: {provider}, model: {model}")
+
+    def record_failure(self, provider: str, model: str):
+        state = self.circuit_state(provider, model)
+        if state == "half_open":
+            [fields] = self._read([self._circuit_name(provider, model)])
+            trips = int(fields.get("trips", 1)) + 1
+            seconds = min(self.open_seconds * 2 ** (trips - 1), self.max_open_seconds)
+            self.open_circuit(provider, model, seconds, trips)
+        elif state == "closed":
+            failures = self._call("incr", self._failures_name(provider, model), "count", self.failure_window)
+            if failures >= self.failure_threshold:
+                self.open_circuit(provider, model, self.open_seconds)
+        # Failures of requests sent before the circuit opened change nothing
+
+    def record_success(self, provider: str, model: str):
+        if self.circuit_state(provider, model) == "half_open":
+            self.close_circuit(provider, model)
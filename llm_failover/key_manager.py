@@ -4,12 +4,25 @@ from typing import Any, Dict
 import time
 import json
 from llm_failover.config import logger, AVAILABLE_PROVIDERS, API_KEY_VISIBLE_PREFIX, API_KEY_VISIBLE_SUFFIX, API_KEY_VISIBLE_MINIMUM
+from llm_failover.health import ProviderHealth, key_id
+from llm_failover.key_selection import KeyMetrics, KeySelector, parse_rate_limit_headers
+from llm_failover.routing import ModelRouter
 
 class KeyInfo:
-    def __init__(self, key: str, last_used: float = 0, paused: bool = False):
+    def __init__(self, key: str, last_used: float = 0, paused: bool = False, weight: float = 1):
         self.key = key
+        self.key_id = key_id(key)
         self.last_used = last_used
         self.paused = paused
+        self.weight = weight
+        self.current_weight = KeySelector.start_weight(weight)
+        # Utilization in this process
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        # Share of quota left, as last reported by the provider
+        self.remaining = None
 
     def masked_key(self) -> str:
         prefix = API_KEY_VISIBLE_PREFIX
@@ -22,7 +35,21 @@ class KeyInfo:
         return {
             "key": self.masked_key(),
             "last_used": self.last_used,
-            "paused": self.paused
+            "paused": self.paused,
+            "in_flight": self.in_flight,
+            "remaining": self.remaining,
+        }
+
+    def utilization(self) -> Dict[str, Any]:
+        return {
+            "masked_key": self.masked_key(),
+            "weight": self.weight,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "remaining": self.remaining,
+            "paused": self.paused,
         }
 
     def __repr__(self) -> str:
@@ -37,9 +64,19 @@ class KeyInfo:
         return hash(self.key)
 
 class KeyManager:
-    def __init__(self, env_vars: dict):
+    def __init__(self, env_vars: dict, health: ProviderHealth = None):
         self.api_key_refresh_interval = int(env_vars["API_KEY_REFRESH_INTERVAL"])
         self.provider_refresh_interval = int(env_vars["PROVIDER_REFRESH_INTERVAL"])
+        # Paused and removed keys and provider circuits, shared across processes
+        self.health = health or ProviderHealth.from_env(
+            env_vars,
+            key_pause_seconds=self.api_key_refresh_interval,
+            open_seconds=self.provider_refresh_interval,
+        )
+
+        self.metrics = KeyMetrics(self.health, float(env_vars.get("LLM_KEY_METRICS_INTERVAL", 30)))
+        self.router = ModelRouter.from_env(env_vars, AVAILABLE_PROVIDERS, self.health)
+        default_policy = env_vars.get("KEY_SELECTION_POLICY", "round_robin")
 
         self.provider_details = {}
         # Load providers and keys from environment variable
@@ -48,11 +85,15 @@ class KeyManager:
             ENV_API_KEY = provider_config["api_key"]
             ENV_DEFAULT_MODEL = provider_config["default_model"]
             if ENV_API_KEY in env_vars:
+                keys = env_vars[ENV_API_KEY].split(",")
+                # Relative share of traffic per key, e.g. "3,1,1" for a key with three times the quota
+                weights = [float(w) for w in env_vars.get(provider_config["key_weights"], "").split(",") if w.strip()]
+                weights += [1.0] * (len(keys) - len(weights))
                 self.provider_details[provider] = {
                     "default_model": env_vars[ENV_DEFAULT_MODEL],
                     "last_used": 0,
-                    "paused": False,
-                    "keys": [ KeyInfo(key, 0, False) for key in env_vars[ENV_API_KEY].split(",") ]
+                    "selector": KeySelector(env_vars.get(provider_config["key_policy"], default_policy)),
+                    "keys": [ KeyInfo(key, 0, False, weight) for key, weight in zip(keys, weights) ]
                 }
 
         self.log_status("KeyManager loaded providers and keys from environment variables")
@@ -62,55 +103,96 @@ class KeyManager:
         logger.debug(f"KeyManager status: {self.provider_details}")
 
     def remove_key(self, provider: str, key_info: KeyInfo):
-        self.provider_details[provider]["keys"].remove(key_info)
+        key_info.paused = True
+        self.health.remove_key(provider, key_info.key)
         self.log_status(f"KeyManager removed the key. provider: {provider}, {key_info}")
 
-    def pause_key(self, provider: str, key_info: KeyInfo):
+    def pause_key(self, provider: str, key_info: KeyInfo, headers=None):
         key_info.paused = True
+        key_info.rate_limited += 1
+        # Pause until the provider says the key is usable again, when it says so
+        rate_limit = parse_rate_limit_headers(headers)
+        self.health.pause_key(provider, key_info.key, rate_limit and rate_limit.retry_after)
         self.log_status(f"KeyManager paused the key. provider: {provider}, {key_info}")
 
-    def resume_key(self, provider: str, key_info: KeyInfo):
-        key_info.paused = False
-        self.log_status(f"KeyManager resumed the key. provider: {provider} {key_info}")
-
     def pause_provider(self, provider: str):
-        self.provider_details[provider]["paused"] = True
+        # Every model of the provider, until a probe gets through
+        self.health.open_circuit(provider, "*", self.provider_refresh_interval)
         self.log_status(f"KeyManager paused the provider: {provider}")
 
     def resume_provider(self, provider: str):
-        self.provider_details[provider]["paused"] = False
+        self.health.close_circuit(provider, "*")
         self.log_status(f"KeyManager resumed the provider: {provider}")
 
+    def release_key(self, provider: str, key_info: KeyInfo, headers=None):
+        """Ends a request on key_info, recording the quota left reported in its response headers."""
+        key_info.in_flight = max(key_info.in_flight - 1, 0)
+        rate_limit = parse_rate_limit_headers(headers)
+        if rate_limit and rate_limit.remaining is not None:
+            key_info.remaining = rate_limit.remaining
+            self.health.observe_quota(provider, key_info.key, rate_limit.remaining, rate_limit.reset_seconds)
+        self.metrics.maybe_publish(self.provider_details)
+
+    def utilization(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            provider: {key_info.key_id: key_info.utilization() for key_info in info["keys"]}
+            for provider, info in self.provider_details.items()
+        }
+
+    def record_failure(self, provider: str, model: str, key_info: KeyInfo = None):
+        if key_info is not None:
+            key_info.failures += 1
+        self.health.record_failure(provider, model)
+
+    def record_success(self, provider: str, model: str):
+        self.health.record_success(provider, model)
+        self.health.record_success(provider, "*")
+
+    def policy(self, provider: str) -> str:
+        return self.provider_details[provider]["selector"].policy if provider in self.provider_details else ""
+
     def get_api_retries(self) -> int:
         return sum([ len(provider_info["keys"]) for provider_info in self.provider_details.values() ]) + 1
 
-    def get_api_info(self, initial_provider: str) -> tuple[str, str, KeyInfo]:
+    def get_api_info(
+        self,
+        initial_provider: str,
+        initial_model: str = "",
+        prompt_tokens: int = None,
+        output_tokens: int = None,
+    ) -> tuple[str, str, KeyInfo]:
         # Iterate all providers by priority but suggested one as the first
         for provider in dict.fromkeys([initial_provider, *self.provider_details.keys()]):
             # Skip unconfigured providers
             if provider not in self.provider_details:
                 continue
             provider_info = self.provider_details[provider]
+            model = initial_model if provider == initial_provider and initial_model else provider_info["default_model"]
 
-            # Check and refresh paused status
-            if provider_info["paused"]:
-                if time.time() - provider_info["last_used"] < self.provider_refresh_interval:
+            # A model whose context window and cost policy fit the prompt, if the provider has one
+            if prompt_tokens is not None:
+                model = self.router.route(provider, model, prompt_tokens, output_tokens)
+                if model is None:
                     continue
-                self.resume_provider(provider)
-            
-            # Load and find the first valid key
+
+            # Skip open circuits; half-open ones let one probe through at a time
+            if not (self.health.allow(provider, "*") and self.health.allow(provider, model)):
+                continue
+
+            # Pick among the available keys by the provider's selection policy
             keys = provider_info["keys"]
-            #keys.sort(key=lambda x: x["last_used"])
-            for key_info in keys:
-                # Check and refresh paused status
-                if key_info.paused:
-                    if time.time() - key_info.last_used < self.api_key_refresh_interval:
-                        continue
-                    self.resume_key(provider, key_info)
-                
-                key_info.last_used = time.time()
-                provider_info["last_used"] = time.time()
-                return (provider, provider_info["default_model"], key_info)
+            for key_info, state in zip(keys, self.health.key_states(provider, [k.key for k in keys])):
+                key_info.paused = not state.available
+                key_info.remaining = state.remaining
+            key_info = provider_info["selector"].select([k for k in keys if not k.paused])
+            if key_info is None:
+                continue
+
+            key_info.last_used = time.time()
+            key_info.requests += 1
+            key_info.in_flight += 1
+            provider_info["last_used"] = time.time()
+            return (provider, model, key_info)
             
         self.log_status("No valid keys available in KeyManager")
         raise Exception(f"No valid keys available at the moment")
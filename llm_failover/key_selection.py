@@ -0,0 +1,171 @@
+import json
+import os
+import random
+import re
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Mapping, NamedTuple, Optional
+
+KEY_METRICS_NAME = "key_metrics"
+KEY_METRICS_INTERVAL = 30
+
+POLICIES = ("first", "round_robin", "least_in_flight", "quota")
+
+
+class RateLimitHeaders(NamedTuple):
+    # Lowest of the request and token shares left, 0..1
+    remaining: Optional[float]
+    reset_seconds: float
+    retry_after: Optional[float]
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _seconds(value: str) -> Optional[float]:
+    """Parses "6m0s" / "20ms" style (OpenAI), RFC 3339 (Anthropic) and plain seconds."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+def parse_rate_limit_headers(headers: Optional[Mapping[str, str]]) -> Optional[RateLimitHeaders]:
+    """Remaining quota from OpenAI (x-ratelimit-*) or Anthropic (anthropic-ratelimit-*) headers."""
+    if not headers:
+        return None
+    headers = {k.lower(): v for k, v in headers.items()}
+    shares, resets = [], []
+    for kind in ("requests", "tokens"):
+        for remaining_name, limit_name, reset_name in (
+            (f"x-ratelimit-remaining-{kind}", f"x-ratelimit-limit-{kind}", f"x-ratelimit-reset-{kind}"),
+            (f"anthropic-ratelimit-{kind}-remaining", f"anthropic-ratelimit-{kind}-limit", f"anthropic-ratelimit-{kind}-reset"),
+        ):
+            try:
+                remaining, limit = float(headers[remaining_name]), float(headers[limit_name])
+            except (KeyError, ValueError):
+                continue
+            if limit > 0:
+                shares.append(remaining / limit)
+                resets.append(_seconds(headers.get(reset_name, "")) or 60)
+    retry_after = _seconds(headers["retry-after"]) if "retry-after" in headers else None
+    if not shares and retry_after is None:
+        return None
+    return RateLimitHeaders(
+        min(shares) if shares else None,
+        max(resets) if resets else 60,
+        retry_after,
+    )
+
+
+class KeySelector:
+    """
+    Picks one of a provider's available keys (KeyInfo objects) by policy:
+
+    - first: the first available key, every time
+    - round_robin: smooth weighted round robin over the key weights
+    - least_in_flight: fewest requests in flight in this process per weight
+    - quota: most quota left as reported by the provider's rate limit headers,
+      keys not reported yet count as full; ties go to least_in_flight
+    """
+
+    def __init__(self, policy: str = "round_robin"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown key selection policy: {policy}, expected one of {POLICIES}")
+        self.policy = policy
+
+    def select(self, keys: List) -> Optional[object]:
+        if not keys:
+            return None
+        if self.policy == "first":
+            return keys[0]
+        if self.policy == "least_in_flight":
+            return min(keys, key=_load)
+        if self.policy == "quota":
+            return min(keys, key=lambda k: (-(1.0 if k.remaining is None else k.remaining), *_load(k)))
+        total = sum(k.weight for k in keys)
+        for key_info in keys:
+            key_info.current_weight += key_info.weight
+        chosen = max(keys, key=lambda k: k.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+    @staticmethod
+    def start_weight(weight: float) -> float:
+        # Processes start at different points of the cycle, not all on key one
+        return random.uniform(0, weight)
+
+
+def _load(key_info) -> tuple:
+    return key_info.in_flight / key_info.weight, key_info.last_used
+
+
+class KeyMetrics:
+    """
+    Per-key utilization of this process, published as one field of a shared
+    hash at most every KEY_METRICS_INTERVAL seconds.
+    """
+
+    def __init__(self, health, interval: float = KEY_METRICS_INTERVAL):
+        self.health = health
+        self.interval = interval
+        self.process = f"{socket.gethostname()}:{os.getpid()}"
+        self._published_at = 0.0
+
+    def snapshot(self, provider_details: Dict) -> Dict:
+        return {
+            "process": self.process,
+            "published_at": time.time(),
+            "providers": {
+                provider: {key_info.key_id: key_info.utilization() for key_info in info["keys"]}
+                for provider, info in provider_details.items()
+            },
+        }
+
+    def maybe_publish(self, provider_details: Dict, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._published_at < self.interval:
+            return
+        self._published_at = now
+        self.health.publish(
+            KEY_METRICS_NAME,
+            self.process,
+            json.dumps(self.snapshot(provider_details)),
+            10 * self.interval,
+        )
+
+
+def summarize_key_metrics(published: List, interval: float = KEY_METRICS_INTERVAL) -> Dict:
+    """Sums the per-process snapshots per provider and key, dropping processes that stopped publishing."""
+    summary: Dict[str, Dict[str, Dict]] = {}
+    cutoff = time.time() - 10 * interval
+    for raw in published:
+        snapshot = json.loads(raw)
+        if snapshot["published_at"] < cutoff:
+            continue
+        for provider, keys in snapshot["providers"].items():
+            for key, stats in keys.items():
+                total = summary.setdefault(provider, {}).setdefault(
+                    key,
+                    {"masked_key": stats["masked_key"], "requests": 0, "in_flight": 0, "failures": 0, "rate_limited": 0, "remaining": None},
+                )
+                for counter in ("requests", "in_flight", "failures", "rate_limited"):
+                    total[counter] += stats[counter]
+                if stats["remaining"] is not None:
+                    total["remaining"] = min(stats["remaining"], 1 if total["remaining"] is None else total["remaining"])
+    for keys in summary.values():
+        requests = sum(stats["requests"] for stats in keys.values())
+        for stats in keys.values():
+            stats["share"] = round(stats["requests"] / requests, 4) if requests else 0
+    return summary
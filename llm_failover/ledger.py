@@ -0,0 +1,213 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import redis
+from langchain_core.messages import BaseMessage
+
+from llm_failover.config import logger
+from llm_failover.health import HEALTH_PREFIX, redis_url
+
+LEDGER_STREAM = f"{HEALTH_PREFIX}ledger"
+# Comma separated sinks: redis (the app's Redis, drained into the llm_call table), log or off
+LLM_LEDGER_SINKS = os.environ.get("LLM_LEDGER_SINKS", "redis").lower()
+# Approximate cap on records waiting in the stream for the drain
+LLM_LEDGER_STREAM_MAXLEN = int(os.environ.get("LLM_LEDGER_STREAM_MAXLEN", 1000000))
+# Records waiting for the writer thread; beyond it records are dropped
+LLM_LEDGER_QUEUE_SIZE = int(os.environ.get("LLM_LEDGER_QUEUE_SIZE", 10000))
+LEDGER_WRITE_BATCH = 500
+
+
+@dataclass
+class CallRecord:
+    """
+    One attempt of a ChatFailoverLLM call. Attempts of the same call share
+    call_id; an attempt with an error was followed by a failover unless it is
+    the call's last.
+    """
+
+    call_id: str
+    attempt: int
+    provider: str
+    model: str
+    # key_id of the API key, never the key
+    key: str
+    latency_seconds: float
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_prompt_tokens: Optional[int] = None
+    error: Optional[str] = None
+    cost: Optional[float] = None
+    stream: bool = False
+    tags: Dict[str, Any] = field(default_factory=dict)
+    called_at: float = field(default_factory=time.time)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw) -> "CallRecord":
+        return cls(**json.loads(raw))
+
+
+def new_call_id() -> str:
+    return uuid.uuid4().hex
+
+
+_tags: ContextVar[Dict[str, Any]] = ContextVar("llm_ledger_tags", default={})
+
+
+@contextmanager
+def ledger_tags(**tags: Any) -> Iterator[None]:
+    """Tags the records of calls made while active, e.g. with run_id, evaluator and engagement."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags() -> Dict[str, Any]:
+    return dict(_tags.get())
+
+
+def usage_of(result: Any) -> Dict[str, Optional[int]]:
+    """Token usage of a call result: a message, or structured output with include_raw."""
+    message = result.get("raw") if isinstance(result, dict) else result
+    usage = getattr(message, "usage_metadata", None) if isinstance(message, BaseMessage) else None
+    if not usage:
+        return {}
+    return {
+        "prompt_tokens": usage.get("input_tokens"),
+        "completion_tokens": usage.get("output_tokens"),
+        "cached_prompt_tokens": (usage.get("input_token_details") or {}).get("cache_read", 0),
+    }
+
+
+class LogSink:
+    def write(self, record: CallRecord):
+        logger.info(f"LLM call {record.to_json()}")
+
+
+class RedisStreamSink:
+    """
+    Appends records to a Redis stream, from which app.utils.llm_ledger drains
+    them into the database. Records are queued and written by a background
+    thread, so a slow or hung Redis never holds up a call, on the event loop
+    or off it; when the queue is full they are dropped with a warning.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        stream: str = LEDGER_STREAM,
+        maxlen: int = LLM_LEDGER_STREAM_MAXLEN,
+        queue_size: int = LLM_LEDGER_QUEUE_SIZE,
+    ):
+        self.client = client
+        self.stream = stream
+        self.maxlen = maxlen
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue: Optional[queue.Queue] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _started_queue(self) -> queue.Queue:
+        # A forked worker inherits the queue but not its thread
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(self.queue_size)
+                    threading.Thread(target=self._run, args=(self._queue,), name="llm-ledger", daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def write(self, record: CallRecord):
+        try:
+            self._started_queue().put_nowait(record.to_json())
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Call ledger queue is full, {self.dropped} records dropped so far")
+
+    def _run(self, records: queue.Queue):
+        while True:
+            batch = [records.get()]
+            while len(batch) < LEDGER_WRITE_BATCH:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for raw in batch:
+                    pipe.xadd(self.stream, {"record": raw}, maxlen=self.maxlen, approximate=True)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Could not write {len(batch)} call records to Redis: {e}")
+            finally:
+                for _ in batch:
+                    records.task_done()
+
+    def flush(self, timeout: float = 2.0):
+        """Waits up to timeout seconds for the queued records to be written."""
+        deadline = time.monotonic() + timeout
+        while self._queue is not None and self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+class Ledger:
+    """
+    Hands each call record to the sinks, any object with write(record).
+    A failing sink is logged and never fails the call.
+    """
+
+    def __init__(self, sinks: Optional[List[Any]] = None):
+        self.sinks = list(sinks or [])
+
+    def add_sink(self, sink: Any):
+        self.sinks.append(sink)
+
+    def emit(self, record: CallRecord):
+        if not record.tags:
+            record.tags = current_tags()
+        for sink in self.sinks:
+            try:
+                sink.write(record)
+            except Exception as e:
+                logger.warning(f"Could not write call record to {type(sink).__name__}: {e}")
+
+    @classmethod
+    def from_env(cls, env_vars) -> "Ledger":
+        sinks = []
+        for name in (s.strip() for s in env_vars.get("LLM_LEDGER_SINKS", LLM_LEDGER_SINKS).lower().split(",")):
+            if name == "log":
+                sinks.append(LogSink())
+            elif name == "redis" and redis_url(env_vars):
+                client = redis.Redis.from_url(redis_url(env_vars), socket_timeout=0.5, socket_connect_timeout=0.5)
+                sink = RedisStreamSink(client)
+                atexit.register(sink.flush)
+                sinks.append(sink)
+            elif name not in ("", "off", "redis"):
+                logger.warning(f"Unknown call ledger sink: {name}")
+        return cls(sinks)
+
+
+_ledger = None
+
+
+def ledger() -> Ledger:
+    """The process-wide ledger per LLM_LEDGER_SINKS."""
+    global _ledger
+    if _ledger is None:
+        _ledger = Ledger.from_env(os.environ)
+    return _ledger
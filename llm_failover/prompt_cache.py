@@ -0,0 +1,39 @@
+import os
+from typing import List
+
+from langchain_core.messages import BaseMessage
+
+# additional_kwargs key a caller sets on a message whose first n characters
+# are the same across calls, such as a system prompt before its variables
+CACHE_BREAKPOINT = "cache_breakpoint"
+# Anthropic allows four cache_control breakpoints per request
+MAX_BREAKPOINTS = 4
+LLM_PROMPT_CACHING = os.environ.get("LLM_PROMPT_CACHING", "true").lower() in ("true", "1", "t")
+
+
+def anthropic_cache_control(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Anthropic caches a prompt prefix only up to an explicit cache_control
+    breakpoint. Splits each message marked with CACHE_BREAKPOINT into its
+    stable and variable text blocks and puts the breakpoint on the stable one.
+    OpenAI and Gemini cache stable prefixes on their own and never see the
+    marker, which is only an additional_kwargs entry.
+    """
+    if not LLM_PROMPT_CACHING:
+        return messages
+    marked, breakpoints = [], 0
+    for message in messages:
+        chars = message.additional_kwargs.get(CACHE_BREAKPOINT)
+        if chars and isinstance(message.content, str) and breakpoints < MAX_BREAKPOINTS:
+            head, tail = message.content[:chars], message.content[chars:]
+            # Empty or blank text blocks are rejected by the API
+            if not tail.strip():
+                head, tail = message.content, ""
+            if head.strip():
+                blocks = [{"type": "text", "text": head, "cache_control": {"type": "ephemeral"}}]
+                if tail:
+                    blocks.append({"type": "text", "text": tail})
+                message = message.model_copy(update={"content": blocks})
+                breakpoints += 1
+        marked.append(message)
+    return marked
@@ -0,0 +1,288 @@
+import json
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from llm_failover.config import logger
+
+ROUTE_METRICS_NAME = "route_metrics"
+
+# Context windows in tokens by model name prefix; the longest matching prefix
+# wins, so dated versions inherit their family's window
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-instruct": 4096,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    # The 128k previews are dated versions of gpt-4, not of gpt-4-turbo
+    "gpt-4-0125-preview": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-vision-preview": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.5": 128000,
+    "gpt-5": 400000,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+    "claude-3": 200000,
+    "claude-sonnet-4": 200000,
+    "claude-opus-4": 200000,
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+    "gemini-2.0-flash": 1048576,
+    "gemini-2.5": 1048576,
+}
+
+POLICIES = ("first", "cheapest")
+
+# The limit reported in context length errors: OpenAI "maximum context length
+# is 8192 tokens", Anthropic "prompt is too long: 210000 tokens > 200000
+# maximum" or "190000 + 20000 > 200000", Gemini "exceeds the maximum number
+# of tokens allowed (1048576)"
+CONTEXT_LIMIT_PATTERNS = (
+    re.compile(r"maximum context length is (\d+)"),
+    re.compile(r"maximum number of tokens allowed \((\d+)\)"),
+    re.compile(r"> (\d+)"),
+)
+
+
+def context_limit(message: str) -> Optional[int]:
+    """The context window a provider's context length error reports, if any."""
+    for pattern in CONTEXT_LIMIT_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return int(match.group(1))
+    return None
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:  # pragma: no cover
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    # Four characters a token without tiktoken, close enough for English and code
+    return len(_encoding.encode(text, disallowed_special=())) if _encoding else len(text) // 4 + 1
+
+
+def estimate_prompt_tokens(input: Any) -> int:
+    """
+    Tokens of a model input (string, messages, prompt value) by the OpenAI
+    tokenizer, plus a few per message. Other providers' tokenizers differ by
+    some percent, which the router's margin covers; images aren't counted.
+    """
+    if hasattr(input, "to_messages"):
+        input = input.to_messages()
+    if isinstance(input, str):
+        return count_tokens(input)
+    tokens = 0
+    for message in input:
+        if isinstance(message, BaseMessage):
+            content = message.content
+        elif isinstance(message, dict):
+            content = message.get("content", "")
+        elif isinstance(message, (tuple, list)) and len(message) == 2:
+            content = message[1]
+        else:
+            content = message
+        if isinstance(content, list):
+            content = " ".join(
+                block.get("text", "") if isinstance(block, dict) else str(block) for block in content
+            )
+        tokens += count_tokens(str(content)) + 4
+    return tokens
+
+
+class ModelRouter:
+    """
+    Picks the model a call goes to on a provider from the estimated prompt
+    size, before any request is sent. Candidates are the requested model,
+    then the provider's route models (<PROVIDER>_ROUTE_MODELS) in order.
+
+    - first: the first candidate whose context window holds the prompt with
+      margin plus the output tokens, and whose estimated cost stays within
+      max_call_cost when one is set
+    - cheapest: of those, the one with the lowest estimated cost
+
+    A provider with no fitting candidate is skipped. Models of unknown window
+    fit any prompt; models without a price fit any cost. A context length
+    error caps the model's window for cap_seconds, see cap_window.
+
+    Decisions are counted per (provider, requested, chosen, reason) and
+    published every interval seconds for the health endpoint.
+    """
+
+    def __init__(
+        self,
+        route_models: Optional[Dict[str, List[str]]] = None,
+        context_windows: Optional[Dict[str, int]] = None,
+        prices: Optional[Dict[str, Tuple[float, float]]] = None,
+        policy: str = "first",
+        max_call_cost: Optional[float] = None,
+        margin: float = 1.1,
+        output_tokens: int = 4096,
+        health=None,
+        interval: float = 30,
+        window_floor: int = 4096,
+        cap_seconds: float = 3600,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown routing policy: {policy}, expected one of {POLICIES}")
+        self.route_models = route_models or {}
+        self.context_windows = {**CONTEXT_WINDOWS, **(context_windows or {})}
+        self.prices = prices or {}
+        self.policy = policy
+        self.max_call_cost = max_call_cost
+        self.margin = margin
+        self.output_tokens = output_tokens
+        self.health = health
+        self.interval = interval
+        self.window_floor = window_floor
+        self.cap_seconds = cap_seconds
+        # Windows lowered by context length errors: model -> (window, expires_at)
+        self._caps: Dict[str, Tuple[int, float]] = {}
+        self.decisions: Counter = Counter()
+        self.process = f"{socket.gethostname()}:{os.getpid()}"
+        self._published_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, env_vars, providers: List[Dict[str, str]], health=None) -> "ModelRouter":
+        prices = {
+            model: tuple(price)
+            for model, price in json.loads(env_vars.get("LLM_MODEL_PRICES", "{}")).items()
+        }
+        max_call_cost = env_vars.get("LLM_ROUTE_MAX_CALL_COST")
+        return cls(
+            route_models={
+                config["provider"]: [m.strip() for m in env_vars[config["route_models"]].split(",") if m.strip()]
+                for config in providers
+                if env_vars.get(config["route_models"])
+            },
+            context_windows={
+                model: int(window)
+                for model, window in json.loads(env_vars.get("LLM_CONTEXT_WINDOWS", "{}")).items()
+            },
+            prices=prices,
+            policy=env_vars.get("LLM_ROUTE_POLICY", "first"),
+            max_call_cost=float(max_call_cost) if max_call_cost else None,
+            margin=float(env_vars.get("LLM_ROUTE_TOKEN_MARGIN", 1.1)),
+            output_tokens=int(env_vars.get("LLM_ROUTE_OUTPUT_TOKENS", 4096)),
+            health=health,
+            interval=float(env_vars.get("LLM_KEY_METRICS_INTERVAL", 30)),
+            window_floor=int(env_vars.get("LLM_ROUTE_WINDOW_FLOOR", 4096)),
+            cap_seconds=float(env_vars.get("LLM_ROUTE_CAP_SECONDS", 3600)),
+        )
+
+    @staticmethod
+    def _lookup(table: Dict[str, Any], model: str) -> Any:
+        matches = [prefix for prefix in table if model.startswith(prefix)]
+        return table[max(matches, key=len)] if matches else None
+
+    def context_window(self, model: str) -> Optional[int]:
+        cap = self._caps.get(model)
+        if cap is not None:
+            if cap[1] > time.monotonic():
+                return cap[0]
+            with self._lock:
+                self._caps.pop(model, None)
+        return self._lookup(self.context_windows, model)
+
+    def call_cost(self, model: str, prompt_tokens: int, output_tokens: int) -> Optional[float]:
+        price = self._lookup(self.prices, model)
+        if price is None:
+            return None
+        return (prompt_tokens * price[0] + output_tokens * price[1]) / 1000000
+
+    def fits(self, model: str, prompt_tokens: int, output_tokens: int) -> bool:
+        window = self.context_window(model)
+        return window is None or prompt_tokens * self.margin + output_tokens <= window
+
+    def route(self, provider: str, model: str, prompt_tokens: int, output_tokens: Optional[int] = None) -> Optional[str]:
+        """The model to call on provider for a prompt of prompt_tokens, None to skip the provider."""
+        output_tokens = output_tokens or self.output_tokens
+        candidates = [
+            c for c in dict.fromkeys([model, *self.route_models.get(provider, [])])
+            if self.fits(c, prompt_tokens, output_tokens)
+            and (self.max_call_cost is None or (self.call_cost(c, prompt_tokens, output_tokens) or 0) <= self.max_call_cost)
+        ]
+        if self.policy == "cheapest":
+            # Stable, so unpriced models keep their order behind the priced ones
+            candidates.sort(key=lambda c: self.call_cost(c, prompt_tokens, output_tokens) or float("inf"))
+        chosen = candidates[0] if candidates else None
+        if chosen == model:
+            reason = "requested"
+        elif chosen is None:
+            reason = "no_fit"
+        else:
+            reason = "cost" if self.fits(model, prompt_tokens, output_tokens) else "context"
+        self.record(provider, model, chosen, reason)
+        if chosen != model:
+            logger.info(
+                f"Routed {prompt_tokens} prompt tokens on {provider} from {model} to {chosen or 'the next provider'} ({reason})"
+            )
+        return chosen
+
+    def cap_window(self, model: str, message: str, prompt_tokens: int, output_tokens: Optional[int] = None):
+        """
+        Lowers the model's window for cap_seconds after a context length error
+        with message. The new window is the limit the provider reported, else
+        just below what the call needed, output included, so an error caused
+        by max_tokens doesn't shrink the window to the prompt. It never goes
+        below window_floor.
+        """
+        limit = context_limit(message)
+        if limit is None:
+            limit = int(prompt_tokens * self.margin) + (output_tokens or self.output_tokens) - 1
+        capped = max(self.window_floor, limit)
+        window = self.context_window(model)
+        if window is None or capped < window:
+            with self._lock:
+                self._caps[model] = (capped, time.monotonic() + self.cap_seconds)
+            logger.warning(f"Context length exceeded at {prompt_tokens} prompt tokens, capped the window of {model} to {capped}")
+
+    def record(self, provider: str, requested: str, chosen: Optional[str], reason: str):
+        with self._lock:
+            self.decisions[(provider, requested, chosen or "", reason)] += 1
+        self.maybe_publish()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            decisions = [
+                {"provider": p, "requested": r, "chosen": c, "reason": reason, "count": n}
+                for (p, r, c, reason), n in self.decisions.items()
+            ]
+        return {"process": self.process, "published_at": time.time(), "decisions": decisions}
+
+    def maybe_publish(self, force: bool = False):
+        now = time.monotonic()
+        if self.health is None or (not force and now - self._published_at < self.interval):
+            return
+        self._published_at = now
+        self.health.publish(ROUTE_METRICS_NAME, self.process, json.dumps(self.snapshot()), 10 * self.interval)
+
+
+def summarize_route_metrics(published: List, interval: float = 30) -> List[Dict]:
+    """Sums the per-process routing decisions, dropping processes that stopped publishing."""
+    totals: Counter = Counter()
+    cutoff = time.time() - 10 * interval
+    for raw in published:
+        snapshot = json.loads(raw)
+        if snapshot["published_at"] < cutoff:
+            continue
+        for decision in snapshot["decisions"]:
+            totals[(decision["provider"], decision["requested"], decision["chosen"], decision["reason"])] += decision["count"]
+    return [
+        {"provider": p, "requested": r, "chosen": c, "reason": reason, "count": n}
+        for (p, r, c, reason), n in sorted(totals.items())
+    ]
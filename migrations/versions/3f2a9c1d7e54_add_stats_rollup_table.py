@@ -0,0 +1,70 @@
+"""add stats_rollup table
+
+Populate it once afterwards with the backfill_stats_rollups task.
+
+Revision ID: 3f2a9c1d7e54
+Revises: 65718fcafdca
+Create Date: 2026-10-19 09:12:41.318204+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f2a9c1d7e54"
+down_revision: Union[str, None] = "65718fcafdca"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stats_rollup",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("engagement_id", sa.Integer(), nullable=False),
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("evaluator_id", sa.Integer(), nullable=False),
+        sa.Column("run_count", sa.Integer(), nullable=False),
+        sa.Column("run_failed_count", sa.Integer(), nullable=False),
+        sa.Column("evaluation_count", sa.Integer(), nullable=False),
+        sa.Column("evaluation_failed_count", sa.Integer(), nullable=False),
+        sa.Column("total_prompt_tokens", sa.BigInteger(), nullable=False),
+        sa.Column("total_generate_tokens", sa.BigInteger(), nullable=False),
+        sa.Column("total_latency_ms", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "day",
+            "engagement_id",
+            "project_id",
+            "evaluator_id",
+            name="uq_stats_rollup_grain",
+        ),
+    )
+    op.create_index(
+        "idx_stats_rollup_engagement_day", "stats_rollup", ["engagement_id", "day"]
+    )
+    op.create_index(
+        "idx_stats_rollup_project_day", "stats_rollup", ["project_id", "day"]
+    )
+    op.create_index(
+        "idx_stats_rollup_evaluator_day", "stats_rollup", ["evaluator_id", "day"]
+    )
+    op.create_table(
+        "stats_rollup_lock",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint("day"),
+    )
+    # Compaction scans runs by creation day
+    op.create_index("idx_run_created_at", "run", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_run_created_at", table_name="run")
+    op.drop_table("stats_rollup_lock")
+    op.drop_table("stats_rollup")
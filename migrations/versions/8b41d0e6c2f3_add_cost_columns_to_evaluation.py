@@ -0,0 +1,40 @@
+"""add cost columns to evaluation
+
+Revision ID: 8b41d0e6c2f3
+Revises: 3f2a9c1d7e54
+Create Date: 2026-10-19 11:47:05.902114+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8b41d0e6c2f3"
+down_revision: Union[str, None] = "3f2a9c1d7e54"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "evaluation", sa.Column("llm_provider", sa.String(length=80), nullable=True)
+    )
+    op.add_column(
+        "evaluation", sa.Column("llm_model", sa.String(length=100), nullable=True)
+    )
+    op.add_column("evaluation", sa.Column("cost", sa.Float(), nullable=True))
+    op.create_index(
+        "idx_evaluation_user_project_role_created_at",
+        "evaluation",
+        ["user_project_role_id", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_evaluation_user_project_role_created_at", table_name="evaluation")
+    op.drop_column("evaluation", "cost")
+    op.drop_column("evaluation", "llm_model")
+    op.drop_column("evaluation", "llm_provider")
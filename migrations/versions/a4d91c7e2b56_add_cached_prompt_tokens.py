@@ -0,0 +1,34 @@
+"""add cached prompt tokens
+
+Revision ID: a4d91c7e2b56
+Revises: f3a0d6c84e19
+Create Date: 2026-10-19 20:14:08.531726+00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a4d91c7e2b56"
+down_revision: Union[str, None] = "f3a0d6c84e19"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "evaluation",
+        sa.Column("cached_prompt_tokens_used", sa.Integer(), nullable=True),
+    )
+    op.add_column(
+        "llm_pricing",
+        sa.Column("cached_input_price_per_million_tokens", sa.Float(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("llm_pricing", "cached_input_price_per_million_tokens")
+    op.drop_column("evaluation", "cached_prompt_tokens_used")
@@ -0,0 +1,62 @@
+"""add llm_call table
+
+Revision ID: b7e2f05c9a13
+Revises: a4d91c7e2b56
+Create Date: 2026-10-19 21:02:37.418530+00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e2f05c9a13"
+down_revision: Union[str, None] = "a4d91c7e2b56"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "llm_call",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("call_id", sa.String(length=32), nullable=False),
+        sa.Column("attempt", sa.Integer(), nullable=False),
+        sa.Column("provider", sa.String(length=100), nullable=False),
+        sa.Column("model", sa.String(length=100), nullable=False),
+        sa.Column("key_alias", sa.String(length=16), nullable=False),
+        sa.Column("run_id", sa.Integer(), nullable=True),
+        sa.Column("evaluator", sa.String(length=150), nullable=True),
+        sa.Column("engagement", sa.String(length=150), nullable=True),
+        sa.Column("latency_ms", sa.Integer(), nullable=False),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=True),
+        sa.Column("completion_tokens", sa.Integer(), nullable=True),
+        sa.Column("cached_prompt_tokens", sa.Integer(), nullable=True),
+        sa.Column("error", sa.String(length=100), nullable=True),
+        sa.Column("stream", sa.Boolean(), nullable=False),
+        sa.Column("cost", sa.Float(), nullable=True),
+        sa.Column("called_at", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        # Lets the drain re-insert records it already committed
+        sa.UniqueConstraint("call_id", "attempt", name="uq_llm_call_attempt"),
+    )
+    op.create_index("idx_llm_call_run_id", "llm_call", ["run_id"])
+    op.create_index(
+        "idx_llm_call_evaluator_called_at", "llm_call", ["evaluator", "called_at"]
+    )
+    op.create_index(
+        "idx_llm_call_engagement_called_at", "llm_call", ["engagement", "called_at"]
+    )
+    op.create_index("idx_llm_call_called_at", "llm_call", ["called_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_llm_call_called_at", table_name="llm_call")
+    op.drop_index("idx_llm_call_engagement_called_at", table_name="llm_call")
+    op.drop_index("idx_llm_call_evaluator_called_at", table_name="llm_call")
+    op.drop_index("idx_llm_call_run_id", table_name="llm_call")
+    op.drop_table("llm_call")
@@ -0,0 +1,44 @@
+"""add keyset pagination indexes
+
+Revision ID: c5e7a3f19d08
+Revises: 8b41d0e6c2f3
+Create Date: 2026-10-19 14:03:26.517390+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5e7a3f19d08"
+down_revision: Union[str, None] = "8b41d0e6c2f3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table) for every list endpoint paginated on (created_at, id)
+KEYSET_INDEXES = [
+    ("idx_engagement_created_at_id", "engagement"),
+    ("idx_role_created_at_id", "roles"),
+    ("idx_user_created_at_id", "users"),
+    ("idx_project_created_at_id", "project"),
+    ("idx_user_project_role_created_at_id", "user_project_roles"),
+    ("idx_batch_run_created_at_id", "batch_run"),
+    ("idx_run_created_at_id", "run"),
+    ("idx_evaluation_created_at_id", "evaluation"),
+    ("idx_evaluator_type_created_at_id", "evaluator_type"),
+    ("idx_evaluator_created_at_id", "evaluator"),
+]
+
+
+def upgrade() -> None:
+    for name, table in KEYSET_INDEXES:
+        op.create_index(name, table, ["created_at", "id"])
+    # Superseded by idx_run_created_at_id
+    op.drop_index("idx_run_created_at", table_name="run")
+
+
+def downgrade() -> None:
+    op.create_index("idx_run_created_at", "run", ["created_at"])
+    for name, table in KEYSET_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,43 @@
+"""add blob tier
+
+Revision ID: d2b8e4a61f37
+Revises: c5e7a3f19d08
+Create Date: 2026-10-19 16:21:44.208113+00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d2b8e4a61f37"
+down_revision: Union[str, None] = "c5e7a3f19d08"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blob",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("hash", sa.String(length=64), nullable=False),
+        sa.Column("codec", sa.String(length=10), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("data", sa.LargeBinary(length=2**32 - 1), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("hash", name="uq_blob_hash"),
+    )
+    op.add_column("run", sa.Column("message_blob", sa.String(length=64), nullable=True))
+    op.add_column(
+        "evaluation", sa.Column("output_blob", sa.String(length=64), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("evaluation", "output_blob")
+    op.drop_column("run", "message_blob")
+    op.drop_table("blob")
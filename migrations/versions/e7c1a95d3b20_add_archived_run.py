@@ -0,0 +1,39 @@
+"""add archived run
+
+Revision ID: e7c1a95d3b20
+Revises: d2b8e4a61f37
+Create Date: 2026-10-19 17:38:12.664021+00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e7c1a95d3b20"
+down_revision: Union[str, None] = "d2b8e4a61f37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "archived_run",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("run_id", sa.Integer(), nullable=False),
+        sa.Column("batch_run_id", sa.Integer(), nullable=True),
+        sa.Column("month", sa.String(length=7), nullable=False),
+        sa.Column("object_name", sa.String(length=255), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("run_id", name="uq_archived_run_run_id"),
+    )
+    op.create_index("idx_archived_run_batch_run_id", "archived_run", ["batch_run_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_archived_run_batch_run_id", table_name="archived_run")
+    op.drop_table("archived_run")
@@ -0,0 +1,39 @@
+"""add covering query indexes
+
+Revision ID: f3a0d6c84e19
+Revises: e7c1a95d3b20
+Create Date: 2026-10-19 18:52:30.117842+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a0d6c84e19"
+down_revision: Union[str, None] = "e7c1a95d3b20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Batch status reads (id, status) of a batch's runs from the index alone.
+    # It supersedes idx_run_batch_run_id, its left prefix, also for the FK.
+    op.create_index("idx_run_batch_run_id_status", "run", ["batch_run_id", "status"])
+    op.drop_index("idx_run_batch_run_id", table_name="run")
+    op.create_index("idx_run_input_hash", "run", ["input_hash"])
+    # Likewise supersedes the two single column run_id indexes, which were
+    # duplicates of each other, and backs the run_id FK
+    op.create_index("idx_evaluation_run_id_name", "evaluation", ["run_id", "name"])
+    op.drop_index("idx_run_id", table_name="evaluation")
+    op.drop_index("idx_evaluation_run_id", table_name="evaluation")
+
+
+def downgrade() -> None:
+    op.create_index("idx_evaluation_run_id", "evaluation", ["run_id"])
+    op.create_index("idx_run_id", "evaluation", ["run_id"])
+    op.drop_index("idx_evaluation_run_id_name", table_name="evaluation")
+    op.drop_index("idx_run_input_hash", table_name="run")
+    op.create_index("idx_run_batch_run_id", "run", ["batch_run_id"])
+    op.drop_index("idx_run_batch_run_id_status", table_name="run")
@@ -0,0 +1,38 @@
+from datetime import date, datetime
+
+from app.db_api.archive import (
+    LocalArchiveStorage,
+    _group,
+    _load,
+    decode_chunk,
+    encode_chunk,
+    month_start,
+)
+
+RECORDS = [
+    {
+        "run": {"id": run_id, "created_at": datetime(2026, 1, 5, 12, 0)},
+        "evaluations": [{"id": run_id * 10, "run_id": run_id, "output": {"score": 4}}],
+    }
+    for run_id in (1, 2, 3)
+]
+
+
+class TestArchive:
+
+    def test_month_start_crosses_year_boundaries(self):
+        assert month_start(date(2026, 3, 17)) == date(2026, 3, 1)
+        assert month_start(date(2026, 3, 17), 6) == date(2025, 9, 1)
+        assert month_start(date(2025, 12, 1), -1) == date(2026, 1, 1)
+
+    def test_chunk_round_trips(self):
+        records = decode_chunk(encode_chunk(RECORDS))
+        assert [record["run"]["id"] for record in records] == [1, 2, 3]
+        assert records[0]["run"]["created_at"] == "2026-01-05T12:00:00"
+        assert records[2]["evaluations"][0]["output"] == {"score": 4}
+
+    def test_load_reads_only_the_requested_runs(self, tmp_path):
+        storage = LocalArchiveStorage(str(tmp_path))
+        storage.put("runs/2026-01/1-3.jsonl.gz", encode_chunk(RECORDS))
+        records = _load(storage, _group([(2, "runs/2026-01/1-3.jsonl.gz")]))
+        assert [record["run"]["id"] for record in records] == [2]
@@ -0,0 +1,83 @@
+import os
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import Session
+
+from app.db_api.blob_store import BlobStore, DatabaseBlobBackend, LocalBlobBackend
+from app.db_api.models import Blob
+from app.utils.stats_rollups import insert_ignore_stmt
+
+LARGE_OUTPUT = {"cells": [{"issues": ["x" * 200], "score": i} for i in range(50)]}
+
+
+def make_store(tmp_path):
+    return BlobStore(LocalBlobBackend(str(tmp_path)), threshold=1024)
+
+
+class TestBlobStore:
+
+    def test_small_payloads_stay_inline(self, tmp_path):
+        store = make_store(tmp_path)
+        rows = store.offload_rows(
+            [{"id": 1, "output": {"score": 4}}, {"id": 2, "output": None}],
+            "output",
+            "output_blob",
+        )
+        assert rows == [
+            {"id": 1, "output": {"score": 4}, "output_blob": None},
+            {"id": 2, "output": None, "output_blob": None},
+        ]
+        assert os.listdir(tmp_path) == []
+
+    def test_large_payload_round_trips_through_blob(self, tmp_path):
+        store = make_store(tmp_path)
+        [row] = store.offload_rows(
+            [{"id": 1, "output": LARGE_OUTPUT}], "output", "output_blob"
+        )
+        assert row["output"] is None
+        assert len(row["output_blob"]) == 64
+        store.load_rows([row], "output", "output_blob")
+        assert row["output"] == LARGE_OUTPUT
+
+    def test_identical_payloads_share_one_blob(self, tmp_path):
+        store = make_store(tmp_path)
+        rows = store.offload_rows(
+            [{"id": 1, "output": LARGE_OUTPUT}, {"id": 2, "output": LARGE_OUTPUT}],
+            "output",
+            "output_blob",
+        )
+        assert rows[0]["output_blob"] == rows[1]["output_blob"]
+        [shard] = os.listdir(tmp_path)
+        assert len(os.listdir(tmp_path / shard)) == 1
+
+    def test_offload_leaves_the_callers_rows_untouched(self, tmp_path):
+        store = make_store(tmp_path)
+        evaluations = [{"id": 1, "output": LARGE_OUTPUT}]
+        store.offload_rows(evaluations, "output", "output_blob")
+        assert evaluations == [{"id": 1, "output": LARGE_OUTPUT}]
+
+    def test_database_backend_skips_stored_keys(self):
+        engine = create_engine("sqlite://")
+        Blob.__table__.create(engine)
+        with Session(engine) as db:
+            # Two processes storing the same payload
+            for _ in range(2):
+                BlobStore(DatabaseBlobBackend(), threshold=1024).offload_rows(
+                    [{"id": 1, "output": LARGE_OUTPUT}],
+                    "output",
+                    "output_blob",
+                    session=db,
+                )
+            db.commit()
+            assert db.scalar(select(func.count(Blob.id))) == 1
+
+    def test_mysql_skips_duplicate_keys_only(self):
+        db = SimpleNamespace(bind=SimpleNamespace(dialect=mysql.dialect()))
+        sql = str(
+            insert_ignore_stmt(db, Blob.__table__).compile(dialect=mysql.dialect())
+        )
+        # INSERT IGNORE would also let truncated data through
+        assert "IGNORE" not in sql
+        assert "ON DUPLICATE KEY UPDATE id = `blob`.id" in sql
@@ -0,0 +1,42 @@
+import gzip
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.bulk_ingest import iter_jsonl_lines, parse_jsonl_line
+
+
+async def _stream(body: bytes, chunk_size: int = 7):
+    for i in range(0, len(body), chunk_size):
+        yield body[i : i + chunk_size]
+
+
+async def _collect(body: bytes, **kwargs):
+    return [item async for item in iter_jsonl_lines(_stream(body), **kwargs)]
+
+
+class TestBulkIngest:
+
+    @pytest.mark.asyncio
+    async def test_iter_jsonl_lines_plain(self):
+        body = b'{"batch_name": "b"}\n{"a": 1}\n\n{"a": 2}'
+        lines = await _collect(body)
+        assert [number for number, _ in lines] == [1, 2, 4]
+        assert [json.loads(line) for _, line in lines][1:] == [{"a": 1}, {"a": 2}]
+
+    @pytest.mark.asyncio
+    async def test_iter_jsonl_lines_gzip_is_sniffed(self):
+        body = b'{"batch_name": "b"}\n{"a": 1}\n{"a": 2}\n'
+        lines = await _collect(gzip.compress(body))
+        assert [json.loads(line) for _, line in lines] == [
+            {"batch_name": "b"},
+            {"a": 1},
+            {"a": 2},
+        ]
+
+    def test_parse_jsonl_line_reports_line_number(self):
+        with pytest.raises(HTTPException) as exc_info:
+            parse_jsonl_line(12, b"{not json")
+        assert exc_info.value.status_code == 400
+        assert "line 12" in exc_info.value.detail
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from pydantic import BaseModel
+
+import llm_failover.chat_failover_llm as chat_failover_llm
+from llm_failover import ChatFailoverLLM
+from llm_failover.call_cache import CallCache, DiskCallCache, call_key, encode_result
+
+
+def answer(content="ok"):
+    return AIMessage(
+        content=content,
+        usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12},
+        response_metadata={"token_usage": {"prompt_tokens": 10}},
+    )
+
+
+class TestCallCache:
+
+    def setup_method(self):
+        self.now = 1000.0
+
+    def make_cache(self, tmp_path, **kwargs):
+        backend = DiskCallCache(str(tmp_path), clock=lambda: self.now)
+        return CallCache(backend, ttl=60, poll_seconds=0.01, **kwargs)
+
+    def test_replays_with_zero_usage_until_the_ttl(self, tmp_path):
+        cache = self.make_cache(tmp_path)
+        calls = []
+        call = lambda: calls.append(1) or answer()
+
+        assert cache.get_or_call("k", call).usage_metadata["total_tokens"] == 12
+        replay = cache.get_or_call("k", call)
+        assert replay.content == "ok"
+        assert replay.usage_metadata["total_tokens"] == 0
+        assert replay.response_metadata == {"cache_hit": True}
+        assert len(calls) == 1
+
+        self.now += 61
+        cache.get_or_call("k", call)
+        assert len(calls) == 2
+        assert cache.stats() == {"hits": 1, "misses": 2, "coalesced": 0}
+
+    def test_concurrent_identical_calls_share_one_upstream_call(self, tmp_path):
+        cache = self.make_cache(tmp_path)
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return answer()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_call("k", slow))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert [r.content for r in results] == ["ok"] * 4
+        assert cache.stats()["coalesced"] == 3
+
+    def test_other_processes_wait_for_the_lock_holder(self, tmp_path):
+        cache = self.make_cache(tmp_path)
+        other = self.make_cache(tmp_path)
+        assert other.backend.acquire("k", 60)
+
+        def finish():
+            time.sleep(0.1)
+            other.backend.set("k", encode_result(answer("theirs")), 60)
+            other.backend.release("k")
+
+        threading.Thread(target=finish).start()
+        assert cache.get_or_call("k", lambda: answer("mine")).content == "theirs"
+
+    def test_failed_calls_are_not_cached(self, tmp_path):
+        cache = self.make_cache(tmp_path)
+
+        def fail():
+            raise ValueError("down")
+
+        try:
+            cache.get_or_call("k", fail)
+        except ValueError:
+            pass
+        assert cache.get_or_call("k", lambda: answer("retried")).content == "retried"
+
+    def test_structured_output_is_loaded_into_its_schema(self, tmp_path):
+        class Grade(BaseModel):
+            score: int
+
+        cache = self.make_cache(tmp_path)
+        call = lambda: {"raw": answer(), "parsed": Grade(score=3), "parsing_error": None}
+        cache.get_or_call("k", call, Grade)
+        replay = cache.get_or_call("k", lambda: None, Grade)
+        assert replay["parsed"] == Grade(score=3)
+        assert replay["raw"].response_metadata == {"cache_hit": True}
+
+    @pytest.mark.asyncio
+    async def test_followers_call_themselves_when_the_leader_is_cancelled(self, tmp_path):
+        cache = self.make_cache(tmp_path)
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def follow():
+            return answer("mine")
+
+        leader = asyncio.create_task(cache.aget_or_call("k", hang))
+        await started.wait()
+        follower = asyncio.create_task(cache.aget_or_call("k", follow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert (await follower).content == "mine"
+        assert leader.cancelled()
+
+    def test_key_ignores_message_ids(self):
+        one = call_key(messages=[HumanMessage(content="hi", id="a")], params={})
+        two = call_key(messages=[HumanMessage(content="hi", id="b")], params={})
+        other = call_key(messages=[HumanMessage(content="hi")], params={"seed": 1})
+        assert one == two != other
+
+
+class TestChatFailoverLLMCache:
+
+    def test_only_deterministic_calls_are_cached(self, tmp_path, monkeypatch):
+        cache = CallCache(DiskCallCache(str(tmp_path)))
+        monkeypatch.setattr(chat_failover_llm, "call_cache", lambda: cache)
+        calls = []
+
+        def execute(self, func, prompt_tokens=None, served=None):
+            calls.append(1)
+            served.append((self.initial_provider, self.initial_model))
+            return answer()
+
+        monkeypatch.setattr(ChatFailoverLLM, "_execute_with_failover", execute)
+
+        llm = ChatFailoverLLM("openai_api", "gpt-4o", temperature=0)
+        llm.invoke("hello")
+        llm.invoke("hello")
+        llm.invoke("hello there")
+        assert len(calls) == 2
+
+        llm = ChatFailoverLLM("openai_api", "gpt-4o", temperature=0.7)
+        llm.invoke("hello")
+        llm.invoke("hello")
+        assert len(calls) == 4
+
+    def test_answers_of_another_model_are_not_cached(self, tmp_path, monkeypatch):
+        cache = CallCache(DiskCallCache(str(tmp_path)))
+        monkeypatch.setattr(chat_failover_llm, "call_cache", lambda: cache)
+        calls = []
+
+        def execute(self, func, prompt_tokens=None, served=None):
+            calls.append(1)
+            served.append(("anthropic_api", "claude-3-5-sonnet"))
+            return answer()
+
+        monkeypatch.setattr(ChatFailoverLLM, "_execute_with_failover", execute)
+
+        llm = ChatFailoverLLM("openai_api", "gpt-4o", temperature=0)
+        llm.invoke("hello")
+        llm.invoke("hello")
+        assert len(calls) == 2
@@ -0,0 +1,184 @@
+import httpx
+import openai
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+import llm_failover.chat_failover_llm as chat_failover_llm
+from llm_failover import ChatFailoverLLM, StreamInterruptedError
+from llm_failover.health import LocalHealthStore, ProviderHealth
+from llm_failover.key_manager import KeyManager
+from llm_failover.ledger import Ledger, ledger_tags
+
+ENV = {
+    "API_KEY_REFRESH_INTERVAL": "300",
+    "PROVIDER_REFRESH_INTERVAL": "900",
+    "OPENAI_API_KEY": "sk-one,sk-two",
+    "OPENAI_DEFAULT_MODEL": "gpt-4o-mini",
+    "OPENAI_KEY_POLICY": "first",
+    "ANTHROPIC_API_KEY": "sk-ant",
+    "ANTHROPIC_DEFAULT_MODEL": "claude-3-5-haiku",
+}
+
+
+def rate_limit_error():
+    response = httpx.Response(
+        429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    )
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class FakeModel:
+    """Answers with the key it was built with, or raises the error queued for that key."""
+
+    def __init__(self, provider, key, errors):
+        self.provider = provider
+        self.key = key
+        self.errors = errors
+
+    def _respond(self):
+        if self.key in self.errors:
+            raise self.errors.pop(self.key)
+        return AIMessage(content=f"{self.provider}:{self.key}")
+
+    def invoke(self, *args, **kwargs):
+        return self._respond()
+
+    async def ainvoke(self, *args, **kwargs):
+        return self._respond()
+
+    def _chunks(self):
+        yield AIMessageChunk(content=f"{self.provider}:")
+        if f"{self.key}:mid-stream" in self.errors:
+            raise self.errors.pop(f"{self.key}:mid-stream")
+        yield AIMessageChunk(
+            content=self.key,
+            usage_metadata={"input_tokens": 7, "output_tokens": 2, "total_tokens": 9},
+        )
+
+    def stream(self, *args, **kwargs):
+        if self.key in self.errors:
+            raise self.errors.pop(self.key)
+        return self._chunks()
+
+    async def astream(self, *args, **kwargs):
+        if self.key in self.errors:
+            raise self.errors.pop(self.key)
+        for chunk in self._chunks():
+            yield chunk
+
+
+@pytest.fixture
+def errors(monkeypatch):
+    errors = {}
+    health = ProviderHealth(
+        LocalHealthStore(), key_pause_seconds=300, open_seconds=900, cache_seconds=0
+    )
+    monkeypatch.setattr(chat_failover_llm, "key_manager", KeyManager(ENV, health))
+    monkeypatch.setattr(chat_failover_llm, "ledger", lambda: Ledger())
+    monkeypatch.setattr(
+        ChatFailoverLLM,
+        "_create_model",
+        lambda self, provider, key, model_name, loop=None: FakeModel(
+            provider, key, errors
+        ),
+    )
+    return errors
+
+
+class TestChatFailoverLLM:
+
+    def test_sync_rotates_key_on_rate_limit(self, errors):
+        errors["sk-one"] = rate_limit_error()
+        result = ChatFailoverLLM("openai_api", "gpt-4o").invoke("hi")
+        assert result.content == "openai_api:sk-two"
+
+    async def test_async_rotates_key_on_rate_limit(self, errors):
+        errors["sk-one"] = rate_limit_error()
+        llm = ChatFailoverLLM("openai_api", "gpt-4o")
+        result = await llm.ainvoke("hi")
+        assert result.content == "openai_api:sk-two"
+        assert llm.last_model == "gpt-4o"
+
+    async def test_async_fails_over_to_next_provider(self, errors):
+        errors["sk-one"] = rate_limit_error()
+        errors["sk-two"] = rate_limit_error()
+        llm = ChatFailoverLLM("openai_api", "gpt-4o")
+        result = await llm.ainvoke("hi")
+        assert result.content == "anthropic_api:sk-ant"
+        assert llm.last_model == "claude-3-5-haiku"
+
+    async def test_async_raises_unclassified_errors(self, errors):
+        errors["sk-one"] = ValueError("bad input")
+        with pytest.raises(ValueError):
+            await ChatFailoverLLM("openai_api", "gpt-4o").ainvoke("hi")
+
+    def test_stream_fails_over_before_the_first_chunk(self, errors):
+        errors["sk-one"] = rate_limit_error()
+        llm = ChatFailoverLLM("openai_api", "gpt-4o")
+        text = "".join(chunk.content for chunk in llm.stream("hi"))
+        assert text == "openai_api:sk-two"
+        assert llm.last_usage["total_tokens"] == 9
+        assert llm.last_first_chunk_seconds is not None
+
+    def test_stream_failure_after_first_chunk_is_surfaced(self, errors):
+        errors["sk-one:mid-stream"] = rate_limit_error()
+        chunks = []
+        with pytest.raises(StreamInterruptedError) as raised:
+            for chunk in ChatFailoverLLM("openai_api", "gpt-4o").stream("hi"):
+                chunks.append(chunk)
+        assert len(chunks) == 1
+        assert raised.value.provider == "openai_api"
+        assert raised.value.chunks == 1
+
+    async def test_astream_fails_over_before_the_first_chunk(self, errors):
+        errors["sk-one"] = rate_limit_error()
+        llm = ChatFailoverLLM("openai_api", "gpt-4o")
+        text = "".join([chunk.content async for chunk in llm.astream("hi")])
+        assert text == "openai_api:sk-two"
+        assert llm.last_usage["output_tokens"] == 2
+
+
+class RecordingSink:
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+
+class TestCallLedger:
+
+    @pytest.fixture
+    def sink(self, errors, monkeypatch):
+        sink = RecordingSink()
+        monkeypatch.setattr(chat_failover_llm, "ledger", lambda: Ledger([sink]))
+        return sink
+
+    def test_records_each_attempt_of_a_call(self, errors, sink):
+        errors["sk-one"] = rate_limit_error()
+        with ledger_tags(run_id=7, evaluator="grammar"):
+            ChatFailoverLLM("openai_api", "gpt-4o").invoke("hi")
+        failed, succeeded = sink.records
+        assert failed.call_id == succeeded.call_id
+        assert (failed.attempt, failed.error) == (0, "RateLimitError")
+        assert (succeeded.attempt, succeeded.error) == (1, None)
+        assert failed.key != succeeded.key
+        assert "sk-" not in failed.key
+        assert succeeded.tags == {"run_id": 7, "evaluator": "grammar"}
+
+    def test_records_stream_usage(self, errors, sink):
+        "".join(c.content for c in ChatFailoverLLM("openai_api", "gpt-4o").stream("hi"))
+        [record] = sink.records
+        assert record.stream
+        assert (record.prompt_tokens, record.completion_tokens) == (7, 2)
+
+    def test_failing_sinks_do_not_fail_calls(self, errors, monkeypatch):
+        class BrokenSink:
+            def write(self, record):
+                raise ConnectionError("down")
+
+        monkeypatch.setattr(chat_failover_llm, "ledger", lambda: Ledger([BrokenSink()]))
+        assert (
+            ChatFailoverLLM("openai_api", "gpt-4o").invoke("hi").content
+            == "openai_api:sk-one"
+        )
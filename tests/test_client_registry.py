@@ -0,0 +1,77 @@
+import asyncio
+
+from llm_failover.client_registry import ClientRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestClientRegistry:
+
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.registry = ClientRegistry(max_size=3, idle_seconds=60, clock=self.clock)
+
+    def get(self, provider="openai_api", model="gpt-4o", key="sk-one", **params):
+        return self.registry.get(provider, model, key, params, object)
+
+    def test_reuses_instance_for_same_arguments(self):
+        assert self.get(temperature=0) is self.get(temperature=0)
+        assert self.registry.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+    def test_separate_instances_per_key_model_and_params(self):
+        first = self.get()
+        assert self.get(key="sk-two") is not first
+        assert self.get(model="gpt-4o-mini") is not first
+        assert self.get(temperature=1) is not first
+
+    def test_least_recently_used_is_dropped_beyond_max_size(self):
+        first = self.get(key="a")
+        self.get(key="b")
+        self.get(key="c")
+        self.get(key="a")
+        self.get(key="d")
+        assert self.get(key="a") is first
+        assert self.registry.stats()["size"] == 3
+        assert self.registry.evict("openai_api", "b") == 0
+
+    def test_idle_instances_are_rebuilt(self):
+        first = self.get()
+        self.clock.now += 61
+        assert self.get() is not first
+
+    def test_evict_removed_key(self):
+        first = self.get(key="sk-bad")
+        other = self.get(key="sk-good")
+        assert self.registry.evict("openai_api", "sk-bad") == 1
+        assert self.get(key="sk-bad") is not first
+        assert self.get(key="sk-good") is other
+
+    def test_reset_connections_replaces_the_pool(self):
+        client = self.registry.http_client("openai_api")
+        assert self.registry.http_client("openai_api") is client
+        first = self.get()
+        self.registry.reset_connections("openai_api")
+        assert self.registry.http_client("openai_api") is not client
+        assert self.get() is not first
+
+    def test_instances_of_a_closed_event_loop_are_dropped(self):
+        def get_on(loop):
+            return self.registry.get("openai_api", "gpt-4o", "sk-one", {}, object, loop=loop)
+
+        loop = asyncio.new_event_loop()
+        first = get_on(loop)
+        assert get_on(loop) is first
+        loop.close()
+        self.get()
+        assert self.registry.stats()["size"] == 1
+        other = asyncio.new_event_loop()
+        try:
+            assert get_on(other) is not first
+        finally:
+            other.close()
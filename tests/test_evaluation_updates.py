@@ -0,0 +1,107 @@
+from sqlalchemy import create_engine, literal, null, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from app.db_api import models
+from app.utils.evaluation_updates import claim_select, evaluation_results_update
+from common.pubsub_queue import EvaluationStatus
+
+
+def compiled(stmt, dialect):
+    return str(
+        stmt.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    )
+
+
+class TestEvaluationUpdates:
+    def test_claim_filters_on_claimable_statuses(self):
+        sql = compiled(claim_select([1, 2]), mysql.dialect())
+        assert "evaluation.id IN (%s, %s)" in sql
+        assert "evaluation.status IN (%s, %s)" in sql
+        assert sql.endswith("FOR UPDATE SKIP LOCKED")
+        # SQLite has no row locks: the same filter runs without them
+        sql = compiled(claim_select([1, 2]), sqlite.dialect())
+        assert "evaluation.status IN (?, ?)" in sql
+        assert "FOR UPDATE" not in sql
+
+    def test_claim_selects_only_queued_and_pending_rows(self):
+        engine = create_engine("sqlite://")
+        for model in (models.EvaluatorType, models.Evaluator, models.Evaluation):
+            model.__table__.create(engine)
+        with Session(engine) as db:
+            for evaluation_id, status in enumerate(EvaluationStatus, start=1):
+                db.add(
+                    models.Evaluation(
+                        id=evaluation_id, run_id=1, evaluator_id=1, status=status.value
+                    )
+                )
+            db.commit()
+            claimed = db.execute(claim_select(range(1, 10))).scalars().all()
+        assert sorted(evaluation.status for evaluation in claimed) == sorted(
+            [EvaluationStatus.QUEUED.value, EvaluationStatus.PENDING.value]
+        )
+
+    def test_results_update_picks_each_rows_values_by_id(self):
+        sql = compiled(
+            evaluation_results_update(
+                {1: "success", 2: "failed"},
+                {1: "ok", 2: None},
+                {1: None, 2: None},
+                {2: "boom"},
+            ),
+            mysql.dialect(),
+        )
+        assert "status=CASE evaluation.id WHEN %s THEN %s WHEN %s THEN %s END" in sql
+        assert (
+            "fail_reason=CASE evaluation.id WHEN %s THEN %s ELSE evaluation.fail_reason END"
+            in sql
+        )
+        assert "WHERE evaluation.id IN (%s, %s)" in sql
+
+    def test_results_update_keeps_fail_reasons_it_does_not_set(self):
+        engine = create_engine("sqlite://")
+        models.Evaluation.__table__.create(engine)
+        with Session(engine) as db:
+            db.add_all(
+                [
+                    models.Evaluation(
+                        id=1,
+                        run_id=1,
+                        evaluator_id=1,
+                        status="in_progress",
+                        fail_reason="earlier",
+                    ),
+                    models.Evaluation(
+                        id=2, run_id=1, evaluator_id=1, status="in_progress"
+                    ),
+                    models.Evaluation(
+                        id=3, run_id=1, evaluator_id=1, status="in_progress"
+                    ),
+                ]
+            )
+            db.commit()
+            db.execute(
+                evaluation_results_update(
+                    {1: "success", 2: "failed"},
+                    {
+                        1: literal({"score": 1}, models.Evaluation.output.type),
+                        2: null(),
+                    },
+                    {1: None, 2: None},
+                    {2: "boom"},
+                )
+            )
+            db.commit()
+            rows = db.execute(
+                select(
+                    models.Evaluation.id,
+                    models.Evaluation.status,
+                    models.Evaluation.output,
+                    models.Evaluation.fail_reason,
+                ).order_by(models.Evaluation.id)
+            ).all()
+        assert [tuple(row) for row in rows] == [
+            (1, "success", {"score": 1}, "earlier"),
+            (2, "failed", None, "boom"),
+            (3, "in_progress", None, None),
+        ]
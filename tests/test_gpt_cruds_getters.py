@@ -1,9 +1,15 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-from app.db_api.database import DATABASE_URL, Base, get_db_gen
+from app.db_api.database import (
+    ASYNC_DATABASE_URL,
+    DATABASE_URL,
+    Base,
+    async_get_db_session,
+)
+from app.db_api.replicas import async_get_read_db_session
 from app.main import app
 from app.schemas.gpt_generated_schemas_for_all import (
     BatchRun,
@@ -20,22 +26,23 @@ from app.schemas.gpt_generated_schemas_for_all import (
 
 # Configure the test database
 engine = create_engine(DATABASE_URL)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+TestingSessionLocal = async_sessionmaker(
+    autocommit=False, autoflush=False, bind=async_engine
+)
 
 # Create the test database tables
 Base.metadata.create_all(bind=engine)
 
 
 # Dependency override
-def override_get_db_gen():
-    try:
-        db = TestingSessionLocal()
+async def override_async_get_db_session():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-app.dependency_overrides[get_db_gen] = override_get_db_gen
+app.dependency_overrides[async_get_db_session] = override_async_get_db_session
+app.dependency_overrides[async_get_read_db_session] = override_async_get_db_session
 
 client = TestClient(app)
 
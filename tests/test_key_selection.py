@@ -0,0 +1,131 @@
+import json
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from llm_failover.key_selection import (
+    KeySelector,
+    parse_rate_limit_headers,
+    summarize_key_metrics,
+)
+
+
+def make_key(name, weight=1.0, in_flight=0, remaining=None, last_used=0.0):
+    return SimpleNamespace(
+        key=name,
+        weight=weight,
+        current_weight=0.0,
+        in_flight=in_flight,
+        remaining=remaining,
+        last_used=last_used,
+    )
+
+
+class TestKeySelector:
+
+    def test_round_robin_spreads_by_weight(self):
+        keys = [make_key("a", 3), make_key("b"), make_key("c")]
+        selector = KeySelector("round_robin")
+        picks = Counter(selector.select(keys).key for _ in range(500))
+        assert picks == {"a": 300, "b": 100, "c": 100}
+
+    def test_round_robin_interleaves(self):
+        keys = [make_key("a"), make_key("b")]
+        selector = KeySelector("round_robin")
+        assert [selector.select(keys).key for _ in range(4)] == ["a", "b", "a", "b"]
+
+    def test_least_in_flight(self):
+        keys = [
+            make_key("a", in_flight=3),
+            make_key("b", in_flight=1),
+            make_key("c", weight=4, in_flight=2),
+        ]
+        assert KeySelector("least_in_flight").select(keys).key == "c"
+
+    def test_quota_prefers_most_remaining(self):
+        keys = [
+            make_key("a", remaining=0.1),
+            make_key("b", remaining=0.7),
+            make_key("c", remaining=0.4),
+        ]
+        assert KeySelector("quota").select(keys).key == "b"
+
+    def test_quota_treats_unreported_keys_as_full(self):
+        keys = [make_key("a", remaining=0.9), make_key("b")]
+        assert KeySelector("quota").select(keys).key == "b"
+
+    def test_first(self):
+        assert KeySelector("first").select([make_key("a"), make_key("b")]).key == "a"
+
+    def test_no_keys(self):
+        assert KeySelector("quota").select([]) is None
+
+
+class TestRateLimitHeaders:
+
+    def test_openai(self):
+        parsed = parse_rate_limit_headers(
+            {
+                "x-ratelimit-limit-requests": "500",
+                "x-ratelimit-remaining-requests": "400",
+                "x-ratelimit-reset-requests": "12ms",
+                "x-ratelimit-limit-tokens": "30000",
+                "x-ratelimit-remaining-tokens": "3000",
+                "x-ratelimit-reset-tokens": "1m30s",
+            }
+        )
+        assert parsed.remaining == 0.1
+        assert parsed.reset_seconds == 90
+        assert parsed.retry_after is None
+
+    def test_anthropic_with_retry_after(self):
+        parsed = parse_rate_limit_headers(
+            {
+                "anthropic-ratelimit-requests-limit": "50",
+                "anthropic-ratelimit-requests-remaining": "0",
+                "anthropic-ratelimit-requests-reset": "2000-01-01T00:00:00Z",
+                "retry-after": "7",
+            }
+        )
+        assert parsed.remaining == 0
+        assert parsed.retry_after == 7
+
+    def test_no_rate_limit_headers(self):
+        assert parse_rate_limit_headers({"content-type": "application/json"}) is None
+        assert parse_rate_limit_headers(None) is None
+
+
+class TestKeyMetrics:
+
+    def test_summary_sums_processes_and_drops_stale_ones(self):
+        def snapshot(published_at, requests, remaining):
+            stats = {
+                "masked_key": "sk-abc***wxyz",
+                "weight": 1,
+                "requests": requests,
+                "in_flight": 1,
+                "failures": 0,
+                "rate_limited": 0,
+                "remaining": remaining,
+                "paused": False,
+            }
+            return json.dumps(
+                {
+                    "process": "host:1",
+                    "published_at": published_at,
+                    "providers": {
+                        "openai_api": {"k1": stats, "k2": {**stats, "requests": 10}}
+                    },
+                }
+            )
+
+        summary = summarize_key_metrics(
+            [
+                snapshot(time.time(), 30, 0.5),
+                snapshot(time.time(), 10, 0.2),
+                snapshot(0, 999, 0),
+            ]
+        )
+        assert summary["openai_api"]["k1"]["requests"] == 40
+        assert summary["openai_api"]["k1"]["remaining"] == 0.2
+        assert summary["openai_api"]["k1"]["share"] == 0.6667
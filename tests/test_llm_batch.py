@@ -0,0 +1,274 @@
+import json
+
+import httpx
+import pytest
+
+from llm_failover.batch import (
+    AnthropicBatchAPI,
+    BatchPending,
+    BatchTransport,
+    LocalBatchStore,
+    OpenAIBatchAPI,
+    poll_submitted,
+    submit_pending,
+)
+
+
+def completion(content):
+    return {
+        "id": "chatcmpl-batch",
+        "object": "chat.completion",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+    }
+
+
+def message(content):
+    return {
+        "id": "msg-batch",
+        "type": "message",
+        "role": "assistant",
+        "content": [{"type": "text", "text": content}],
+        "usage": {"input_tokens": 5, "output_tokens": 1},
+    }
+
+
+class FakeBatchServer:
+    """
+    The OpenAI files/batches and Anthropic message batches endpoints, in
+    memory. Batches run until finish(); each request is answered with its
+    last user message upper-cased.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.batches = {}
+        self.live_calls = 0
+        self.reject = False
+
+    def client(self):
+        return httpx.Client(transport=httpx.MockTransport(self.handle))
+
+    def finish(self, expire=()):
+        for batch in self.batches.values():
+            batch["done"] = True
+            batch["requests"] = [r for r in batch["requests"] if r[0] not in expire]
+
+    @staticmethod
+    def answer(body):
+        return body["messages"][-1]["content"].upper()
+
+    def handle(self, request):
+        path = request.url.path
+        if self.reject:
+            return httpx.Response(500, json={"error": "down"})
+        if path == "/v1/files" and request.method == "POST":
+            content = request.read().decode()
+            lines = [
+                json.loads(line)
+                for line in content.splitlines()
+                if line.startswith("{")
+            ]
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = lines
+            return httpx.Response(200, json={"id": file_id})
+        if path == "/v1/batches":
+            body = json.loads(request.read())
+            requests = [
+                (line["custom_id"], line["body"])
+                for line in self.files[body["input_file_id"]]
+            ]
+            return self.create("openai", requests)
+        if path == "/v1/messages/batches":
+            body = json.loads(request.read())
+            return self.create(
+                "anthropic", [(r["custom_id"], r["params"]) for r in body["requests"]]
+            )
+        if path.startswith("/v1/batches/"):
+            batch = self.batches[path.rsplit("/", 1)[1]]
+            status = "completed" if batch["done"] else "in_progress"
+            return httpx.Response(
+                200,
+                json={
+                    "status": status,
+                    "output_file_id": f"out-{batch['id']}" if batch["done"] else None,
+                },
+            )
+        if path.startswith("/v1/files/out-"):
+            batch = self.batches[path.split("/")[3][4:]]
+            lines = [
+                {
+                    "custom_id": custom_id,
+                    "response": {
+                        "status_code": 200,
+                        "body": completion(self.answer(body)),
+                    },
+                    "error": None,
+                }
+                for custom_id, body in batch["requests"]
+            ]
+            return httpx.Response(
+                200, text="\n".join(json.dumps(line) for line in lines)
+            )
+        if path.startswith("/v1/messages/batches/") and path.endswith("/results"):
+            batch = self.batches[path.split("/")[4]]
+            lines = [
+                {
+                    "custom_id": custom_id,
+                    "result": {
+                        "type": "succeeded",
+                        "message": message(self.answer(body)),
+                    },
+                }
+                for custom_id, body in batch["requests"]
+            ]
+            return httpx.Response(
+                200, text="\n".join(json.dumps(line) for line in lines)
+            )
+        if path.startswith("/v1/messages/batches/"):
+            batch = self.batches[path.rsplit("/", 1)[1]]
+            return httpx.Response(
+                200,
+                json={
+                    "processing_status": "ended" if batch["done"] else "in_progress",
+                    "results_url": f"https://fake/v1/messages/batches/{batch['id']}/results",
+                },
+            )
+        # Anything else is a live call
+        self.live_calls += 1
+        body = json.loads(request.read())
+        payload = (
+            completion(self.answer(body))
+            if path.endswith("/chat/completions")
+            else message(self.answer(body))
+        )
+        return httpx.Response(200, json=payload)
+
+    def create(self, kind, requests):
+        batch_id = f"{kind}batch{len(self.batches)}"
+        self.batches[batch_id] = {"id": batch_id, "requests": requests, "done": False}
+        return httpx.Response(200, json={"id": batch_id})
+
+
+def call(transport, url, content):
+    with httpx.Client(transport=transport) as client:
+        return client.post(
+            url, json={"model": "m", "messages": [{"role": "user", "content": content}]}
+        ).json()
+
+
+class TestBatchMode:
+
+    def setup_method(self):
+        self.server = FakeBatchServer()
+        self.store = LocalBatchStore()
+        self.apis = {
+            "openai_api": OpenAIBatchAPI(
+                "sk-batch", "https://fake/v1", client=self.server.client()
+            ),
+            "anthropic_api": AnthropicBatchAPI(
+                "sk-ant-batch", "https://fake", client=self.server.client()
+            ),
+        }
+        live = httpx.MockTransport(self.server.handle)
+        self.openai = BatchTransport(
+            "openai_api", "/chat/completions", live, self.store
+        )
+        self.anthropic = BatchTransport(
+            "anthropic_api", "/v1/messages", live, self.store
+        )
+
+    def test_calls_wait_for_the_batch_and_replay_its_result(self):
+        with pytest.raises(BatchPending):
+            call(self.openai, "https://fake/v1/chat/completions", "hello")
+        # The retry before the batch completed queues nothing new
+        with pytest.raises(BatchPending):
+            call(self.openai, "https://fake/v1/chat/completions", "hello")
+        assert submit_pending(self.store, self.apis) == {"openai_api": 1}
+        assert poll_submitted(self.store, self.apis) == 0
+
+        self.server.finish()
+        assert poll_submitted(self.store, self.apis) == 1
+        result = call(self.openai, "https://fake/v1/chat/completions", "hello")
+        assert result["choices"][0]["message"]["content"] == "HELLO"
+        assert self.server.live_calls == 0
+        assert self.store.batches() == {}
+
+    def test_anthropic_message_batches(self):
+        for content in ("one", "two"):
+            with pytest.raises(BatchPending):
+                call(self.anthropic, "https://fake/v1/messages", content)
+        assert submit_pending(self.store, self.apis) == {"anthropic_api": 2}
+        self.server.finish()
+        poll_submitted(self.store, self.apis)
+        assert (
+            call(self.anthropic, "https://fake/v1/messages", "two")["content"][0][
+                "text"
+            ]
+            == "TWO"
+        )
+        assert self.server.live_calls == 0
+
+    def test_requests_are_split_into_batches_of_max_requests(self):
+        for content in ("a", "b", "c"):
+            with pytest.raises(BatchPending):
+                call(self.openai, "https://fake/v1/chat/completions", content)
+        submit_pending(self.store, self.apis, max_requests=2)
+        assert len(self.server.batches) == 2
+
+    def test_expired_requests_run_live(self):
+        for content in ("kept", "expired"):
+            with pytest.raises(BatchPending):
+                call(self.openai, "https://fake/v1/chat/completions", content)
+        submit_pending(self.store, self.apis)
+        [(batch_id, batch)] = self.server.batches.items()
+        expired = [
+            custom_id
+            for custom_id, body in batch["requests"]
+            if body["messages"][0]["content"] == "expired"
+        ]
+        self.server.finish(expire=expired)
+        poll_submitted(self.store, self.apis)
+
+        assert (
+            call(self.openai, "https://fake/v1/chat/completions", "kept")["choices"][0][
+                "message"
+            ]["content"]
+            == "KEPT"
+        )
+        assert self.server.live_calls == 0
+        assert (
+            call(self.openai, "https://fake/v1/chat/completions", "expired")["choices"][
+                0
+            ]["message"]["content"]
+            == "EXPIRED"
+        )
+        assert self.server.live_calls == 1
+
+    def test_refused_submission_falls_back_to_live_calls(self):
+        with pytest.raises(BatchPending):
+            call(self.openai, "https://fake/v1/chat/completions", "hello")
+        self.server.reject = True
+        assert submit_pending(self.store, self.apis) == {}
+        self.server.reject = False
+        assert (
+            call(self.openai, "https://fake/v1/chat/completions", "hello")["choices"][
+                0
+            ]["message"]["content"]
+            == "HELLO"
+        )
+        assert self.server.live_calls == 1
+
+    def test_streams_and_other_endpoints_are_live(self):
+        with httpx.Client(transport=self.openai) as client:
+            client.post(
+                "https://fake/v1/chat/completions",
+                json={"messages": [{"role": "user", "content": "x"}], "stream": True},
+            )
+        assert self.server.live_calls == 1
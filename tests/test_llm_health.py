@@ -0,0 +1,109 @@
+import redis
+
+from llm_failover.health import LocalHealthStore, ProviderHealth
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BrokenStore:
+    def __getattr__(self, name):
+        def fail(*args):
+            raise redis.ConnectionError("down")
+
+        return fail
+
+
+def make_health(store, clock, **kwargs):
+    return ProviderHealth(
+        store,
+        key_pause_seconds=300,
+        open_seconds=60,
+        failure_threshold=3,
+        probe_interval=10,
+        cache_seconds=0,
+        clock=clock,
+        **kwargs,
+    )
+
+
+class TestProviderHealth:
+
+    def setup_method(self):
+        self.clock = FakeClock()
+        self.store = LocalHealthStore(self.clock)
+        # Two processes sharing one store
+        self.first = make_health(self.store, self.clock)
+        self.second = make_health(self.store, self.clock)
+
+    def test_paused_key_is_skipped_by_every_process(self):
+        self.first.pause_key("openai_api", "sk-one")
+        assert not self.second.key_available("openai_api", "sk-one")
+        assert self.second.key_available("openai_api", "sk-two")
+        self.clock.now += 301
+        assert self.second.key_available("openai_api", "sk-one")
+
+    def test_removed_key_is_skipped_by_every_process(self):
+        self.first.remove_key("google_api", "bad-key")
+        self.clock.now += 3600
+        assert not self.second.key_available("google_api", "bad-key")
+
+    def test_failures_across_processes_open_the_circuit(self):
+        self.first.record_failure("openai_api", "gpt-4o")
+        self.second.record_failure("openai_api", "gpt-4o")
+        assert self.first.allow("openai_api", "gpt-4o")
+        self.second.record_failure("openai_api", "gpt-4o")
+        assert not self.first.allow("openai_api", "gpt-4o")
+        assert self.first.allow("openai_api", "gpt-4o-mini")
+
+    def test_half_open_admits_one_probe_per_interval(self):
+        self.first.open_circuit("anthropic_api", "claude", 60)
+        self.clock.now += 61
+        assert self.first.circuit_state("anthropic_api", "claude") == "half_open"
+        assert self.first.allow("anthropic_api", "claude")
+        assert not self.second.allow("anthropic_api", "claude")
+        self.clock.now += 11
+        assert self.second.allow("anthropic_api", "claude")
+
+    def test_successful_probe_closes_the_circuit(self):
+        self.first.open_circuit("anthropic_api", "claude", 60)
+        self.clock.now += 61
+        assert self.first.allow("anthropic_api", "claude")
+        self.first.record_success("anthropic_api", "claude")
+        assert self.second.circuit_state("anthropic_api", "claude") == "closed"
+
+    def test_failed_probe_reopens_with_backoff(self):
+        self.first.open_circuit("anthropic_api", "claude", 60)
+        self.clock.now += 61
+        self.first.record_failure("anthropic_api", "claude")
+        self.clock.now += 61
+        assert self.second.circuit_state("anthropic_api", "claude") == "open"
+        self.clock.now += 60
+        assert self.second.circuit_state("anthropic_api", "claude") == "half_open"
+
+    def test_late_failures_do_not_extend_an_open_circuit(self):
+        self.first.open_circuit("openai_api", "gpt-4o", 60)
+        self.second.record_failure("openai_api", "gpt-4o")
+        self.clock.now += 61
+        assert self.first.circuit_state("openai_api", "gpt-4o") == "half_open"
+
+    def test_unreachable_store_keeps_health_in_process(self):
+        health = make_health(BrokenStore(), self.clock)
+        health.pause_key("openai_api", "sk-one")
+        assert not health.key_available("openai_api", "sk-one")
+        assert health.allow("openai_api", "gpt-4o")
+
+    def test_exhausted_quota_makes_the_key_unavailable_until_reset(self):
+        self.first.observe_quota("openai_api", "sk-one", 0, 20)
+        self.first.observe_quota("openai_api", "sk-two", 0.5, 20)
+        one, two = self.second.key_states("openai_api", ["sk-one", "sk-two"])
+        assert not one.available
+        assert two.available and two.remaining == 0.5
+        self.clock.now += 21
+        one, two = self.second.key_states("openai_api", ["sk-one", "sk-two"])
+        assert one.available and one.remaining is None
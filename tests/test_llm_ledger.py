@@ -0,0 +1,160 @@
+import time
+from datetime import date
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import Session
+
+from app.db_api import models
+from app.utils.llm_ledger import (
+    LEDGER_DEAD_STREAM,
+    call_row,
+    drain_ledger,
+    llm_call_stats_select,
+)
+from app.utils.pricing_index import pricing_index
+from llm_failover.ledger import CallRecord, RedisStreamSink
+from test_pricing_index import pricing_row
+
+
+def record(**fields):
+    return CallRecord(
+        **{
+            "call_id": "c1",
+            "attempt": 0,
+            "provider": "openai_api",
+            "model": "gpt-4o",
+            "key": "abc",
+            "latency_seconds": 1.25,
+            "called_at": 1718000000.0,
+            **fields,
+        }
+    )
+
+
+class FakeStream:
+    """The stream commands drain_ledger uses, on one stream with one consumer."""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.pending = {}
+        self.dead = []
+
+    def xgroup_create(self, *args, **kwargs):
+        pass
+
+    def xreadgroup(self, group, consumer, streams, count):
+        start = list(streams.values())[0]
+        if start == ">":
+            batch = [e for e in self.entries if e[0] not in self.pending][:count]
+        else:
+            batch = [e for e in self.entries if e[0] in self.pending and e[0] > start]
+        for entry_id, _ in batch:
+            self.pending[entry_id] = self.pending.get(entry_id, 0) + 1
+        return [("stream", batch)] if batch else []
+
+    def xpending_range(self, stream, group, min, max, count):
+        return [{"message_id": min, "times_delivered": self.pending[min]}]
+
+    def xadd(self, stream, fields):
+        assert stream == LEDGER_DEAD_STREAM
+        self.dead.append(fields)
+
+    def xack(self, stream, group, *entry_ids):
+        for entry_id in entry_ids:
+            self.pending.pop(entry_id, None)
+
+    def xdel(self, stream, *entry_ids):
+        self.entries = [e for e in self.entries if e[0] not in entry_ids]
+
+
+class SlowPipeline:
+    def __init__(self, written):
+        self.written = written
+        self.batch = []
+
+    def xadd(self, stream, fields, **kwargs):
+        self.batch.append(fields["record"])
+
+    def execute(self):
+        time.sleep(0.2)
+        self.written.extend(self.batch)
+
+
+class TestLLMLedger:
+
+    def test_records_round_trip_as_json(self):
+        original = record(prompt_tokens=10, tags={"run_id": 3})
+        assert CallRecord.from_json(original.to_json()) == original
+
+    def test_stream_sink_writes_in_the_background(self):
+        written = []
+        client = SimpleNamespace(pipeline=lambda transaction: SlowPipeline(written))
+        sink = RedisStreamSink(client)
+        started = time.monotonic()
+        sink.write(record(attempt=0))
+        sink.write(record(attempt=1))
+        assert time.monotonic() - started < 0.1
+        sink.flush()
+        assert [CallRecord.from_json(r).attempt for r in written] == [0, 1]
+
+    def test_call_row_prices_from_llm_pricing(self, monkeypatch):
+        monkeypatch.setattr(pricing_index, "_prices", {})
+        monkeypatch.setattr(pricing_index, "_starts", {})
+        pricing_index.load(
+            [pricing_row("openai_api", "gpt-4o", date(2024, 1, 1), 2.0, 8.0)]
+        )
+        row = call_row(
+            record(
+                prompt_tokens=1000000,
+                completion_tokens=0,
+                cost=99.0,
+                tags={"run_id": "3", "evaluator": "grammar", "engagement": "acme"},
+            )
+        )
+        assert row["cost"] == 2.0
+        assert row["latency_ms"] == 1250
+        assert (row["run_id"], row["evaluator"], row["engagement"]) == (
+            3,
+            "grammar",
+            "acme",
+        )
+        # Unpriced models keep the worker's estimate
+        assert call_row(record(model="other", prompt_tokens=1, cost=0.5))["cost"] == 0.5
+        assert (
+            call_row(record(provider="azure_api", prompt_tokens=1, cost=0.5))["cost"]
+            == 0.5
+        )
+
+    def test_stats_group_by_and_filter(self):
+        sql = str(
+            llm_call_stats_select(["evaluator", "model"], run_id=3).compile(
+                dialect=mysql.dialect()
+            )
+        )
+        assert "GROUP BY llm_call.evaluator, llm_call.model" in sql
+        assert "count(DISTINCT llm_call.call_id) AS calls" in sql
+        assert "llm_call.run_id = " in sql
+
+    def test_drain_skips_committed_records_and_dead_letters_malformed_ones(
+        self, monkeypatch
+    ):
+        monkeypatch.setattr(pricing_index, "refresh", lambda db: None)
+        engine = create_engine("sqlite://")
+        models.LLMCall.__table__.create(engine)
+        with Session(engine) as db:
+            # The first record was committed by a drain that died before XACK
+            db.execute(models.LLMCall.__table__.insert(), [call_row(record(attempt=0))])
+            db.commit()
+            client = FakeStream(
+                [
+                    (b"1-0", {b"record": record(attempt=0).to_json().encode()}),
+                    (b"2-0", {b"record": record(attempt=1).to_json().encode()}),
+                    (b"3-0", {b"record": b"not json"}),
+                ]
+            )
+            drain_ledger(db, client)
+            assert db.execute(select(func.count(models.LLMCall.id))).scalar() == 2
+        assert client.entries == [] and client.pending == {}
+        assert [d["record"] for d in client.dead] == [b"not json"]
@@ -0,0 +1,169 @@
+import json
+
+import httpx
+import openai
+
+from llm_failover.config import AVAILABLE_PROVIDERS, is_context_length_error
+from llm_failover.health import LocalHealthStore, ProviderHealth
+from llm_failover.key_manager import KeyManager
+from llm_failover.routing import (
+    ModelRouter,
+    context_limit,
+    estimate_prompt_tokens,
+    summarize_route_metrics,
+)
+
+ENV = {
+    "API_KEY_REFRESH_INTERVAL": "300",
+    "PROVIDER_REFRESH_INTERVAL": "900",
+    "OPENAI_API_KEY": "sk-one",
+    "OPENAI_DEFAULT_MODEL": "gpt-4",
+    "OPENAI_ROUTE_MODELS": "gpt-4-turbo",
+    "ANTHROPIC_API_KEY": "sk-ant",
+    "ANTHROPIC_DEFAULT_MODEL": "claude-3-5-haiku",
+}
+
+
+def bad_request(message):
+    response = httpx.Response(
+        400, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    )
+    return openai.BadRequestError(message, response=response, body=None)
+
+
+class TestModelRouter:
+
+    def test_keeps_the_requested_model_when_it_fits(self):
+        router = ModelRouter(route_models={"openai_api": ["gpt-4-turbo"]})
+        assert router.route("openai_api", "gpt-4", 1000, 1000) == "gpt-4"
+
+    def test_routes_past_a_window_too_small(self):
+        router = ModelRouter(route_models={"openai_api": ["gpt-4-turbo"]})
+        assert router.route("openai_api", "gpt-4", 20000) == "gpt-4-turbo"
+        assert router.route("openai_api", "gpt-4", 200000) is None
+
+    def test_longest_prefix_wins(self):
+        router = ModelRouter()
+        assert router.context_window("gpt-4-turbo-2024-04-09") == 128000
+        assert router.context_window("gpt-4-0613") == 8192
+        assert router.context_window("gpt-4-0125-preview") == 128000
+        assert router.context_window("gpt-4-1106-preview") == 128000
+        assert router.context_window("my-finetune") is None
+
+    def test_cheapest_policy_and_cost_cap(self):
+        router = ModelRouter(
+            route_models={"openai_api": ["gpt-4o-mini", "gpt-4.1"]},
+            prices={"gpt-4o": (2.5, 10), "gpt-4o-mini": (0.15, 0.6), "gpt-4.1": (2, 8)},
+            policy="cheapest",
+        )
+        assert router.route("openai_api", "gpt-4o", 1000, 100) == "gpt-4o-mini"
+
+        router = ModelRouter(
+            route_models={"openai_api": ["gpt-4.1"]},
+            prices={"gpt-4o": (2.5, 10), "gpt-4.1": (2, 8)},
+            max_call_cost=0.25,
+        )
+        assert router.route("openai_api", "gpt-4o", 100000, 0) == "gpt-4.1"
+
+    def test_context_length_error_caps_the_window_to_the_reported_limit(self):
+        router = ModelRouter(route_models={"openai_api": ["gpt-4-turbo"]})
+        router.cap_window(
+            "gpt-4o", "This model's maximum context length is 32000 tokens", 50000
+        )
+        assert router.context_window("gpt-4o") == 32000
+        assert router.context_window("gpt-4o-mini") == 128000
+        assert router.route("openai_api", "gpt-4o", 50000, 100) == "gpt-4-turbo"
+
+    def test_cap_without_a_reported_limit_counts_the_output(self):
+        router = ModelRouter(margin=1.0)
+        router.cap_window("gpt-4o", "prompt is too long", 20000, 100000)
+        assert router.context_window("gpt-4o") == 119999
+
+    def test_cap_has_a_floor_and_expires(self):
+        router = ModelRouter(window_floor=4096, cap_seconds=0)
+        router.cap_window(
+            "gpt-4o", "prompt is too long: 9000 tokens > 100 maximum", 9000
+        )
+        assert router.context_window("gpt-4o") == 128000
+        router.cap_seconds = 60
+        router.cap_window(
+            "gpt-4o", "prompt is too long: 9000 tokens > 100 maximum", 9000
+        )
+        assert router.context_window("gpt-4o") == 4096
+
+    def test_context_limit_of_provider_errors(self):
+        assert context_limit("maximum context length is 8192 tokens. However") == 8192
+        assert (
+            context_limit(
+                "input length and `max_tokens` exceed context limit: 190000 + 20000 > 200000, decrease"
+            )
+            == 200000
+        )
+        assert (
+            context_limit("exceeds the maximum number of tokens allowed (1048576).")
+            == 1048576
+        )
+        assert context_limit("context_length_exceeded") is None
+
+    def test_decisions_are_published_and_summed(self):
+        router = ModelRouter(route_models={"openai_api": ["gpt-4-turbo"]})
+        router.route("openai_api", "gpt-4", 100)
+        router.route("openai_api", "gpt-4", 20000)
+        router.route("openai_api", "gpt-4", 20000)
+        published = [json.dumps(router.snapshot())]
+        assert summarize_route_metrics(published) == [
+            {
+                "provider": "openai_api",
+                "requested": "gpt-4",
+                "chosen": "gpt-4",
+                "reason": "requested",
+                "count": 1,
+            },
+            {
+                "provider": "openai_api",
+                "requested": "gpt-4",
+                "chosen": "gpt-4-turbo",
+                "reason": "context",
+                "count": 2,
+            },
+        ]
+
+    def test_from_env(self):
+        router = ModelRouter.from_env(
+            {
+                **ENV,
+                "LLM_ROUTE_POLICY": "cheapest",
+                "LLM_MODEL_PRICES": '{"gpt-4": [30, 60]}',
+                "LLM_CONTEXT_WINDOWS": '{"my-finetune": 32768}',
+            },
+            AVAILABLE_PROVIDERS,
+        )
+        assert router.route_models == {"openai_api": ["gpt-4-turbo"]}
+        assert router.policy == "cheapest"
+        assert router.prices == {"gpt-4": (30, 60)}
+        assert router.context_window("my-finetune") == 32768
+
+
+class TestRoutedFailover:
+
+    def test_key_manager_skips_providers_without_a_fitting_model(self):
+        health = ProviderHealth(
+            LocalHealthStore(), key_pause_seconds=300, open_seconds=900, cache_seconds=0
+        )
+        manager = KeyManager(ENV, health)
+        provider, model, _ = manager.get_api_info("openai_api", "gpt-4", 20000)
+        assert (provider, model) == ("openai_api", "gpt-4-turbo")
+        provider, model, _ = manager.get_api_info("openai_api", "gpt-4", 150000)
+        assert (provider, model) == ("anthropic_api", "claude-3-5-haiku")
+
+    def test_estimate_prompt_tokens(self):
+        assert estimate_prompt_tokens("hello world") > 0
+        messages = [("system", "be brief"), ("human", "hello world")]
+        assert estimate_prompt_tokens(messages) > estimate_prompt_tokens("hello world")
+
+    def test_context_length_errors(self):
+        assert is_context_length_error(
+            bad_request("This model's maximum context length is 8192 tokens")
+        )
+        assert not is_context_length_error(bad_request("Invalid value for 'n'"))
+        assert not is_context_length_error(ValueError("maximum context length"))
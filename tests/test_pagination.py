@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor, page_size
+
+
+class TestPagination:
+
+    def test_cursor_round_trip(self):
+        created_at = datetime(2024, 5, 1, 12, 30, 15, 250000)
+        cursor = encode_cursor(created_at, 42)
+        assert "=" not in cursor
+        assert decode_cursor(cursor) == (created_at, 42)
+
+    def test_cursor_of_a_row_without_created_at(self):
+        assert decode_cursor(encode_cursor(None, 42)) == (None, 42)
+
+    def test_malformed_cursor_is_rejected(self):
+        with pytest.raises(HTTPException) as exc_info:
+            decode_cursor("not-a-cursor")
+        assert exc_info.value.status_code == 400
+
+    def test_page_size_is_capped(self):
+        assert page_size(10) == 10
+        assert page_size(0) == 1
+        assert page_size(MAX_PAGE_SIZE + 1000) == MAX_PAGE_SIZE
@@ -0,0 +1,85 @@
+import time
+
+from app.db_api.pool_profiles import (
+    POOL_PROFILES,
+    connection_footprint,
+    pool_profile,
+    summarize_pool_metrics,
+)
+from common import serialization
+
+SUPERVISOR_CONF = """
+[supervisord]
+nodaemon=true
+
+[program:uvicorn]
+command=/opt/venv/bin/uvicorn app.main:app --port 8887 --workers 4
+environment=DB_POOL_ROLE="api"
+
+[program:evaluation_worker]
+command=/opt/venv/bin/celery -A workers.celery_worker worker -n evaluation_worker_%(process_num)02d@%%h
+environment=DB_POOL_ROLE="evaluation_worker"
+numprocs=50
+
+[program:worker]
+command=/opt/venv/bin/python /app/workers/worker.py
+numprocs=10
+autostart=false
+"""
+
+
+def snapshot(role, checked_out, max_wait_seconds, published_at=None):
+    return serialization.dumps(
+        {
+            "role": role,
+            "process": f"{role}:host:1",
+            "published_at": published_at or time.time(),
+            "checkouts": 10,
+            "waits": 2,
+            "wait_seconds": 0.5,
+            "max_wait_seconds": max_wait_seconds,
+            "timeouts": 0,
+            "pools": {
+                "sync": {
+                    "size": 5,
+                    "checked_out": checked_out,
+                    "overflow": 0,
+                    "max_overflow": 5,
+                }
+            },
+        }
+    )
+
+
+class TestPoolProfiles:
+
+    def test_unknown_role_uses_default_profile(self):
+        assert pool_profile("no_such_role") == pool_profile("default")
+
+    def test_every_profile_keeps_a_bounded_pool(self):
+        # pool_size=0 would mean an unlimited QueuePool
+        for profile in POOL_PROFILES.values():
+            assert profile.pool_size > 0
+
+    def test_footprint_multiplies_processes_and_skips_disabled_programs(self, tmp_path):
+        conf = tmp_path / "supervisord.conf"
+        conf.write_text(SUPERVISOR_CONF)
+        footprint = connection_footprint(str(conf))
+        assert footprint == {
+            "uvicorn": 4 * pool_profile("api").max_connections,
+            "evaluation_worker": 50 * pool_profile("evaluation_worker").max_connections,
+        }
+
+    def test_summary_sums_processes_per_role_and_drops_stale_ones(self):
+        summary = summarize_pool_metrics(
+            [
+                snapshot("saving_worker", 3, 0.2),
+                snapshot("saving_worker", 4, 0.7),
+                snapshot("api", 1, 0.0, published_at=1.0),
+            ]
+        )
+        assert list(summary) == ["saving_worker"]
+        assert summary["saving_worker"]["processes"] == 2
+        assert summary["saving_worker"]["checked_out"] == 7
+        assert summary["saving_worker"]["checkouts"] == 20
+        assert summary["saving_worker"]["max_wait_seconds"] == 0.7
@@ -0,0 +1,76 @@
+from datetime import date
+from types import SimpleNamespace
+
+from app.utils.pricing_index import (
+    Price,
+    PricingIndex,
+    evaluation_cost,
+    evaluation_model,
+)
+
+
+def pricing_row(
+    provider, model, effective_from, input_price, output_price, cached_price=None
+):
+    return SimpleNamespace(
+        provider=provider,
+        model=model,
+        effective_from=effective_from,
+        input_price_per_million_tokens=input_price,
+        output_price_per_million_tokens=output_price,
+        cached_input_price_per_million_tokens=cached_price,
+    )
+
+
+class TestPricingIndex:
+
+    def test_price_in_force_on_a_day(self):
+        index = PricingIndex()
+        index.load(
+            [
+                pricing_row("openai_api", "gpt-4o", date(2024, 6, 1), 2.5, 10.0),
+                pricing_row("openai_api", "gpt-4o", date(2024, 1, 1), 5.0, 15.0),
+                pricing_row("anthropic_api", "claude", date(2024, 3, 1), 3.0, 15.0),
+            ]
+        )
+        assert index.price_at("openai_api", "gpt-4o", date(2023, 12, 31)) is None
+        assert index.price_at("openai_api", "gpt-4o", date(2024, 1, 1)).effective_from == date(2024, 1, 1)
+        assert index.price_at("openai_api", "gpt-4o", date(2024, 5, 31)).effective_from == date(2024, 1, 1)
+        assert index.price_at("openai_api", "gpt-4o", date(2024, 6, 1)).effective_from == date(2024, 6, 1)
+        assert index.price_at("openai_api", "unknown", date(2024, 6, 1)) is None
+
+    def test_providers_of_the_same_model_keep_their_own_intervals(self):
+        index = PricingIndex()
+        index.load(
+            [
+                pricing_row("openai_api", "gpt-4o", date(2024, 1, 1), 5.0, 15.0),
+                pricing_row("azure_api", "gpt-4o", date(2024, 3, 1), 4.0, 12.0),
+                pricing_row("openai_api", "gpt-4o", date(2024, 6, 1), 2.5, 10.0),
+            ]
+        )
+        assert index.price_at("openai_api", "gpt-4o", date(2024, 4, 1)).input_price_per_million_tokens == 5.0
+        assert index.price_at("azure_api", "gpt-4o", date(2024, 7, 1)).input_price_per_million_tokens == 4.0
+        assert index.price_at("azure_api", "gpt-4o", date(2024, 2, 1)) is None
+
+    def test_evaluation_cost(self):
+        price = Price(date(2024, 1, 1), 2.0, 8.0)
+        assert evaluation_cost(1000000, 500000, price) == 6.0
+        assert evaluation_cost(None, None, price) == 0
+
+    def test_cached_prompt_tokens_cost_the_cached_price(self):
+        price = Price(date(2024, 1, 1), 2.0, 8.0, 0.5)
+        assert evaluation_cost(1000000, 0, price, 800000) == 0.8
+        # Without a cached price they are billed as input
+        assert evaluation_cost(1000000, 0, Price(date(2024, 1, 1), 2.0, 8.0), 800000) == 2.0
+
+    def test_override_model_takes_precedence(self):
+        evaluator_models = {1: ("openai", "gpt-4o")}
+        assert evaluation_model({"evaluator_id": 1}, evaluator_models) == (
+            "openai",
+            "gpt-4o",
+        )
+        override = {"llm_config": {"provider": "anthropic", "model": "claude"}}
+        assert evaluation_model(
+            {"evaluator_id": 1, "evaluator_config_override": override},
+            evaluator_models,
+        ) == ("anthropic", "claude")
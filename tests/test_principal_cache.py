@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from app.db_api import models
+from app.utils.principal_cache import PrincipalCache, restore, snapshot, user_key
+
+
+class TestPrincipalCache:
+
+    def test_set_get_and_clear(self):
+        cache = PrincipalCache(ttl=30)
+        cache.set(user_key(1), [{"id": 1}])
+        assert cache.get(user_key(1)) == [{"id": 1}]
+        cache.clear()
+        assert cache.get(user_key(1)) is None
+
+    def test_entries_expire(self):
+        cache = PrincipalCache(ttl=0)
+        cache.set(user_key(1), [{"id": 1}])
+        assert cache.get(user_key(1)) is None
+
+    def test_oldest_entry_is_evicted_at_max_size(self):
+        cache = PrincipalCache(ttl=30, max_size=2)
+        for user_id in range(3):
+            cache.set(user_key(user_id), [{"id": user_id}])
+        assert cache.get(user_key(0)) is None
+        assert cache.get(user_key(2)) == [{"id": 2}]
+
+    def test_restore_parses_serialized_datetimes(self):
+        created_at = datetime(2024, 5, 1, 12, 30)
+        user = models.User(id=7, email="a@b.com", created_at=created_at)
+        data = snapshot(user)
+        data["created_at"] = created_at.isoformat()
+        restored = restore(models.User, data)
+        assert restored.id == 7
+        assert restored.email == "a@b.com"
+        assert restored.created_at == created_at
+
+    def test_snapshot_leaves_out_credentials(self):
+        user = models.User(id=7, email="a@b.com", api_token="t", client_secret="s")
+        data = snapshot(user)
+        assert data["email"] == "a@b.com"
+        assert "api_token" not in data
+        assert "client_secret" not in data
@@ -0,0 +1,75 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompts import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    SystemMessagePromptTemplate,
+)
+
+from evaluators.langchain_evaluator_base import LangChainBaseEvaluator, literal_prefix
+from llm_failover import CACHE_BREAKPOINT
+from llm_failover.prompt_cache import anthropic_cache_control
+
+
+class TestPromptCache:
+
+    def test_literal_prefix_stops_at_the_first_variable(self):
+        assert literal_prefix("Rubric {{json}} for {cell} and {history}") == (
+            "Rubric {json} for ",
+            True,
+        )
+        assert literal_prefix("No variables") == ("No variables", False)
+
+    def test_stable_prefix_spans_messages_without_variables(self):
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template("Long rubric"),
+                HumanMessagePromptTemplate.from_template("Notebook: {cell}"),
+            ]
+        )
+        assert LangChainBaseEvaluator._stable_prefix(prompt) == (1, "Notebook: ")
+
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template("{cell} first"),
+                HumanMessagePromptTemplate.from_template("stable"),
+            ]
+        )
+        assert LangChainBaseEvaluator._stable_prefix(prompt) is None
+
+    def test_breakpoint_marks_the_formatted_prompt(self):
+        prompt = ChatPromptTemplate.from_messages(
+            [SystemMessagePromptTemplate.from_template("Rubric. Cell: {cell}")]
+        )
+        stable_prefix = LangChainBaseEvaluator._stable_prefix(prompt)
+        [message] = LangChainBaseEvaluator._mark_cache_breakpoint(
+            stable_prefix, prompt.invoke({"cell": "x = 1"})
+        )
+        assert message.additional_kwargs[CACHE_BREAKPOINT] == len("Rubric. Cell: ")
+
+    def test_anthropic_cache_control_splits_the_marked_message(self):
+        messages = anthropic_cache_control(
+            [
+                SystemMessage(
+                    "Rubric. Cell: x = 1",
+                    additional_kwargs={CACHE_BREAKPOINT: len("Rubric. Cell: ")},
+                ),
+                HumanMessage("unmarked"),
+            ]
+        )
+        assert messages[0].content == [
+            {
+                "type": "text",
+                "text": "Rubric. Cell: ",
+                "cache_control": {"type": "ephemeral"},
+            },
+            {"type": "text", "text": "x = 1"},
+        ]
+        assert messages[1].content == "unmarked"
+
+    def test_whole_message_is_cached_when_nothing_follows(self):
+        [message] = anthropic_cache_control(
+            [SystemMessage("Rubric. ", additional_kwargs={CACHE_BREAKPOINT: 7})]
+        )
+        assert message.content == [
+            {"type": "text", "text": "Rubric. ", "cache_control": {"type": "ephemeral"}}
+        ]
@@ -0,0 +1,50 @@
+import pytest
+from fastapi import HTTPException
+
+from app.utils import rate_limit
+from app.utils.rate_limit import (
+    RATE_LIMIT_ENGAGEMENT,
+    RateLimitResult,
+    enforce_rate_limit,
+    request_cost,
+)
+
+
+class TestRateLimit:
+
+    def test_request_cost_is_runs_times_evaluators(self):
+        assert request_cost([{}] * 5000, ["a", "b"], ["agg"]) == 15000
+        assert request_cost([{}], ["a"]) == 1
+
+    def test_headers_on_allowed_request(self):
+        headers = RateLimitResult(True, 500, 120, 0, 45200).headers()
+        assert headers == {
+            "RateLimit-Limit": "500",
+            "RateLimit-Remaining": "120",
+            "RateLimit-Reset": "46",
+        }
+
+    def test_headers_on_rejected_request_include_retry_after(self):
+        headers = RateLimitResult(False, 500, 3, 1500, 59000).headers()
+        assert headers["Retry-After"] == "2"
+        assert headers["RateLimit-Remaining"] == "3"
+
+    @pytest.mark.asyncio
+    async def test_cost_over_a_whole_bucket_is_rejected(self):
+        with pytest.raises(HTTPException) as raised:
+            await enforce_rate_limit("acme", "a@b.c", RATE_LIMIT_ENGAGEMENT + 1)
+        assert raised.value.status_code == 429
+        assert "Retry-After" not in (raised.value.headers or {})
+
+    @pytest.mark.asyncio
+    async def test_bulk_chunks_draw_on_the_bulk_buckets(self, monkeypatch):
+        charged = []
+
+        class Limiter:
+            async def acquire(self, buckets, cost):
+                charged.append(buckets)
+                return RateLimitResult(True, 1, 0, 0, 0)
+
+        monkeypatch.setattr(rate_limit, "rate_limiter", lambda bulk: Limiter())
+        await enforce_rate_limit("acme", "a@b.c", 1000 * 3, bulk=True)
+        assert list(charged[0]) == ["bulk:engagement:acme", "bulk:user:a@b.c"]
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.db_api import replicas
+from app.db_api.replicas import Replica, ReplicaRouter
+
+
+def make_replica(healthy=True):
+    replica = Replica.__new__(Replica)
+    replica.name = "replica"
+    replica.healthy = healthy
+    replica.lag = None
+    return replica
+
+
+class TestReplicas:
+
+    def test_lag_within_bound_is_healthy(self):
+        replica = make_replica(healthy=False)
+        replica._record_lag([{"Seconds_Behind_Source": 1}])
+        assert replica.healthy
+        assert replica.lag == 1
+
+    def test_lag_over_bound_or_stopped_replication_is_unhealthy(self):
+        replica = make_replica()
+        replica._record_lag([{"Seconds_Behind_Source": 3600}])
+        assert not replica.healthy
+        replica = make_replica()
+        replica._record_lag([{"Seconds_Behind_Master": None}])
+        assert not replica.healthy
+
+    def test_no_replication_status_is_unhealthy(self):
+        replica = make_replica()
+        replica._record_lag([])
+        assert not replica.healthy
+        assert replica.lag is None
+
+    @pytest.mark.asyncio
+    async def test_read_failing_on_a_replica_is_retried_on_the_primary(
+        self, monkeypatch
+    ):
+        monkeypatch.setattr(replicas.replica_router, "replicas", [make_replica()])
+        request = SimpleNamespace(method="GET", headers={}, state=SimpleNamespace())
+        calls = []
+
+        async def call_next(request):
+            calls.append(request.state.use_primary)
+            if not request.state.use_primary:
+                request.state.replica = "replica"
+                raise OperationalError("SELECT 1", {}, Exception("gone away"))
+            return "response"
+
+        response = await replicas.replica_routing_middleware(request, call_next)
+        assert response == "response"
+        assert calls == [False, True]
+
+    def test_router_skips_unhealthy_replicas(self):
+        router = ReplicaRouter([])
+        healthy, unhealthy = make_replica(), make_replica(healthy=False)
+        router.replicas = [unhealthy, healthy]
+        router._cycle = iter([unhealthy, healthy] * 2)
+        assert router._next_healthy() is healthy
+        assert router._next_healthy() is healthy
+
+    def test_router_without_healthy_replicas_uses_primary(self):
+        router = ReplicaRouter([])
+        assert router._next_healthy() is None
@@ -0,0 +1,26 @@
+from common.run_coalescing import coalescing_key
+
+EVALUATIONS = [{"evaluator_name": "grammar", "name": "grammar", "config": {}}]
+RUN_CONFIG = {
+    "input_type": "parsed_json_args",
+    "parse": True,
+    "format_to_issues_scores": False,
+    "is_dev_request": False,
+    "engagement_name": "eng",
+}
+
+
+class TestRunCoalescing:
+
+    def test_key_is_stable_for_identical_work(self):
+        assert coalescing_key("h", EVALUATIONS, None, RUN_CONFIG) == coalescing_key(
+            "h", [dict(EVALUATIONS[0])], None, dict(reversed(RUN_CONFIG.items()))
+        )
+
+    def test_key_changes_with_input_evaluators_or_config(self):
+        key = coalescing_key("h", EVALUATIONS, None, RUN_CONFIG)
+        assert key != coalescing_key("other", EVALUATIONS, None, RUN_CONFIG)
+        assert key != coalescing_key("h", EVALUATIONS, EVALUATIONS, RUN_CONFIG)
+        assert key != coalescing_key(
+            "h", EVALUATIONS, None, {**RUN_CONFIG, "parse": False}
+        )
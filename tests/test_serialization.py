@@ -0,0 +1,85 @@
+import math
+from datetime import datetime, timezone
+from enum import Enum
+
+import pytest
+from pydantic import BaseModel
+
+from common import serialization
+
+
+class _Status(Enum):
+    DONE = "done"
+
+
+class _Item(BaseModel):
+    name: str
+    created_at: datetime
+
+
+class TestSerialization:
+
+    # Digests computed with the pre-orjson formula:
+    # sha256((json.dumps(item, sort_keys=True) + str(input_type)).encode())
+    @pytest.mark.parametrize(
+        "input_item, input_type, expected",
+        [
+            (
+                {
+                    "conversation": ["User: hi", "Assistant: hello"],
+                    "metadata": {"b": 1, "a": [1.5, 2, None, True]},
+                },
+                "parsed_json_args",
+                "c54797d0a38233d5b128917c3d3671d9857dbc5727bd76674c3b1f0e9b440c6d",
+            ),
+            (
+                {
+                    "text": "Grüße — 你好 🚀",
+                    "nested": {"z": {"y": 1e-05, "x": 12345678901234567890}},
+                },
+                "parsed_json_args",
+                "4272eede7589426c6a4a317817b32b7f5433d6fec004dd9b484d7bdc0c61809d",
+            ),
+            (
+                [{"role": "user", "content": 'line\nbreak "quoted"'}],
+                ["colab_url"],
+                "5b2cacadd9852d46c741eb7db6e81e1428efdb5d70afc0501c19efdacaee9ff2",
+            ),
+            (
+                {},
+                "colab_url",
+                "dcc26ab2723d526a4db3caebb28da134158f5b56a4d8d1badeb478eb96e66943",
+            ),
+        ],
+    )
+    def test_input_hash_matches_legacy_digests(self, input_item, input_type, expected):
+        _, input_hash = serialization.compute_input_hash(input_item, input_type)
+        assert input_hash == expected
+
+    def test_round_trip(self):
+        payload = {"a": [1, 2.5, None], "b": {"c": "ü"}, 3: "non-str key"}
+        assert serialization.loads(serialization.dumps(payload)) == {
+            "a": [1, 2.5, None],
+            "b": {"c": "ü"},
+            "3": "non-str key",
+        }
+
+    def test_dumps_handles_extended_types(self):
+        created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+        data = serialization.loads(
+            serialization.dumps(
+                {
+                    "item": _Item(name="x", created_at=created_at),
+                    "status": _Status.DONE,
+                    "when": created_at,
+                    "big": 2**70,
+                }
+            )
+        )
+        assert data["item"]["name"] == "x"
+        assert data["status"] == "done"
+        assert data["when"].startswith("2024-05-01T12:30:00")
+        assert data["big"] == 2**70
+
+    def test_loads_accepts_nan_literal(self):
+        assert math.isnan(serialization.loads('{"x": NaN}')["x"])
@@ -0,0 +1,81 @@
+from datetime import date
+
+from app.db_api import models
+from app.utils.stats_rollups import (
+    ALL_EVALUATORS,
+    _elapsed_ms,
+    batch_count_select,
+    run_rollup_increments,
+)
+
+
+class TestStatsRollups:
+
+    def test_run_level_row_totals_every_evaluation(self):
+        evaluations = [
+            {
+                "evaluator_id": 3,
+                "status": "success",
+                "prompt_tokens_used": 10,
+                "generate_tokens_used": 2,
+            },
+            {
+                "evaluator_id": 5,
+                "status": "failed",
+                "prompt_tokens_used": 7,
+                "generate_tokens_used": None,
+            },
+            {
+                "evaluator_id": 3,
+                "status": "success",
+                "prompt_tokens_used": 1,
+                "generate_tokens_used": 1,
+            },
+        ]
+        rows = run_rollup_increments(
+            date(2024, 5, 1), 1, 2, "success", evaluations, 1500
+        )
+
+        assert [row["evaluator_id"] for row in rows] == [ALL_EVALUATORS, 3, 5]
+        run_row = rows[0]
+        assert run_row["run_count"] == 1
+        assert run_row["run_failed_count"] == 0
+        assert run_row["evaluation_count"] == 3
+        assert run_row["evaluation_failed_count"] == 1
+        assert run_row["total_prompt_tokens"] == 18
+        assert run_row["total_generate_tokens"] == 3
+        assert run_row["total_latency_ms"] == 1500
+
+    def test_each_evaluator_counts_the_run_once(self):
+        evaluations = [
+            {"evaluator_id": 3, "status": "success", "prompt_tokens_used": 10},
+            {"evaluator_id": 3, "status": "success", "prompt_tokens_used": 4},
+        ]
+        rows = run_rollup_increments(date(2024, 5, 1), 1, 2, "failed", evaluations, 900)
+
+        evaluator_row = rows[1]
+        assert evaluator_row["run_count"] == 1
+        assert evaluator_row["run_failed_count"] == 1
+        assert evaluator_row["evaluation_count"] == 2
+        assert evaluator_row["total_prompt_tokens"] == 14
+        assert evaluator_row["total_latency_ms"] == 900
+
+    def test_run_without_evaluations_still_counts(self):
+        rows = run_rollup_increments(date(2024, 5, 1), 1, 2, "success", [], 0)
+        assert len(rows) == 1
+        assert rows[0]["run_count"] == 1
+        assert rows[0]["evaluation_count"] == 0
+
+    def test_elapsed_ms_only_uses_timestampdiff_on_mysql(self):
+        for dialect in ("postgresql", "sqlite"):
+            expression = _elapsed_ms(
+                dialect, models.Run.created_at, models.Run.updated_at
+            )
+            assert "timestampdiff" not in str(expression).lower()
+
+    def test_batch_count_is_distinct_over_batches_not_days(self):
+        engagement = str(batch_count_select(engagement_id=1))
+        assert "count(batch_run.id)" in engagement
+        assert "stats_rollup" not in engagement
+        evaluator = str(batch_count_select(evaluator_id=1))
+        assert "count(DISTINCT run.batch_run_id)" in evaluator
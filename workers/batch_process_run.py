@@ -1,7 +1,7 @@
 import time
-import json
 import redis
 import os
+from common import serialization
 from common.utils import load_env
 from workers.slim_tasks import process_run
 
@@ -28,7 +28,7 @@ def process_run_batch(batch):
     Send batch of runs to process_run.
     """
     for item in batch:
-        data = json.loads(item)  # Deserialize the item
+        data = serialization.loads(item)  # Deserialize the item
         process_run.apply_async(
             args=[
                 data["run_item"],
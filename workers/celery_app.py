@@ -2,7 +2,10 @@ import logging
 import os
 
 from celery import Celery
+from celery.schedules import crontab
+from kombu.serialization import register
 
+from common import serialization
 from common.utils import load_env
 
 
@@ -12,6 +15,80 @@ REDIS_PORT = os.environ.get("REDIS_PORT", "6379")
 broker_url = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 backend_url = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 
+# orjson-backed serializer for task and result payloads. Workers accept it
+# and json alike, but json stays the default: workers from before this change
+# only accept json and reject orjson messages. Roll it out in two steps: deploy
+# every worker with this accept list, then set CELERY_SERIALIZER=orjson.
+# orjson sends datetimes as ISO strings, where kombu's json restores them as
+# datetimes, so tasks must not rely on receiving datetime arguments.
+register(
+    "orjson",
+    serialization.dumps,
+    serialization.loads,
+    content_type="application/x-orjson",
+    content_encoding="utf-8",
+)
+CELERY_SERIALIZER = env_vars.get("CELERY_SERIALIZER", "json")
+
+STATS_ROLLUP_COMPACTION_MINUTES = int(
+    env_vars.get("STATS_ROLLUP_COMPACTION_MINUTES", 15)
+)
+STATS_ROLLUP_COMPACTION_DAYS = int(env_vars.get("STATS_ROLLUP_COMPACTION_DAYS", 2))
+
+# Provider batch APIs for bulk runs, see LLM_BATCH_MODE in workers.slim_tasks
+LLM_BATCH_SCHEDULE = (
+    {
+        "submit-llm-batches": {
+            "task": "workers.slim_tasks.submit_llm_batches",
+            "schedule": int(env_vars.get("LLM_BATCH_SUBMIT_SECONDS", 60)),
+        },
+        "poll-llm-batches": {
+            "task": "workers.slim_tasks.poll_llm_batches",
+            "schedule": int(env_vars.get("LLM_BATCH_POLL_SECONDS", 300)) // 2,
+        },
+    }
+    if env_vars.get("LLM_BATCH_MODE", "f").lower() in ("true", "1", "t")
+    else {}
+)
+
+# Runs past retention are deleted once archived, see app.db_api.archive
+RUN_ARCHIVE_SCHEDULE = (
+    {
+        # Nightly; only does work once a month has passed retention
+        "archive-cold-runs": {
+            "task": "workers.slim_tasks.archive_cold_runs",
+            "schedule": crontab(hour=3, minute=30),
+        },
+    }
+    if env_vars.get("RUN_ARCHIVE_ENABLED", "f").lower() in ("true", "1", "t")
+    else {}
+)
+
+# Model call records appended to the ledger stream, see llm_failover.ledger
+LLM_LEDGER_SCHEDULE = (
+    {
+        "drain-llm-ledger": {
+            "task": "workers.slim_tasks.drain_llm_ledger",
+            "schedule": int(env_vars.get("LLM_LEDGER_DRAIN_SECONDS", 30)),
+        },
+    }
+    if "redis" in env_vars.get("LLM_LEDGER_SINKS", "redis").lower()
+    else {}
+)
+
+# Followers of coalesced runs whose leader never reported back, see
+# common.run_coalescing
+RUN_COALESCING_SCHEDULE = (
+    {
+        "sweep-coalesced-runs": {
+            "task": "workers.slim_tasks.sweep_coalesced_runs",
+            "schedule": int(env_vars.get("COALESCING_SWEEP_SECONDS", 300)),
+        },
+    }
+    if env_vars.get("COALESCING_ENABLED", "f").lower() in ("true", "1", "t")
+    else {}
+)
+
 logging.info(f"Configured Redis broker URL: {broker_url}")
 logging.info(f"Configured Redis backend URL: {backend_url}")
 
@@ -36,8 +113,32 @@ celery_app.conf.update(
         "workers.celery_app.evaluate_workflow": {"queue": "evaluation_queue"},
         "workers.celery_app.prepare_output_for_saving": {"queue": "evaluation_queue"},
         "workers.celery_app.process_webhook_data": {"queue": "webhook_queue"},
+        "workers.slim_tasks.compact_stats_rollups": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.backfill_stats_rollups": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.backfill_evaluation_costs": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.offload_large_payloads": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.archive_cold_runs": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.submit_llm_batches": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.poll_llm_batches": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.drain_llm_ledger": {"queue": "db_fetch_queue"},
+        "workers.slim_tasks.sweep_coalesced_runs": {"queue": "db_fetch_queue"},
+    },
+    beat_schedule={
+        "compact-stats-rollups": {
+            "task": "workers.slim_tasks.compact_stats_rollups",
+            "schedule": crontab(minute=f"*/{STATS_ROLLUP_COMPACTION_MINUTES}"),
+            "args": (STATS_ROLLUP_COMPACTION_DAYS,),
+        },
+        **RUN_ARCHIVE_SCHEDULE,
+        **LLM_BATCH_SCHEDULE,
+        **LLM_LEDGER_SCHEDULE,
+        **RUN_COALESCING_SCHEDULE,
     },
     # broker_pool_limit=0,  # Disable connection pool for the broker
+    task_serializer=CELERY_SERIALIZER,
+    result_serializer=CELERY_SERIALIZER,
+    accept_content=["orjson", "json"],
+    result_accept_content=["orjson", "json"],
     worker_concurrency=25,  # Number of concurrent worker processes/threads for I/O bound tasks
     # worker_pool="gevent",  # Use gevent pool for handling I/O bound tasks
     task_acks_late=True,  # Ensure tasks are acknowledged only after execution
@@ -1,9 +1,11 @@
 import json
+import math
 import os
 import time
 import traceback
 
 import celery.exceptions
+import redis
 from celery import chain, chord, current_task, group, shared_task
 from celery.result import AsyncResult
 from celery.signals import task_failure, worker_process_init
@@ -12,10 +14,20 @@ from google.oauth2 import service_account
 
 from sqlalchemy import TextClause
 
-from app.db_api.database import get_db_ctx_manual
+from app.db_api.archive import RUN_RETENTION_MONTHS, archive_cold_months
+from app.db_api.blob_store import blob_store, offload_existing
+from app.db_api.database import db_pool_profile, get_db_ctx_manual
 from app.db_api.models import models
 from app.logging_config import is_json_logging_enabled, logger
+from app.utils.llm_ledger import drain_ledger
+from app.utils.pricing_index import backfill_costs, stamp_costs
+from app.utils.stats_rollups import (
+    backfill_rollups,
+    compact_rollups,
+    record_saved_run,
+)
 from common.constants import GOOGLE_API_CREDENTIALS_PATH
+from common.run_coalescing import COALESCING_ENABLED, RunCoalescer
 from common.utils import load_env, get_next_queue
 from evaluators.library import (
     AppleCodeTranslationEvaluator,
@@ -39,6 +51,16 @@ from evaluators.library import (
     EvaluationPlagiarismChecker,
     EvaluationAIChecker
 )
+from llm_failover.batch import (
+    BatchPending,
+    batch_apis_from_env,
+    batch_mode,
+    batch_store,
+    poll_submitted,
+    submit_pending,
+)
+from llm_failover.health import redis_url
+from llm_failover.ledger import ledger_tags
 from workers.celery_app import celery_app
 from workers.task_utils import (
     EvaluationStatus,
@@ -63,6 +85,17 @@ PUSH_TO_WEBHOOK = env_vars.get("PUSH_TO_WEBHOOK", "f").lower() in (
 )
 
 
+# Bulk workers send the model calls of evaluations through the providers'
+# batch APIs (OpenAI, Anthropic): an evaluation is retried every
+# LLM_BATCH_POLL_SECONDS until its calls completed, and runs live past
+# LLM_BATCH_MAX_WAIT_SECONDS
+LLM_BATCH_MODE = bool(os.getenv("BULK_REQUEST")) and env_vars.get(
+    "LLM_BATCH_MODE", "f"
+).lower() in ("true", "1", "t")
+LLM_BATCH_POLL_SECONDS = int(env_vars.get("LLM_BATCH_POLL_SECONDS", 300))
+LLM_BATCH_MAX_WAIT_SECONDS = int(env_vars.get("LLM_BATCH_MAX_WAIT_SECONDS", 26 * 3600))
+LLM_BATCH_MAX_DEFERRALS = math.ceil(LLM_BATCH_MAX_WAIT_SECONDS / LLM_BATCH_POLL_SECONDS)
+
 EVALUATOR_TYPES_MAP = {
     "single_stage_system_prompt": SingleStageSystemPromptEvaluator,
     "single_stage_system_prompt_aspector": SingleStageSystemPromptAspectorEvaluator,
@@ -110,7 +143,9 @@ topic_path = (
 
 @worker_process_init.connect
 def on_init(*args, **kwargs):
-    # relieving cold start
+    # relieving cold start, only for roles that query the DB on every task
+    if not db_pool_profile.warm:
+        return
     with get_db_ctx_manual() as sess:
         sess.execute(TextClause("SELECT 1"))
 
@@ -199,14 +234,20 @@ def evaluate(input_payload, evaluator_setup, run_id, engagement_name):
             run_id=run_id,
             engagement_name=engagement_name,
         )
+        deferred = LLM_BATCH_MODE and current_task.request.retries < LLM_BATCH_MAX_DEFERRALS
         try:
-            evaluated_result = evaluator.evaluate(
-                input_data=input_payload,
-                config=evaluator_setup["config"],
-                input_validation=True,
-                parse=evaluator_setup["parse"],
-                format_to_issues_scores=evaluator_setup["format_to_issues_scores"],
-            )
+            with batch_mode(deferred), ledger_tags(
+                run_id=run_id,
+                evaluator=evaluator_setup["name"],
+                engagement=engagement_name,
+            ):
+                evaluated_result = evaluator.evaluate(
+                    input_data=input_payload,
+                    config=evaluator_setup["config"],
+                    input_validation=True,
+                    parse=evaluator_setup["parse"],
+                    format_to_issues_scores=evaluator_setup["format_to_issues_scores"],
+                )
             out["result"] = evaluated_result["result"]
             out["token_usage"] = evaluated_result.get("metadata", {})
         except Exception as e:
@@ -248,6 +289,12 @@ def evaluate(input_payload, evaluator_setup, run_id, engagement_name):
             #     raise e
         logger.debug("Leaving evaluate task")
         return out
+    except BatchPending as e:
+        # Replayed from the batch results once they are in
+        logger.debug(f"Evaluation {evaluator_setup['name']} of run {run_id} waits for {e}")
+        raise current_task.retry(
+            countdown=LLM_BATCH_POLL_SECONDS, max_retries=LLM_BATCH_MAX_DEFERRALS
+        )
     except Exception as e:
         if is_json_logging_enabled():
             logger.exception(
@@ -272,9 +319,40 @@ def evaluate(input_payload, evaluator_setup, run_id, engagement_name):
 
 
 @celery_app.task
-def save_results(prepared_output, task_id=None, run_id=None):
+def save_results(
+    prepared_output, task_id=None, run_id=None, batch_deadline=None, intermediate_id=None
+):
     try:
-        if task_id is not None:
+        if task_id is not None and batch_deadline is not None:
+            # Runs in batch mode take up to a day: check back every
+            # LLM_BATCH_POLL_SECONDS instead of holding a saving worker
+            if intermediate_id is None and AsyncResult(task_id).ready():
+                intermediate_id = AsyncResult(task_id).get(disable_sync_subtasks=False)
+            if intermediate_id is not None and AsyncResult(intermediate_id).ready():
+                prepared_output = AsyncResult(intermediate_id).get(
+                    disable_sync_subtasks=False
+                )
+            elif time.time() < batch_deadline:
+                save_results.apply_async(
+                    args=[None],
+                    kwargs={
+                        "task_id": task_id,
+                        "run_id": run_id,
+                        "batch_deadline": batch_deadline,
+                        "intermediate_id": intermediate_id,
+                    },
+                    queue=get_next_queue("saving_queue"),
+                    countdown=LLM_BATCH_POLL_SECONDS,
+                )
+                return
+            else:
+                logger.error(
+                    f"Batch run timed out. Task ID: {task_id} and intermediate: {intermediate_id}"
+                )
+                AsyncResult(intermediate_id or task_id).revoke(terminate=True)
+                fail_run.apply_async(args=[run_id], queue=get_next_queue("process_queue"))
+                return
+        elif task_id is not None:
             try:
                 start_time = time.time()
                 async_result = AsyncResult(task_id)
@@ -318,17 +396,34 @@ def save_results(prepared_output, task_id=None, run_id=None):
 
         with get_db_ctx_manual() as db:
             try:
-                # Bulk insert evaluations
-                logger.debug(f"Bulk inserting evaluations: {evaluations}")
-                db.bulk_insert_mappings(models.Evaluation, evaluations)
                 run_to_update = (
                     db.query(models.Run)
                     .filter(models.Run.id == run["run_id"])
                     .with_for_update()
                     .one()
                 )
+                # Priced on the day the run started rather than when it is
+                # saved: in batch mode the two can be a day apart
+                stamp_costs(db, evaluations, run_to_update.created_at.date())
+                # Bulk insert evaluations
+                logger.debug(f"Bulk inserting evaluations: {evaluations}")
+                db.bulk_insert_mappings(
+                    models.Evaluation,
+                    blob_store.offload_rows(
+                        evaluations, "output", "output_blob", session=db
+                    ),
+                )
                 for key, value in run_fields.items():
                     setattr(run_to_update, key, value)
+                db.flush()
+                record_saved_run(
+                    db,
+                    run,
+                    run_fields.get("status"),
+                    evaluations,
+                    run_to_update.created_at,
+                    run_to_update.updated_at,
+                )
 
                 db.commit()
                 logger.debug("Leaving save_results task")
@@ -339,6 +434,22 @@ def save_results(prepared_output, task_id=None, run_id=None):
                 raise e
         elapsed_time = time.time() - start_time
         logger.info(f"Time elapsed for get_db_ctx_manual {elapsed_time:.2f} seconds")
+        if COALESCING_ENABLED:
+            # The leader is saved; failing to hand its results to followers
+            # must not fail it. Followers left behind are failed by
+            # sweep_coalesced_runs once the coalescing keys expire.
+            try:
+                followers = RunCoalescer().complete(run["run_id"])
+                if followers:
+                    save_follower_results.apply_async(
+                        args=[prepared_output, followers],
+                        queue=get_next_queue("saving_queue"),
+                    )
+            except Exception as e:
+                logger.error(
+                    f"Failed to complete coalesced followers of run {run['run_id']}",
+                    exc_info=e,
+                )
     except Exception as e:
         logger.error("Failed to save results. Timeout? - ", exc_info=e)
         logger.debug("Leaving save_results task with error")
@@ -346,6 +457,96 @@ def save_results(prepared_output, task_id=None, run_id=None):
         raise e
 
 
+def copy_evaluations_for_follower(evaluations, follower):
+    """
+    Rebinds a leader's evaluation rows to a coalesced follower run. Token counts
+    are zeroed: the follower didn't call any model, so usage and cost stay on
+    the leader.
+    """
+    return [
+        {
+            **{k: v for k, v in evaluation.items() if k not in ("id", "uuid_token")},
+            "run_id": follower["run_id"],
+            "batch_run_id": follower["batch_run_id"],
+            "user_project_role_id": follower["user_project_role_id"],
+            "prompt_tokens_used": 0,
+            "generate_tokens_used": 0,
+            "cached_prompt_tokens_used": 0,
+            "cost": 0.0 if evaluation.get("cost") is not None else None,
+        }
+        for evaluation in evaluations
+    ]
+
+
+@celery_app.task
+def save_follower_results(prepared_output, followers):
+    """Copies a leader run's saved results onto the runs coalesced behind it."""
+    logger.debug("Entering save_follower_results task")
+    run_fields = prepared_output["run_fields"]
+    follower_evaluations = {
+        follower["run_id"]: copy_evaluations_for_follower(
+            prepared_output["evaluations"], follower
+        )
+        for follower in followers
+    }
+    with get_db_ctx_manual() as db:
+        try:
+            db.bulk_insert_mappings(
+                models.Evaluation,
+                blob_store.offload_rows(
+                    [e for evaluations in follower_evaluations.values() for e in evaluations],
+                    "output",
+                    "output_blob",
+                    session=db,
+                ),
+            )
+            db.bulk_update_mappings(
+                models.Run,
+                [
+                    {"id": follower["run_id"], **run_fields}
+                    for follower in followers
+                ],
+            )
+            follower_runs = db.query(
+                models.Run.id, models.Run.created_at, models.Run.updated_at
+            ).filter(models.Run.id.in_(list(follower_evaluations)))
+            runs_by_id = {follower["run_id"]: follower for follower in followers}
+            for run_id, created_at, updated_at in follower_runs.all():
+                record_saved_run(
+                    db,
+                    runs_by_id[run_id],
+                    run_fields.get("status"),
+                    follower_evaluations[run_id],
+                    created_at,
+                    updated_at,
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("Failed to save coalesced follower results.", exc_info=e)
+            for follower in followers:
+                fail_run.apply_async(
+                    args=[follower["run_id"]], queue=get_next_queue("process_queue")
+                )
+            raise e
+    logger.info(
+        f"Copied results of run {prepared_output['run']['run_id']} to {len(followers)} coalesced runs"
+    )
+
+    if PUSH_TO_WEBHOOK:
+        for follower in followers:
+            process_webhook_data.apply_async(
+                args=[
+                    {
+                        "run": follower,
+                        "evaluations": follower_evaluations[follower["run_id"]],
+                    }
+                ],
+                queue=get_next_queue("webhook_queue"),
+            )
+    logger.debug("Leaving save_follower_results task")
+
+
 @celery_app.task
 def fail_run_on_save_error(*args, **kwargs):
     fail_run.apply_async(args=[kwargs["run_id"]], queue=get_next_queue("process_queue"))
@@ -404,6 +605,131 @@ def fail_run(run_id):
             logger.error("Failed to mark run as failed.", exc_info=e)
             logger.debug("Leaving fail_run task with error")
             raise e
+    if COALESCING_ENABLED:
+        # Followers share the leader's outcome, including failure
+        for follower in RunCoalescer().complete(run_id):
+            fail_run.apply_async(
+                args=[follower["run_id"]], queue=get_next_queue("process_queue")
+            )
+
+
+@celery_app.task
+def sweep_coalesced_runs():
+    """
+    Fails the coalesced runs whose leader's keys expired before it saved or
+    failed, e.g. because it was revoked or lost with its worker, so they
+    don't stay pending. Scheduled by celery beat when coalescing is enabled.
+    """
+    logger.debug("Entering sweep_coalesced_runs task")
+    for follower in RunCoalescer().sweep():
+        fail_run.apply_async(
+            args=[follower["run_id"]], queue=get_next_queue("process_queue")
+        )
+    logger.debug("Leaving sweep_coalesced_runs task")
+
+
+@celery_app.task
+def compact_stats_rollups(days=2):
+    """
+    Recomputes the trailing days of stats rollups from runs and evaluations,
+    repairing drift from failed incremental updates and runs failed outside
+    save_results. Scheduled by celery beat.
+    """
+    logger.debug("Entering compact_stats_rollups task")
+    with get_db_ctx_manual() as db:
+        compact_rollups(db, days=days)
+    logger.debug("Leaving compact_stats_rollups task")
+
+
+@celery_app.task
+def backfill_stats_rollups(chunk_days=30):
+    """
+    Compacts the stats rollups of every day since the first run. Not
+    scheduled: run it once after the rollup table is created, e.g.
+    celery -A workers.celery_worker call workers.slim_tasks.backfill_stats_rollups
+    """
+    logger.debug("Entering backfill_stats_rollups task")
+    with get_db_ctx_manual() as db:
+        compacted = backfill_rollups(db, chunk_days=chunk_days)
+    logger.info(f"Backfilled {compacted} stats rollup rows")
+    logger.debug("Leaving backfill_stats_rollups task")
+
+
+@celery_app.task
+def backfill_evaluation_costs(batch_size=1000, after_id=0):
+    """Stamps cost on evaluations saved before costs were stamped at save time."""
+    logger.debug("Entering backfill_evaluation_costs task")
+    with get_db_ctx_manual() as db:
+        stamped = backfill_costs(db, batch_size=batch_size, after_id=after_id)
+    logger.info(f"Backfilled cost on {stamped} evaluations")
+
+
+@celery_app.task
+def archive_cold_runs(retention_months=RUN_RETENTION_MONTHS):
+    """
+    Exports runs and evaluations of months past retention to the archive and
+    deletes them. Scheduled by celery beat.
+    """
+    logger.debug("Entering archive_cold_runs task")
+    with get_db_ctx_manual() as db:
+        archived = archive_cold_months(db, retention_months=retention_months)
+    logger.info(f"Archived {archived} runs older than {retention_months} months")
+
+
+@celery_app.task
+def offload_large_payloads(batch_size=500):
+    """Moves large run inputs and evaluation outputs saved inline to the blob tier."""
+    logger.debug("Entering offload_large_payloads task")
+    with get_db_ctx_manual() as db:
+        runs = offload_existing(db, models.Run, "message", "message_blob", batch_size)
+        evaluations = offload_existing(
+            db, models.Evaluation, "output", "output_blob", batch_size
+        )
+    logger.info(f"Offloaded {runs} run inputs and {evaluations} evaluation outputs")
+
+
+@celery_app.task
+def submit_llm_batches():
+    """
+    Submits the model calls queued by evaluations in batch mode to the
+    providers' batch APIs. Scheduled by celery beat.
+    """
+    logger.debug("Entering submit_llm_batches task")
+    submitted = submit_pending(batch_store(), batch_apis_from_env(env_vars))
+    if submitted:
+        logger.info(f"Submitted model calls to batch APIs: {submitted}")
+
+
+@celery_app.task
+def poll_llm_batches():
+    """
+    Stores the results of finished provider batches, for the evaluations
+    waiting on them. Scheduled by celery beat.
+    """
+    logger.debug("Entering poll_llm_batches task")
+    completed = poll_submitted(batch_store(), batch_apis_from_env(env_vars))
+    if completed:
+        logger.info(f"Collected results of {completed} batches")
+
+
+@celery_app.task
+def drain_llm_ledger():
+    """
+    Moves the model call records workers appended to the call ledger stream
+    into llm_call. Scheduled by celery beat.
+    """
+    logger.debug("Entering drain_llm_ledger task")
+    url = redis_url(env_vars)
+    if not url:
+        return
+    client = redis.Redis.from_url(url)
+    try:
+        with get_db_ctx_manual() as db:
+            drained = drain_ledger(db, client)
+    finally:
+        client.close()
+    if drained:
+        logger.info(f"Drained {drained} model call records")
 
 
 @celery_app.task
@@ -526,6 +852,9 @@ def prepare_output_for_saving(results, run, compiled_evaluations):
         user_proj_role_id=run["user_project_role_id"],
         is_dev_request=run["is_dev_request"],
     )
+    for evaluation in evaluations:
+        token_usage = mapped_results.get(evaluation.get("name"), {}).get("token_usage") or {}
+        evaluation["cached_prompt_tokens_used"] = token_usage.get("cached_prompt_tokens", 0)
     logger.debug("Leaving prepare_output_for_saving task")
 
     # Asynchronously process and send to webhook
@@ -570,6 +899,11 @@ def process_run(run, evaluations, aggregated_evaluations, save_to_db=True):
             kwargs={
                 "task_id": workflow_lazy_chain_that_returns_output_task_id.task_id,
                 "run_id": run["run_id"],
+                "batch_deadline": (
+                    time.time() + LLM_BATCH_MAX_WAIT_SECONDS + LLM_BATCH_POLL_SECONDS
+                    if LLM_BATCH_MODE
+                    else None
+                ),
             },
             queue=get_next_queue("saving_queue"),
         )
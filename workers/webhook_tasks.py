@@ -1,7 +1,5 @@
 import asyncio
 from functools import partial
-import json
-from datetime import datetime
 
 from celery import shared_task
 from fastapi import HTTPException
@@ -10,17 +8,11 @@ import httpx
 from app.db_api.database import get_db_ctx_manual
 from app.db_api.models import models
 from app.logging_config import logger
+from common import serialization
 
 event_loop = None
 
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
-
-
 # Asynchronous function to fetch data from a service with retry logic and exponential backoff
 async def fetch_data_from_service(
     url: str,
@@ -33,7 +25,7 @@ async def fetch_data_from_service(
     async with httpx.AsyncClient() as client:
         for attempt in range(retries):
             try:
-                json_data = json.dumps(data, cls=DateTimeEncoder)
+                json_data = serialization.dumps(data)
                 logger.info(f"Posting data to URL: {url}")
                 # logger.debug(f"Request data: {json_data}")
                 response = await client.post(
@@ -9,12 +9,17 @@ import pstats
 from io import StringIO
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from typing import NamedTuple
+
 import redis
 from google.cloud import pubsub_v1
 from google.oauth2 import service_account
+from sqlalchemy import func, literal, null, select, update
 
+from app.db_api.blob_store import blob_store
 from app.db_api.database import get_db_ctx
 from app.db_api.models import Evaluation, Run
+from app.utils.evaluation_updates import claim_select, evaluation_results_update
 
 # Configure logging
 from app.logging_config import (
@@ -83,42 +88,51 @@ def ack(subscription_path, subscriber, message):
     subscriber.acknowledge(subscription=subscription_path, ack_ids=[message.ack_id])
 
 
+def truncate_fail_reason(fail_reason):
+    sep = "\n\n.......\n\n"
+    return fail_reason[: 500 - len(sep)] + sep + fail_reason[-500:]
+
+
 def fail_run(run_id, error_message):
+    # One transaction: count the open evaluations per stage, fail them with a
+    # single UPDATE and move the counters on the run with another
     with get_db_ctx() as session:
-        evaluations_to_fail = (
-            session.query(Evaluation)
-            .filter(
-                Evaluation.run_id == run_id,
-                Evaluation.status.in_(
-                    [EvaluationStatus.PENDING.value, EvaluationStatus.QUEUED.value]
-                ),
+        open_statuses = [EvaluationStatus.PENDING.value, EvaluationStatus.QUEUED.value]
+        failed_counts = dict(
+            session.execute(
+                select(Evaluation.is_aggregator, func.count())
+                .filter(
+                    Evaluation.run_id == run_id, Evaluation.status.in_(open_statuses)
+                )
+                .group_by(Evaluation.is_aggregator)
+                .with_for_update()
+            ).all()
+        )
+        session.execute(
+            update(Evaluation)
+            .where(Evaluation.run_id == run_id, Evaluation.status.in_(open_statuses))
+            .values(
+                status=EvaluationStatus.FAILED.value,
+                fail_reason=truncate_fail_reason(error_message),
             )
-            .with_for_update()
-            .all()
+            .execution_options(synchronize_session=False)
         )
-
-        failed_count_aggregator_true = 0
-        failed_count_aggregator_false = 0
-
-        for eval_to_process in evaluations_to_fail:
-            eval_to_process.status = EvaluationStatus.FAILED.value
-            sep = "\n\n.......\n\n"
-            eval_to_process.fail_reason = (
-                error_message[: 500 - len(sep)] + sep + error_message[-500:]
+        failed_count_aggregator_true = failed_counts.get(True, 0)
+        failed_count_aggregator_false = failed_counts.get(False, 0) + failed_counts.get(
+            None, 0
+        )
+        session.execute(
+            update(Run)
+            .where(Run.id == run_id)
+            .values(
+                status=RunStatus.FAILED.value,
+                stage2_failed=Run.stage2_failed + failed_count_aggregator_true,
+                stage2_left=Run.stage2_left - failed_count_aggregator_true,
+                stage1_failed=Run.stage1_failed + failed_count_aggregator_false,
+                stage1_left=Run.stage1_left - failed_count_aggregator_false,
             )
-            if eval_to_process.is_aggregator:
-                failed_count_aggregator_true += 1
-            else:
-                failed_count_aggregator_false += 1
-    with get_db_ctx() as session:
-        run_to_update = (
-            session.query(Run).filter(Run.id == run_id).with_for_update().one()
+            .execution_options(synchronize_session=False)
         )
-        run_to_update.status = RunStatus.FAILED.value
-        run_to_update.stage2_failed += failed_count_aggregator_true
-        run_to_update.stage2_left -= failed_count_aggregator_true
-        run_to_update.stage1_failed += failed_count_aggregator_false
-        run_to_update.stage1_left -= failed_count_aggregator_false
         logger.info(
             "Failed evaluations and run updated due to stage 2 message failure."
         )
@@ -126,13 +140,9 @@ def fail_run(run_id, error_message):
 
 def get_run_id_from_evaluation_id(evaluation_id):
     with get_db_ctx() as session:
-        evaluation = (
-            session.query(Evaluation)
-            .filter(Evaluation.id == evaluation_id)
-            .with_for_update()
-            .one()
+        return session.scalar(
+            select(Evaluation.run_id).filter(Evaluation.id == evaluation_id)
         )
-        return evaluation.run_id
 
 
 def update_run_table(run_id, **kwargs):
@@ -140,39 +150,61 @@ def update_run_table(run_id, **kwargs):
         logger.info(
             f"Updating run table for run_id: {run_id} with the following parameters: {kwargs}"
         )
+        values = {key: value for key, value in kwargs.items() if hasattr(Run, key)}
+        if debug_mode:
+            for key, value in values.items():
+                logger.debug(f"Key={key}, Value={value} updated in Run")
         with get_db_ctx() as session:
-            run = session.query(Run).filter(Run.id == run_id).with_for_update().one()
-            for key, value in kwargs.items():
-                if hasattr(run, key):
-                    setattr(run, key, value)
-                    if debug_mode:
-                        logger.debug(f"Key={key}, Value={value} updated in Run")
-            # session.commit()
-            logger.info(f"Run {run_id} updated. Current status: {run.status}")
+            session.execute(
+                update(Run)
+                .where(Run.id == run_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        logger.info(f"Run {run_id} updated. Current status: {values.get('status')}")
     except Exception as e:
         logger.error(
             f"Failed to update run status for run_id: {run_id} with parameters: {kwargs} due to error: {str(e)}"
         )
 
 
-def update_evaluation_status(
-    evaluation_id, status, evaluation_result, fail_reason: str | None = None
-):
+def update_evaluation_results(results):
+    """
+    Writes the status, output and fail reason of a stage's evaluations in one
+    UPDATE, picking each row's values with CASE on the id.
+    """
+    if not results:
+        return
+    statuses, outputs, output_blobs, fail_reasons = {}, {}, {}, {}
     with get_db_ctx() as session:
-        evaluation = (
-            session.query(Evaluation)
-            .filter(Evaluation.id == evaluation_id)
-            .with_for_update()
-            .one()
+        # Outputs above the blob threshold are stored in the blob tier and
+        # referenced from output_blob
+        stored = blob_store.offload_rows(
+            [
+                {
+                    "id": evaluation_id,
+                    "output": None if result.get("fail_reason") else result["result"],
+                }
+                for evaluation_id, result in results.items()
+            ],
+            "output",
+            "output_blob",
+            session=session,
         )
-        evaluation.status = status
-        evaluation.output = evaluation_result
-        if fail_reason is not None:
-            sep = "\n\n.......\n\n"
-            evaluation.fail_reason = (
-                fail_reason[: 500 - len(sep)] + sep + fail_reason[-500:]
+        for row in stored:
+            result = results[row["id"]]
+            statuses[row["id"]] = result["status"].value
+            outputs[row["id"]] = (
+                null()
+                if row["output"] is None
+                else literal(row["output"], Evaluation.output.type)
             )
-        # session.commit()
+            output_blobs[row["id"]] = row["output_blob"]
+            if result.get("fail_reason"):
+                fail_reasons[row["id"]] = truncate_fail_reason(result["fail_reason"])
+        session.execute(
+            evaluation_results_update(statuses, outputs, output_blobs, fail_reasons)
+        )
 
 
 def parse_and_update_run_status(
@@ -250,8 +282,14 @@ def parse_and_update_run_status(
         )
 
 
-def prepare_evaluation(evaluation_id, is_dev_req):
-    start_time = timeit.default_timer()
+class ClaimedEvaluation(NamedTuple):
+    run_id: int
+    evaluator_type_name: str | None
+    evaluator_config: dict
+    eval_config: dict | None
+
+
+def evaluator_config_for(evaluation, is_dev_req):
     evaluator_config_dict = {
         "name": None,
         "config": None,
@@ -264,94 +302,134 @@ def prepare_evaluation(evaluation_id, is_dev_req):
         "input_schema": None,
         "output_schema": None,
     }
-    logger.info(f"Preparing evaluation for id: {evaluation_id}")
+    evaluator_type_name = None
+    if evaluation.evaluator_id is not None:
+        evaluator_orm = evaluation.evaluator
+        evaluator_type_orm = evaluator_orm.evaluator_type
+        evaluator_type_name = evaluator_type_orm.name
+
+        evaluator_config_dict = {
+            "name": evaluator_orm.name,
+            "config": evaluator_orm.config,
+            "llm_config": {
+                "provider": evaluator_orm.llm_provider,
+                "model": evaluator_orm.llm_model,
+                "params": evaluator_orm.llm_params,
+            },
+            "config_schema": evaluator_type_orm.config_schema,
+            "input_schema": evaluator_orm.input_schema,
+            "output_schema": evaluator_orm.output_schema,
+        }
+    elif is_dev_req:
+        evaluator_config_override = evaluation.evaluator_config_override
+        if evaluator_config_override.get("evaluator_type_name", None):
+            evaluator_type_name = evaluator_config_override["evaluator_type_name"]
+        for key in evaluator_config_dict:
+            if evaluator_config_override.get(key, None):
+                evaluator_config_dict[key] = evaluator_config_override[key]
+        evaluator_config_dict["config_validation"] = False
+        logger.info("Dev req %s", evaluator_config_dict)
+    else:
+        logger.error(
+            f"No evaluator configuration found for evaluation id {evaluation.id} and not a dev request."
+        )
+        raise ValueError("No evaluator configuration found and not a dev request.")
+    return evaluator_type_name, evaluator_config_dict
+
+
+def claim_evaluations(evaluation_ids, is_dev_req):
+    """
+    Claims the queued evaluations among evaluation_ids in one transaction:
+    a single SELECT ... FOR UPDATE SKIP LOCKED (rows another worker holds are
+    left to it), one UPDATE moving them to in progress and one moving their
+    runs from pending to in progress.
+
+    Returns the claimed evaluations and the (run_id, fail reason) of those that
+    were claimed but can't be evaluated.
+    """
+    start_time = timeit.default_timer()
+    claimed, failed = {}, {}
     with get_db_ctx() as session:
-        evaluation = (
-            session.query(Evaluation)
-            .filter(Evaluation.id == evaluation_id)
-            .with_for_update()
-            .first()
+        evaluations = (
+            session.execute(claim_select(evaluation_ids))
+            .scalars()
+            .all()
         )
-        if evaluation is None:
-            raise ValueError(
-                f"Evaluation with id {evaluation_id} not found in the database."
-            )
-        if evaluation.status not in (
-            EvaluationStatus.QUEUED.value,
-            EvaluationStatus.PENDING.value,
-        ):
+        skipped = set(evaluation_ids) - {evaluation.id for evaluation in evaluations}
+        if skipped:
             logger.error(
-                f"Evaluation status for id {evaluation_id} is not queued. Got: {evaluation.status}"
+                f"Evaluations {sorted(skipped)} are not queued or are claimed by another worker."
             )
-            return None
-        evaluation.status = EvaluationStatus.IN_PROGRESS.value
-        run_id = evaluation.run_id
-        eval_config = evaluation.config
-        evaluator_type_name = None
-        if evaluation.evaluator_id is not None:
-            evaluator_orm = evaluation.evaluator
-            evaluator_type_orm = evaluator_orm.evaluator_type
-            evaluator_type_name = evaluator_type_orm.name
-
-            evaluator_config_dict = {
-                "name": evaluator_orm.name,
-                "config": evaluator_orm.config,
-                "llm_config": {
-                    "provider": evaluator_orm.llm_provider,
-                    "model": evaluator_orm.llm_model,
-                    "params": evaluator_orm.llm_params,
-                },
-                "config_schema": evaluator_type_orm.config_schema,
-                "input_schema": evaluator_orm.input_schema,
-                "output_schema": evaluator_orm.output_schema,
-            }
-        elif is_dev_req:
-            evaluator_config_override = evaluation.evaluator_config_override
-            if evaluator_config_override.get("evaluator_type_name", None):
-                evaluator_type_name = evaluator_config_override["evaluator_type_name"]
-            for key in evaluator_config_dict:
-                if evaluator_config_override.get(key, None):
-                    evaluator_config_dict[key] = evaluator_config_override[key]
-            evaluator_config_dict["config_validation"] = False
-            logger.info("Dev req %s", evaluator_config_dict)
-        else:
-            logger.error(
-                f"No evaluator configuration found for evaluation id {evaluation_id} and not a dev request."
+        if not evaluations:
+            return claimed, failed
+
+        session.execute(
+            update(Evaluation)
+            .where(Evaluation.id.in_([evaluation.id for evaluation in evaluations]))
+            .values(status=EvaluationStatus.IN_PROGRESS.value)
+            .execution_options(synchronize_session=False)
+        )
+        run_ids = {evaluation.run_id for evaluation in evaluations}
+        session.execute(
+            update(Run)
+            .where(Run.id.in_(run_ids), Run.status == RunStatus.PENDING.value)
+            .values(status=RunStatus.IN_PROGRESS.value)
+            .execution_options(synchronize_session=False)
+        )
+        run_statuses = dict(
+            session.execute(select(Run.id, Run.status).filter(Run.id.in_(run_ids)))
+        )
+
+        for evaluation in evaluations:
+            if run_statuses.get(evaluation.run_id) != RunStatus.IN_PROGRESS.value:
+                failed[evaluation.id] = (
+                    evaluation.run_id,
+                    "Invalid run status for evaluation progression.",
+                )
+                continue
+            try:
+                evaluator_type_name, evaluator_config = evaluator_config_for(
+                    evaluation, is_dev_req
+                )
+            except Exception:
+                failed[evaluation.id] = (
+                    evaluation.run_id,
+                    traceback.format_exc().strip(),
+                )
+                continue
+            claimed[evaluation.id] = ClaimedEvaluation(
+                evaluation.run_id,
+                evaluator_type_name,
+                evaluator_config,
+                evaluation.config,
             )
-            raise ValueError("No evaluator configuration found and not a dev request.")
 
-    with get_db_ctx() as session:
-        run = session.query(Run).filter(Run.id == run_id).with_for_update().one()
-        if run.status == RunStatus.PENDING.value:
-            run.status = RunStatus.IN_PROGRESS.value
-        elif run.status != RunStatus.IN_PROGRESS.value:
-            raise Exception("Invalid run status for evaluation progression.")
-
-    EvaluatorClass = EVALUATOR_TYPES_MAP[evaluator_type_name]
-    logger.info(f"Evaluator class {EvaluatorClass.__name__} prepared.")
     duration = timeit.default_timer() - start_time
     logger.info(
-        f"Preparation of evaluation id {evaluation_id} completed in {duration:.2f} seconds."
+        f"Claimed {len(claimed)} of {len(evaluation_ids)} evaluations in {duration:.2f} seconds."
     )
-    return (EvaluatorClass(**evaluator_config_dict), eval_config, run_id)
+    return claimed, failed
 
 
 # Define a function to run evaluation for a single message and a single evaluator
 def run_single_evaluation(
-    single_conversation, evaluation_id, is_dev_req, parse, format_to_issues_scores
+    single_conversation,
+    evaluation_id,
+    claim: ClaimedEvaluation,
+    is_dev_req,
+    parse,
+    format_to_issues_scores,
 ):
     set_log_context(thread_name=threading.current_thread().name)
-    run_id = None
     start_time = timeit.default_timer()
     try:
-        evaluator_out = prepare_evaluation(evaluation_id, is_dev_req)
-        if evaluator_out is None:
-            return None
-        evaluator, eval_config, run_id = evaluator_out
+        EvaluatorClass = EVALUATOR_TYPES_MAP[claim.evaluator_type_name]
+        logger.info(f"Evaluator class {EvaluatorClass.__name__} prepared.")
+        evaluator = EvaluatorClass(**claim.evaluator_config)
         start_eval_time = timeit.default_timer()
         evaluation_result = evaluator.evaluate(
             single_conversation,
-            eval_config,
+            claim.eval_config,
             input_validation=not is_dev_req,
             parse=parse,
             format_to_issues_scores=format_to_issues_scores,
@@ -364,7 +442,7 @@ def run_single_evaluation(
             f"Evaluation id {evaluation_id} completed successfully in {elapsed_time:.2f} seconds."
         )
         return {
-            "run_id": run_id,
+            "run_id": claim.run_id,
             "evaluation_id": evaluation_id,
             "result": evaluation_result,
             "status": EvaluationStatus.SUCCESS,
@@ -376,7 +454,7 @@ def run_single_evaluation(
             f"Evaluation id {evaluation_id} failed after {elapsed_time:.2f} seconds."
         )
         return {
-            "run_id": run_id,
+            "run_id": claim.run_id,
             "evaluation_id": evaluation_id,
             "result": None,
             "fail_reason": traceback.format_exc().strip(),
@@ -418,18 +496,29 @@ def process_message(pubsub_message, pubsub_message_id):
         def run_stage_evaluations(stage_ids, input_data, stage_number):
             start_time = timeit.default_timer()
             logger.info(f"Starting stage {stage_number} evaluations.{stage_ids}")
+            claimed, failed = claim_evaluations(stage_ids, is_dev_req)
             futures = {
                 executor.submit(
                     run_single_evaluation,
                     input_data,
                     stage_id,
+                    claim,
                     is_dev_req,
                     parse,
                     format_to_issues_scores and stage_number == 1,
                 ): stage_id
-                for stage_id in stage_ids
+                for stage_id, claim in claimed.items()
+            }
+            all_results = {
+                stage_id: {
+                    "run_id": run_id,
+                    "evaluation_id": stage_id,
+                    "result": None,
+                    "fail_reason": fail_reason,
+                    "status": EvaluationStatus.FAILED,
+                }
+                for stage_id, (run_id, fail_reason) in failed.items()
             }
-            all_results = {}
             for future in as_completed(futures):
                 stage_id = futures[future]
                 try:
@@ -456,24 +545,16 @@ def process_message(pubsub_message, pubsub_message_id):
                         exc_info=e,
                     )
                     all_results[stage_id] = {
+                        "run_id": claimed[stage_id].run_id,
                         "evaluation_id": stage_id,
                         "fail_reason": traceback.format_exc(),
                         "status": EvaluationStatus.FAILED,
                     }
 
-            for stage_id, result in all_results.items():
-                fail_reason = result.get("fail_reason", None)
-                if fail_reason:
-                    update_evaluation_status(
-                        stage_id, result["status"].value, None, fail_reason
-                    )
-                else:
-                    update_evaluation_status(
-                        stage_id, result["status"].value, result["result"]
-                    )
-                logger.info(
-                    f"Updated status for stage {stage_number} evaluation id: {stage_id} to {result['status']}."
-                )
+            update_evaluation_results(all_results)
+            logger.info(
+                f"Updated status for {len(all_results)} stage {stage_number} evaluations."
+            )
 
             elapsed = timeit.default_timer() - start_time
             logger.info(